@@ -42,12 +42,18 @@ FERNET_KEY = os.environ.get('FERNET_KEY')
 SECRET_KEY = os.environ['SECRET_KEY']
 CRYPTO_ALGORITHM = os.environ.get('CRYPTO_ALGORITHM', 'HS256')
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get('ACCESS_TOKEN_EXPIRE_MINUTES', '30'))
+# Время жизни (сек.) кэша пользователя и его прав доступа в ЛК.
+AUTH_CACHE_TTL = int(os.environ.get('AUTH_CACHE_TTL', 30))
+# Канал PostgreSQL NOTIFY, через который процессы сообщают серверу о сбросе кэша прав доступа.
+AUTH_CACHE_CHANNEL = os.environ.get('AUTH_CACHE_CHANNEL', 'auth_context_invalidate')
 
 
 # Google sheet
 SHEETS_TEMPLATE_FILE_ID = os.environ.get('SHEETS_TEMPLATE_FILE_ID')
 CLIENT_TEMPLATE_ID = os.environ.get('CLIENT_TEMPLATE_ID')
 LEAD_SHEET_ID = os.environ.get('LEAD_SHEET_ID')
+# Сколько секунд хранить в памяти профили пользователей Telegram (имя и username) для выгрузки лидов.
+TG_USER_INFO_CACHE_TTL = int(os.environ.get('TG_USER_INFO_CACHE_TTL', 24 * 60 * 60))
 ANALYTICS_SHEET_ID = os.environ.get('ANALYTICS_SHEET_ID')
 
 # Telegram
@@ -70,6 +76,18 @@ ROBOKASSA_MERCHANT_PASS_2 = os.environ.get('ROBOKASSA_MERCHANT_PASS_2')
 SERVER_LINK = os.environ.get('SERVER_LINK')
 ROBOKASSA_IS_TEST = os.environ.get('ROBOKASSA_IS_TEST')
 
+# amoCRM API (integrations/amo_crm/http_client.py).
+# Запросов в секунду к одному аккаунту из процесса (ограничение amoCRM – 7 в секунду).
+AMOCRM_REQUESTS_PER_SECOND = float(os.environ.get('AMOCRM_REQUESTS_PER_SECOND', 7))
+# Таймауты (сек.) подключения и чтения ответа.
+AMOCRM_CONNECT_TIMEOUT = float(os.environ.get('AMOCRM_CONNECT_TIMEOUT', 5))
+AMOCRM_READ_TIMEOUT = float(os.environ.get('AMOCRM_READ_TIMEOUT', 30))
+# Попыток запроса при ответах 429 и 5xx и максимальная задержка (сек.) между ними.
+AMOCRM_MAX_ATTEMPTS = int(os.environ.get('AMOCRM_MAX_ATTEMPTS', 5))
+AMOCRM_MAX_BACKOFF = float(os.environ.get('AMOCRM_MAX_BACKOFF', 30))
+# Максимальное количество соединений с одним аккаунтом.
+AMOCRM_POOL_MAXSIZE = int(os.environ.get('AMOCRM_POOL_MAXSIZE', 10))
+
 # Битрикс24.
 BITRIX24_RECHKA_INTEGRATION_ID = os.environ['BITRIX24_RECHKA_INTEGRATION_ID']
 BITRIX24_NEW_TG_USER_PIPELINE_ID = os.environ.get('BITRIX24_NEW_TG_USER_PIPELINE_ID')
@@ -80,6 +98,17 @@ BITRIX24_CONTACT_TG_ID_FIELD_NAME = os.environ['BITRIX24_CONTACT_TG_ID_FIELD_NAM
 # ID воронки «ЛИДЫ».
 BITRIX24_LEAD_PIPELINE_ID = '-1'
 
+# Кэш метаданных CRM: воронки, этапы, пользователи, отделы, поля (helpers/metadata_cache.py).
+# Сколько секунд запись свежая и сколько еще секунд ее можно отдавать, обновляя в фоне.
+CRM_METADATA_CACHE_TTL = int(os.environ.get('CRM_METADATA_CACHE_TTL', 10 * 60))
+CRM_METADATA_CACHE_STALE_TTL = int(os.environ.get('CRM_METADATA_CACHE_STALE_TTL', 24 * 60 * 60))
+# Максимальное количество записей в кэше процесса (на каждую CRM).
+CRM_METADATA_CACHE_MAX_SIZE = int(os.environ.get('CRM_METADATA_CACHE_MAX_SIZE', 5000))
+# Не чаще, чем раз в столько секунд, загружать запись заново, если в ней нет нужного ID (этапа, воронки).
+CRM_METADATA_CACHE_MIN_REFRESH_INTERVAL = int(os.environ.get('CRM_METADATA_CACHE_MIN_REFRESH_INTERVAL', 60))
+# Канал PostgreSQL NOTIFY, через который процессы сервера сообщают друг другу о сбросе кэша метаданных.
+CRM_METADATA_CACHE_CHANNEL = os.environ.get('CRM_METADATA_CACHE_CHANNEL', 'crm_metadata_invalidate')
+
 
 # Общие настройки
 BOT_APP_NAME = 'My bot'
@@ -97,6 +126,69 @@ UPLOAD_GOOGLE_MAX_ATTEMPTS = os.environ.get('UPLOAD_GOOGLE_MAX_ATTEMPTS', 10)
 UPLOAD_GOOGLE_MAX_WORKERS = os.environ.get('UPLOAD_GOOGLE_MAX_WORKERS', 20)
 # Максимальное количество строк, выгружаемых за раз в Гугл.
 UPLOAD_GOOGLE_CHUNK_SIZE = os.environ.get('UPLOAD_GOOGLE_CHUNK_SIZE', 2000)
+# Сколько секунд держать открытую Гугл Таблицу (метаданные и первый лист) в кэше клиента.
+GOOGLE_SPREADSHEET_CACHE_TTL = int(os.environ.get('GOOGLE_SPREADSHEET_CACHE_TTL', 60 * 60))
+# Запросов к Google Sheets API в минуту от одного сервисного аккаунта (квота Google – 60 в минуту на пользователя).
+GOOGLE_SHEETS_ACCOUNT_REQUESTS_PER_MINUTE = int(os.environ.get('GOOGLE_SHEETS_ACCOUNT_REQUESTS_PER_MINUTE', 55))
+# Запросов в минуту к одной таблице: одна большая выгрузка не занимает всю квоту аккаунта.
+GOOGLE_SHEETS_SPREADSHEET_REQUESTS_PER_MINUTE = int(os.environ.get('GOOGLE_SHEETS_SPREADSHEET_REQUESTS_PER_MINUTE', 15))
+# Попыток запроса к Google Sheets API при ответах 429 и 5xx.
+GOOGLE_SHEETS_MAX_ATTEMPTS = int(os.environ.get('GOOGLE_SHEETS_MAX_ATTEMPTS', 6))
+# Максимальная задержка (сек.) между попытками запроса к Google Sheets API.
+GOOGLE_SHEETS_MAX_BACKOFF = int(os.environ.get('GOOGLE_SHEETS_MAX_BACKOFF', 64))
+# Канал PostgreSQL NOTIFY, в который сообщается о новых строках для выгрузки в Гугл.
+UPLOAD_GOOGLE_CHANNEL = os.environ.get('UPLOAD_GOOGLE_CHANNEL', 'gspread_upload')
+# Сколько секунд копить строки отчета после первого уведомления, чтобы выгрузить их одним пакетом.
+UPLOAD_GOOGLE_DEBOUNCE_SEC = float(os.environ.get('UPLOAD_GOOGLE_DEBOUNCE_SEC', 5))
+# Интервал (сек.) полной проверки невыгруженных строк – на случай потерянных уведомлений.
+UPLOAD_GOOGLE_SWEEP_INTERVAL = int(os.environ.get('UPLOAD_GOOGLE_SWEEP_INTERVAL', 10 * 60))
+# Файл с состоянием выгрузки в Гугл Таблицы (очередь и квоты) для /status/sheets_upload.
+UPLOAD_GOOGLE_STATUS_PATH = os.path.join(LOGS_DIR, 'upload_google_status.json')
+
+# Буфер строк лога запросов, записываемых в БД (RequestLogLine).
+# Максимальное количество строк в очереди. При переполнении новые строки отбрасываются.
+REQUEST_LOG_QUEUE_SIZE = int(os.environ.get('REQUEST_LOG_QUEUE_SIZE', 10000))
+# Количество строк, записываемых в БД одним запросом.
+REQUEST_LOG_BATCH_SIZE = int(os.environ.get('REQUEST_LOG_BATCH_SIZE', 500))
+# Максимальное время (сек.) нахождения строки в буфере до записи в БД.
+REQUEST_LOG_FLUSH_INTERVAL = float(os.environ.get('REQUEST_LOG_FLUSH_INTERVAL', 1.0))
+
+
+# Отложенные задачи (DeferredJob): обработка вебхуков CRM после задержки get_deal_timeout.
+# Количество потоков процесса сервера, выполняющих наступившие задачи.
+DEFERRED_JOB_WORKERS = int(os.environ.get('DEFERRED_JOB_WORKERS', 10))
+# Интервал (сек.) проверки БД на задачи, которые не запустил создавший их процесс (например, после перезапуска).
+DEFERRED_JOB_SWEEP_INTERVAL = int(os.environ.get('DEFERRED_JOB_SWEEP_INTERVAL', 30))
+# Как часто (сек.) процесс отмечает в БД, что выполняемые им задачи еще работают.
+DEFERRED_JOB_HEARTBEAT_INTERVAL = int(os.environ.get('DEFERRED_JOB_HEARTBEAT_INTERVAL', 60))
+# Через сколько секунд без отметки задача считается прерванной (процесс остановлен) и завершается с ошибкой.
+DEFERRED_JOB_STALE_SEC = int(os.environ.get('DEFERRED_JOB_STALE_SEC', 10 * 60))
+
+
+# Журнал баланса компаний (BalanceEntry, BalanceHold).
+# Как часто (сек.) переносить списания из журнала в Company.seconds_balance.
+BALANCE_COMPACT_INTERVAL = int(os.environ.get('BALANCE_COMPACT_INTERVAL', 60))
+# Через сколько часов незакрытый резерв баланса считается зависшим и снимается.
+BALANCE_HOLD_TTL_HOURS = int(os.environ.get('BALANCE_HOLD_TTL_HOURS', 6))
+
+
+# Партиционирование таблиц по месяцам.
+# На сколько месяцев вперед заранее создавать партиции.
+PARTITIONS_MONTHS_AHEAD = int(os.environ.get('PARTITIONS_MONTHS_AHEAD', 2))
+# Сколько месяцев хранить партиции в БД. Более старые отсоединяются и архивируются.
+# 0 – не архивировать партиции таблицы.
+PARTITIONS_RETENTION_MONTHS = {
+    'task': int(os.environ.get('TASK_RETENTION_MONTHS', 0)),
+    'modeanswer': int(os.environ.get('MODEANSWER_RETENTION_MONTHS', 0)),
+    'requestlog': int(os.environ.get('REQUESTLOG_RETENTION_MONTHS', 3)),
+    # Строки лога запросов хранятся столько же, сколько сами запросы.
+    'request_log_line': int(os.environ.get('REQUESTLOG_RETENTION_MONTHS', 3)),
+}
+# Каталог для архивов отсоединенных партиций (csv.gz).
+PARTITIONS_ARCHIVE_DIR = os.environ.get('PARTITIONS_ARCHIVE_DIR', os.path.join(ROOT_DIR, 'archive/'))
+# S3-хранилище для архивов. Если бакет не задан, архивы остаются только в PARTITIONS_ARCHIVE_DIR.
+PARTITIONS_ARCHIVE_S3_BUCKET = os.environ.get('PARTITIONS_ARCHIVE_S3_BUCKET')
+PARTITIONS_ARCHIVE_S3_ENDPOINT = os.environ.get('PARTITIONS_ARCHIVE_S3_ENDPOINT')
 
 
 # Стартовые настройки продукта
@@ -120,6 +212,41 @@ FASTAPI_CORS_ORIGINS: list = [
     x.strip() for x in os.environ.get('FASTAPI_CORS_ORIGINS', '').split(',') if x.strip()
 ]
 FASTAPI_TEST_ENV_PORT = os.environ.get('FASTAPI_TEST_ENV_PORT', 80)
+# Максимальное количество потоков для синхронных обработчиков FastAPI (def-эндпоинты, запросы к БД).
+# Каждый поток держит свое соединение с БД.
+FASTAPI_THREADPOOL_SIZE = int(os.environ.get('FASTAPI_THREADPOOL_SIZE', 40))
+# Задержка event loop (мс), начиная с которой блокирующий вызов записывается в лог.
+EVENT_LOOP_LAG_THRESHOLD_MS = int(os.environ.get('EVENT_LOOP_LAG_THRESHOLD_MS', 100))
+# Ответы FastAPI меньше этого размера (байт) не сжимаются.
+FASTAPI_GZIP_MIN_SIZE = int(os.environ.get('FASTAPI_GZIP_MIN_SIZE', 1000))
+# Строить графики ЛК без фильтров по почасовым агрегатам (ChartRollup).
+# Включать после первичного заполнения агрегатов командой rebuild_chart_rollups.
+CHART_ROLLUPS_ENABLED = os.environ.get('CHART_ROLLUPS_ENABLED', 'false').lower() == 'true'
+# Кэш данных графиков ЛК (helpers/chart_cache.py).
+# Время жизни (сек.) данных за диапазон, включающий сегодняшний день, и за прошедший диапазон.
+CHART_CACHE_TTL = int(os.environ.get('CHART_CACHE_TTL', 60))
+CHART_CACHE_PAST_TTL = int(os.environ.get('CHART_CACHE_PAST_TTL', 24 * 60 * 60))
+# Максимальное количество графиков в кэше процесса.
+CHART_CACHE_MAX_SIZE = int(os.environ.get('CHART_CACHE_MAX_SIZE', 2000))
+# Redis для кэша, общего для всех процессов сервера. Если не указан, используется только кэш процесса.
+CHART_CACHE_REDIS_URL = os.environ.get('CHART_CACHE_REDIS_URL')
+# Колоночная аналитика отчетов в памяти процесса (modules/analytics.py).
+# Сколько отчетов держать в памяти, через сколько секунд полностью перестраивать снимок отчета,
+# максимальное число групп в ответе и размер пачки задач при загрузке.
+ANALYTICS_MAX_REPORTS = int(os.environ.get('ANALYTICS_MAX_REPORTS', 20))
+ANALYTICS_SNAPSHOT_MAX_AGE = int(os.environ.get('ANALYTICS_SNAPSHOT_MAX_AGE', 60 * 60))
+ANALYTICS_MAX_GROUPS = int(os.environ.get('ANALYTICS_MAX_GROUPS', 5000))
+ANALYTICS_LOAD_BATCH_SIZE = int(os.environ.get('ANALYTICS_LOAD_BATCH_SIZE', 5000))
+# Конфигурация полнотекстового поиска PostgreSQL (data/search.py).
+SEARCH_TEXT_CONFIG = os.environ.get('SEARCH_TEXT_CONFIG', 'russian')
+# Выгрузка звонков отчета в файл (modules/report_export.py).
+# Сколько строк читать из БД за раз (и строк в группе Parquet).
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 10000))
+# S3-хранилище для фоновых выгрузок. Если бакет не задан, доступна только потоковая выгрузка.
+EXPORTS_S3_BUCKET = os.environ.get('EXPORTS_S3_BUCKET')
+EXPORTS_S3_ENDPOINT = os.environ.get('EXPORTS_S3_ENDPOINT')
+# Время жизни (сек.) ссылки на скачивание файла фоновой выгрузки.
+EXPORT_URL_TTL = int(os.environ.get('EXPORT_URL_TTL', 24 * 60 * 60))
 
 # Каталог со статическими файлами fastapi-приложения, которые будут доступны извне.
 FASTAPI_STATIC_DIR = os.path.join(ROOT_DIR, 'static')
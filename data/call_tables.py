@@ -0,0 +1,214 @@
+"""
+Таблицы звонков отчетов для таблицы задач ЛК.
+
+Для каждого отчета поддерживается отдельная таблица report_calls_<ID отчета>: одна строка на завершенную
+задачу и по одной типизированной колонке q_<ID вопроса> на каждый активный вопрос отчета
+(числа – bigint, даты – текст YYYY-MM-DD, остальное – text). Сортировка и фильтрация по любой колонке
+не требуют сборки ответов из ModeAnswer. По числовым колонкам и датам строится индекс; текстовые колонки
+не индексируются: длинный ответ (больше ~2.7 КБ) не помещается в строку btree-индекса, а фильтры
+по тексту (содержит, не содержит) индекс btree не использовали бы.
+
+- rebuild_call_table() – полное построение (первичное и при изменении набора колонок);
+- refresh_call_table_rows() – пересчет строк отдельных задач (завершение задачи, новый ответ);
+- get_call_source() – источник строк для чтения: таблица, если она соответствует текущим вопросам,
+  иначе тот же запрос-разворот по ModeAnswer (медленнее, но с тем же результатом).
+"""
+import json
+import re
+from typing import Iterable, List, Optional, Tuple
+
+import peewee
+from loguru import logger
+
+from data.models import main_db, Task, ModeAnswer, ModeQuestion, ModeQuestionType, CallTableState
+
+
+# Пространство имен advisory-блокировок построения таблиц (второй ключ – ID отчета).
+CALL_TABLE_LOCK_NAMESPACE = 3202
+
+NUMERIC_TYPES = {ModeQuestionType.INTEGER, ModeQuestionType.PERCENT}
+
+# Даты ответов (DD.MM.YYYY) хранятся как YYYY-MM-DD, чтобы сортировка по тексту совпадала с сортировкой по дате.
+DATE_PATTERN = r'^(\d{2})\.(\d{2})\.(\d{4})$'
+ISO_DATE_PATTERN = r'^(\d{4})-(\d{2})-(\d{2})$'
+ISO_DATE_RE = re.compile(ISO_DATE_PATTERN)
+
+# Колонки задачи, которые копируются в таблицу звонков.
+TASK_COLUMNS = ['task_id', 'created', 'is_archived', 'source', 'duration_sec']
+
+
+def get_call_table_name(report_id: int) -> str:
+    return f'report_calls_{report_id}'
+
+
+def get_column_name(question_id: int) -> str:
+    return f'q_{question_id}'
+
+
+def get_call_table_columns(report_id: int) -> List[dict]:
+    """
+    Колонки вопросов таблицы звонков: активные вопросы отчета в порядке отображения.
+    """
+    questions = (
+        ModeQuestion
+        .select(ModeQuestion.id, ModeQuestion.answer_type, ModeQuestion.short_name)
+        .where(ModeQuestion.report == report_id, ModeQuestion.is_active == True)
+        .order_by(ModeQuestion.column_index, ModeQuestion.id)
+    )
+    return [
+        {
+            'id': x.id,
+            'name': get_column_name(x.id),
+            'answer_type': x.answer_type,
+            'short_name': x.short_name,
+        }
+        for x in questions
+    ]
+
+
+def get_columns_signature(columns: List[dict]) -> str:
+    return json.dumps(sorted([x['id'], x['answer_type']] for x in columns))
+
+
+def build_pivot_query(
+        report_id: int,
+        columns: List[dict],
+        task_ids: Optional[Iterable[int]] = None,
+) -> peewee.ModelSelect:
+    """
+    Разворот ответов завершенных задач отчета в строки «задача × колонки вопросов».
+    """
+    fields = [
+        Task.id.alias('task_id'),
+        Task.created,
+        Task.is_archived,
+        Task.source,
+        Task.duration_sec,
+    ]
+    for column in columns:
+        if column['answer_type'] in NUMERIC_TYPES:
+            # Нечисловые ответы в числовой колонке считаются пустыми.
+            answer_value = ModeAnswer.get_integer_value_expression(default=None)
+        elif column['answer_type'] == ModeQuestionType.DATE:
+            answer_value = peewee.fn.REGEXP_REPLACE(ModeAnswer.answer_text, DATE_PATTERN, r'\3-\2-\1')
+        else:
+            answer_value = ModeAnswer.answer_text
+        fields.append(peewee.fn.MAX(answer_value).filter(ModeAnswer.question == column['id']).alias(column['name']))
+
+    query = (
+        Task
+        .select(*fields)
+        .join(ModeAnswer, peewee.JOIN.LEFT_OUTER, on=(
+            (ModeAnswer.task == Task.id)
+            & (ModeAnswer.question.in_([x['id'] for x in columns]))
+        ))
+        .where(Task.report == report_id, Task.status == Task.StatusChoices.DONE)
+        .group_by(Task.id, Task.created, Task.is_archived, Task.source, Task.duration_sec)
+    )
+    if task_ids is not None:
+        query = query.where(Task.id.in_(list(task_ids)))
+    return query
+
+
+def get_indexed_columns(columns: List[dict]) -> List[dict]:
+    """
+    Колонки вопросов, по которым строится индекс таблицы звонков: числа и даты.
+    """
+    return [x for x in columns if x['answer_type'] in NUMERIC_TYPES or x['answer_type'] == ModeQuestionType.DATE]
+
+
+def get_call_table(report_id: int) -> peewee.Table:
+    # Колонки задаются через table.c, как и у подзапроса-разворота: оба источника читаются одинаково.
+    return peewee.Table(get_call_table_name(report_id)).bind(main_db)
+
+
+def is_call_table_fresh(report_id: int, columns: List[dict]) -> bool:
+    """
+    Построена ли таблица звонков с текущим набором колонок.
+    """
+    state = CallTableState.get_or_none(CallTableState.report == report_id)
+    return state is not None and state.columns_signature == get_columns_signature(columns)
+
+
+def get_call_source(report_id: int) -> Tuple[peewee.Source, List[dict], bool]:
+    """
+    Источник строк таблицы звонков, колонки вопросов и признак того, что источник – построенная таблица.
+    """
+    columns = get_call_table_columns(report_id)
+    if is_call_table_fresh(report_id, columns):
+        return get_call_table(report_id), columns, True
+    return build_pivot_query(report_id, columns).alias('calls'), columns, False
+
+
+def rebuild_call_table(report_id: int, only_if_stale: bool = False) -> None:
+    """
+    Строит таблицу звонков отчета заново.
+    С only_if_stale=True ничего не делает, если таблица соответствует текущим вопросам.
+    """
+    table_name = get_call_table_name(report_id)
+
+    with main_db.atomic():
+        # Построения и обновления таблицы одного отчета выполняются по очереди.
+        main_db.execute_sql('SELECT pg_advisory_xact_lock(%s, %s)', (CALL_TABLE_LOCK_NAMESPACE, report_id))
+
+        columns = get_call_table_columns(report_id)
+        if only_if_stale and is_call_table_fresh(report_id, columns):
+            return
+
+        pivot_sql, pivot_params = build_pivot_query(report_id, columns).sql()
+        main_db.execute_sql(f'DROP TABLE IF EXISTS "{table_name}"')
+        main_db.execute_sql(f'CREATE TABLE "{table_name}" AS {pivot_sql}', pivot_params)
+        main_db.execute_sql(f'ALTER TABLE "{table_name}" ADD PRIMARY KEY (task_id)')
+        main_db.execute_sql(f'CREATE INDEX "{table_name}_created" ON "{table_name}" (created, task_id)')
+        for column in get_indexed_columns(columns):
+            main_db.execute_sql(
+                f'CREATE INDEX "{table_name}_{column["name"]}" ON "{table_name}" ("{column["name"]}", task_id)'
+            )
+
+        (CallTableState
+         .insert(report=report_id, columns_signature=get_columns_signature(columns))
+         .on_conflict(conflict_target=[CallTableState.report],
+                      update={CallTableState.columns_signature: get_columns_signature(columns),
+                              CallTableState.built: peewee.fn.NOW()})
+         .execute())
+
+    logger.info(f'Таблица звонков отчета {report_id} построена: {len(columns)} колонок.')
+
+
+def refresh_call_table_rows(report_id: int, task_ids: Iterable[int]) -> bool:
+    """
+    Пересчитывает строки задач в таблице звонков. Незавершенные задачи удаляются из таблицы.
+    Возвращает False, если таблица не построена или устарела (ее нужно перестроить).
+    """
+    task_ids = list(task_ids)
+
+    with main_db.atomic():
+        main_db.execute_sql('SELECT pg_advisory_xact_lock(%s, %s)', (CALL_TABLE_LOCK_NAMESPACE, report_id))
+
+        columns = get_call_table_columns(report_id)
+        if not is_call_table_fresh(report_id, columns):
+            return False
+
+        table = get_call_table(report_id)
+        table.delete().where(table.c.task_id.in_(task_ids)).execute()
+        table.insert(
+            build_pivot_query(report_id, columns, task_ids=task_ids),
+            columns=[getattr(table.c, x) for x in TASK_COLUMNS + [x['name'] for x in columns]],
+        ).execute()
+    return True
+
+
+def refresh_task_call_row(task: Task) -> None:
+    if task.report_id is not None:
+        refresh_call_table_rows(task.report_id, [task.id])
+
+
+def format_answer_value(column: dict, value):
+    """
+    Значение колонки таблицы звонков в формате ответа (даты – DD.MM.YYYY).
+    """
+    if column['answer_type'] == ModeQuestionType.DATE and isinstance(value, str):
+        match = ISO_DATE_RE.match(value)
+        if match:
+            return f'{match.group(3)}.{match.group(2)}.{match.group(1)}'
+    return value
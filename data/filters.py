@@ -0,0 +1,147 @@
+"""
+Фильтры задач по ответам на вопросы отчета (фильтры вида таблицы и фильтры графиков).
+
+Каждый фильтр превращается в отдельный подзапрос EXISTS по ответам одного вопроса задачи,
+а условия фильтров объединяются через AND. В отличие от объединения условий через OR
+с последующим HAVING COUNT(*) = n, такой запрос использует индекс ModeAnswer (question, task)
+для каждого фильтра и не разрастается на широких наборах фильтров.
+
+Числовые ответы сравниваются как числа (ModeAnswer.get_integer_value_expression), а не как строки.
+Фильтр с нечисловым значением для числового вопроса, некорректной датой или неподдерживаемой операцией
+не проходит ни одна задача (при создании такие фильтры отклоняются, см. routers/helpers.py check_filter_value).
+Скомпилированные условия кэшируются по набору фильтров.
+"""
+from datetime import date
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple, Union
+
+import peewee
+from loguru import logger
+
+from data.call_tables import get_column_name, ISO_DATE_PATTERN
+from data.models import Task, ModeAnswer, ModeQuestionType, ColumnFilter, TableActiveFilter, ChartFilter
+
+
+# (ID вопроса, тип ответа, операция, значение).
+FilterKey = Tuple[int, str, str, str]
+
+
+def get_filters_key(filters: Iterable[Union[TableActiveFilter, ChartFilter]]) -> Tuple[FilterKey, ...]:
+    """
+    Ключ набора фильтров: одинаковые наборы фильтров отбирают одинаковые задачи.
+    У фильтров должен быть загружен mode_question.
+    """
+    return tuple(sorted(
+        (x.mode_question_id, x.mode_question.answer_type, x.operation, x.value)
+        for x in filters
+    ))
+
+
+def parse_integer_filter_value(value) -> Optional[int]:
+    """
+    Значение фильтра числового или процентного вопроса («50», «50%»). None – значение не число.
+    """
+    try:
+        return int(str(value).strip().rstrip('%').strip())
+    except ValueError:
+        return None
+
+
+def get_invalid_filter_condition(question_id: int, value: str) -> peewee.Node:
+    logger.warning(f'Некорректное значение числового фильтра вопроса {question_id}: {value!r}. '
+                   f'Фильтр не проходит ни одна задача.')
+    return peewee.SQL('FALSE')
+
+
+def build_condition(field: peewee.Node, question_id: int, answer_type: str, operation: str, value) -> peewee.Node:
+    """
+    Условие ColumnFilter.build. Фильтр, который не удалось построить, не проходит ни одна задача.
+    """
+    try:
+        return ColumnFilter.build(field, answer_type, operation, value)
+    except ValueError as ex:
+        logger.warning(f'Некорректный фильтр вопроса {question_id}: {operation} {value!r} ({ex}). '
+                       f'Фильтр не проходит ни одна задача.')
+        return peewee.SQL('FALSE')
+
+
+def compile_filter(filter_key: FilterKey, alias_name: str) -> peewee.Expression:
+    """
+    Условие EXISTS для одного фильтра: у задачи есть ответ на вопрос, удовлетворяющий фильтру.
+    """
+    question_id, answer_type, operation, value = filter_key
+    answer = ModeAnswer.alias(alias_name)
+
+    if answer_type in {ModeQuestionType.INTEGER, ModeQuestionType.PERCENT}:
+        value = parse_integer_filter_value(value)
+        if value is None:
+            return get_invalid_filter_condition(question_id, filter_key[3])
+        # Нечисловые ответы не проходят числовые фильтры.
+        field = ModeAnswer.get_integer_value_expression(answer.answer_text, default=None)
+    else:
+        field = answer.answer_text
+
+    condition = build_condition(field, question_id, answer_type, operation, value)
+    subquery = (
+        answer
+        .select(peewee.SQL('1'))
+        .where(
+            answer.task == Task.id,
+            answer.question == question_id,
+            condition,
+        )
+    )
+    return peewee.fn.EXISTS(subquery)
+
+
+@lru_cache(maxsize=1024)
+def _compile_filters(filters_key: Tuple[FilterKey, ...], today: date) -> peewee.Expression:
+    # today входит в ключ кэша: фильтр «Последние X дней» зависит от текущей даты.
+    conditions = [compile_filter(x, f'filter_answer_{i}') for i, x in enumerate(filters_key)]
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+    return expression
+
+
+def compile_task_filters(
+        filters: Iterable[Union[TableActiveFilter, ChartFilter]],
+) -> Optional[peewee.Expression]:
+    """
+    Условие на Task, которому удовлетворяют только задачи, прошедшие все фильтры.
+    Возвращает None, если фильтров нет.
+    """
+    filters_key = get_filters_key(filters)
+    if not filters_key:
+        return None
+    return _compile_filters(filters_key, date.today())
+
+
+def compile_call_table_filters(
+        source: peewee.Source,
+        filters: Iterable[Union[TableActiveFilter, ChartFilter]],
+) -> Optional[peewee.Expression]:
+    """
+    Условие для строк таблицы звонков отчета (data/call_tables.py), где ответы уже разложены
+    по типизированным колонкам q_<ID вопроса>. Возвращает None, если фильтров нет.
+    """
+    conditions: List[peewee.Expression] = []
+    for question_id, answer_type, operation, value in get_filters_key(filters):
+        column = getattr(source.c, get_column_name(question_id))
+        if answer_type in {ModeQuestionType.INTEGER, ModeQuestionType.PERCENT}:
+            integer_value = parse_integer_filter_value(value)
+            if integer_value is None:
+                conditions.append(get_invalid_filter_condition(question_id, value))
+                continue
+            value = integer_value
+        elif answer_type == ModeQuestionType.DATE:
+            # Фильтры дат ожидают формат DD.MM.YYYY.
+            column = peewee.fn.REGEXP_REPLACE(column, ISO_DATE_PATTERN, r'\3.\2.\1')
+        conditions.append(build_condition(column, question_id, answer_type, operation, value))
+
+    if not conditions:
+        return None
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+    return expression
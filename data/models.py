@@ -2,18 +2,19 @@ import json
 import re
 import urllib.parse
 from copy import deepcopy
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from enum import Enum
 from functools import reduce
 from json import JSONDecodeError
 from operator import or_, and_
 from time import sleep
-from typing import Optional, Set
+from typing import Dict, Iterable, Optional, Set
 
 from gspread.urls import SPREADSHEET_DRIVE_URL
 from loguru import logger
 
 import peewee
+from playhouse.postgres_ext import TSVectorField
 
 import config.config as cfg
 from misc.time import get_refresh_time
@@ -75,6 +76,18 @@ class BaseModel(peewee.Model):
         self.save()
 
 
+class UnconstrainedForeignKeyField(peewee.ForeignKeyField):
+    """
+    Внешний ключ без ограничения FOREIGN KEY в БД (индекс создается).
+    Используется для ссылок на партиционированные таблицы (см. data/partitions.py): их первичный ключ
+    составной (id, ключ партиционирования), поэтому ограничение невозможно, и целостность поддерживает приложение.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # create_table не создает ограничения для отложенных внешних ключей.
+        self.deferred = True
+
+
 class Company(BaseModel):
     """
     Компания объединяет нескольких пользователей.
@@ -95,31 +108,34 @@ class Company(BaseModel):
     seconds_balance = peewee.IntegerField(default=0)
     bitrix_company_id = peewee.CharField(default=None, null=True)
 
+    @staticmethod
+    def round_balance_change(seconds: int) -> int:
+        """
+        Минимальная величина изменения баланса – 60 секунд.
+        """
+        if abs(seconds) < 60:
+            return 60 if seconds > 0 else -60
+        return seconds
+
     def add_balance(
             self,
             seconds_to_add: int,
             **transaction_kwargs,
     ):
         """
+        Изменяет баланс компании сразу (пополнения, переводы, ручные изменения).
+        Для списаний за обработку звонков используются BalanceHold и BalanceEntry.charge.
+
         Если transaction_kwargs не переданы, транзакция не создается.
         """
-
-        # Минимум 60 секунд.
-        if abs(seconds_to_add) < 60:
-            if seconds_to_add > 0:
-                seconds_to_add = 60
-            else:
-                seconds_to_add = -60
+        seconds_to_add = self.round_balance_change(seconds_to_add)
 
         with main_db.atomic():
 
-            # Блокируем строку для изменения другими транзакциями.
-            company = Company.select().where(Company.id == self.id).for_update().get()
-
             if transaction_kwargs:
                 rounded_minutes = seconds_to_add // 60
                 transaction_kwargs.update({
-                    'company': company,
+                    'company': self.id,
                     'minutes': rounded_minutes,
                 })
                 transaction = Transaction.create(**transaction_kwargs)
@@ -127,18 +143,78 @@ class Company(BaseModel):
                 transaction = None
 
             if seconds_to_add != 0:
-                initial_balance = company.seconds_balance
-
-                Company.update(
-                    seconds_balance=Company.seconds_balance + seconds_to_add
-                ).where(Company.id == self.id).execute()
-                updated_balance = Company.get(id=self.id).seconds_balance
+                # Запись сразу учтена в материализованном балансе (compacted=True).
+                BalanceEntry.create(
+                    company=self.id,
+                    seconds=seconds_to_add,
+                    kind=BalanceEntry.Kind.ADJUSTMENT,
+                    transaction=transaction,
+                    compacted=True,
+                )
+                # Одно атомарное UPDATE без предварительной блокировки строки.
+                cursor = (
+                    Company
+                    .update(seconds_balance=Company.seconds_balance + seconds_to_add)
+                    .where(Company.id == self.id)
+                    .returning(Company.seconds_balance)
+                    .tuples()
+                    .execute()
+                )
+                updated_balance = list(cursor)[0][0]
 
-                logger.info(f"Добавил {seconds_to_add} секунд компании ID: {company.id}. "
-                            f"Баланс: {initial_balance} -> {updated_balance} секунд.")
+                logger.info(f"Добавил {seconds_to_add} секунд компании ID: {self.id}. "
+                            f"Баланс: {updated_balance - seconds_to_add} -> {updated_balance} секунд.")
 
         return transaction
 
+    def _get_balance(self, subtract_holds: bool) -> int:
+        pending_entries = (
+            BalanceEntry
+            .select(peewee.fn.COALESCE(peewee.fn.SUM(BalanceEntry.seconds), 0))
+            .where(BalanceEntry.company == Company.id,
+                   BalanceEntry.compacted == False)
+        )
+        balance = Company.seconds_balance + pending_entries
+
+        if subtract_holds:
+            active_holds = (
+                BalanceHold
+                .select(peewee.fn.COALESCE(peewee.fn.SUM(BalanceHold.seconds), 0))
+                .where(BalanceHold.company == Company.id,
+                       BalanceHold.status == BalanceHold.Status.HELD)
+            )
+            balance = balance - active_holds
+
+        return Company.select(balance).where(Company.id == self.id).scalar()
+
+    def get_balance(self) -> int:
+        """
+        Текущий баланс: материализованный seconds_balance + еще не учтенные записи журнала.
+        """
+        return self._get_balance(subtract_holds=False)
+
+    def get_available_balance(self) -> int:
+        """
+        Баланс, доступный для новых звонков: текущий баланс за вычетом активных резервов.
+        """
+        return self._get_balance(subtract_holds=True)
+
+    @staticmethod
+    def get_balances(companies: Iterable['Company']) -> Dict[int, int]:
+        """
+        Текущие балансы загруженных компаний (как get_balance) одним запросом к журналу. ID компании -> баланс.
+        """
+        companies = list(companies)
+        pending_entries = dict(
+            BalanceEntry
+            .select(BalanceEntry.company, peewee.fn.SUM(BalanceEntry.seconds))
+            .where(BalanceEntry.company.in_([x.id for x in companies]),
+                   BalanceEntry.compacted == False)
+            .group_by(BalanceEntry.company)
+            .tuples()
+        ) if companies else {}
+        return {x.id: x.seconds_balance + pending_entries.get(x.id, 0) for x in companies}
+
     @staticmethod
     def transfer_balance(
             from_company: 'Company',
@@ -217,7 +293,7 @@ class User(BaseModel):
                 .where(User.id == self.id))
 
     def get_seconds_balance(self) -> int:
-        return self.company.seconds_balance
+        return self.company.get_balance()
 
     def get_accessible_companies(
             self,
@@ -498,6 +574,22 @@ class RequestLog(BaseModel):
     company = peewee.ForeignKeyField(Company, default=None, null=True)
 
 
+class RequestLogLine(BaseModel):
+    """
+    Строка лога, связанная с запросом к FastAPI-приложению (RequestLog).
+    Таблица только пополняется: строки пишутся пачками из буфера DBLogHandler.
+    Партиционируется по месяцам и архивируется вместе с RequestLog (см. data/partitions.py).
+    """
+    class Meta:
+        table_name = 'request_log_line'
+
+    created = peewee.DateTimeField(default=datetime.now)
+    # Без внешнего ключа: таблица RequestLog может быть партиционирована (см. data/partitions.py).
+    request_log_id = peewee.BigIntegerField(index=True)
+    level = peewee.CharField(max_length=16, null=True)
+    message = peewee.TextField()
+
+
 class Task(BaseModel):
     class StatusChoices:
         IN_PROGRESS = 'in_progress'
@@ -511,6 +603,12 @@ class Task(BaseModel):
             (CANCELLED, CANCELLED),
         )
 
+    class Meta:
+        indexes = (
+            # Выборка задач отчета за период (графики, таблица ЛК).
+            (('report', 'created'), False),
+        )
+
     created = peewee.DateTimeField(default=datetime.now)
     user = peewee.ForeignKeyField(User, backref="tasks", default=None, null=True)
     deal = peewee.ForeignKeyField(Deal, null=True)
@@ -523,7 +621,7 @@ class Task(BaseModel):
     status = peewee.TextField(choices=StatusChoices.choices, default=StatusChoices.IN_PROGRESS)
     error_details = peewee.TextField(default=None, null=True)
     is_archived = peewee.BooleanField(default=False)
-    request_log = peewee.ForeignKeyField(RequestLog, default=None, null=True)
+    request_log = UnconstrainedForeignKeyField(RequestLog, default=None, null=True)
 
     # Анализ и настройки выполнения задачи.
     transcript_id = peewee.TextField(default=None, null=True)
@@ -640,6 +738,183 @@ class Task(BaseModel):
         return result
 
 
+class BalanceHold(BaseModel):
+    """
+    Резерв баланса компании на время обработки звонка.
+
+    Пока резерв активен (held), он уменьшает доступный баланс компании.
+    По завершении обработки резерв либо списывается (capture), либо снимается (release).
+    Резерв старше BALANCE_HOLD_TTL_HOURS считается зависшим (expired) и перестает уменьшать доступный баланс,
+    но если обработка звонка все же завершится, он списывается.
+    """
+    class Status(str, Enum):
+        HELD = 'held'
+        CAPTURED = 'captured'
+        RELEASED = 'released'
+        EXPIRED = 'expired'
+
+    class Meta:
+        indexes = (
+            (('company', 'status'), False),
+        )
+
+    created = peewee.DateTimeField(default=datetime.now)
+    closed = peewee.DateTimeField(default=None, null=True, verbose_name='Дата списания или снятия резерва')
+    company = peewee.ForeignKeyField(Company, backref='balance_holds')
+    # Без внешнего ключа: таблица Task может быть партиционирована (см. data/partitions.py).
+    task_id = peewee.BigIntegerField(default=None, null=True, index=True)
+    seconds = peewee.IntegerField()
+    status = peewee.CharField(default=Status.HELD.value,
+                              choices=[(x.value, x.value) for x in Status])
+
+    @classmethod
+    def place(cls, company: Company, seconds: int, task: Optional['Task'] = None) -> Optional['BalanceHold']:
+        """
+        Резервирует seconds, если их хватает на доступном балансе компании. Иначе возвращает None.
+        Проверка и резерв выполняются под блокировкой строки компании: параллельные звонки
+        не могут вместе зарезервировать больше доступного баланса.
+        """
+        with main_db.atomic():
+            Company.select(Company.id).where(Company.id == company.id).for_update().get()
+            available_balance = company.get_available_balance()
+            if available_balance < seconds:
+                logger.info(f'[-] Недостаточно баланса для резерва. Доступный баланс: {available_balance} сек. '
+                            f'Необходимо: {seconds} сек. company.id = {company.id}.')
+                return None
+            hold = cls.create(
+                company=company,
+                task_id=task.id if task else None,
+                seconds=Company.round_balance_change(seconds),
+            )
+        logger.info(f'Зарезервировал {hold.seconds} секунд компании ID: {company.id}. Резерв: {hold.id}.')
+        return hold
+
+    def _close(self, status: 'BalanceHold.Status', from_statuses: Iterable['BalanceHold.Status']) -> bool:
+        """
+        Закрывает резерв, если он в одном из статусов from_statuses. Возвращает False, если резерв уже был закрыт.
+        """
+        updated = (
+            BalanceHold
+            .update(status=status, closed=datetime.now())
+            .where(BalanceHold.id == self.id,
+                   BalanceHold.status.in_(list(from_statuses)))
+            .execute()
+        )
+        if updated:
+            self.status = status
+        return bool(updated)
+
+    def capture(self, seconds: Optional[int] = None) -> Optional['BalanceEntry']:
+        """
+        Списывает резерв. Можно списать сумму, отличную от зарезервированной (например, фактическую длительность).
+        Зависший резерв (обработка шла дольше BALANCE_HOLD_TTL_HOURS) тоже списывается: звонок обработан.
+        """
+        seconds = self.seconds if seconds is None else Company.round_balance_change(seconds)
+        with main_db.atomic():
+            if not self._close(BalanceHold.Status.CAPTURED,
+                               (BalanceHold.Status.HELD, BalanceHold.Status.EXPIRED)):
+                logger.warning(f'Резерв {self.id} уже закрыт. Повторное списание пропущено.')
+                return None
+            entry = BalanceEntry.charge(self.company_id, seconds, task_id=self.task_id, hold=self)
+        return entry
+
+    def release(self) -> bool:
+        released = self._close(BalanceHold.Status.RELEASED,
+                               (BalanceHold.Status.HELD, BalanceHold.Status.EXPIRED))
+        if released:
+            logger.info(f'Снял резерв {self.id} ({self.seconds} секунд) компании ID: {self.company_id}.')
+        return released
+
+    @classmethod
+    def release_expired(cls, max_age: timedelta) -> int:
+        """
+        Помечает зависшие резервы (например, если процесс обработки звонка был прерван) как expired:
+        они больше не уменьшают доступный баланс, но могут быть списаны, если обработка завершится.
+        """
+        released = (
+            cls
+            .update(status=cls.Status.EXPIRED)
+            .where(cls.status == cls.Status.HELD,
+                   cls.created < datetime.now() - max_age)
+            .execute()
+        )
+        if released:
+            logger.warning(f'Сняты зависшие резервы баланса: {released} шт.')
+        return released
+
+
+class BalanceEntry(BaseModel):
+    """
+    Запись журнала изменений баланса компании. Записи только добавляются.
+
+    Company.seconds_balance – материализованный баланс, в котором учтены записи с compacted=True.
+    Списания за звонки добавляются без блокировки строки компании (compacted=False)
+    и периодически переносятся в seconds_balance методом compact().
+    """
+    class Kind(str, Enum):
+        # Пополнения, переводы и ручные изменения (Company.add_balance).
+        ADJUSTMENT = 'adjustment'
+        # Списание за обработку звонка.
+        CHARGE = 'charge'
+
+    class Meta:
+        indexes = (
+            (('company', 'compacted'), False),
+        )
+
+    created = peewee.DateTimeField(default=datetime.now)
+    company = peewee.ForeignKeyField(Company, backref='balance_entries')
+    seconds = peewee.IntegerField(verbose_name='Изменение баланса (секунды, со знаком)')
+    kind = peewee.CharField(choices=[(x.value, x.value) for x in Kind])
+    # Без внешнего ключа: таблица Task может быть партиционирована (см. data/partitions.py).
+    task_id = peewee.BigIntegerField(default=None, null=True, index=True)
+    hold = peewee.ForeignKeyField(BalanceHold, default=None, null=True)
+    transaction = peewee.ForeignKeyField(Transaction, default=None, null=True)
+    compacted = peewee.BooleanField(default=False, verbose_name='Учтена в Company.seconds_balance')
+
+    @classmethod
+    def charge(
+            cls,
+            company_id: int,
+            seconds: int,
+            task_id: Optional[int] = None,
+            hold: Optional[BalanceHold] = None,
+    ) -> 'BalanceEntry':
+        """
+        Списание за обработку звонка. Строка компании не блокируется.
+        """
+        seconds = Company.round_balance_change(abs(seconds))
+        entry = cls.create(
+            company=company_id,
+            seconds=-seconds,
+            kind=cls.Kind.CHARGE,
+            task_id=task_id,
+            hold=hold,
+        )
+        logger.info(f'Списал {seconds} секунд компании ID: {company_id}. Task: {task_id}.')
+        return entry
+
+    @classmethod
+    def compact(cls) -> int:
+        """
+        Переносит неучтенные записи журнала в Company.seconds_balance.
+        Записи помечаются учтенными и суммируются одним запросом, поэтому
+        запись, добавленная во время компакции, не может быть потеряна или учтена дважды.
+        Возвращает количество компаний, баланс которых изменился.
+        """
+        cursor = main_db.execute_sql(
+            f'WITH moved AS ('
+            f'  UPDATE "{cls._meta.table_name}" SET compacted = TRUE'
+            f'  WHERE compacted = FALSE'
+            f'  RETURNING company_id, seconds'
+            f') '
+            f'UPDATE "{Company._meta.table_name}" AS c SET seconds_balance = c.seconds_balance + m.total '
+            f'FROM (SELECT company_id, SUM(seconds) AS total FROM moved GROUP BY company_id) AS m '
+            f'WHERE c.id = m.company_id'
+        )
+        return cursor.rowcount
+
+
 class ModeQuestionType(str, Enum):
     """
     Типы данных ответов, полученных от нейронки.
@@ -765,10 +1040,36 @@ class ModeAnswer(BaseModel):
     Ответ нейронной сети на вопрос.
     В рамках одного промпта может быть получено несколько ответов за запрос.
     """
-    task = peewee.ForeignKeyField(Task)
+    class Meta:
+        indexes = (
+            # Ответы на вопрос по списку задач (графики).
+            (('question', 'task'), False),
+        )
+
+    # Ключ партиционирования таблицы (см. data/partitions.py).
+    created = peewee.DateTimeField(default=datetime.now)
+    task = UnconstrainedForeignKeyField(Task)
     question = peewee.ForeignKeyField(ModeQuestion)
     answer_text = peewee.TextField(null=True)
 
+    @staticmethod
+    def get_integer_value_expression(
+            answer_text: Optional[peewee.Node] = None,
+            default: Optional[int] = 0,
+    ) -> peewee.Node:
+        """
+        SQL-выражение: числовое значение ответа ("85%" -> 85). Нечисловые ответы считаются равными default.
+        answer_text – поле текста ответа (например, у псевдонима таблицы), по умолчанию ModeAnswer.answer_text.
+        """
+        if answer_text is None:
+            answer_text = ModeAnswer.answer_text
+        answer_number = peewee.fn.BTRIM(peewee.fn.REPLACE(answer_text, '%', ''))
+        return peewee.Case(
+            None,
+            ((answer_number.regexp(r'^[+-]?[0-9]{1,18}$'), answer_number.cast('bigint')),),
+            default,
+        )
+
 
 class UserMode(BaseModel):
     user = peewee.ForeignKeyField(User, backref='modes', default=None, null=True)
@@ -878,13 +1179,14 @@ class GSpreadTask(BaseModel):
     Содержимое ячеек для записи – в поле `values_to_upload`.
     """
     created = peewee.DateTimeField(default=datetime.now, verbose_name='Дата создания')
-    task = peewee.ForeignKeyField(Task, null=True, verbose_name='Задача')
+    task = UnconstrainedForeignKeyField(Task, null=True, verbose_name='Задача')
     mode = peewee.ForeignKeyField(Mode, null=True, verbose_name='Режим')
     values_to_upload = peewee.TextField(verbose_name='Значения ячеек для выгрузки')
 
     retry_count = peewee.IntegerField(default=0, verbose_name='Количество попыток')
     last_attempt = peewee.DateTimeField(default=None, null=True, verbose_name='Время последней попытки')
     uploaded = peewee.DateTimeField(default=None, null=True, verbose_name='Дата успешной выгрузки')
+    last_error = peewee.TextField(default=None, null=True, verbose_name='Ошибка последней попытки')
 
 
 class TableViewSettings(BaseModel):
@@ -971,6 +1273,8 @@ class ColumnFilter:
     FILTER_OPERATIONS[ModeQuestionType.PERCENT] = deepcopy(FILTER_OPERATIONS[ModeQuestionType.INTEGER])
     # Операции для списка строк те же, что и для строки.
     FILTER_OPERATIONS[ModeQuestionType.LIST_OF_VALUES] = deepcopy(FILTER_OPERATIONS[ModeQuestionType.STRING])
+    # Операции, результат которых зависит от текущей даты.
+    RELATIVE_OPERATIONS = {'last_x_days'}
 
     @staticmethod
     def build(
@@ -1036,6 +1340,10 @@ class ColumnFilter:
                 values_list = json.loads(value)
             except JSONDecodeError:
                 values_list = [value]
+            if not isinstance(values_list, list):
+                values_list = [value]
+            if not values_list:
+                raise ValueError('Пустой список значений фильтра')
 
             if operation == 'contains_one_of':
                 return reduce(or_, [(field == v) for v in values_list])
@@ -1141,6 +1449,225 @@ class ChartFilter(BaseModel):
         return super().save(*args, **kwargs)
 
 
+class ChartRollup(BaseModel):
+    """
+    Почасовые агрегаты ответов на вопрос отчета для графиков (см. data/rollups.py).
+    Учитываются только завершенные задачи (Task.status == DONE), час – по Task.created.
+    """
+    class Meta:
+        table_name = 'chart_rollup'
+        indexes = (
+            (('report', 'question', 'hour'), True),
+        )
+
+    report = peewee.ForeignKeyField(Report, on_delete='CASCADE')
+    question = peewee.ForeignKeyField(ModeQuestion, on_delete='CASCADE')
+    hour = peewee.DateTimeField()
+    answers_count = peewee.IntegerField()
+    # Агрегаты числового значения ответа (ModeAnswer.get_integer_value_expression).
+    value_sum = peewee.BigIntegerField()
+    value_min = peewee.BigIntegerField()
+    value_max = peewee.BigIntegerField()
+
+
+class ChartRollupChoice(BaseModel):
+    """
+    Почасовое количество ответов каждого варианта для вопросов с типом MULTIPLE_CHOICE.
+    """
+    class Meta:
+        table_name = 'chart_rollup_choice'
+        indexes = (
+            (('report', 'question', 'hour', 'choice'), True),
+        )
+
+    report = peewee.ForeignKeyField(Report, on_delete='CASCADE')
+    question = peewee.ForeignKeyField(ModeQuestion, on_delete='CASCADE')
+    hour = peewee.DateTimeField()
+    # Вариант ответа в нижнем регистре.
+    choice = peewee.TextField()
+    answers_count = peewee.IntegerField()
+
+
+class ReportVersion(BaseModel):
+    """
+    Версия данных отчета для кэша графиков ЛК (helpers/chart_cache.py).
+    version увеличивается при любом изменении: завершении задачи, изменении ответов, графиков, их параметров,
+    фильтров и вопросов отчета. settings_version – только при изменении настроек и пересчете агрегатов:
+    данные прошедших диапазонов зависят от нее и от версий дней диапазона (ReportDayVersion).
+    """
+    class Meta:
+        table_name = 'report_version'
+
+    report = peewee.ForeignKeyField(Report, primary_key=True, on_delete='CASCADE')
+    version = peewee.BigIntegerField(default=1)
+    settings_version = peewee.BigIntegerField(default=1)
+
+    @classmethod
+    def bump(cls, report_id: int) -> None:
+        """
+        Изменение настроек графиков или пересчет агрегатов: устаревают данные всех диапазонов.
+        """
+        (cls
+         .insert(report=report_id, version=1, settings_version=1)
+         .on_conflict(conflict_target=[cls.report],
+                      update={cls.version: cls.version + 1, cls.settings_version: cls.settings_version + 1})
+         .execute())
+
+    @classmethod
+    def bump_data(cls, report_id: int, day: date) -> None:
+        """
+        Новые или измененные ответы задач отчета, созданных в день day.
+        Данные прошедших диапазонов устаревают, только если в них входит day.
+        """
+        with main_db.atomic():
+            (cls
+             .insert(report=report_id, version=1)
+             .on_conflict(conflict_target=[cls.report], update={cls.version: cls.version + 1})
+             .execute())
+            if day < date.today():
+                ReportDayVersion.bump(report_id, day)
+
+    @classmethod
+    def get_version(cls, report_id: int) -> int:
+        return cls.select(cls.version).where(cls.report == report_id).scalar() or 0
+
+    @classmethod
+    def get_range_version(cls, report_id: int, from_date: date, to_date: date) -> str:
+        """
+        Версия данных прошедшего диапазона: версия настроек и сумма версий дней диапазона.
+        """
+        settings_version = cls.select(cls.settings_version).where(cls.report == report_id).scalar() or 0
+        days_version = (
+            ReportDayVersion
+            .select(peewee.fn.SUM(ReportDayVersion.version))
+            .where(ReportDayVersion.report == report_id,
+                   ReportDayVersion.day.between(from_date, to_date))
+            .scalar()
+        ) or 0
+        return f'{settings_version}.{days_version}'
+
+
+class ReportDayVersion(BaseModel):
+    """
+    Версия данных отчета за день (по дате создания задач). Увеличивается при изменении ответов задач прошедшего дня.
+    """
+    class Meta:
+        table_name = 'report_day_version'
+        primary_key = peewee.CompositeKey('report', 'day')
+
+    report = peewee.ForeignKeyField(Report, on_delete='CASCADE')
+    day = peewee.DateField()
+    version = peewee.BigIntegerField(default=1)
+
+    @classmethod
+    def bump(cls, report_id: int, day: date) -> None:
+        (cls
+         .insert(report=report_id, day=day, version=1)
+         .on_conflict(conflict_target=[cls.report, cls.day], update={cls.version: cls.version + 1})
+         .execute())
+
+
+class CallTableState(BaseModel):
+    """
+    Состояние таблицы звонков отчета (data/call_tables.py): набор колонок, с которым она построена.
+    """
+    class Meta:
+        table_name = 'call_table_state'
+
+    report = peewee.ForeignKeyField(Report, primary_key=True, on_delete='CASCADE')
+    # JSON-список [ID вопроса, тип ответа] активных вопросов отчета на момент построения.
+    columns_signature = peewee.TextField()
+    built = peewee.DateTimeField(default=datetime.now)
+
+
+class TaskSearchDocument(BaseModel):
+    """
+    Поисковый документ завершенной задачи (см. data/search.py): текст транскрипта и ответов
+    и их tsvector с GIN-индексом.
+    """
+    class Meta:
+        table_name = 'task_search_document'
+        indexes = (
+            (('report', 'created'), False),
+        )
+
+    # Внешний ключ на партиционированную таблицу Task невозможен (см. data/partitions.py).
+    task_id = peewee.BigIntegerField(primary_key=True)
+    report = peewee.ForeignKeyField(Report, on_delete='CASCADE')
+    # Дата создания задачи (для фильтра по периоду и отсечения партиций Task).
+    created = peewee.DateTimeField()
+    transcript = peewee.TextField(null=True)
+    answers = peewee.TextField(null=True)
+    # Ответы (вес A) и транскрипт (вес B).
+    document = TSVectorField()
+    indexed = peewee.DateTimeField(default=datetime.now)
+
+
+class ReportExport(BaseModel):
+    """
+    Фоновая выгрузка звонков отчета в файл в S3 (см. modules/report_export.py).
+    """
+    class StatusChoices:
+        IN_PROGRESS = 'in_progress'
+        DONE = 'done'
+        ERROR = 'error'
+        choices = (
+            (IN_PROGRESS, IN_PROGRESS),
+            (DONE, DONE),
+            (ERROR, ERROR),
+        )
+
+    class Meta:
+        table_name = 'report_export'
+
+    report = peewee.ForeignKeyField(Report, on_delete='CASCADE')
+    user = peewee.ForeignKeyField(User, null=True, on_delete='SET NULL')
+    created = peewee.DateTimeField(default=datetime.now)
+    finished = peewee.DateTimeField(null=True)
+    file_format = peewee.CharField()
+    status = peewee.TextField(choices=StatusChoices.choices, default=StatusChoices.IN_PROGRESS)
+    rows_count = peewee.IntegerField(null=True)
+    # Ключ файла в бакете EXPORTS_S3_BUCKET.
+    file_key = peewee.TextField(null=True)
+    error_details = peewee.TextField(null=True)
+
+
+class LeadSyncState(BaseModel):
+    """
+    Состояние выгрузки лидов (пользователей бота) в Гугл Таблицу (integrations/gs_api/syncer.py):
+    пользователи с ID не больше last_user_id уже выгружены.
+    """
+    class Meta:
+        table_name = 'lead_sync_state'
+
+    sheet_id = peewee.CharField(primary_key=True)
+    last_user_id = peewee.BigIntegerField(default=0)
+    synced = peewee.DateTimeField(default=datetime.now)
+
+
+class DeferredJob(BaseModel):
+    """
+    Задача, отложенная до run_after (см. helpers/deferred_jobs.py).
+    Например, обработка вебхука CRM после задержки, за которую CRM привязывает звонок к сделке.
+    Успешно выполненные задачи удаляются, у завершившихся ошибкой или прерванных заполнены finished и last_error.
+    Задача запускается только один раз.
+    """
+    class Meta:
+        table_name = 'deferred_job'
+
+    created = peewee.DateTimeField(default=datetime.now)
+    run_after = peewee.DateTimeField(index=True, verbose_name='Не раньше')
+    handler = peewee.CharField(verbose_name='Обработчик')
+    # Именованные аргументы обработчика (JSON).
+    payload = peewee.TextField()
+    context_id = peewee.CharField(null=True)
+    started = peewee.DateTimeField(null=True, verbose_name='Время запуска')
+    # Последняя отметка процесса, выполняющего задачу.
+    heartbeat = peewee.DateTimeField(null=True)
+    finished = peewee.DateTimeField(null=True)
+    last_error = peewee.TextField(null=True)
+
+
 class IntegrationServiceName(str, Enum):
     """
     Названия типов интеграций.
@@ -1169,6 +1696,7 @@ ALL_MODELS = [
     Report,
     ActiveTelegramReport,
     RequestLog,
+    RequestLogLine,
     Task,
     ModeQuestion,
     ModeAnswer,
@@ -1180,6 +1708,8 @@ ALL_MODELS = [
     CallDownload,
     CallDownloadAMO,
     Transaction,
+    BalanceHold,
+    BalanceEntry,
     VPBXCall,
     GSpreadTask,
     TableViewSettings,
@@ -1188,6 +1718,15 @@ ALL_MODELS = [
     Chart,
     ChartParameter,
     ChartFilter,
+    ChartRollup,
+    ChartRollupChoice,
+    ReportVersion,
+    ReportDayVersion,
+    CallTableState,
+    TaskSearchDocument,
+    ReportExport,
+    LeadSyncState,
+    DeferredJob,
 ]
 
 
@@ -0,0 +1,318 @@
+"""
+Партиционирование больших таблиц по месяцам и архивация старых партиций.
+
+Таблицы Task, ModeAnswer, RequestLog и RequestLogLine растут без ограничений, поэтому они разбиваются
+на месячные партиции (PARTITION BY RANGE) по дате создания записи:
+
+1. convert_to_partitioned() – разовая миграция существующей таблицы. Старая таблица целиком
+   становится первой партицией (без копирования данных), новые записи попадают в месячные партиции.
+2. ensure_partitions() – заранее создает партиции на текущий и следующие месяцы.
+3. archive_old_partitions() – отсоединяет партиции старше срока хранения (PARTITIONS_RETENTION_MONTHS),
+   выгружает их в csv.gz (и в S3, если настроено) и удаляет из БД.
+
+Ограничение PostgreSQL: первичный ключ партиционированной таблицы должен включать ключ партиционирования,
+поэтому внешние ключи, ссылающиеся на партиционированную таблицу, при миграции удаляются.
+Ссылочная целостность для них поддерживается приложением, а в моделях такие поля объявлены
+как UnconstrainedForeignKeyField, чтобы create_table не создавал ограничения.
+Индексы модели (в том числе составные Meta.indexes) создаются на родительской таблице
+и наследуются всеми партициями (create_partition_indexes).
+"""
+import gzip
+import os
+import re
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+
+import boto3
+import peewee
+from loguru import logger
+
+from config import config as cfg
+from data.models import main_db, Task, ModeAnswer, RequestLog, RequestLogLine
+
+
+# Партиционируемые модели и поле, по которому делается разбиение.
+PARTITIONED_MODELS = {
+    Task: Task.created,
+    ModeAnswer: ModeAnswer.created,
+    RequestLog: RequestLog.timestamp,
+    RequestLogLine: RequestLogLine.created,
+}
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    """
+    Первое число месяца, отстоящего от value на months месяцев.
+    """
+    month_index = value.year * 12 + (value.month - 1) + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(model: type[peewee.Model], month: date) -> str:
+    return f'{model._meta.table_name}_p{month.year}_{month.month:02d}'
+
+
+def is_partitioned(model: type[peewee.Model]) -> bool:
+    cursor = main_db.execute_sql(
+        'SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)',
+        (model._meta.table_name,),
+    )
+    row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def create_month_partition(model: type[peewee.Model], month: date) -> str:
+    """
+    Создает партицию таблицы модели на месяц month, если ее еще нет.
+    """
+    table_name = model._meta.table_name
+    name = partition_name(model, month)
+    main_db.execute_sql(
+        f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table_name}" '
+        f'FOR VALUES FROM (%s) TO (%s)',
+        (month.isoformat(), add_months(month, 1).isoformat()),
+    )
+    return name
+
+
+def ensure_partitions(months_ahead: int = cfg.PARTITIONS_MONTHS_AHEAD) -> None:
+    """
+    Создает партиции на текущий месяц и months_ahead месяцев вперед
+    для всех уже партиционированных таблиц.
+    """
+    current_month = month_start(datetime.now().date())
+
+    for model in PARTITIONED_MODELS:
+        if not is_partitioned(model):
+            logger.warning(f'Таблица {model._meta.table_name} не партиционирована. Пропускаем.')
+            continue
+        for i in range(months_ahead + 1):
+            create_month_partition(model, add_months(current_month, i))
+
+    logger.info(f'Партиции созданы на {months_ahead} мес. вперед.')
+
+
+def add_mode_answer_created_column() -> None:
+    """
+    Миграция: добавляет ModeAnswer.created (ключ партиционирования).
+    Для существующих ответов дата заполняется датой создания задачи.
+    """
+    table_name = ModeAnswer._meta.table_name
+    columns = [x.name for x in main_db.get_columns(table_name)]
+    if 'created' in columns:
+        return
+
+    logger.info(f'Добавляем колонку created в таблицу {table_name}.')
+    with main_db.atomic():
+        main_db.execute_sql(f'ALTER TABLE "{table_name}" ADD COLUMN created TIMESTAMP')
+        main_db.execute_sql(
+            f'UPDATE "{table_name}" AS ma SET created = t.created '
+            f'FROM "{Task._meta.table_name}" AS t WHERE t.id = ma.task_id'
+        )
+        main_db.execute_sql(f'UPDATE "{table_name}" SET created = NOW() WHERE created IS NULL')
+        main_db.execute_sql(f'ALTER TABLE "{table_name}" ALTER COLUMN created SET DEFAULT NOW(), '
+                            f'ALTER COLUMN created SET NOT NULL')
+
+
+def get_partition_indexes(model: type[peewee.Model]) -> List[Tuple[str, List[str], bool]]:
+    """
+    Индексы партиционированной таблицы модели: (имя, колонки, уникальный).
+    Ключ партиционирования, внешние ключи, поля с index/unique и составные индексы Meta.indexes.
+
+    Уникальный индекс партиционированной таблицы должен включать ключ партиционирования.
+    Уникальность без него БД обеспечить не может: такой индекс создается неуникальным.
+    """
+    table_name = model._meta.table_name
+    partition_column = PARTITIONED_MODELS[model].column_name
+
+    definitions = [([partition_column], False)]
+    for field in model._meta.sorted_fields:
+        if field.primary_key:
+            continue
+        if isinstance(field, peewee.ForeignKeyField) or field.index or field.unique:
+            definitions.append(([field.column_name], field.unique))
+    for field_names, unique in model._meta.indexes:
+        definitions.append(([model._meta.fields[x].column_name for x in field_names], unique))
+
+    indexes = []
+    for columns, unique in definitions:
+        if unique and partition_column not in columns:
+            logger.warning(f'Уникальный индекс {table_name} ({", ".join(columns)}) не включает ключ '
+                           f'партиционирования {partition_column}: создается неуникальным.')
+            unique = False
+        name = f'{table_name}_{"_".join(columns)}_part'
+        if name not in [x[0] for x in indexes]:
+            indexes.append((name, columns, unique))
+    return indexes
+
+
+def create_partition_indexes(model: type[peewee.Model]) -> None:
+    """
+    Создает недостающие индексы на родительской партиционированной таблице.
+    PostgreSQL создает их и на всех партициях, в том числе созданных позже.
+    """
+    table_name = model._meta.table_name
+    for name, columns, unique in get_partition_indexes(model):
+        main_db.execute_sql(f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS "{name}" '
+                            f'ON "{table_name}" ({", ".join(columns)})')
+
+
+def convert_to_partitioned(
+        model: type[peewee.Model],
+        months_ahead: int = cfg.PARTITIONS_MONTHS_AHEAD,
+) -> None:
+    """
+    Миграция: превращает обычную таблицу модели в партиционированную по месяцам.
+
+    Данные не копируются: существующая таблица переименовывается в {table}_legacy
+    и подключается как партиция на диапазон (MINVALUE; начало текущего месяца).
+    Партиция {table}_legacy архивируется целиком, когда весь ее диапазон выйдет за срок хранения.
+    """
+    table_name = model._meta.table_name
+    legacy_name = f'{table_name}_legacy'
+    field = PARTITIONED_MODELS[model]
+    column = field.column_name
+    boundary = month_start(datetime.now().date())
+
+    if is_partitioned(model):
+        logger.info(f'Таблица {table_name} уже партиционирована.')
+        return
+
+    logger.info(f'Партиционируем таблицу {table_name} по полю {column}.')
+
+    with main_db.atomic():
+        main_db.execute_sql(f'ALTER TABLE "{table_name}" RENAME TO "{legacy_name}"')
+
+        # Внешние ключи, ссылающиеся на таблицу, несовместимы с составным первичным ключом.
+        cursor = main_db.execute_sql(
+            "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+            "WHERE contype = 'f' AND confrelid = %s::regclass",
+            (legacy_name,),
+        )
+        for referencing_table, constraint_name in cursor.fetchall():
+            logger.info(f'Удаляем внешний ключ {constraint_name} таблицы {referencing_table}.')
+            main_db.execute_sql(f'ALTER TABLE {referencing_table} DROP CONSTRAINT "{constraint_name}"')
+
+        # Родительская таблица с той же структурой. Значение id по-прежнему берется из старой последовательности.
+        main_db.execute_sql(
+            f'CREATE TABLE "{table_name}" (LIKE "{legacy_name}" INCLUDING DEFAULTS INCLUDING STORAGE) '
+            f'PARTITION BY RANGE ({column})'
+        )
+        main_db.execute_sql(f'ALTER TABLE "{table_name}" ADD PRIMARY KEY (id, {column})')
+
+        # Последовательность должна пережить удаление старой партиции.
+        cursor = main_db.execute_sql('SELECT pg_get_serial_sequence(%s, %s)', (legacy_name, 'id'))
+        sequence_name = cursor.fetchone()[0]
+        if sequence_name:
+            main_db.execute_sql(f'ALTER SEQUENCE {sequence_name} OWNED BY "{table_name}".id')
+
+        # LIKE не копирует индексы: создаем индексы модели на родительской таблице.
+        create_partition_indexes(model)
+
+        # С проверенным CHECK-ограничением ATTACH PARTITION не сканирует таблицу повторно.
+        check_name = f'{legacy_name}_bound'
+        main_db.execute_sql(
+            f'ALTER TABLE "{legacy_name}" ADD CONSTRAINT "{check_name}" '
+            f'CHECK ({column} IS NOT NULL AND {column} < %s)',
+            (boundary.isoformat(),),
+        )
+        main_db.execute_sql(
+            f'ALTER TABLE "{table_name}" ATTACH PARTITION "{legacy_name}" '
+            f'FOR VALUES FROM (MINVALUE) TO (%s)',
+            (boundary.isoformat(),),
+        )
+        main_db.execute_sql(f'ALTER TABLE "{legacy_name}" DROP CONSTRAINT "{check_name}"')
+
+        for i in range(months_ahead + 1):
+            create_month_partition(model, add_months(boundary, i))
+
+    logger.info(f'Таблица {table_name} партиционирована. Граница старых данных: {boundary}.')
+
+
+def convert_all_to_partitioned() -> None:
+    add_mode_answer_created_column()
+    for model in PARTITIONED_MODELS:
+        convert_to_partitioned(model)
+        # Таблицы, партиционированные раньше, получают индексы, которых тогда не создавали.
+        create_partition_indexes(model)
+
+
+def get_partitions(model: type[peewee.Model]) -> List[Tuple[str, Optional[datetime]]]:
+    """
+    Возвращает партиции таблицы модели и верхнюю границу диапазона каждой из них.
+    """
+    cursor = main_db.execute_sql(
+        'SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) '
+        'FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+        'WHERE i.inhparent = to_regclass(%s)',
+        (model._meta.table_name,),
+    )
+
+    partitions = []
+    for name, bound_expr in cursor.fetchall():
+        # Пример: FOR VALUES FROM ('2024-05-01 00:00:00') TO ('2024-06-01 00:00:00')
+        match = re.search(r"TO \('([^']+)'\)", bound_expr or '')
+        upper_bound = datetime.fromisoformat(match.group(1)) if match else None
+        partitions.append((name, upper_bound))
+
+    return partitions
+
+
+def upload_archive_to_s3(path: str) -> None:
+    s3 = boto3.client('s3', endpoint_url=cfg.PARTITIONS_ARCHIVE_S3_ENDPOINT)
+    key = f'partitions/{os.path.basename(path)}'
+    s3.upload_file(path, cfg.PARTITIONS_ARCHIVE_S3_BUCKET, key)
+    logger.info(f'Архив {path} загружен в S3: {cfg.PARTITIONS_ARCHIVE_S3_BUCKET}/{key}.')
+
+
+def archive_partition(model: type[peewee.Model], name: str) -> str:
+    """
+    Отсоединяет партицию, выгружает ее содержимое в csv.gz и удаляет из БД.
+    Возвращает путь к файлу архива.
+    """
+    os.makedirs(cfg.PARTITIONS_ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(cfg.PARTITIONS_ARCHIVE_DIR, f'{name}.csv.gz')
+
+    # Сначала сохраняем данные, и только потом удаляем партицию из БД.
+    cursor = main_db.cursor()
+    with gzip.open(path, 'wb') as archive_file:
+        cursor.copy_expert(f'COPY "{name}" TO STDOUT WITH (FORMAT csv, HEADER)', archive_file)
+
+    if cfg.PARTITIONS_ARCHIVE_S3_BUCKET:
+        upload_archive_to_s3(path)
+
+    with main_db.atomic():
+        main_db.execute_sql(f'ALTER TABLE "{model._meta.table_name}" DETACH PARTITION "{name}"')
+        main_db.execute_sql(f'DROP TABLE "{name}"')
+    logger.info(f'Партиция {name} заархивирована в {path} и удалена из БД.')
+
+    return path
+
+
+def archive_old_partitions(now: Optional[datetime] = None) -> List[str]:
+    """
+    Архивирует партиции, все записи которых старше срока хранения своей таблицы.
+    """
+    now = now or datetime.now()
+    archived = []
+
+    for model in PARTITIONED_MODELS:
+        table_name = model._meta.table_name
+        retention_months = cfg.PARTITIONS_RETENTION_MONTHS.get(table_name, 0)
+        if not retention_months or not is_partitioned(model):
+            continue
+
+        cutoff = datetime.combine(add_months(month_start(now.date()), -retention_months), datetime.min.time())
+        for name, upper_bound in get_partitions(model):
+            if upper_bound is None or upper_bound > cutoff:
+                continue
+            try:
+                archived.append(archive_partition(model, name))
+            except Exception as ex:
+                logger.error(f'Не удалось заархивировать партицию {name}: {type(ex)} {ex}')
+
+    return archived
@@ -0,0 +1,162 @@
+"""
+Почасовые агрегаты ответов для графиков ЛК (ChartRollup, ChartRollupChoice).
+
+Агрегаты часа пересчитываются целиком по исходным ответам, поэтому пересчет
+можно безопасно повторять: при завершении задачи (finish_task) пересчитывается час
+ее создания, а rebuild_rollups() заполняет агрегаты за весь период (первичное заполнение,
+изменение типа вопроса, исправление расхождений).
+"""
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from loguru import logger
+from peewee import fn
+
+from data.models import main_db, Task, ModeAnswer, ModeQuestion, ModeQuestionType, Report, ChartRollup, \
+    ChartRollupChoice, ReportVersion
+
+
+# Пространство имен advisory-блокировок пересчета агрегатов (второй ключ – ID отчета).
+ROLLUP_LOCK_NAMESPACE = 3201
+
+
+def hour_start(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def refresh_rollups(
+        report_id: int,
+        from_hour: datetime,
+        to_hour: datetime,
+        question_ids: Optional[Iterable[int]] = None,
+) -> None:
+    """
+    Пересчитывает агрегаты отчета за часы [from_hour; to_hour).
+    Если переданы question_ids, то пересчитываются только эти вопросы.
+    """
+    question_ids = list(question_ids) if question_ids is not None else None
+    hour_expression = fn.DATE_TRUNC('hour', Task.created)
+    answer_value = ModeAnswer.get_integer_value_expression()
+
+    def select_answers(*fields):
+        query = (
+            ModeAnswer
+            .select(*fields)
+            .join(Task, on=(ModeAnswer.task == Task.id))
+            .where(
+                Task.report == report_id,
+                Task.status == Task.StatusChoices.DONE,
+                Task.created >= from_hour,
+                Task.created < to_hour,
+                # Ответ не может быть создан раньше задачи: отсекаем старые партиции.
+                ModeAnswer.created >= from_hour,
+            )
+        )
+        if question_ids is not None:
+            query = query.where(ModeAnswer.question.in_(question_ids))
+        return query
+
+    totals = (
+        select_answers(
+            Task.report,
+            ModeAnswer.question,
+            hour_expression,
+            fn.COUNT(ModeAnswer.id),
+            fn.SUM(answer_value),
+            fn.MIN(answer_value),
+            fn.MAX(answer_value),
+        )
+        .group_by(Task.report, ModeAnswer.question, hour_expression)
+    )
+    choices = (
+        select_answers(
+            Task.report,
+            ModeAnswer.question,
+            hour_expression,
+            fn.LOWER(ModeAnswer.answer_text),
+            fn.COUNT(ModeAnswer.id),
+        )
+        .switch(ModeAnswer)
+        .join(ModeQuestion, on=(ModeAnswer.question == ModeQuestion.id))
+        .where(
+            ModeQuestion.answer_type == ModeQuestionType.MULTIPLE_CHOICE,
+            ModeAnswer.answer_text.is_null(False),
+        )
+        .group_by(Task.report, ModeAnswer.question, hour_expression, fn.LOWER(ModeAnswer.answer_text))
+    )
+
+    with main_db.atomic():
+        # Пересчеты одного отчета выполняются по очереди.
+        main_db.execute_sql('SELECT pg_advisory_xact_lock(%s, %s)', (ROLLUP_LOCK_NAMESPACE, report_id))
+
+        for model in (ChartRollup, ChartRollupChoice):
+            query = model.delete().where(model.report == report_id,
+                                         model.hour >= from_hour,
+                                         model.hour < to_hour)
+            if question_ids is not None:
+                query = query.where(model.question.in_(question_ids))
+            query.execute()
+
+        ChartRollup.insert_from(totals, [
+            ChartRollup.report,
+            ChartRollup.question,
+            ChartRollup.hour,
+            ChartRollup.answers_count,
+            ChartRollup.value_sum,
+            ChartRollup.value_min,
+            ChartRollup.value_max,
+        ]).execute()
+        ChartRollupChoice.insert_from(choices, [
+            ChartRollupChoice.report,
+            ChartRollupChoice.question,
+            ChartRollupChoice.hour,
+            ChartRollupChoice.choice,
+            ChartRollupChoice.answers_count,
+        ]).execute()
+
+
+def refresh_task_rollups(task: Task) -> None:
+    """
+    Пересчитывает агрегаты часа, в который была создана задача.
+    """
+    if task.report_id is None:
+        return
+    from_hour = hour_start(task.created)
+    refresh_rollups(task.report_id, from_hour, from_hour + timedelta(hours=1))
+
+
+def rebuild_rollups(
+        report_id: Optional[int] = None,
+        question_ids: Optional[Iterable[int]] = None,
+        chunk_days: int = 7,
+) -> None:
+    """
+    Пересчитывает агрегаты за весь период существования задач отчета (или всех отчетов).
+    Пересчет идет частями по chunk_days дней, чтобы не держать длинные транзакции.
+    """
+    question_ids = list(question_ids) if question_ids is not None else None
+
+    reports = Report.select(Report.id)
+    if report_id is not None:
+        reports = reports.where(Report.id == report_id)
+
+    for report in reports:
+        first_created, last_created = (
+            Task
+            .select(fn.MIN(Task.created), fn.MAX(Task.created))
+            .where(Task.report == report.id)
+            .tuples()
+            .first()
+        )
+        if first_created is None:
+            continue
+
+        from_hour = hour_start(first_created)
+        end_hour = hour_start(last_created) + timedelta(hours=1)
+        while from_hour < end_hour:
+            to_hour = min(from_hour + timedelta(days=chunk_days), end_hour)
+            refresh_rollups(report.id, from_hour, to_hour, question_ids=question_ids)
+            from_hour = to_hour
+
+        ReportVersion.bump(report.id)
+        logger.info(f'Агрегаты графиков отчета {report.id} пересчитаны.')
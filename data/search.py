@@ -0,0 +1,262 @@
+"""
+Полнотекстовый поиск по транскриптам и ответам нейронной сети.
+
+Для каждой завершенной задачи хранится поисковый документ TaskSearchDocument: текст транскрипта
+(Task.data['transcript'], сохраняется при обработке звонка), текстовые ответы на активные вопросы отчета и их tsvector
+(конфигурация cfg.SEARCH_TEXT_CONFIG, по умолчанию russian) с GIN-индексом.
+
+- index_tasks() – (пере)индексация задач: вызывается при завершении задачи и при новом ответе;
+- rebuild_search_index() – первичное заполнение по всем задачам (tools/commands.build_search_index).
+  У задач, обработанных до сохранения транскрипта в Task.data, есть только transcript_id:
+  команда загружает их транскрипты из AssemblyAI и сохраняет в Task.data;
+- search_tasks() – поиск с ранжированием (ts_rank_cd) и подсветкой совпадений (ts_headline).
+"""
+import html
+import json
+from datetime import datetime
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import peewee
+from loguru import logger
+
+from config import config as cfg
+from data.models import main_db, Task, ModeAnswer, ModeQuestion, ModeQuestionType, TaskSearchDocument
+
+
+# Ответы этих типов содержат текст, по которому имеет смысл искать.
+SEARCH_ANSWER_TYPES = [ModeQuestionType.STRING, ModeQuestionType.MULTIPLE_CHOICE, ModeQuestionType.LIST_OF_VALUES]
+
+# ts_headline не экранирует текст, поэтому совпадения отмечаются управляющими символами,
+# а после экранирования HTML заменяются на <mark>.
+HEADLINE_START = '\x02'
+HEADLINE_STOP = '\x03'
+HEADLINE_OPTIONS = f'MaxFragments=3, MaxWords=25, MinWords=8, StartSel={HEADLINE_START}, StopSel={HEADLINE_STOP}'
+
+
+def get_tsquery(query_text: str) -> peewee.Node:
+    """
+    Поисковый запрос в синтаксисе веб-поиска: слова, "точная фраза", -исключение, OR.
+    """
+    return peewee.fn.websearch_to_tsquery(cfg.SEARCH_TEXT_CONFIG, query_text)
+
+
+def get_document_expression(transcript: Optional[str], answers: Optional[str]) -> peewee.Node:
+    """
+    tsvector документа: совпадения в ответах (вес A) ранжируются выше совпадений в транскрипте (вес B).
+    """
+    answers_vector = peewee.fn.setweight(peewee.fn.to_tsvector(cfg.SEARCH_TEXT_CONFIG, answers or ''), 'A')
+    transcript_vector = peewee.fn.setweight(peewee.fn.to_tsvector(cfg.SEARCH_TEXT_CONFIG, transcript or ''), 'B')
+    return answers_vector.concat(transcript_vector)
+
+
+# Загружает текст транскрипта задачи по Task.transcript_id.
+TranscriptLoader = Callable[[Task], Optional[str]]
+
+
+def get_task_transcript(task: Task, load_transcript: Optional[TranscriptLoader] = None) -> Optional[str]:
+    """
+    Текст транскрипта из Task.data. Если его нет, но есть transcript_id, текст загружается через load_transcript
+    и сохраняется в Task.data.
+    """
+    data = task.get_data()
+    transcript = data.get('transcript')
+    if transcript is not None or load_transcript is None or task.transcript_id is None:
+        return transcript
+
+    try:
+        transcript = load_transcript(task)
+    except Exception as ex:
+        logger.warning(f'Не удалось загрузить транскрипт задачи {task.id}: {type(ex)} {ex}')
+        return None
+    if transcript is not None:
+        data['transcript'] = transcript
+        Task.update(data=json.dumps(data)).where(Task.id == task.id, Task.created == task.created).execute()
+    return transcript
+
+
+def index_tasks(task_ids: Iterable[int], load_transcript: Optional[TranscriptLoader] = None) -> int:
+    """
+    Обновляет поисковые документы задач. Документы незавершенных задач удаляются.
+    load_transcript – загрузка транскриптов, которых нет в Task.data (см. get_task_transcript).
+    Возвращает количество проиндексированных задач.
+    """
+    task_ids = list(task_ids)
+    if not task_ids:
+        return 0
+
+    tasks = list(
+        Task
+        .select(Task.id, Task.report, Task.created, Task.data, Task.transcript_id)
+        .where(Task.id.in_(task_ids),
+               Task.status == Task.StatusChoices.DONE,
+               Task.report.is_null(False))
+    )
+
+    answers_by_task = {x.id: [] for x in tasks}
+    if tasks:
+        answers = (
+            ModeAnswer
+            .select(ModeAnswer.task, ModeAnswer.answer_text)
+            .join(ModeQuestion)
+            .where(
+                ModeAnswer.task.in_(list(answers_by_task)),
+                # Ответ не может быть создан раньше задачи: отсекаем старые партиции.
+                ModeAnswer.created >= min(x.created for x in tasks),
+                ModeAnswer.answer_text.is_null(False),
+                ModeQuestion.is_active == True,
+                ModeQuestion.answer_type.in_(SEARCH_ANSWER_TYPES),
+            )
+            .order_by(ModeQuestion.column_index, ModeQuestion.id)
+        )
+        for answer in answers:
+            answers_by_task[answer.task_id].append(answer.answer_text)
+
+    rows = []
+    for task in tasks:
+        transcript = get_task_transcript(task, load_transcript)
+        answers_text = '\n'.join(answers_by_task[task.id]) or None
+        rows.append({
+            'task_id': task.id,
+            'report': task.report_id,
+            'created': task.created,
+            'transcript': transcript,
+            'answers': answers_text,
+            'document': get_document_expression(transcript, answers_text),
+            'indexed': datetime.now(),
+        })
+
+    with main_db.atomic():
+        indexed_ids = [x['task_id'] for x in rows]
+        (TaskSearchDocument
+         .delete()
+         .where(TaskSearchDocument.task_id.in_(task_ids), TaskSearchDocument.task_id.not_in(indexed_ids))
+         .execute())
+        if rows:
+            (TaskSearchDocument
+             .insert_many(rows)
+             .on_conflict(conflict_target=[TaskSearchDocument.task_id],
+                          preserve=[TaskSearchDocument.report,
+                                    TaskSearchDocument.created,
+                                    TaskSearchDocument.transcript,
+                                    TaskSearchDocument.answers,
+                                    TaskSearchDocument.document,
+                                    TaskSearchDocument.indexed])
+             .execute())
+    return len(rows)
+
+
+def index_task(task: Task) -> None:
+    index_tasks([task.id])
+
+
+def rebuild_search_index(
+        report_id: Optional[int] = None,
+        batch_size: int = 500,
+        load_transcript: Optional[TranscriptLoader] = None,
+) -> int:
+    """
+    Индексирует все завершенные задачи (или задачи одного отчета) пачками по batch_size.
+    """
+    last_task_id = 0
+    total = 0
+    while True:
+        db_query = (
+            Task
+            .select(Task.id)
+            .where(Task.id > last_task_id, Task.status == Task.StatusChoices.DONE)
+            .order_by(Task.id)
+            .limit(batch_size)
+        )
+        if report_id is not None:
+            db_query = db_query.where(Task.report == report_id)
+
+        task_ids = [x.id for x in db_query]
+        if not task_ids:
+            break
+        total += index_tasks(task_ids, load_transcript)
+        last_task_id = task_ids[-1]
+        logger.info(f'Поисковый индекс: проиндексировано {total} задач (до задачи {last_task_id}).')
+    return total
+
+
+def format_headline(headline: Optional[str]) -> Optional[str]:
+    """
+    Экранирует фрагменты ts_headline и отмечает совпадения тегом <mark>.
+    """
+    # Без совпадений ts_headline возвращает начало текста – такой фрагмент не показываем.
+    if not headline or HEADLINE_START not in headline:
+        return None
+    return html.escape(headline).replace(HEADLINE_START, '<mark>').replace(HEADLINE_STOP, '</mark>')
+
+
+def search_tasks(
+        query_text: str,
+        report_ids: peewee.SelectQuery,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        limit: int = 20,
+        offset: int = 0,
+) -> Tuple[int, List[dict]]:
+    """
+    Задачи отчетов report_ids, в транскрипте или ответах которых встречается запрос,
+    по убыванию релевантности. Возвращает общее количество найденных задач и страницу результатов.
+    """
+    tsquery = get_tsquery(query_text)
+    rank = peewee.fn.ts_rank_cd(TaskSearchDocument.document, tsquery)
+
+    db_query = (
+        TaskSearchDocument
+        .select(TaskSearchDocument.task_id, TaskSearchDocument.report, TaskSearchDocument.created,
+                rank.alias('rank'))
+        # Документы архивированных партиций Task в поиск не попадают.
+        .join(Task, on=((Task.id == TaskSearchDocument.task_id) & (Task.created == TaskSearchDocument.created)))
+        .where(
+            TaskSearchDocument.report.in_(report_ids),
+            peewee.Expression(TaskSearchDocument.document, '@@', tsquery),
+        )
+    )
+    if from_date is not None:
+        db_query = db_query.where(TaskSearchDocument.created >= from_date)
+    if to_date is not None:
+        db_query = db_query.where(TaskSearchDocument.created < to_date)
+
+    total_count = db_query.count()
+    page = list(
+        db_query
+        .order_by(rank.desc(), TaskSearchDocument.created.desc())
+        .limit(limit)
+        .offset(offset)
+        .dicts()
+    )
+    if not page:
+        return total_count, []
+
+    # Подсветка дорогая, поэтому строится только для страницы результатов.
+    headlines = {
+        x['task_id']: x
+        for x in (
+            TaskSearchDocument
+            .select(
+                TaskSearchDocument.task_id,
+                peewee.fn.ts_headline(cfg.SEARCH_TEXT_CONFIG, TaskSearchDocument.transcript, tsquery,
+                                      HEADLINE_OPTIONS).alias('transcript_headline'),
+                peewee.fn.ts_headline(cfg.SEARCH_TEXT_CONFIG, TaskSearchDocument.answers, tsquery,
+                                      HEADLINE_OPTIONS).alias('answers_headline'),
+            )
+            .where(TaskSearchDocument.task_id.in_([x['task_id'] for x in page]))
+            .dicts()
+        )
+    }
+
+    items = []
+    for row in page:
+        headline = headlines.get(row['task_id'], {})
+        items.append({
+            'task_id': row['task_id'],
+            'report_id': row['report'],
+            'created': row['created'],
+            'rank': row['rank'],
+            'transcript_headline': format_headline(headline.get('transcript_headline')),
+            'answers_headline': format_headline(headline.get('answers_headline')),
+        })
+    return total_count, items
@@ -72,20 +72,26 @@ def download_file_from_amo(entity_id, entity_name, account_id):
 
 
 def update_downloads_bitrix():
+    pending_condition = (CallDownload.status != "completed") & (CallDownload.status != "rejected")
+    expiration_cutoff = datetime.now() - timedelta(days=1)
+
+    # Задания старше суток отклоняем одним запросом, не загружая их из БД.
+    rejected_count = (
+        CallDownload
+        .update(status="rejected")
+        .where(pending_condition & (CallDownload.timestamp < expiration_cutoff))
+        .execute()
+    )
+    logger.info(f"Отклонено заданий Bitrix из-за истечения срока: {rejected_count}")
+
     pending_downloads = CallDownload.select().where(
-        (CallDownload.status != "completed") &
-        (CallDownload.status != "rejected")
+        pending_condition & (CallDownload.timestamp >= expiration_cutoff)
     )
 
     logger.info(f"Начинаю скачивать аудио Bitrix: всего {len(pending_downloads)}")
 
     # Проходимся по всем записям и пробуем их загрузить
     for record in pending_downloads:
-        if record.timestamp < datetime.now() - timedelta(days=1):
-            record.status = "rejected"
-            record.save()
-            logger.info(f"Запись с Call ID {record.call_id} отклонена из-за истечения срока.")
-            continue
         call_info = download_file_from_bitrix(record.call_id, record.webhook)
 
         # Если загрузка успешна
@@ -116,21 +122,26 @@ def update_downloads_bitrix():
 
 
 def update_downloads_amo():
+    pending_condition = (CallDownloadAMO.status != "completed") & (CallDownloadAMO.status != "rejected")
+    expiration_cutoff = datetime.now() - timedelta(days=1)
+
+    # Задания старше суток отклоняем одним запросом, не загружая их из БД.
+    rejected_count = (
+        CallDownloadAMO
+        .update(status="rejected")
+        .where(pending_condition & (CallDownloadAMO.timestamp < expiration_cutoff))
+        .execute()
+    )
+    logger.info(f"Отклонено заданий AMO из-за истечения срока: {rejected_count}")
+
     pending_amo_downloads = CallDownloadAMO.select().where(
-        (CallDownloadAMO.status != "completed") &
-        (CallDownloadAMO.status != "rejected")
+        pending_condition & (CallDownloadAMO.timestamp >= expiration_cutoff)
     )
 
     logger.info(f"Начинаю скачивать аудио AMO: всего {len(pending_amo_downloads)}")
 
     # Проходимся по всем записям и пробуем их загрузить
     for record in pending_amo_downloads:
-        if record.timestamp < datetime.now() - timedelta(days=1):
-            record.status = "rejected"
-            record.save()
-            logger.info(f"Запись с Entity ID {record.entity_id} отклонена из-за истечения срока.")
-            continue
-
         try:
             call_info = download_file_from_amo(entity_id=record.entity_id,
                                                entity_name=record.entity_name,
@@ -0,0 +1,131 @@
+"""
+Кэш контекста авторизации пользователей ЛК.
+
+Контекст (пользователь + ID доступных ему компаний) вычисляется одним-двумя запросами
+и хранится в памяти процесса AUTH_CACHE_TTL секунд. После изменения роли, компании
+или интеграторских связей пользователя нужно вызвать invalidate_auth_context_everywhere():
+контекст сбрасывается в текущем процессе и рассылается процессам сервера через PostgreSQL NOTIFY
+(канал cfg.AUTH_CACHE_CHANNEL, поток auth_invalidation_listener). Так изменения из Telegram-бота
+и других процессов видны сразу. Если уведомление не дошло, контекст устареет через AUTH_CACHE_TTL секунд.
+"""
+import json
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from loguru import logger
+from peewee import JOIN
+
+from config import config as cfg
+from data.models import User, Company, IntegratorCompany, main_db
+from helpers.metadata_cache import MetadataInvalidationListener
+from schemas.user import AuthContext
+
+
+# user_id -> (время истечения, контекст).
+_cache: Dict[int, Tuple[float, AuthContext]] = {}
+_lock = threading.Lock()
+
+
+def build_auth_context(user_id: int) -> Optional[AuthContext]:
+    """
+    Загружает пользователя и вычисляет компании, к которым у него есть доступ.
+    Правила доступа совпадают с User.get_accessible_companies.
+    """
+    user = (
+        User
+        .select(User, Company)
+        .join(Company, JOIN.LEFT_OUTER)
+        .where(User.id == user_id)
+        .first()
+    )
+    if user is None:
+        return None
+
+    context = AuthContext(
+        id=user.id,
+        created=user.created,
+        tg_id=user.tg_id,
+        full_name=user.full_name,
+        email=user.email,
+        company_id=user.company_id,
+        company_role=user.company_role,
+        is_admin=user.is_admin,
+    )
+
+    # Системный администратор имеет доступ ко всем компаниям.
+    if user.is_admin:
+        return context
+
+    admin_company_ids = {
+        x.company_id
+        for x in IntegratorCompany.select(IntegratorCompany.company).where(IntegratorCompany.integrator == user_id)
+    }
+    member_company_ids = set(admin_company_ids)
+
+    if user.company_id is not None:
+        member_company_ids.add(user.company_id)
+        if user.company_role == Company.Roles.ADMIN:
+            admin_company_ids.add(user.company_id)
+
+    context.admin_company_ids = admin_company_ids
+    context.member_company_ids = member_company_ids
+    return context
+
+
+def get_auth_context(user_id: int) -> Optional[AuthContext]:
+    """
+    Возвращает копию контекста из кэша или вычисляет его заново.
+    """
+    now = time.monotonic()
+    with _lock:
+        cached = _cache.get(user_id)
+    if cached is not None and cached[0] > now:
+        return cached[1].model_copy(deep=True)
+
+    context = build_auth_context(user_id)
+    if context is None:
+        invalidate_auth_context(user_id)
+        return None
+
+    with _lock:
+        _cache[user_id] = (now + cfg.AUTH_CACHE_TTL, context)
+    return context.model_copy(deep=True)
+
+
+def invalidate_auth_context(user_id: Optional[int] = None) -> None:
+    """
+    Удаляет контекст пользователя из кэша. Без user_id очищает кэш полностью.
+    """
+    with _lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
+
+
+def invalidate_auth_context_everywhere(user_id: Optional[int] = None) -> None:
+    """
+    Удаляет контекст пользователя в текущем процессе и сообщает о сбросе процессам сервера.
+    """
+    invalidate_auth_context(user_id)
+    try:
+        main_db.execute_sql('SELECT pg_notify(%s, %s)', (cfg.AUTH_CACHE_CHANNEL, json.dumps({'user_id': user_id})))
+    except Exception as ex:
+        # В процессах сервера контекст устареет по TTL.
+        logger.warning(f'Не удалось разослать сброс кэша прав доступа пользователя {user_id}: {ex}')
+
+
+def apply_auth_invalidation(payload: str) -> None:
+    """
+    Сбрасывает контекст по уведомлению, отправленному invalidate_auth_context_everywhere().
+    """
+    try:
+        user_id = json.loads(payload)['user_id']
+    except (ValueError, KeyError, TypeError):
+        logger.warning(f'Некорректное уведомление о сбросе кэша прав доступа: {payload!r}')
+        return
+    invalidate_auth_context(user_id)
+
+
+auth_invalidation_listener = MetadataInvalidationListener(cfg.AUTH_CACHE_CHANNEL, handler=apply_auth_invalidation)
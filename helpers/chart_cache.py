@@ -0,0 +1,143 @@
+"""
+Кэш данных графиков ЛК.
+
+Ключ содержит версию данных отчета (ReportVersion), поэтому после завершения задачи
+или изменения настроек графиков старые записи перестают читаться и вытесняются по TTL/LRU.
+Ключ прошедшего диапазона вместо нее содержит версию настроек и версии дней диапазона
+(ReportVersion.get_range_version): завершение сегодняшних задач его не меняет, и запись живет CHART_CACHE_PAST_TTL.
+Данные хранятся в памяти процесса и, если указан CHART_CACHE_REDIS_URL, в Redis,
+общем для всех процессов сервера. Ошибки Redis не прерывают построение графика.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Optional, Any
+
+import redis
+from loguru import logger
+
+from config import config as cfg
+
+
+class ChartDataCache:
+    """
+    LRU-кэш процесса с TTL записей и необязательным вторым уровнем в Redis.
+    """
+
+    def __init__(
+            self,
+            max_size: int = cfg.CHART_CACHE_MAX_SIZE,
+            redis_url: Optional[str] = cfg.CHART_CACHE_REDIS_URL,
+    ):
+        self.max_size = max_size
+        self.redis_url = redis_url
+
+        # key -> (время истечения, данные).
+        self._local: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(report_id: int, version: int, chart_id: int, from_date: date, to_date: date) -> str:
+        return f'chart_data:{report_id}:{version}:{chart_id}:{from_date.isoformat()}:{to_date.isoformat()}'
+
+    @staticmethod
+    def make_past_key(report_id: int, range_version: str, chart_id: int, from_date: date, to_date: date) -> str:
+        return f'chart_data_past:{report_id}:{range_version}:{chart_id}:{from_date.isoformat()}:{to_date.isoformat()}'
+
+    @staticmethod
+    def is_past_range(to_date: date) -> bool:
+        return to_date < date.today()
+
+    @staticmethod
+    def get_ttl(to_date: date) -> int:
+        """
+        Данные за прошедший диапазон меняются только при изменении ответов задач этого диапазона
+        (что увеличит версию его дней), поэтому хранятся дольше.
+        """
+        if ChartDataCache.is_past_range(to_date):
+            return cfg.CHART_CACHE_PAST_TTL
+        return cfg.CHART_CACHE_TTL
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._local.get(key)
+            if cached is not None and cached[0] > now:
+                self._local.move_to_end(key)
+                self.local_hits += 1
+                return cached[1]
+
+        redis_client = self._get_redis()
+        if redis_client is not None:
+            try:
+                raw_value = redis_client.get(key)
+                ttl = redis_client.ttl(key) if raw_value is not None else None
+            except Exception as ex:
+                logger.warning(f'Ошибка чтения кэша графиков из Redis: {type(ex)} {ex}')
+            else:
+                if raw_value is not None:
+                    value = json.loads(raw_value)
+                    self._set_local(key, value, ttl if ttl and ttl > 0 else cfg.CHART_CACHE_TTL)
+                    with self._lock:
+                        self.redis_hits += 1
+                    return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        """
+        Сохраняет данные графика. value должен сериализоваться в JSON.
+        """
+        self._set_local(key, value, ttl)
+
+        redis_client = self._get_redis()
+        if redis_client is not None:
+            try:
+                redis_client.set(key, json.dumps(value), ex=ttl)
+            except Exception as ex:
+                logger.warning(f'Ошибка записи кэша графиков в Redis: {type(ex)} {ex}')
+
+    def clear(self) -> None:
+        with self._lock:
+            self._local.clear()
+            self.local_hits = self.redis_hits = self.misses = 0
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            hits = self.local_hits + self.redis_hits
+            total = hits + self.misses
+            return {
+                'local_hits': self.local_hits,
+                'redis_hits': self.redis_hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / total, 3) if total else None,
+                'local_size': len(self._local),
+                'max_size': self.max_size,
+                'redis': self.redis_url is not None,
+            }
+
+    def _set_local(self, key: str, value: Any, ttl: int) -> None:
+        with self._lock:
+            self._local[key] = (time.monotonic() + ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+    def _get_redis(self):
+        if self.redis_url is None:
+            return None
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(self.redis_url, socket_timeout=0.5)
+        return self._redis
+
+
+chart_cache = ChartDataCache()
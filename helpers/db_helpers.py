@@ -1,6 +1,10 @@
+import atexit
 import json
+import queue
 import random
 import string
+import threading
+import time
 from typing import Optional
 
 import peewee
@@ -8,8 +12,12 @@ from assemblyai import LemurTaskResponse, LemurQuestionResponse
 from loguru import logger
 
 from config import config as cfg
-from data.models import Mode, User, Task, Payment, main_db, Report, RequestLog, ModeQuestion, ModeQuestionCalcType, \
-    DefaultQuestions, Integration, ActiveTelegramReport, ModeQuestionType, IntegrationServiceName, ModeAnswer, Company
+from data.models import Mode, User, Task, Payment, main_db, Report, RequestLogLine, ModeQuestion, ModeQuestionCalcType, \
+    DefaultQuestions, Integration, ActiveTelegramReport, ModeQuestionType, IntegrationServiceName, ModeAnswer, Company, \
+    ReportVersion
+from data.call_tables import refresh_task_call_row
+from data.rollups import refresh_task_rollups
+from data.search import index_task
 from modules.audiofile import Audiofile
 from modules.json_processor.struct_checkers import get_dict_from_json
 
@@ -145,17 +153,43 @@ def update_task_with_error(
 
 
 def finish_task(task: Task):
-    """ Обновляет задачу при возникновении ошибки. """
+    """ Переводит задачу в статус «Готово» и обновляет агрегаты графиков, таблицу звонков и поисковый индекс. """
     task.status = Task.StatusChoices.DONE
     task.save()
     logger.debug(f"finish_task. task: {task.id}, status: {task.status}")
 
+    # Агрегаты вспомогательные: при ошибке их можно пересчитать командой rebuild_chart_rollups.
+    try:
+        refresh_task_rollups(task)
+    except Exception as ex:
+        logger.error(f'Не удалось обновить агрегаты графиков для задачи {task.id}: {type(ex)} {ex}')
+
+    # Версия отчета сбрасывает кэш графиков: новые ответы задачи должны попасть в графики,
+    # даже если агрегаты обновить не удалось.
+    if task.report_id is not None:
+        try:
+            ReportVersion.bump_data(task.report_id, task.created.date())
+        except Exception as ex:
+            logger.error(f'Не удалось обновить версию отчета {task.report_id}: {type(ex)} {ex}')
+
+    # Таблица звонков тоже вспомогательная: при ошибке ее можно перестроить командой build_call_tables.
+    try:
+        refresh_task_call_row(task)
+    except Exception as ex:
+        logger.error(f'Не удалось обновить таблицу звонков для задачи {task.id}: {type(ex)} {ex}')
+
+    try:
+        index_task(task)
+    except Exception as ex:
+        logger.error(f'Не удалось обновить поисковый индекс для задачи {task.id}: {type(ex)} {ex}')
+
 
 def not_enough_company_balance(company: Company, audio_duration_in_sec: int) -> bool:
     """
     Проверка, хватит ли баланса для проведения анализа.
+    Учитываются списания, еще не перенесенные в seconds_balance, и активные резервы.
     """
-    current_balance = company.seconds_balance
+    current_balance = company.get_available_balance()
 
     if current_balance < audio_duration_in_sec:
         logger.info(f"[-] Недостаточно баланса. "
@@ -240,24 +274,104 @@ def select_pg_stat_activity() -> None:
 class DBLogHandler:
 
     """
-    Пишет сообщение в базу данных, если передан ID RequestLog.
+    Пишет сообщение в базу данных (RequestLogLine), если передан ID RequestLog.
+
+    write() не обращается к БД: строка кладется в ограниченную очередь, а фоновый поток
+    записывает строки пачками через insert_many, когда набралось batch_size строк
+    или прошло flush_interval секунд. Если очередь переполнена, строка отбрасывается
+    и увеличивается счетчик dropped_count, поэтому логирование не замедляет обработку запросов.
     """
 
+    def __init__(
+            self,
+            max_queue_size: int = cfg.REQUEST_LOG_QUEUE_SIZE,
+            batch_size: int = cfg.REQUEST_LOG_BATCH_SIZE,
+            flush_interval: float = cfg.REQUEST_LOG_FLUSH_INTERVAL,
+    ):
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        # Количество отброшенных строк: переполнение очереди или ошибка записи в БД.
+        self.dropped_count = 0
+        self._reported_dropped_count = 0
+        self._lock = threading.Lock()
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='DBLogHandler', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
     def write(self, message):
 
-        # Получаем объект, в который нужно сохранить сообщение.
+        # Пишем в БД, только если указан объект, к которому относится сообщение.
         request_log_id = message.record.get('extra', {}).get('request_log_id')
-        if request_log_id:
-            request_log = RequestLog.get_or_none(id=request_log_id)
-        else:
-            request_log = None
-
-        # Пишем в БД, если объект найден.
-        if request_log:
-            if request_log.log:
-                request_log.log += '\n'
-            request_log.log += message.record['message']
-            request_log.save(only=['log'])
+        if not request_log_id:
+            return
+
+        row = {
+            'created': message.record['time'].replace(tzinfo=None),
+            'request_log_id': request_log_id,
+            'level': message.record['level'].name,
+            'message': message.record['message'],
+        }
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            self._add_dropped(1)
+
+    def _add_dropped(self, count: int):
+        with self._lock:
+            self.dropped_count += count
+
+    def _take_batch(self) -> list:
+        """
+        Забирает из очереди до batch_size строк, ожидая не дольше flush_interval.
+        """
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: list):
+        try:
+            main_db.connect(reuse_if_open=True)
+            RequestLogLine.insert_many(batch).execute()
+        except Exception as ex:
+            self._add_dropped(len(batch))
+            # Без request_log_id, иначе сообщение снова попадет в этот обработчик.
+            logger.error(f'Не удалось записать в БД строки лога запросов ({len(batch)} шт.): {type(ex)} {ex}')
+
+        if self.dropped_count != self._reported_dropped_count:
+            self._reported_dropped_count = self.dropped_count
+            logger.warning(f'Отброшено строк лога запросов с момента запуска: {self.dropped_count}.')
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            batch = self._take_batch()
+            if batch:
+                self._flush(batch)
+
+        # Дописываем то, что осталось в очереди на момент остановки.
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        for chunk_start in range(0, len(batch), self.batch_size):
+            self._flush(batch[chunk_start:chunk_start + self.batch_size])
+
+    def stop(self, timeout: float = 5.0):
+        self._stop_event.set()
+        self._thread.join(timeout)
 
 
 def create_default_telegram_report(
@@ -0,0 +1,297 @@
+"""
+Отложенные задачи: выполнить обработчик не раньше заданного времени.
+
+Раньше обработка вебхука CRM ждала get_deal_timeout через time.sleep, и каждый вебхук занимал поток
+сервера на все время задержки. Теперь вебхук записывается в БД (DeferredJob) с временем run_after,
+а обработчик запроса сразу возвращается.
+
+В каждом процессе сервера один поток DeferredScheduler хранит время запуска своих задач в куче
+и ждет ближайшее из них: тысячи ожидающих задач не занимают потоков. Наступившие задачи выполняются
+в пуле из cfg.DEFERRED_JOB_WORKERS потоков.
+Задачи, которые не запустил создавший их процесс (перезапуск сервера), раз в cfg.DEFERRED_JOB_SWEEP_INTERVAL
+подбирает из БД любой процесс. Запуск задачи – атомарный UPDATE, поэтому задача выполняется одним процессом.
+
+Задача запускается только один раз: обработка вебхука создает задачу анализа и списывает баланс,
+повторный запуск привел бы к дублям. Пока задача выполняется, процесс раз в cfg.DEFERRED_JOB_HEARTBEAT_INTERVAL
+обновляет heartbeat. Задачу без отметки дольше cfg.DEFERRED_JOB_STALE_SEC (процесс остановлен во время обработки)
+проверка БД завершает с ошибкой, не запуская снова.
+
+Обработчики регистрируются декоратором deferred_handler, аргументы задачи передаются им именованными.
+"""
+import heapq
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from config import config as cfg
+from data.models import DeferredJob
+
+
+_handlers: Dict[str, Callable[..., None]] = {}
+
+
+def deferred_handler(name: str):
+    """
+    Регистрирует функцию как обработчик отложенных задач с именем name.
+    """
+    def decorator(func):
+        _handlers[name] = func
+        return func
+    return decorator
+
+
+def defer(handler: str, delay: float, context_id: Optional[str] = None, **kwargs) -> DeferredJob:
+    """
+    Записывает задачу в БД и планирует ее выполнение через delay секунд.
+    kwargs – аргументы обработчика, должны сериализоваться в JSON.
+    """
+    job = DeferredJob.create(
+        run_after=datetime.now() + timedelta(seconds=delay),
+        handler=handler,
+        payload=json.dumps(kwargs, ensure_ascii=False),
+        context_id=context_id,
+    )
+    deferred_scheduler.schedule(job.id, job.run_after)
+    logger.info(f'Отложенная задача {handler} (DeferredJob.id={job.id}) запланирована через {delay} сек.')
+    return job
+
+
+class DeferredScheduler:
+    """
+    Запускает отложенные задачи процесса в их время.
+    """
+    def __init__(
+            self,
+            workers: int = cfg.DEFERRED_JOB_WORKERS,
+            sweep_interval: float = cfg.DEFERRED_JOB_SWEEP_INTERVAL,
+            heartbeat_interval: float = cfg.DEFERRED_JOB_HEARTBEAT_INTERVAL,
+            stale_sec: float = cfg.DEFERRED_JOB_STALE_SEC,
+    ):
+        self.workers = workers
+        self.sweep_interval = sweep_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_sec = stale_sec
+
+        # Куча (run_after, job_id) и ID задач в ней.
+        self._heap: List[Tuple[datetime, int]] = []
+        self._scheduled = set()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stopped = threading.Event()
+
+        self._stats_lock = threading.Lock()
+        # ID выполняемых процессом задач.
+        self._running_ids = set()
+        self.done = 0
+        self.failed = 0
+        self.interrupted = 0
+        self.skipped = 0
+        self.max_lag_sec = 0.0
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='DeferredJob')
+        self._thread = threading.Thread(target=self._loop, name='DeferredScheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Останавливает планировщик. Еще не начатые задачи остаются в БД и будут подобраны после перезапуска.
+        """
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def schedule(self, job_id: int, run_after: datetime) -> None:
+        with self._cond:
+            if job_id in self._scheduled:
+                return
+            self._scheduled.add(job_id)
+            heapq.heappush(self._heap, (run_after, job_id))
+            # Будим поток, только если новая задача стала ближайшей.
+            if self._heap[0][1] == job_id:
+                self._cond.notify()
+
+    def pop_due(self, now: Optional[datetime] = None) -> List[int]:
+        """
+        Забирает из кучи ID задач, время которых наступило.
+        """
+        now = now or datetime.now()
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                run_after, job_id = heapq.heappop(self._heap)
+                self._scheduled.discard(job_id)
+                due.append(job_id)
+        return due
+
+    def _get_wait(self, sweep_at: float, heartbeat_at: float) -> float:
+        wait = max(0.0, min(sweep_at, heartbeat_at) - time.monotonic())
+        if self._heap:
+            wait = min(wait, max(0.0, (self._heap[0][0] - datetime.now()).total_seconds()))
+        return wait
+
+    @staticmethod
+    def _get_runnable():
+        return DeferredJob.started.is_null() & DeferredJob.finished.is_null()
+
+    def fail_interrupted(self) -> int:
+        """
+        Завершает с ошибкой задачи, процесс которых перестал обновлять heartbeat. Возвращает их количество.
+        """
+        now = datetime.now()
+        stale = now - timedelta(seconds=self.stale_sec)
+        job_ids = [x.id for x in (DeferredJob
+                                  .update(finished=now, last_error='Обработка прервана: процесс остановлен.')
+                                  .where(DeferredJob.started.is_null(False),
+                                         DeferredJob.finished.is_null(),
+                                         DeferredJob.heartbeat < stale)
+                                  .returning(DeferredJob.id)
+                                  .execute())]
+        if job_ids:
+            logger.error(f'Отложенные задачи прерваны и не будут запущены повторно: {job_ids}.')
+            with self._stats_lock:
+                self.interrupted += len(job_ids)
+        return len(job_ids)
+
+    def send_heartbeat(self) -> None:
+        """
+        Отмечает в БД, что выполняемые процессом задачи еще работают.
+        """
+        with self._stats_lock:
+            job_ids = list(self._running_ids)
+        if job_ids:
+            DeferredJob.update(heartbeat=datetime.now()).where(DeferredJob.id.in_(job_ids)).execute()
+
+    def sweep(self, include_future: bool = False) -> int:
+        """
+        Планирует задачи из БД, которые еще не запущены, и завершает прерванные.
+        include_future – также задачи, время которых не наступило (при старте процесса).
+        Возвращает количество запланированных задач.
+        """
+        self.fail_interrupted()
+        now = datetime.now()
+        query = DeferredJob.select(DeferredJob.id, DeferredJob.run_after).where(self._get_runnable())
+        if not include_future:
+            query = query.where(DeferredJob.run_after <= now)
+
+        count = 0
+        for job_id, run_after in query.tuples():
+            self.schedule(job_id, run_after)
+            count += 1
+        return count
+
+    def run_job(self, job_id: int) -> bool:
+        """
+        Выполняет задачу, если ее еще не запустил другой процесс. Возвращает True, если задача запускалась.
+        """
+        now = datetime.now()
+        claimed = (DeferredJob
+                   .update(started=now, heartbeat=now)
+                   .where((DeferredJob.id == job_id) & self._get_runnable())
+                   .execute())
+        if not claimed:
+            self._count('skipped')
+            return False
+
+        with self._stats_lock:
+            self._running_ids.add(job_id)
+        job = DeferredJob.get_by_id(job_id)
+        with self._stats_lock:
+            self.max_lag_sec = max(self.max_lag_sec, (now - job.run_after).total_seconds())
+
+        handler = _handlers.get(job.handler)
+        try:
+            with logger.contextualize(context_id=job.context_id or str(uuid.uuid4())):
+                if handler is None:
+                    raise LookupError(f'Нет обработчика {job.handler}.')
+                handler(**json.loads(job.payload))
+        except Exception as ex:
+            # Обработка вебхука не идемпотентна (задача анализа, списание баланса), поэтому не повторяется.
+            logger.error(f'Отложенная задача {job.handler} (DeferredJob.id={job.id}) завершилась ошибкой: '
+                         f'{type(ex)} {ex}')
+            job.finished = datetime.now()
+            job.last_error = f'{type(ex).__name__}: {ex}'
+            job.save(only=['finished', 'last_error'])
+            self._count('failed')
+        else:
+            job.delete_instance()
+            self._count('done')
+        finally:
+            with self._stats_lock:
+                self._running_ids.discard(job_id)
+        return True
+
+    def _run_job_safe(self, job_id: int) -> None:
+        try:
+            self.run_job(job_id)
+        except Exception as ex:
+            # Ошибка БД до или после обработчика: задачу завершит проверка прерванных задач.
+            logger.error(f'Не удалось выполнить отложенную задачу DeferredJob.id={job_id}: {type(ex)} {ex}')
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _loop(self) -> None:
+        include_future = True
+        sweep_at = 0.0
+        heartbeat_at = time.monotonic() + self.heartbeat_interval
+        while not self._stopped.is_set():
+            if time.monotonic() >= heartbeat_at:
+                try:
+                    self.send_heartbeat()
+                except Exception as ex:
+                    logger.error(f'Не удалось обновить heartbeat отложенных задач: {type(ex)} {ex}')
+                heartbeat_at = time.monotonic() + self.heartbeat_interval
+
+            if time.monotonic() >= sweep_at:
+                try:
+                    count = self.sweep(include_future=include_future)
+                    include_future = False
+                    if count:
+                        logger.info(f'Из БД запланировано отложенных задач: {count}.')
+                except Exception as ex:
+                    logger.error(f'Не удалось загрузить отложенные задачи из БД: {type(ex)} {ex}')
+                sweep_at = time.monotonic() + self.sweep_interval
+
+            for job_id in self.pop_due():
+                self._executor.submit(self._run_job_safe, job_id)
+
+            with self._cond:
+                if not self._stopped.is_set():
+                    self._cond.wait(self._get_wait(sweep_at, heartbeat_at))
+
+    def get_stats(self) -> dict:
+        with self._cond:
+            pending = len(self._heap)
+            next_run = self._heap[0][0].isoformat() if self._heap else None
+        with self._stats_lock:
+            return {
+                'pending': pending,
+                'next_run': next_run,
+                'running': len(self._running_ids),
+                'done': self.done,
+                'failed': self.failed,
+                'interrupted': self.interrupted,
+                'skipped': self.skipped,
+                'max_lag_sec': round(self.max_lag_sec, 1),
+            }
+
+
+deferred_scheduler = DeferredScheduler()
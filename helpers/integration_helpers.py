@@ -1,3 +1,6 @@
+from typing import Optional
+
+
 def get_number_from_integration_settings(settings: dict):
     if settings:
         entity_deal_number = settings.get("entity_deal_number")
@@ -15,3 +18,10 @@ def get_number_from_integration_settings(settings: dict):
         number = 0
 
     return number
+
+
+def get_deal_timeout(crm_data: Optional[dict]) -> float:
+    """
+    Задержка (сек.) перед первым запросом к CRM: за это время CRM привязывает звонок к сделке.
+    """
+    return (crm_data or {}).get('get_deal_timeout') or 0
@@ -0,0 +1,137 @@
+"""
+Мониторинг задержек event loop FastAPI-сервера.
+
+Любой синхронный вызов (запрос к БД через peewee, bcrypt, HTTP-запрос через requests),
+выполненный прямо в async-обработчике, останавливает обработку всех остальных запросов.
+EventLoopMonitor измеряет такие задержки и запоминает место в коде, которое блокировало event loop.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from typing import Optional, List, Dict
+
+from loguru import logger
+
+from config import config as cfg
+
+
+class EventLoopMonitor:
+    """
+    Корутина-"пульс" просыпается каждые interval секунд. Если она проснулась позже,
+    значит event loop был заблокирован. Отдельный поток-наблюдатель в момент блокировки
+    снимает стек потока event loop и определяет место вызова в коде приложения.
+    """
+
+    def __init__(
+            self,
+            threshold_ms: int = cfg.EVENT_LOOP_LAG_THRESHOLD_MS,
+            interval: float = 0.05,
+            max_callsites: int = 200,
+    ):
+        self.threshold_ms = threshold_ms
+        self.interval = interval
+        self.max_callsites = max_callsites
+
+        # Максимальная задержка за все время работы (мс).
+        self.max_lag_ms = 0.0
+        # Статистика по местам блокировки: callsite -> {'count', 'max_ms', 'total_ms'}.
+        self._callsites: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+        self._last_tick = time.monotonic()
+        self._stall_callsite: Optional[str] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._watchdog_thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        """
+        Запускает мониторинг. Вызывается из работающего event loop (например, в lifespan).
+        """
+        if self._heartbeat_task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stopped.clear()
+        self._heartbeat_task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._watchdog_thread = threading.Thread(target=self._watchdog, name='EventLoopMonitor', daemon=True)
+        self._watchdog_thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        if self._watchdog_thread is not None:
+            self._watchdog_thread.join(timeout=1)
+            self._watchdog_thread = None
+
+    def reset(self) -> None:
+        with self._lock:
+            self.max_lag_ms = 0.0
+            self._callsites.clear()
+
+    def get_stats(self, limit: int = 20) -> List[dict]:
+        """
+        Места в коде, сильнее всего блокировавшие event loop (по убыванию максимальной задержки).
+        """
+        with self._lock:
+            stats = [{'callsite': callsite, **data} for callsite, data in self._callsites.items()]
+        stats.sort(key=lambda x: x['max_ms'], reverse=True)
+        return stats[:limit]
+
+    async def _heartbeat(self) -> None:
+        while True:
+            self._last_tick = time.monotonic()
+            self._stall_callsite = None
+            await asyncio.sleep(self.interval)
+            lag_ms = (time.monotonic() - self._last_tick - self.interval) * 1000
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            if lag_ms >= self.threshold_ms:
+                self._record(lag_ms, self._stall_callsite or 'unknown')
+
+    def _watchdog(self) -> None:
+        threshold = self.interval + self.threshold_ms / 1000
+        while not self._stopped.wait(self.interval / 2):
+            if self._stall_callsite is not None:
+                continue
+            if time.monotonic() - self._last_tick < threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                self._stall_callsite = self._get_callsite(frame)
+
+    @staticmethod
+    def _get_callsite(frame) -> str:
+        """
+        Ближайший к месту блокировки кадр стека из кода приложения (не из библиотек).
+        """
+        root_dir = str(cfg.ROOT_DIR)
+        innermost = frame
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if (filename.startswith(root_dir)
+                    and 'site-packages' not in filename
+                    and filename != __file__):
+                path = os.path.relpath(filename, root_dir)
+                return f'{path}:{frame.f_lineno} {frame.f_code.co_name}'
+            frame = frame.f_back
+        return f'{innermost.f_code.co_filename}:{innermost.f_lineno} {innermost.f_code.co_name}'
+
+    def _record(self, lag_ms: float, callsite: str) -> None:
+        with self._lock:
+            data = self._callsites.get(callsite)
+            if data is None:
+                if len(self._callsites) >= self.max_callsites:
+                    return
+                data = self._callsites[callsite] = {'count': 0, 'max_ms': 0.0, 'total_ms': 0.0}
+            data['count'] += 1
+            data['max_ms'] = max(data['max_ms'], round(lag_ms, 1))
+            data['total_ms'] = round(data['total_ms'] + lag_ms, 1)
+        logger.warning(f'Event loop был заблокирован на {lag_ms:.0f} мс. Место вызова: {callsite}.')
+
+
+loop_monitor = EventLoopMonitor()
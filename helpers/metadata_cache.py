@@ -0,0 +1,308 @@
+"""
+Кэш редко меняющихся метаданных CRM (воронки, этапы, пользователи, отделы, поля) по аккаунтам.
+
+- Запись свежая TTL секунд. После этого еще stale_ttl секунд отдается устаревшее значение,
+  а обновление выполняется в фоне (stale-while-revalidate).
+- Загрузка одного ключа выполняется одним потоком (single-flight): остальные запросы того же ключа
+  ждут ее результата, поэтому пачка вебхуков одного аккаунта делает один запрос к CRM.
+- is_valid – проверка значения (например, «этап с таким ID есть в списке»). Если проверка не пройдена,
+  значение загружается заново: так новые воронки и этапы видны сразу, без ожидания TTL.
+  Повторно по is_valid запись загружается не чаще, чем раз в min_refresh_interval секунд,
+  чтобы несуществующий ID (например, удаленный этап) не приводил к запросу на каждый вебхук.
+- invalidate() – сброс записей аккаунта в текущем процессе.
+
+Кэш хранится в памяти процесса, а сервер запущен в нескольких процессах. Поэтому сброс по событиям CRM
+и вручную администратором выполняется через invalidate_everywhere(): запись сбрасывается в текущем процессе
+и рассылается остальным через PostgreSQL NOTIFY (канал cfg.CRM_METADATA_CACHE_CHANNEL).
+Каждый процесс получает уведомления потоком MetadataInvalidationListener.
+"""
+import json
+import select
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+import psycopg2
+import psycopg2.extensions
+from loguru import logger
+
+from config import config as cfg
+from data.models import main_db
+
+
+# (аккаунт, тип данных, уточнение ключа: ID воронки, пользователя и т.п.)
+CacheKey = Tuple[str, str, Optional[Hashable]]
+
+# Кэши процесса по именам – для сброса по уведомлениям других процессов.
+_caches: Dict[str, 'MetadataCache'] = {}
+
+
+class MetadataCache:
+    """
+    LRU-кэш метаданных CRM с TTL, single-flight загрузкой и фоновым обновлением устаревших записей.
+    """
+    def __init__(
+            self,
+            name: str,
+            ttl: Optional[int] = None,
+            stale_ttl: Optional[int] = None,
+            max_size: Optional[int] = None,
+            min_refresh_interval: Optional[int] = None,
+            refresh_workers: int = 2,
+            clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.clock = clock
+        self.ttl = cfg.CRM_METADATA_CACHE_TTL if ttl is None else ttl
+        self.stale_ttl = cfg.CRM_METADATA_CACHE_STALE_TTL if stale_ttl is None else stale_ttl
+        self.max_size = max_size or cfg.CRM_METADATA_CACHE_MAX_SIZE
+        self.min_refresh_interval = (cfg.CRM_METADATA_CACHE_MIN_REFRESH_INTERVAL
+                                     if min_refresh_interval is None else min_refresh_interval)
+
+        # key -> (время загрузки, свежее до, можно отдавать до, значение).
+        self._entries: 'OrderedDict[CacheKey, Tuple[float, float, float, Any]]' = OrderedDict()
+        # Загрузки, выполняющиеся сейчас.
+        self._loading: Dict[CacheKey, Future] = {}
+        # Поколение записей аккаунта: загрузка, начатая до invalidate(), не сохраняется.
+        self._generations: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix=f'{name}-metadata')
+
+        # Тип данных -> счетчики.
+        self._stats = defaultdict(lambda: {'hits': 0, 'stale_hits': 0, 'misses': 0, 'coalesced': 0,
+                                           'refreshes': 0, 'errors': 0})
+        _caches[name] = self
+
+    def get(
+            self,
+            account: str,
+            kind: str,
+            loader: Callable[[], Any],
+            subkey: Optional[Hashable] = None,
+            is_valid: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """
+        Значение из кэша или результат loader().
+        """
+        key = (account, kind, subkey)
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > now and (
+                    is_valid is None or now - entry[0] < self.min_refresh_interval or is_valid(entry[3])):
+                self._entries.move_to_end(key)
+                if entry[1] > now:
+                    self._stats[kind]['hits'] += 1
+                else:
+                    self._stats[kind]['stale_hits'] += 1
+                    if key not in self._loading:
+                        future = self._start_loading(key)
+                        self._executor.submit(self._refresh, key, loader, future)
+                return entry[3]
+
+            future = self._loading.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = self._start_loading(key)
+                self._stats[kind]['misses'] += 1
+            else:
+                self._stats[kind]['coalesced'] += 1
+
+        if not is_owner:
+            return future.result()
+        return self._load(key, loader, future)
+
+    def _start_loading(self, key: CacheKey) -> Future:
+        future = Future()
+        future.generation = self._generations[key[0]]
+        self._loading[key] = future
+        return future
+
+    def _load(self, key: CacheKey, loader: Callable[[], Any], future: Future) -> Any:
+        try:
+            value = loader()
+        except Exception as ex:
+            with self._lock:
+                self._stats[key[1]]['errors'] += 1
+                self._loading.pop(key, None)
+            future.set_exception(ex)
+            raise
+
+        with self._lock:
+            if self._generations[key[0]] == future.generation:
+                self._store(key, value)
+            self._loading.pop(key, None)
+        future.set_result(value)
+        return value
+
+    def _refresh(self, key: CacheKey, loader: Callable[[], Any], future: Future) -> None:
+        with self._lock:
+            self._stats[key[1]]['refreshes'] += 1
+        try:
+            self._load(key, loader, future)
+        except Exception as ex:
+            logger.warning(f'Не удалось обновить метаданные {self.name} {key}: {type(ex)} {ex}')
+
+    def put(self, account: str, kind: str, value: Any, subkey: Optional[Hashable] = None) -> None:
+        """
+        Сохраняет значение, полученное без loader (например, из общего списка при прогреве).
+        """
+        with self._lock:
+            self._store((account, kind, subkey), value)
+
+    def _store(self, key: CacheKey, value: Any) -> None:
+        now = self.clock()
+        self._entries[key] = (now, now + self.ttl, now + self.ttl + self.stale_ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def run_in_background(self, func: Callable, *args) -> Future:
+        """
+        Выполняет func (например, прогрев кэша) в потоке фонового обновления.
+        """
+        def run():
+            try:
+                func(*args)
+            except Exception as ex:
+                logger.warning(f'Кэш метаданных {self.name}: ошибка фоновой задачи {func.__name__}: {type(ex)} {ex}')
+
+        return self._executor.submit(run)
+
+    def invalidate(self, account: str, kinds: Optional[Iterable[str]] = None) -> int:
+        """
+        Удаляет записи аккаунта (всех типов или только kinds). Возвращает количество удаленных записей.
+        """
+        kinds = set(kinds) if kinds is not None else None
+        with self._lock:
+            keys = [x for x in self._entries if x[0] == account and (kinds is None or x[1] in kinds)]
+            for key in keys:
+                del self._entries[key]
+            self._generations[account] += 1
+        logger.info(f'Кэш метаданных {self.name}: сброшено {len(keys)} записей аккаунта {account} ({kinds or "все"}).')
+        return len(keys)
+
+    def invalidate_everywhere(self, account: str, kinds: Optional[Iterable[str]] = None) -> int:
+        """
+        Удаляет записи аккаунта в текущем процессе и сообщает о сбросе остальным процессам сервера.
+        Возвращает количество удаленных записей в текущем процессе.
+        """
+        count = self.invalidate(account, kinds)
+        payload = json.dumps({'cache': self.name, 'account': account,
+                              'kinds': list(kinds) if kinds is not None else None}, ensure_ascii=False)
+        try:
+            main_db.execute_sql('SELECT pg_notify(%s, %s)', (cfg.CRM_METADATA_CACHE_CHANNEL, payload))
+        except Exception as ex:
+            # В остальных процессах записи устареют по TTL.
+            logger.warning(f'Кэш метаданных {self.name}: не удалось разослать сброс аккаунта {account}: {ex}')
+        return count
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._stats.clear()
+            for account in self._generations:
+                self._generations[account] += 1
+
+    def get_stats(self) -> dict:
+        """
+        Счетчики и доля попаданий по типам данных.
+        """
+        with self._lock:
+            kinds = {}
+            for kind, stats in self._stats.items():
+                hits = stats['hits'] + stats['stale_hits'] + stats['coalesced']
+                total = hits + stats['misses']
+                kinds[kind] = {**stats, 'hit_rate': round(hits / total, 3) if total else None}
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'kinds': kinds,
+            }
+
+
+def apply_invalidation(payload: str) -> None:
+    """
+    Сбрасывает записи по уведомлению, отправленному invalidate_everywhere().
+    """
+    try:
+        data = json.loads(payload)
+        cache = _caches[data['cache']]
+        account = data['account']
+        kinds = data.get('kinds')
+    except (ValueError, KeyError, TypeError):
+        logger.warning(f'Некорректное уведомление о сбросе кэша метаданных: {payload!r}')
+        return
+    cache.invalidate(account, kinds)
+
+
+class MetadataInvalidationListener:
+    """
+    Поток процесса сервера, получающий уведомления о сбросе кэшей метаданных (канал cfg.CRM_METADATA_CACHE_CHANNEL).
+    Отдельное соединение в режиме autocommit; при обрыве переподключается.
+    handler – обработчик текста уведомления (другие кэши процесса слушают свои каналы, см. helpers/auth_cache.py).
+    """
+    def __init__(
+            self,
+            channel: str = cfg.CRM_METADATA_CACHE_CHANNEL,
+            timeout: float = 5,
+            handler: Callable[[str], None] = apply_invalidation,
+    ):
+        self.channel = channel
+        self.timeout = timeout
+        self.handler = handler
+        self.connection = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._loop, name=f'InvalidationListener-{self.channel}', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout + 1)
+            self._thread = None
+        self.close()
+
+    def connect(self) -> None:
+        self.close()
+        self.connection = psycopg2.connect(dbname=main_db.database, **main_db.connect_params)
+        self.connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+
+    def close(self) -> None:
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+
+    def _loop(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                if self.connection is None:
+                    self.connect()
+                if not self.connection.notifies:
+                    select.select([self.connection], [], [], self.timeout)
+                self.connection.poll()
+            except Exception as ex:
+                logger.error(f'Ошибка соединения для уведомлений о сбросе кэша (канал {self.channel}): {ex}')
+                self.close()
+                # Не переподключаемся чаще, чем раз в timeout секунд.
+                self._stopped.wait(self.timeout)
+                continue
+
+            while self.connection.notifies:
+                self.handler(self.connection.notifies.pop(0).payload)
+
+
+metadata_invalidation_listener = MetadataInvalidationListener()
@@ -1,5 +1,11 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import pyrogram
 from loguru import logger
 from pyrogram import Client
+from pyrogram.errors import RPCError
 from pyrogram.types import CallbackQuery, Message
 
 from config import config as cfg
@@ -90,31 +96,74 @@ def send_user_call_report(
                                       quote=True)
 
 
+# Профили пользователей Telegram: tg_id -> (время истечения, данные пользователя).
+_user_info_cache: Dict[int, Tuple[float, dict]] = {}
+_user_info_lock = threading.Lock()
+
+# Максимальное количество пользователей в одном запросе users.getUsers.
+GET_USERS_BATCH_SIZE = 200
+
+
+def make_user_info(tg_id: int, user: Optional[pyrogram.types.User]) -> dict:
+    if user is None:
+        return {'tg_id': tg_id, 'full_name': '', 'username': ''}
+    full_name = f"{user.first_name} {user.last_name}" if user.last_name else user.first_name
+    return {'tg_id': tg_id, 'full_name': full_name, 'username': user.username}
+
+
+def fetch_users(cli, tg_ids: List[int]) -> Dict[int, Optional[pyrogram.types.User]]:
+    """
+    Пользователи Telegram одним запросом. Если пачка не получена целиком (например, один из ID
+    неизвестен клиенту), пользователи запрашиваются по одному.
+    """
+    try:
+        return {user.id: user for user in cli.get_users(tg_ids)}
+    except (ValueError, RPCError) as ex:
+        logger.warning(f'Не удалось получить пачку пользователей Telegram ({len(tg_ids)} шт.): {ex}')
+
+    users = {}
+    for tg_id in tg_ids:
+        try:
+            users[tg_id] = cli.get_users(tg_id)
+        except (ValueError, RPCError):
+            logger.warning(f'Не удалось получить данные пользователя Telegram {tg_id=}.')
+    return users
+
+
 def get_user_info(cli, tg_ids):
     """
     Получение информации о пользователях: full_name, tg_id, username
 
+    Пользователи запрашиваются пачками по GET_USERS_BATCH_SIZE,
+    полученные профили хранятся в памяти процесса TG_USER_INFO_CACHE_TTL секунд.
+
     Пример ответа:
     {833830: {'full_name': 'Андрей Сергеевич',
               'tg_id': 833830,
               'username': 'gorbunov'},
     }
     """
-    users_info = []
-    for tg_id in tg_ids:
-        try:
-            user = cli.get_users(tg_id)
-        except ValueError:
-            logger.warning(f'Не удалось получить данные пользователя Telegram {tg_id=}.')
-            full_name = ''
-            username = ''
-        else:
-            full_name = f"{user.first_name} {user.last_name}" if user.last_name else user.first_name
-            username = user.username
-
-        users_info.append({'tg_id': tg_id, 'full_name': full_name, 'username': username})
-
-    return {info['tg_id']: info for info in users_info}
+    now = time.monotonic()
+    users_info = {}
+    with _user_info_lock:
+        for tg_id in tg_ids:
+            cached = _user_info_cache.get(tg_id)
+            if cached is not None and cached[0] > now:
+                users_info[tg_id] = cached[1]
+
+    missing_ids = [tg_id for tg_id in dict.fromkeys(tg_ids) if tg_id not in users_info]
+    for batch_start in range(0, len(missing_ids), GET_USERS_BATCH_SIZE):
+        batch_ids = missing_ids[batch_start:batch_start + GET_USERS_BATCH_SIZE]
+        users = fetch_users(cli, batch_ids)
+        with _user_info_lock:
+            for tg_id in batch_ids:
+                info = make_user_info(tg_id, users.get(tg_id))
+                users_info[tg_id] = info
+                # Неполученные профили не кэшируем: попробуем получить их в следующий раз.
+                if tg_id in users:
+                    _user_info_cache[tg_id] = (now + cfg.TG_USER_INFO_CACHE_TTL, info)
+
+    return users_info
 
 
 def make_transcript_link(transcript_id):
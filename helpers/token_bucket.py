@@ -0,0 +1,92 @@
+"""
+Корзина токенов (token bucket) для ограничения частоты запросов к внешним API.
+"""
+import asyncio
+import threading
+import time
+from typing import Callable, Optional
+
+
+class TokenBucket:
+    """
+    Корзина токенов: rate_per_minute токенов в минуту, не больше capacity подряд.
+    """
+    def __init__(
+            self,
+            rate_per_minute: float,
+            capacity: Optional[float] = None,
+            clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_minute / 6)
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+        self.paused_until = 0.0
+        self.consumed = 0
+        self.waited_sec = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _get_wait(self, now: float) -> float:
+        self._refill(now)
+        wait = max(0.0, self.paused_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def get_wait(self) -> float:
+        """
+        Сколько секунд ждать следующего токена.
+        """
+        with self._lock:
+            return self._get_wait(self.clock())
+
+    def _take(self, waited: float) -> float:
+        """
+        Берет токен, если он есть, и возвращает 0. Иначе возвращает, сколько секунд ждать.
+        """
+        with self._lock:
+            wait = self._get_wait(self.clock())
+            if wait <= 0:
+                self.tokens -= 1
+                self.consumed += 1
+                self.waited_sec += waited
+            return wait
+
+    def acquire(self, sleep: Callable[[float], None] = time.sleep) -> float:
+        """
+        Берет токен, при необходимости дожидаясь его. Возвращает время ожидания.
+        """
+        waited = 0.0
+        while (wait := self._take(waited)) > 0:
+            sleep(wait)
+            waited += wait
+        return waited
+
+    async def acquire_async(self) -> float:
+        """
+        То же, что acquire, но ожидание не блокирует event loop.
+        """
+        waited = 0.0
+        while (wait := self._take(waited)) > 0:
+            await asyncio.sleep(wait)
+            waited += wait
+        return waited
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self.paused_until = max(self.paused_until, self.clock() + seconds)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            wait = self._get_wait(self.clock())
+            return {
+                'tokens': round(self.tokens, 2),
+                'consumed': self.consumed,
+                'waited_sec': round(self.waited_sec, 1),
+                'wait_sec': round(wait, 1),
+            }
@@ -3,7 +3,6 @@ from pprint import pprint
 from typing import Optional, List, Tuple
 
 import jwt
-import requests
 from datetime import datetime, timedelta
 
 from loguru import logger
@@ -14,6 +13,7 @@ from config.const import AmoNoteType, AmoNoteTypeID
 from data.models import Integration
 from data.server_models import LeadNoteAmoWebhook, ContactNoteAmoWebhook, BaseNoteAmoWebhook, AmoLead
 from helpers.integration_helpers import get_number_from_integration_settings
+from integrations.amo_crm.http_client import AmoHttpClient, get_amo_http_client
 from integrations.const import CallTypeFilter
 from modules.crypter import encrypt
 from modules.numbers_matcher import phone_number_in_list
@@ -55,10 +55,15 @@ class AmoApiAuth:
         if not self.access_token:
             return self.init_oauth2()
         elif self._is_expire(self.access_token):
-            return self._get_new_tokens()
+            # Под блокировкой аккаунта: токен мог уже обновить другой поток.
+            return self.http_client.ensure_token(self)
         else:
             return 'ok'
 
+    @property
+    def http_client(self) -> AmoHttpClient:
+        return get_amo_http_client(self.subdomain)
+
     @staticmethod
     def _is_expire(token: str):
         """
@@ -88,9 +93,10 @@ class AmoApiAuth:
         if self.commit_on_update:
             self.integration.save()
 
-    def _get_new_tokens(self):
+    def refresh_tokens(self):
         """
-        Получает новые токены.
+        Получает новые токены по refresh token.
+        Вызывается клиентом API под блокировкой аккаунта (см. AmoHttpClient.ensure_token).
         """
         data = {
             "client_id": self.client_id,
@@ -99,8 +105,8 @@ class AmoApiAuth:
             "refresh_token": self.refresh_token,
             "redirect_uri": self.redirect_uri
         }
-        url = f'https://{self.subdomain}.amocrm.ru/oauth2/access_token'
-        response = requests.post(url, json=data)
+        client = self.http_client
+        response = client.session.post(f'{client.base_url}/oauth2/access_token', json=data, timeout=client.timeout)
 
         if response.status_code == 403:
             logger.error(f'Ошибка при авторизации: В доступе отказано. '
@@ -131,8 +137,8 @@ class AmoApiAuth:
             "code": self.secret_code,
             "redirect_uri": self.redirect_uri
         }
-        url = f'https://{self.subdomain}.amocrm.ru/oauth2/access_token'
-        response = requests.post(url, json=data)
+        client = self.http_client
+        response = client.session.post(f'{client.base_url}/oauth2/access_token', json=data, timeout=client.timeout)
 
         if response.status_code == 403:
             logger.error(f'Ошибка при авторизации: В доступе отказано. '
@@ -160,17 +166,6 @@ class AmoApiBase(AmoApiAuth):
     Авторизация осуществляется через OAuth2.
     """
 
-    def _make_headers(self):
-        """
-        Создает заголовки запроса. Если токен истек, то он обновляется.
-        """
-        if self._is_expire(self.access_token):
-            self._get_new_tokens()
-
-        access_token = f"Bearer {self.access_token}"
-
-        return {"Authorization": access_token}
-
     def base_request(self, **kwargs) -> Optional[dict]:
         """
         Отправляет запрос к API AmoCRM.
@@ -181,19 +176,29 @@ class AmoApiBase(AmoApiAuth):
         :param params: параметры для запроса
         """
         method, endpoint = kwargs['type'], kwargs['endpoint']
+        json_body = kwargs.get('data') if method.lower() != 'get' else None
+
+        response = self.http_client.request(self, method, endpoint, json=json_body, params=kwargs.get('params'))
+        if response.status_code == 200:
+            return response.json()
 
-        url = f'https://{self.subdomain}.amocrm.ru{endpoint}'
-        headers = self._make_headers()
+        logger.error(f'Ошибка при запросе: {response.status_code} {endpoint}')
+        return None
+
+    async def base_request_async(self, **kwargs) -> Optional[dict]:
+        """
+        То же, что base_request, для async-кода.
+        """
+        method, endpoint = kwargs['type'], kwargs['endpoint']
         json_body = kwargs.get('data') if method.lower() != 'get' else None
 
-        with requests.request(method, url,
-                              headers=headers, json=json_body,
-                              params=kwargs.get('params')) as response:
-            if response.status_code == 200:
-                return response.json()
+        response = await self.http_client.request_async(self, method, endpoint,
+                                                        json=json_body, params=kwargs.get('params'))
+        if response.status_code == 200:
+            return response.json()
 
-            logger.error(f'Ошибка при запросе: {response.status_code} {endpoint}')
-            return None
+        logger.error(f'Ошибка при запросе: {response.status_code} {endpoint}')
+        return None
 
 
 class AmoApi(AmoApiBase):
@@ -276,9 +281,16 @@ class AmoApi(AmoApiBase):
         response: dict = self.base_request(endpoint=endpoint, type="get")
         return response
 
+    def get_user(self, user_id) -> Optional[dict]:
+        """
+        Документация:
+            https://www.amocrm.ru/developers/content/crm_platform/users-api#user-detail
+        """
+        logger.info(f"Получаю пользователя {user_id}")
+        return self.base_request(endpoint=f"/api/v4/users/{user_id}", type="get")
+
     def get_responsible_user_name(self, responsible_user_id):
-        logger.info(f"Получаю Имя ответственного {responsible_user_id}")
-        r = self.base_request(endpoint=f"/api/v4/users/{responsible_user_id}", type="get")
+        r = self.get_user(responsible_user_id)
         return r['name'] if r is not None else "Пользователь удален из AmoCRM"
 
     def get_users(self) -> List[dict]:
@@ -0,0 +1,259 @@
+"""
+HTTP-клиент API amoCRM.
+
+- Одна сессия requests с пулом соединений на аккаунт (поддомен) и процесс, для async-кода – httpx.AsyncClient.
+- Таймауты подключения и чтения.
+- Не больше cfg.AMOCRM_REQUESTS_PER_SECOND запросов в секунду к аккаунту (корзина токенов общая для потоков и корутин).
+- Ответ 429 повторяется для всех методов (запрос не выполнен), ответы 5xx и таймауты – только для идемпотентных.
+  Задержка экспоненциальная со случайной составляющей, но не меньше Retry-After.
+- На 401 токен обновляется один раз под блокировкой аккаунта, и запрос повторяется.
+  Если токен уже обновил другой поток, используется его токен: refresh token amoCRM одноразовый,
+  и повторное обновление старым refresh token завершилось бы ошибкой.
+
+Объект авторизации (auth) – AmoApiAuth: атрибуты access_token, refresh_token и метод refresh_tokens().
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Optional, Tuple
+
+import httpx
+import jwt
+import requests
+from loguru import logger
+from requests.adapters import HTTPAdapter
+
+from config import config as cfg
+from helpers.token_bucket import TokenBucket
+
+
+# Методы, которые можно безопасно повторить после 5xx или таймаута (PATCH в amoCRM задает значения полей).
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT', 'PATCH', 'DELETE'}
+
+
+def get_token_exp(token: Optional[str]) -> float:
+    """
+    Время истечения токена доступа (JWT). 0 – токена нет или его не удалось разобрать.
+    """
+    if not token:
+        return 0
+    try:
+        return float(jwt.decode(token, options={"verify_signature": False})['exp'])
+    except (jwt.PyJWTError, KeyError, TypeError, ValueError):
+        return 0
+
+
+def get_retry_after(headers) -> Optional[float]:
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+class AmoHttpClient:
+    """
+    Запросы к API одного аккаунта amoCRM.
+    """
+    def __init__(
+            self,
+            base_url: str,
+            rate_per_second: Optional[float] = None,
+            timeout: Optional[Tuple[float, float]] = None,
+            max_attempts: Optional[int] = None,
+            base_delay: float = 0.5,
+            max_delay: Optional[float] = None,
+            sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.base_url = base_url.rstrip('/')
+        rate_per_second = rate_per_second or cfg.AMOCRM_REQUESTS_PER_SECOND
+        # Без запаса на всплеск: amoCRM считает запросы за каждую секунду.
+        self.bucket = TokenBucket(rate_per_second * 60, capacity=1)
+        self.timeout = timeout or (cfg.AMOCRM_CONNECT_TIMEOUT, cfg.AMOCRM_READ_TIMEOUT)
+        self.max_attempts = max_attempts or cfg.AMOCRM_MAX_ATTEMPTS
+        self.base_delay = base_delay
+        self.max_delay = max_delay or cfg.AMOCRM_MAX_BACKOFF
+        self.sleep = sleep
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=cfg.AMOCRM_POOL_MAXSIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Последние известные токены аккаунта и блокировка их обновления.
+        self.access_token: Optional[str] = None
+        self.refresh_token: Optional[str] = None
+        self._auth_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.token_refreshes = 0
+        self.errors = defaultdict(int)
+
+    def _count(self, name: str, status: Optional[str] = None) -> None:
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+            if status is not None:
+                self.errors[status] += 1
+
+    def ensure_token(self, auth, failed_token: Optional[str] = None) -> str:
+        """
+        Записывает в auth актуальный токен доступа аккаунта. failed_token – токен, на который API ответил 401.
+        Токен обновляется, если он истек или отклонен и другой поток еще не обновил его.
+        Возвращает 'ok' или ответ amoCRM с ошибкой обновления.
+        """
+        with self._auth_lock:
+            # Из токена объекта auth (прочитан из БД) и токена клиента берем более новый.
+            # Токены, выданные в одну секунду, не различаются по exp: тогда берем токен клиента, если он не отклонен.
+            if (self.access_token and self.access_token != failed_token
+                    and get_token_exp(self.access_token) >= get_token_exp(auth.access_token)):
+                auth.access_token, auth.refresh_token = self.access_token, self.refresh_token
+
+            expired = get_token_exp(auth.access_token) <= time.time()
+            rejected = failed_token is not None and auth.access_token == failed_token
+            if expired or rejected:
+                response = auth.refresh_tokens()
+                self._count('token_refreshes')
+                if response != 'ok':
+                    logger.error(f'amoCRM {self.base_url}: не удалось обновить токен доступа: {response}')
+                    return response
+
+            self.access_token, self.refresh_token = auth.access_token, auth.refresh_token
+            return 'ok'
+
+    def _get_delay(self, attempt: int, headers) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        delay = random.uniform(delay / 2, delay)
+        return max(delay, get_retry_after(headers) or 0)
+
+    def _is_retryable_status(self, method: str, status_code: int) -> bool:
+        return status_code == 429 or (status_code >= 500 and method in IDEMPOTENT_METHODS)
+
+    def request(self, auth, method: str, endpoint: str, **kwargs) -> requests.Response:
+        """
+        Запрос к API аккаунта (endpoint – путь, например /api/v4/leads). kwargs передаются в requests.
+        Возвращает последний ответ; исключение – только если не удалось получить ни одного ответа.
+        """
+        method = method.upper()
+        self.ensure_token(auth)
+        token = auth.access_token
+        refreshed = False
+        attempt = 1
+        while True:
+            self.bucket.acquire(self.sleep)
+            self._count('requests')
+            try:
+                response = self.session.request(method, self.base_url + endpoint,
+                                                headers={'Authorization': f'Bearer {token}'},
+                                                timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as ex:
+                self._count('retries', type(ex).__name__)
+                retryable = isinstance(ex, requests.ConnectTimeout) or method in IDEMPOTENT_METHODS
+                if attempt >= self.max_attempts or not retryable:
+                    raise
+                delay = self._get_delay(attempt, {})
+            else:
+                if response.status_code == 401 and not refreshed:
+                    refreshed = True
+                    self._count('retries', '401')
+                    if self.ensure_token(auth, failed_token=token) != 'ok':
+                        return response
+                    token = auth.access_token
+                    continue
+                if not self._is_retryable_status(method, response.status_code) or attempt >= self.max_attempts:
+                    return response
+                self._count('retries', str(response.status_code))
+                delay = self._get_delay(attempt, response.headers)
+                if response.status_code == 429:
+                    self.bucket.pause(delay)
+
+            logger.warning(f'amoCRM {self.base_url}: {method} {endpoint}, повтор {attempt} через {delay:.1f} сек.')
+            self.sleep(delay)
+            attempt += 1
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            connect, read = self.timeout
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(read, connect=connect),
+                limits=httpx.Limits(max_connections=cfg.AMOCRM_POOL_MAXSIZE),
+            )
+            self._async_loop = loop
+        return self._async_client
+
+    async def request_async(self, auth, method: str, endpoint: str, **kwargs) -> httpx.Response:
+        """
+        То же, что request, для async-кода. Токен обновляется в потоке (запись токенов в БД синхронная).
+        kwargs передаются в httpx.
+        """
+        method = method.upper()
+        client = self._get_async_client()
+        await asyncio.to_thread(self.ensure_token, auth)
+        token = auth.access_token
+        refreshed = False
+        attempt = 1
+        while True:
+            await self.bucket.acquire_async()
+            self._count('requests')
+            try:
+                response = await client.request(method, self.base_url + endpoint,
+                                                 headers={'Authorization': f'Bearer {token}'}, **kwargs)
+            except (httpx.ConnectError, httpx.TimeoutException) as ex:
+                self._count('retries', type(ex).__name__)
+                retryable = isinstance(ex, (httpx.ConnectError, httpx.ConnectTimeout)) or method in IDEMPOTENT_METHODS
+                if attempt >= self.max_attempts or not retryable:
+                    raise
+                delay = self._get_delay(attempt, {})
+            else:
+                if response.status_code == 401 and not refreshed:
+                    refreshed = True
+                    self._count('retries', '401')
+                    if await asyncio.to_thread(self.ensure_token, auth, token) != 'ok':
+                        return response
+                    token = auth.access_token
+                    continue
+                if not self._is_retryable_status(method, response.status_code) or attempt >= self.max_attempts:
+                    return response
+                self._count('retries', str(response.status_code))
+                delay = self._get_delay(attempt, response.headers)
+                if response.status_code == 429:
+                    self.bucket.pause(delay)
+
+            logger.warning(f'amoCRM {self.base_url}: {method} {endpoint}, повтор {attempt} через {delay:.1f} сек.')
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                'requests': self.requests,
+                'retries': self.retries,
+                'token_refreshes': self.token_refreshes,
+                'errors': dict(self.errors),
+                'rate_limit': self.bucket.get_stats(),
+            }
+
+
+_clients: Dict[str, AmoHttpClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_amo_http_client(subdomain: str) -> AmoHttpClient:
+    """
+    Клиент аккаунта amoCRM, общий для всех потоков процесса.
+    """
+    with _clients_lock:
+        if subdomain not in _clients:
+            _clients[subdomain] = AmoHttpClient(f'https://{subdomain}.amocrm.ru')
+        return _clients[subdomain]
+
+
+def get_amo_http_stats() -> dict:
+    with _clients_lock:
+        clients = dict(_clients)
+    return {subdomain: x.get_stats() for subdomain, x in clients.items()}
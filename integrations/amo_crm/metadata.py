@@ -0,0 +1,110 @@
+"""
+Кэш метаданных аккаунтов amoCRM: воронки и статусы, имена пользователей, описания пользовательских полей.
+
+amoCRM ограничивает количество запросов к API аккаунта (около 7 в секунду), а воронки и пользователи
+запрашивались на каждый обработанный звонок. Ключ кэша – ID аккаунта amoCRM.
+Кэш прогревается в фоне при подключении интеграции (см. warm_up).
+Если ID воронки, статуса или пользователя нет в кэше, запись загружается заново (не чаще min_refresh_interval).
+"""
+from typing import List, Optional, Tuple
+
+from loguru import logger
+
+from data.models import Integration
+from helpers.metadata_cache import MetadataCache
+from integrations.amo_crm.amo_api_core import AmoApi
+
+
+amo_metadata_cache = MetadataCache('amocrm')
+
+
+# Сущности с пользовательскими полями, описания которых загружаются при прогреве.
+CUSTOM_FIELDS_ENTITY_TYPES = ['leads', 'contacts', 'companies']
+
+
+def get_account_key(amo: AmoApi) -> str:
+    return str(amo.integration.account_id or amo.subdomain)
+
+
+def get_pipelines(amo: AmoApi, pipeline_id: Optional[int] = None, status_id: Optional[int] = None) -> List[dict]:
+    """
+    Воронки со статусами (см. AmoApi.get_pipelines). pipeline_id и status_id – воронка и статус,
+    которые должны быть в списке.
+    """
+    def is_valid(pipelines: List[dict]) -> bool:
+        pipeline = get_pipeline(pipelines, pipeline_id)
+        if pipeline_id is not None and pipeline is None:
+            return False
+        return status_id is None or get_status(pipelines, pipeline, status_id) is not None
+
+    return amo_metadata_cache.get(get_account_key(amo), 'pipelines', amo.get_pipelines, is_valid=is_valid)
+
+
+def get_pipeline(pipelines: List[dict], pipeline_id) -> Optional[dict]:
+    return next((x for x in pipelines if str(x['id']) == str(pipeline_id)), None)
+
+
+def get_status(pipelines: List[dict], pipeline: Optional[dict], status_id) -> Optional[dict]:
+    """
+    Статус воронки pipeline. Системные статусы (142, 143) общие для всех воронок,
+    поэтому, если воронка неизвестна, статус ищется во всех воронках.
+    """
+    for x in (pipeline,) if pipeline is not None else pipelines:
+        for status in x['statuses']:
+            if str(status['id']) == str(status_id):
+                return status
+    return None
+
+
+def get_pipeline_and_status_names(amo: AmoApi, lead_id) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Название воронки и название статуса сделки. Сделка запрашивается у amoCRM, названия – из кэша.
+    """
+    lead = amo.get_lead_by_id(lead_id)
+    pipelines = get_pipelines(amo, lead['pipeline_id'], lead['status_id'])
+
+    pipeline = get_pipeline(pipelines, lead['pipeline_id'])
+    status = get_status(pipelines, pipeline, lead['status_id'])
+    return (pipeline['name'] if pipeline else None,
+            status['name'] if status else None)
+
+
+def get_user_name(amo: AmoApi, user_id) -> str:
+    """
+    Имя пользователя amoCRM (ответственного).
+    """
+    def load():
+        user = amo.get_user(user_id)
+        return user['name'] if user is not None else None
+
+    name = amo_metadata_cache.get(get_account_key(amo), 'users', load, subkey=str(user_id),
+                                  is_valid=lambda x: x is not None)
+    return name if name is not None else "Пользователь удален из AmoCRM"
+
+
+def get_custom_fields(amo: AmoApi, entity_type: str) -> List[dict]:
+    """
+    Описания пользовательских полей сущности (leads, contacts, companies).
+    """
+    return amo_metadata_cache.get(get_account_key(amo), 'custom_fields',
+                                  lambda: amo.get_custom_fields(entity_type), subkey=entity_type)
+
+
+def load_account_metadata(integration: Integration) -> None:
+    amo = AmoApi(integration)
+    account = get_account_key(amo)
+    amo_metadata_cache.invalidate(account)
+
+    get_pipelines(amo)
+    for entity_type in CUSTOM_FIELDS_ENTITY_TYPES:
+        get_custom_fields(amo, entity_type)
+    for user in amo.get_users():
+        amo_metadata_cache.put(account, 'users', user['name'], subkey=str(user['id']))
+    logger.info(f'Кэш метаданных amoCRM аккаунта {account} прогрет.')
+
+
+def warm_up(integration: Integration) -> None:
+    """
+    Сбрасывает метаданные аккаунта и загружает их заново в фоне (после подключения или изменения интеграции).
+    """
+    amo_metadata_cache.run_in_background(load_account_metadata, integration)
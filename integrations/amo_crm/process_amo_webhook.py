@@ -1,4 +1,3 @@
-import time
 import urllib.parse
 from datetime import datetime
 from typing import Optional
@@ -11,7 +10,9 @@ from config.const import AmoNoteTypeID
 from data.models import Integration, IntegrationServiceName, Task, CallDownloadAMO, Report, RequestLog
 from data.server_models import LeadNoteAmoWebhook, ContactNoteAmoWebhook, BaseNoteAmoWebhook, make_note_webhook
 from helpers.db_helpers import not_enough_company_balance, create_task
-from helpers.integration_helpers import get_number_from_integration_settings
+from helpers.deferred_jobs import defer, deferred_handler
+from helpers.integration_helpers import get_number_from_integration_settings, get_deal_timeout
+from integrations.amo_crm import metadata as amo_metadata
 from integrations.amo_crm.amo_api_core import AmoApi
 from misc.time import get_refresh_time
 from modules.audio_processor import process_crm_call
@@ -72,7 +73,7 @@ def make_crm_values_to_upload(
     """
     refresh_time = get_refresh_time()
     call_date = webhook.date_create
-    responsible_user_name = amo.get_responsible_user_name(webhook.main_user_id)
+    responsible_user_name = amo_metadata.get_user_name(amo, webhook.main_user_id)
 
     # Формируем ссылку на страницу сделки в AmoCRM.
     if isinstance(webhook, ContactNoteAmoWebhook):
@@ -107,7 +108,7 @@ def make_crm_values_to_upload(
             pipline_name = "У контакта нет связанных сделок"
             status_name = "У контакта нет связанных сделок"
         else:
-            pipline_name, status_name = amo.get_pipeline_and_status_names(lead_id)
+            pipline_name, status_name = amo_metadata.get_pipeline_and_status_names(amo, lead_id)
 
         basic_data_full.extend([
             {'crm_id': 'pipeline', 'value': pipline_name},
@@ -194,6 +195,7 @@ def process_amo_webhook(
         add_pipeline_and_status_names: bool,
         use_reports: bool = False,
         context_id: Optional[str] = None,
+        request_log_id: Optional[int] = None,
 ):
     """
     Обработчик вебхука AMOCRM.
@@ -203,6 +205,8 @@ def process_amo_webhook(
     :param add_pipeline_and_status_names: флаг «добавить к ответу поля «Название канала» и «Название статуса».
     :param use_reports: использовать модель Report (отчет) для фильтрации и обработки звонка.
     :param context_id:
+    :param request_log_id: лог запроса, если обработка была отложена (см. process_amo_webhook_deferred).
+        Вебхук уже записан в RequestLog, задержка get_deal_timeout уже выдержана.
 
     Обрабатывает следующие типы списков:
     1. Сделки.
@@ -231,14 +235,19 @@ def process_amo_webhook(
             request_path = '/amo_webhook/v2'
         else:
             request_path = '/amo_webhook'
-    request_log = RequestLog.create(
-        context_id=context_id,
-        method='POST',
-        path=request_path,
-        headers='',
-        body=str(form_data),
-    )
-    request_log_id = request_log.id
+
+    deferred = request_log_id is not None
+    if deferred:
+        request_log = RequestLog.get(id=request_log_id)
+    else:
+        request_log = RequestLog.create(
+            context_id=context_id,
+            method='POST',
+            path=request_path,
+            headers='',
+            body=str(form_data),
+        )
+        request_log_id = request_log.id
 
     if not webhook.DURATION:
         logger.info(f"[-] AmoCRM: Аккаунт с id {webhook.account_id} имеет DURATION = {webhook.DURATION}. Субдомен: {webhook.account_subdomain}", request_log_id=request_log_id)
@@ -265,28 +274,37 @@ def process_amo_webhook(
         return None
 
     i_data = integration.get_data()
-    amo = AmoApi(integration)
 
     if use_reports:
-        reports = Report.select().where(
+        reports = list(Report.select().where(
             (Report.integration == integration) & (Report.active == True)
-        )
-        if reports.count() == 0:
+        ))
+        if not reports:
             logger.info(f'[-] AmoCRM {webhook.account_subdomain}: Нет активных отчетов.', request_log_id=request_log_id)
             return None
+        get_deal_timeouts = [get_deal_timeout(report.get_report_crm_data()) for report in reports]
+    else:
+        get_deal_timeouts = [get_deal_timeout(i_data.get('crm_data'))]
+
+    # Задержка перед первым выполнением запросов к CRM: обработка откладывается, поток не ждет.
+    # Наибольшая из задержек отчетов – к проверке каждого отчета прошло не меньше его задержки.
+    delay = max(get_deal_timeouts)
+    if delay and not deferred:
+        defer('amocrm_webhook', delay, context_id=context_id,
+              form_items=form_data.multi_items(),
+              add_pipeline_and_status_names=add_pipeline_and_status_names,
+              use_reports=use_reports,
+              request_log_id=request_log_id)
+        return None
 
+    amo = AmoApi(integration)
+
+    if use_reports:
         # Оставляем отчеты, прошедшие фильтры.
         reports_bypass_filters = []
         for report in reports:
             filters = report.get_report_filters()
             settings = report.get_report_settings()
-            crm_data = report.get_report_crm_data()
-
-            if crm_data:
-                # Задержка перед первым выполнением запросов к CRM.
-                get_deal_timeout = crm_data.get('get_deal_timeout')
-                if get_deal_timeout:
-                    time.sleep(get_deal_timeout)
 
             if amo.check_call_filters(webhook, filters, settings):
                 reports_bypass_filters.append(report)
@@ -312,12 +330,6 @@ def process_amo_webhook(
         crm_data = i_data.get('crm_data')
         report = None
 
-        if crm_data:
-            # Задержка перед первым выполнением запросов к CRM.
-            get_deal_timeout = crm_data.get('get_deal_timeout')
-            if get_deal_timeout:
-                time.sleep(get_deal_timeout)
-
         filters_succeed = amo.check_call_filters(webhook, filters, settings, request_log_id=request_log_id)
         if not filters_succeed:
             return None
@@ -417,3 +429,11 @@ def process_amo_webhook_v2_report(form_data, **kwargs):
     Обработчик вебхука AMOCRM v2 с отчетами `Report`.
     """
     process_amo_webhook(form_data, add_pipeline_and_status_names=True, use_reports=True, **kwargs)
+
+
+@deferred_handler('amocrm_webhook')
+def process_amo_webhook_deferred(form_items: list, request_log_id: int, **kwargs):
+    """
+    Обработка вебхука AMOCRM после задержки get_deal_timeout.
+    """
+    process_amo_webhook(FormData([tuple(x) for x in form_items]), request_log_id=request_log_id, **kwargs)
@@ -1,17 +1,144 @@
-from typing import Optional, List
-from urllib.parse import urlparse
+import re
+import time
+from typing import Any, Dict, Optional, List, Tuple
+from urllib.parse import urlparse, quote
 
 import bitrix24
+import requests
+from loguru import logger
 
-from integrations.bitrix.exceptions import DataIsNotReadyError
+from integrations.bitrix.exceptions import DataIsNotReadyError, BitrixApiError
 from integrations.bitrix.models import CRMEntityType, CRMEntityTypeID
 
 
+# Максимальное количество команд в одном запросе batch.
+BATCH_MAX_COMMANDS = 50
+
+# Ссылка на результат другой команды пакета: $result[ключ][0][ПОЛЕ].
+RESULT_REF_PATTERN = re.compile(r'^\$result\[([^\]]+)\]((?:\[[^\]]*\])*)$')
+
+
+def build_query_pairs(params: Any, prefix: str = '') -> List[Tuple[str, str]]:
+    """
+    Параметры метода в виде пар ключ-значение строки запроса PHP: filter[ID]=1, select[0]=NAME.
+    """
+    if isinstance(params, dict):
+        items = params.items()
+    elif isinstance(params, (list, tuple)):
+        items = enumerate(params)
+    else:
+        if params is None:
+            value = ''
+        elif isinstance(params, bool):
+            value = 'Y' if params else 'N'
+        else:
+            value = str(params)
+        return [(prefix, value)]
+
+    pairs = []
+    for key, value in items:
+        pairs.extend(build_query_pairs(value, f'{prefix}[{key}]' if prefix else str(key)))
+    return pairs
+
+
+def encode_command(method: str, params: Optional[dict] = None) -> str:
+    """
+    Команда пакета batch: "метод?параметры". Ссылки $result[...] и скобки ключей не экранируются.
+    """
+    query = '&'.join(f'{quote(key, safe="[]")}={quote(value, safe="$[]")}'
+                     for key, value in build_query_pairs(params or {}))
+    return f'{method}?{query}' if query else method
+
+
+class BitrixBatch:
+    """
+    Независимые запросы, выполняемые методом batch (до BATCH_MAX_COMMANDS команд за запрос).
+
+    Параметр команды может ссылаться на результат другой команды: BitrixBatch.ref('user', 0, 'UF_DEPARTMENT', 0).
+    Внутри одного запроса ссылки подставляет Битрикс, а при разбиении на несколько запросов ссылки
+    на результаты предыдущих запросов подставляются перед отправкой.
+    Списочные методы в batch возвращают только первую страницу (50 элементов) – остальные страницы
+    таких команд запрашиваются отдельно.
+
+    Документация:
+        https://apidocs.bitrix24.ru/api-reference/how-to-call-rest-api/batch.html
+    """
+    def __init__(self, bitrix: 'Bitrix24'):
+        self.bitrix = bitrix
+        # Ключ -> (метод, параметры) в порядке добавления.
+        self.commands: Dict[str, Tuple[str, dict]] = {}
+        self.results: Dict[str, Any] = {}
+        self.errors: Dict[str, Any] = {}
+
+    def add(self, key: str, method: str, params: Optional[dict] = None) -> None:
+        self.commands[key] = (method, params or {})
+
+    @staticmethod
+    def ref(key: str, *path) -> str:
+        return f'$result[{key}]' + ''.join(f'[{x}]' for x in path)
+
+    def _resolve(self, value: Any, pending_keys: set) -> Any:
+        """
+        Подставляет в параметры результаты уже выполненных команд.
+        Ссылки на команды из pending_keys (того же запроса) остаются для Битрикс.
+        """
+        if isinstance(value, dict):
+            return {k: self._resolve(v, pending_keys) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._resolve(x, pending_keys) for x in value]
+        if not isinstance(value, str):
+            return value
+
+        match = RESULT_REF_PATTERN.match(value)
+        if match is None or match.group(1) in pending_keys:
+            return value
+
+        result = self.results.get(match.group(1))
+        for part in re.findall(r'\[([^\]]*)\]', match.group(2)):
+            try:
+                result = result[int(part) if isinstance(result, list) else part]
+            except (KeyError, IndexError, TypeError, ValueError):
+                return None
+        return result
+
+    def execute(self, halt: bool = False) -> Dict[str, Any]:
+        """
+        Выполняет накопленные команды. Возвращает результаты по ключам;
+        ошибки отдельных команд сохраняются в errors (результата для таких ключей нет).
+        """
+        keys = list(self.commands)
+        for chunk_start in range(0, len(keys), BATCH_MAX_COMMANDS):
+            chunk_keys = keys[chunk_start:chunk_start + BATCH_MAX_COMMANDS]
+            commands = {
+                key: encode_command(self.commands[key][0], self._resolve(self.commands[key][1], set(chunk_keys)))
+                for key in chunk_keys
+            }
+            response = self.bitrix.call_batch(commands, halt=halt)
+
+            # Пустые объекты PHP возвращает как [].
+            results = response.get('result') or {}
+            self.results.update(results if isinstance(results, dict) else {})
+            errors = response.get('result_error') or {}
+            self.errors.update(errors if isinstance(errors, dict) else {})
+
+            next_pages = response.get('result_next') or {}
+            for key in (next_pages if isinstance(next_pages, dict) else {}):
+                method, params = self.commands[key]
+                self.results[key] = self.bitrix.bx24.callMethod(method, params=self._resolve(params, set()))
+
+        for key, error in self.errors.items():
+            logger.warning(f'Bitrix24 {self.bitrix.domain}: ошибка команды batch {key} '
+                           f'({self.commands[key][0]}): {error}')
+        self.commands.clear()
+        return self.results
+
+
 class Bitrix24:
 
     def __init__(self, webhook):
         self.bx24 = bitrix24.Bitrix24(webhook)
         self.domain = self.extract_domain(webhook)
+        self.rest_url = self.get_rest_url(webhook)
         self.entity_calls = None
 
     def check_integration(self):
@@ -33,20 +160,65 @@ class Bitrix24:
         """
         return urlparse(webhook).hostname
 
-    def get_call_info(self, call_id) -> dict:
+    @staticmethod
+    def get_rest_url(webhook: str) -> str:
         """
-        Возвращает информацию о звонке по его ID.
+        Адрес REST API вебхука: https://домен/rest/ID пользователя/код.
         """
-        bx_method = "voximplant.statistic.get"
-        bx_filter = {"CALL_ID": call_id}
-        response = self.bx24.callMethod(bx_method, filter=bx_filter)
+        o = urlparse(webhook)
+        user_id, code = o.path.split('/')[2:4]
+        return f'{o.scheme}://{o.netloc}/rest/{user_id}/{code}'
+
+    def new_batch(self) -> BitrixBatch:
+        return BitrixBatch(self)
 
+    def call_batch(self, commands: Dict[str, str], halt: bool = False, tries: int = 3) -> dict:
+        """
+        Выполняет до BATCH_MAX_COMMANDS команд ("метод?параметры") одним запросом.
+        Возвращает result ответа: result, result_error, result_total, result_next.
+        """
+        if len(commands) > BATCH_MAX_COMMANDS:
+            raise ValueError(f'В одном запросе batch не больше {BATCH_MAX_COMMANDS} команд.')
+
+        for attempt in range(1, tries + 1):
+            response = requests.post(f'{self.rest_url}/batch.json',
+                                     json={'halt': int(halt), 'cmd': commands},
+                                     timeout=60)
+            try:
+                data = response.json()
+            except ValueError:
+                response.raise_for_status()
+                raise
+
+            error = data.get('error')
+            if error == 'QUERY_LIMIT_EXCEEDED' and attempt < tries:
+                time.sleep(attempt)
+                continue
+            if error:
+                raise BitrixApiError(f'{error}: {data.get("error_description")}')
+            response.raise_for_status()
+            return data['result']
+
+    @staticmethod
+    def parse_call_info(response: list) -> dict:
+        """
+        Первая запись статистики звонка. Ошибки – как в get_call_info.
+        """
         call_info = response[0]
         if call_info.get("RECORD_FILE_ID") is None:
             raise DataIsNotReadyError('Звонок еще не загрузился в Битрикс')
 
         return call_info
 
+    def get_call_info(self, call_id) -> dict:
+        """
+        Возвращает информацию о звонке по его ID.
+        """
+        bx_method = "voximplant.statistic.get"
+        bx_filter = {"CALL_ID": call_id}
+        response = self.bx24.callMethod(bx_method, filter=bx_filter)
+        return self.parse_call_info(response)
+
     def get_file_info(self, file_id):
         """
         Возвращает информацию о файле
@@ -248,7 +420,13 @@ class Bitrix24:
         """
         Возвращает ID сделки дела.
         """
-        bindings = self.get_activity_bindings_list(activity_id)
+        return self.get_bindings_deal_id(self.get_activity_bindings_list(activity_id))
+
+    @staticmethod
+    def get_bindings_deal_id(bindings: List[dict]) -> Optional[int]:
+        """
+        Возвращает ID сделки из списка связей дела.
+        """
         for item in bindings:
             if item['entityTypeId'] == CRMEntityTypeID.DEAL:
                 return item['entityId']
@@ -430,7 +608,14 @@ class Bitrix24:
         """
         Возвращает список воронок.
         """
-        deal_categories = self.get_category_list(CRMEntityTypeID.DEAL.value)['categories']
+        return self.make_funnels(self.get_category_list(CRMEntityTypeID.DEAL.value))
+
+    @staticmethod
+    def make_funnels(category_list: dict) -> List[dict]:
+        """
+        Воронки сделок из ответа crm.category.list.
+        """
+        deal_categories = category_list['categories']
 
         funnels = []
         for category in deal_categories:
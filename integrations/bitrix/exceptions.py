@@ -13,3 +13,8 @@ class DataIsNotReadyError(BaseBitrixException):
     """Данные еще не готовы для получения из Битрикс"""
     pass
 
+
+
+class BitrixApiError(BaseBitrixException):
+    """Ошибка, возвращенная REST API Битрикс"""
+    pass
@@ -0,0 +1,123 @@
+"""
+Кэш метаданных порталов Битрикс24: воронки, этапы, пользователи, отделы, описания полей.
+
+Ключ кэша – домен портала. Метаданные меняются редко, а запрашивались на каждый вебхук звонка.
+Записи сбрасываются во всех процессах сервера по событиям портала (см. get_event_kinds и /bitrix_webhook/events)
+или администратором (/status/crm_metadata_cache).
+События принимаются, только если auth[application_token] исходящего вебхука совпадает
+с data['access']['application_token'] интеграции портала.
+Если ID воронки, этапа или пользователя нет в кэше, запись загружается заново (не чаще min_refresh_interval),
+поэтому новые этапы видны без ожидания TTL.
+"""
+from typing import List, Optional
+
+from helpers.metadata_cache import MetadataCache
+from integrations.bitrix.bitrix_api import Bitrix24
+from integrations.bitrix.models import CRMEntityType
+
+
+bitrix_metadata_cache = MetadataCache('bitrix24')
+
+
+ENTITY_FIELDS_METHODS = {
+    'deal': Bitrix24.get_deal_fields,
+    'lead': Bitrix24.get_lead_fields,
+    'contact': Bitrix24.get_contact_fields,
+    'company': Bitrix24.get_company_fields,
+}
+
+
+def has_id(items: List[dict], item_id, id_key: str = 'ID') -> bool:
+    return item_id is None or any(str(x.get(id_key)) == str(item_id) for x in items)
+
+
+def get_funnels(bx24: Bitrix24, funnel_id: Optional[str] = None) -> List[dict]:
+    """
+    Воронки сделок портала. funnel_id – воронка, которая должна быть в списке.
+    """
+    return bitrix_metadata_cache.get(bx24.domain, 'funnels', bx24.get_funnels,
+                                     is_valid=lambda funnels: has_id(funnels, funnel_id))
+
+
+def get_stages(bx24: Bitrix24, funnel_id: str, status_id: Optional[str] = None) -> List[dict]:
+    """
+    Этапы воронки сделок. status_id – этап, который должен быть в списке.
+    """
+    return bitrix_metadata_cache.get(bx24.domain, 'stages', lambda: bx24.get_stages(funnel_id), subkey=funnel_id,
+                                     is_valid=lambda stages: has_id(stages, status_id, 'STATUS_ID'))
+
+
+def get_lead_stages(bx24: Bitrix24, status_id: Optional[str] = None) -> List[dict]:
+    """
+    Этапы лидов. status_id – этап, который должен быть в списке.
+    """
+    return bitrix_metadata_cache.get(bx24.domain, 'stages', bx24.get_lead_stages, subkey=CRMEntityType.LEAD,
+                                     is_valid=lambda stages: has_id(stages, status_id, 'STATUS_ID'))
+
+
+def get_funnels_with_stages(bx24: Bitrix24) -> List[dict]:
+    return [
+        {'id': x['ID'], 'name': x['NAME'], 'stages': get_stages(bx24, x['ID'])}
+        for x in get_funnels(bx24)
+    ]
+
+
+def get_user(bx24: Bitrix24, portal_user_id) -> Optional[dict]:
+    """
+    Пользователь портала или None, если его нет.
+    """
+    def load():
+        users = bx24.get_users(portal_user_id)
+        return users[0] if users else None
+
+    return bitrix_metadata_cache.get(bx24.domain, 'users', load, subkey=str(portal_user_id),
+                                     is_valid=lambda user: user is not None)
+
+
+def get_department_name(bx24: Bitrix24, department_id) -> Optional[str]:
+    def load():
+        departments = bx24.get_department(department_id)
+        return departments[0].get('NAME') if departments else None
+
+    return bitrix_metadata_cache.get(bx24.domain, 'departments', load, subkey=str(department_id))
+
+
+def get_user_department_name(bx24: Bitrix24, user: Optional[dict]) -> Optional[str]:
+    """
+    Название первого отдела пользователя.
+    """
+    department_ids = (user or {}).get('UF_DEPARTMENT') or []
+    if not department_ids:
+        return None
+    return get_department_name(bx24, department_ids[0])
+
+
+def get_entity_fields(bx24: Bitrix24, entity_type: str) -> dict:
+    """
+    Описание полей сущности (deal, lead, contact, company), в том числе пользовательских.
+    """
+    method = ENTITY_FIELDS_METHODS[entity_type]
+    return bitrix_metadata_cache.get(bx24.domain, 'fields', lambda: method(bx24), subkey=entity_type)
+
+
+def get_event_kinds(event: str) -> Optional[List[str]]:
+    """
+    Типы метаданных, которые меняет событие портала. None – сбросить все записи портала.
+
+    Изменение самих сделок и лидов (ONCRMDEALUPDATE, ONCRMLEADUPDATE) метаданные не меняет:
+    если сделка попала в новую воронку или этап, запись загрузится заново по is_valid.
+    """
+    event = event.upper()
+    if 'USERFIELD' in event:
+        return ['fields']
+    if event.startswith('ONUSER'):
+        return ['users', 'departments']
+    if event.startswith('ONDEPARTMENT'):
+        return ['departments']
+    if 'CATEGORY' in event or 'STATUS' in event or 'STAGE' in event:
+        return ['funnels', 'stages']
+    if event.startswith('ONCRM') and event.endswith(('ADD', 'UPDATE', 'DELETE')):
+        return []
+    if event == 'ONAPPUNINSTALL':
+        return None
+    return []
@@ -1,6 +1,5 @@
-import time
 from collections import defaultdict
-from typing import List, Optional
+from typing import Iterable, List, Optional
 from urllib.parse import parse_qs
 
 from loguru import logger
@@ -9,9 +8,13 @@ from requests import HTTPError
 from config import config as cfg
 from data.models import Integration, IntegrationServiceName, CallDownload, Task, Report, RequestLog
 from helpers.db_helpers import not_enough_company_balance, create_task
+from helpers.deferred_jobs import defer, deferred_handler
+from helpers.integration_helpers import get_deal_timeout
 from integrations.bitrix.bitrix_api import Bitrix24
 from integrations.bitrix.bx_models import BxWhData
-from integrations.bitrix.exceptions import BadWebhookError, DataIsNotReadyError
+from integrations.bitrix.exceptions import BadWebhookError, DataIsNotReadyError, BitrixApiError
+from integrations.bitrix.metadata import (get_funnels, get_lead_stages, get_stages, get_user,
+                                          get_user_department_name)
 from integrations.bitrix.models import CRMEntityType, CallType, CRMEntityTypeID
 from misc.time import get_refresh_time
 from modules.audio_processor import process_crm_call
@@ -199,38 +202,55 @@ def check_responsible_users(domain, bx_wh_data, filters, request_log_id: Optiona
         return True
 
 
-def get_bitrix_call_info(bx24, call_id, webhook_url, body_str, api_router=None) -> dict:
+# Методы получения сущностей CRM по типу.
+ENTITY_GET_METHODS = {
+    CRMEntityType.CONTACT: 'crm.contact.get',
+    CRMEntityType.COMPANY: 'crm.company.get',
+    CRMEntityType.LEAD: 'crm.lead.get',
+    CRMEntityType.DEAL: 'crm.deal.get',
+}
+
+
+def get_call_context(bx24: Bitrix24, bx_wh_data: BxWhData, webhook_url, body_str, api_router=None) -> tuple:
     """
-    Получает информацию о звонке по его ID.
+    Получает одним запросом batch информацию о звонке, ссылку на запись и связи дела звонка.
+    Возвращает (call_info, call_url, bindings).
     В случае ошибки создает повторную попытку загрузки звонка.
     """
+    batch = bx24.new_batch()
+    batch.add('call_info', 'voximplant.statistic.get', {'filter': {'CALL_ID': bx_wh_data.CALL_ID}})
+    batch.add('file', 'disk.file.get', {'id': batch.ref('call_info', 0, 'RECORD_FILE_ID')})
+    if bx_wh_data.CRM_ACTIVITY_ID != 0:
+        logger.debug(f'Получаем биндинг для activity_id={bx_wh_data.CRM_ACTIVITY_ID}')
+        batch.add('bindings', 'crm.activity.binding.list', {'activityId': bx_wh_data.CRM_ACTIVITY_ID})
+    results = batch.execute()
+
     try:
-        call_info = bx24.get_call_info(call_id)
+        call_info = bx24.parse_call_info(results.get('call_info') or [])
     except (IndexError, DataIsNotReadyError) as ex:
 
         if isinstance(ex, IndexError):
             logger.error(f'Не удалось получить информацию о звонке. Проверьте вебхук. '
-                         f'CALL ID: {call_id}. Domain: {bx24.domain}.')
+                         f'CALL ID: {bx_wh_data.CALL_ID}. Domain: {bx24.domain}.')
         elif isinstance(ex, DataIsNotReadyError):
             logger.info('Звонок еще не загрузился в Битрикс.')
-        CallDownload.create_or_update_from_webhook(call_id, body_str, webhook_url, api_router=api_router)
+        CallDownload.create_or_update_from_webhook(bx_wh_data.CALL_ID, body_str, webhook_url, api_router=api_router)
 
         raise BadWebhookError
 
-    return call_info
+    if 'file' in results:
+        call_url = results['file']['DOWNLOAD_URL']
+    else:
+        call_url = bx24.get_call_url(call_info['RECORD_FILE_ID'])
 
+    return call_info, call_url, results.get('bindings') or []
 
-def get_webhook_entity_and_type(
-        bx24: Bitrix24,
-        activity_id: int,
-) -> tuple:
+
+def get_bindings_entity(bindings: List[dict]) -> tuple:
     """
-    Определяет нужный биндинг в данных вебхука
+    Определяет нужный биндинг среди связей дела звонка
     и возвращает его entity_type и entity_id.
     """
-    logger.debug(f'Получаем биндинг для {activity_id=}')
-
-    bindings = bx24.get_activity_bindings_list(activity_id)
     webhook_binding = None
 
     binding_map = defaultdict(list)
@@ -267,33 +287,96 @@ def get_webhook_entity_and_type(
         logger.error(f"[!] Неизвестный тип сущности: {crm_entity_type_id}")
         raise
 
-    logger.debug(f'Определили сущность {crm_entity_type=} {crm_entity_id=} для {activity_id=}.')
+    logger.debug(f'Определили сущность {crm_entity_type=} {crm_entity_id=}.')
     return crm_entity_type, crm_entity_id
 
 
-def get_entity_and_entity_deal(bx24, entity_type, entity_id, activity_id) -> tuple:
-    # Сущность события.
-    if entity_type == CRMEntityType.CONTACT:
-        entity = bx24.get_contact(entity_id)
-    elif entity_type == CRMEntityType.COMPANY:
-        entity = bx24.get_company(entity_id)
-    elif entity_type == CRMEntityType.LEAD:
-        entity = bx24.get_lead(entity_id)
-    elif entity_type == CRMEntityType.DEAL:
-        entity = bx24.get_deal(entity_id)
-    else:
-        entity = None
+def get_crm_context(
+        bx24: Bitrix24,
+        crm_entity_type: Optional[str],
+        crm_entity_id,
+        bindings: List[dict],
+        call_info: dict,
+        portal_user_id=None,
+        system_fields: Iterable[str] = (),
+        with_entity_calls: bool = False,
+        min_call_duration: Optional[int] = None,
+) -> dict:
+    """
+    Получает одним запросом batch сущность звонка, прикрепленную к ней сделку и звонки сущности.
+    Данные для системных полей (ответственный, департамент, воронки, этапы) берутся из кэша метаданных портала
+    (см. integrations/bitrix/metadata.py).
 
-    # Сделка, прикрепленная к сущности.
-    deal = None
-    if entity_type in [CRMEntityType.CONTACT, CRMEntityType.COMPANY]:
-        deal_id = bx24.get_activity_deal_id(activity_id)
+    Ключи результата: entity, entity_deal, entity_calls, user, department_name, funnels, stages.
+    """
+    system_fields = set(system_fields)
+    batch = bx24.new_batch()
+
+    # Сущность события и сделка, прикрепленная к контакту или компании.
+    if crm_entity_type in ENTITY_GET_METHODS:
+        batch.add('entity', ENTITY_GET_METHODS[crm_entity_type], {'id': crm_entity_id})
+    if crm_entity_type in [CRMEntityType.CONTACT, CRMEntityType.COMPANY]:
+        deal_id = bx24.get_bindings_deal_id(bindings)
         if deal_id:
-            deal = bx24.get_deal(deal_id)
+            batch.add('deal', 'crm.deal.get', {'id': deal_id})
         else:
-            logger.warning(f'Не удалось найти сделку сущности {activity_id=}.')
+            logger.warning(f'Не удалось найти сделку сущности {crm_entity_type} {crm_entity_id}.')
+
+    # Звонки сущности. Если у сущности биндинга звонков нет, берем звонки сущности из call_info.
+    if with_entity_calls and crm_entity_type is not None:
+        for key, (entity_type, entity_id) in {
+            'entity_calls': (crm_entity_type, crm_entity_id),
+            'call_entity_calls': (call_info['CRM_ENTITY_TYPE'], call_info['CRM_ENTITY_ID']),
+        }.items():
+            bx_filter = {'CRM_ENTITY_TYPE': entity_type, 'CRM_ENTITY_ID': entity_id}
+            if min_call_duration is not None:
+                bx_filter['>CALL_DURATION'] = min_call_duration
+            batch.add(key, 'voximplant.statistic.get', {'filter': bx_filter, 'sort': 'CALL_START_DATE', 'order': 'ASC'})
+
+    results = batch.execute()
+    for key in ['entity', 'deal']:
+        if key in batch.errors:
+            raise BitrixApiError(f'Не удалось получить {key} ({crm_entity_type} {crm_entity_id}): {batch.errors[key]}')
+
+    entity = results.get('entity')
+    entity_deal = results.get('deal')
+
+    entity_calls = results.get('entity_calls') or results.get('call_entity_calls') or []
+    if with_entity_calls:
+        bx24.entity_calls = entity_calls
+
+    user = get_user(bx24, portal_user_id) if portal_user_id else None
+    department_name = None
+    if 'department' in system_fields:
+        department_name = get_user_department_name(bx24, user)
 
-    return entity, deal
+    pipeline_id = None
+    status_id = None
+    if crm_entity_type is not None and (entity is not None or entity_deal is not None):
+        pipeline_id = get_pipeline_id(crm_entity_type, entity, entity_deal)
+        status_id = get_status_id(crm_entity_type, entity, entity_deal)
+
+    funnels = []
+    if crm_entity_type is not None and 'pipeline' in system_fields:
+        is_deal_funnel = pipeline_id is not None and crm_entity_type != CRMEntityType.LEAD
+        funnels = get_funnels(bx24, pipeline_id if is_deal_funnel else None)
+
+    stages = []
+    if 'stage' in system_fields and status_id is not None:
+        if crm_entity_type == CRMEntityType.LEAD:
+            stages = get_lead_stages(bx24, status_id)
+        elif pipeline_id is not None:
+            stages = get_stages(bx24, pipeline_id, status_id)
+
+    return {
+        'entity': entity,
+        'entity_deal': entity_deal,
+        'entity_calls': entity_calls,
+        'user': user,
+        'department_name': department_name or 'Не указано',
+        'funnels': funnels,
+        'stages': stages,
+    }
 
 
 def make_crm_values_to_upload(
@@ -304,19 +387,21 @@ def make_crm_values_to_upload(
         crm_data: Optional[dict],
         crm_entity_type: Optional[str],
         crm_entity_id: Optional[str],
-        entity,
-        entity_deal,
-        call_info,
+        crm_context: dict,
         domain: str,
 ):
     """
     Генерация ячеек для Google таблицы (значения из CRM).
+    Данные CRM берутся из crm_context (см. get_crm_context).
 
     Для сохранения значения в БД в качестве ответа на CRM-колонку – указать crm_id.
     """
+    entity = crm_context['entity']
+    entity_deal = crm_context['entity_deal']
 
     call_date = bx_wh_data.CALL_START_DATE.strftime("%Y-%m-%d %H:%M")
-    responsible_user_name = bx24.get_user_name(bx_wh_data.PORTAL_USER_ID)
+    user = crm_context['user']
+    responsible_user_name = f"{user['NAME']} {user['LAST_NAME']}" if user else ''
 
     basic_data_full = [
         {'crm_id': 'refresh_time', 'value': get_refresh_time()},
@@ -333,7 +418,7 @@ def make_crm_values_to_upload(
         if 'department' in system_fields:
             basic_data_full.append({
                 'crm_id': 'department',
-                'value': bx24.get_department_name_by_user_id(bx_wh_data.PORTAL_USER_ID),
+                'value': crm_context['department_name'],
             })
 
         # Выгрузка ссылки на сущность, к которой привязан звонок
@@ -362,8 +447,7 @@ def make_crm_values_to_upload(
             if crm_entity_type is None:
                 value = ''
             else:
-                entity_calls = bx24.get_entity_calls(crm_entity_type, crm_entity_id, call_info)
-                value = str(len(entity_calls))
+                value = str(len(crm_context['entity_calls']))
             basic_data_full.append({
                 'crm_id': 'index_number',
                 'value': value,
@@ -375,8 +459,7 @@ def make_crm_values_to_upload(
             if crm_entity_type is not None:
                 pipeline_id = get_pipeline_id(crm_entity_type, entity, entity_deal)
                 if pipeline_id is not None:
-                    funnels = bx24.get_funnels()
-                    for funnel in funnels:
+                    for funnel in crm_context['funnels']:
                         if funnel['ID'] == pipeline_id:
                             funnel_name = funnel['NAME']
                             break
@@ -389,25 +472,13 @@ def make_crm_values_to_upload(
         if 'stage' in system_fields:
             stage_name = ''
             if crm_entity_type is not None:
-                stages = {}
                 status_id = get_status_id(crm_entity_type, entity, entity_deal)
 
-                if status_id is not None:
-                    # Получаем название этапа лида.
-                    if crm_entity_type == CRMEntityType.LEAD:
-                        stages = bx24.get_lead_stages()
-
-                    # Получаем название этапа сделки.
-                    else:  # CONTACT, DEAL, COMPANY
-
-                        # Получаем воронку сделки.
-                        pipeline_id = get_pipeline_id(crm_entity_type, entity, entity_deal)
-                        if pipeline_id is not None:
-                            stages = bx24.get_stages(pipeline_id)
-
-                    if stages:
-                        stages = {x['STATUS_ID']: x['NAME'] for x in stages}
-                        stage_name = stages.get(status_id, '')
+                # Этапы лидов или воронки сделки.
+                stages = crm_context['stages']
+                if status_id is not None and stages:
+                    stages = {x['STATUS_ID']: x['NAME'] for x in stages}
+                    stage_name = stages.get(status_id, '')
 
             basic_data_full.append({
                 'crm_id': 'stage',
@@ -426,9 +497,15 @@ def make_crm_values_to_upload(
     return basic_data_full
 
 
-def process_bx_webhook_v2(request_body: bytes, request_log_id: Optional[int] = None):
+def process_bx_webhook_v2(
+        request_body: bytes,
+        request_log_id: Optional[int] = None,
+        context_id: Optional[str] = None,
+        deferred: bool = False,
+):
     """
-    Обработчик вебхука Bitrix24
+    Обработчик вебхука Bitrix24.
+    deferred – обработка была отложена (см. process_bx_webhook_deferred), задержка get_deal_timeout уже выдержана.
     """
     body_str = request_body.decode("utf-8")
     bx_webhook = parse_body_str(body_str)
@@ -466,24 +543,42 @@ def process_bx_webhook_v2(request_body: bytes, request_log_id: Optional[int] = N
         request_log.company = integration.company
         request_log.save(only=['company'])
 
-    reports = Report.select().where(
+    reports = list(Report.select().where(
         (Report.integration == integration) & (Report.active == True)
-    )
+    ))
+    if not reports:
+        logger.info(f"[-] Bitrix24 V2. Аккаунт: {domain}. Нет связанных отчётов.", request_log_id=request_log_id)
+        return None
+
+    # Фильтры по данным вебхука не требуют запросов к CRM и проверяются до откладывания обработки.
+    reports_bypass_webhook_filters = []
+    for report in reports:
+        if report_bypass_webhook_filters(report, bx_wh_data, domain, request_log_id=request_log_id):
+            reports_bypass_webhook_filters.append(report)
+        else:
+            logger.info(f"[-] Bitrix24 V2. Аккаунт: {domain}. Отчет ID={report.id} не прошел фильтры.")
+    if not reports_bypass_webhook_filters:
+        logger.info(f"[-] Bitrix24 V2. Аккаунт: {domain}. Нет отчётов, прошедших фильтры {bx_wh_data.CALL_ID}.", request_log_id=request_log_id)
+        return None
+
+    # Задержка перед первым выполнением запросов к CRM: обработка откладывается, поток не ждет.
+    # Наибольшая из задержек отчетов – к проверке каждого отчета прошло не меньше его задержки.
+    delay = max(get_deal_timeout(report.get_report_crm_data()) for report in reports_bypass_webhook_filters)
+    if delay and not deferred:
+        defer('bitrix24_webhook', delay, context_id=context_id,
+              body_str=body_str, request_log_id=request_log_id)
+        return None
 
     reports_bypass_filters = []
 
     webhook_url = integration.get_decrypted_access_field('webhook_url')
-    if reports:
-        for report in reports:
-            is_valid_report = report_bypass_filters(report, bx_wh_data, domain, body_str, webhook_url,
-                                                    request_log_id=request_log_id)
-            if is_valid_report:
-                reports_bypass_filters.append(report)
-            else:
-                logger.info(f"[-] Bitrix24 V2. Аккаунт: {domain}. Отчет ID={report.id} не прошел фильтры.")
-    else:
-        logger.info(f"[-] Bitrix24 V2. Аккаунт: {domain}. Нет связанных отчётов.", request_log_id=request_log_id)
-        return None
+    for report in reports_bypass_webhook_filters:
+        is_valid_report = report_bypass_filters(report, bx_wh_data, domain, body_str, webhook_url,
+                                                request_log_id=request_log_id)
+        if is_valid_report:
+            reports_bypass_filters.append(report)
+        else:
+            logger.info(f"[-] Bitrix24 V2. Аккаунт: {domain}. Отчет ID={report.id} не прошел фильтры.")
 
     if reports_bypass_filters:
         # Выбор report с минимальным значением priority
@@ -499,15 +594,14 @@ def process_bx_webhook_v2(request_body: bytes, request_log_id: Optional[int] = N
     bx24 = Bitrix24(webhook_url)
 
     try:
-        call_info = get_bitrix_call_info(bx24, bx_wh_data.CALL_ID, webhook_url, body_str, api_router='/bitrix_webhook/v2')
+        call_info, call_url, bindings = get_call_context(bx24, bx_wh_data, webhook_url, body_str,
+                                                         api_router='/bitrix_webhook/v2')
     except BadWebhookError:
         return None
 
     filters = highest_priority_report.get_report_filters()
     crm_data = highest_priority_report.get_report_crm_data()
 
-    call_url = bx24.get_call_url(call_info['RECORD_FILE_ID'])
-
     # Скачивание аудиофайла
     try:
         audio: Audiofile = Audiofile().load_from_url(call_url)
@@ -548,17 +642,19 @@ def process_bx_webhook_v2(request_body: bytes, request_log_id: Optional[int] = N
         task.save(only=['request_log'])
         logger.info(f'Связал Task с RequestLog {request_log_id}.')
 
-    if bx_wh_data.CRM_ACTIVITY_ID != 0:
-        crm_entity_type, crm_entity_id = get_webhook_entity_and_type(bx24, bx_wh_data.CRM_ACTIVITY_ID)
-    else:
-        crm_entity_type, crm_entity_id = None, None
+    crm_entity_type, crm_entity_id = get_bindings_entity(bindings)
+
+    # Сущность, сделка и данные системных полей – одним запросом.
+    system_fields = (crm_data or {}).get('system_fields') or []
+    crm_context = get_crm_context(bx24, crm_entity_type, crm_entity_id, bindings, call_info,
+                                  portal_user_id=bx_wh_data.PORTAL_USER_ID,
+                                  system_fields=system_fields,
+                                  with_entity_calls='index_number' in system_fields)
+    entity_deal = crm_context['entity_deal']
 
     if crm_entity_type is not None:
-        entity, entity_deal = get_entity_and_entity_deal(bx24, crm_entity_type, crm_entity_id,
-                                                         bx_wh_data.CRM_ACTIVITY_ID)
         deal_url = bx24.get_deal_url(crm_entity_type, crm_entity_id)
     else:
-        entity, entity_deal = None, None
         deal_url = None
 
     if deal_url is None:
@@ -571,9 +667,7 @@ def process_bx_webhook_v2(request_body: bytes, request_log_id: Optional[int] = N
                                                      crm_data,
                                                      crm_entity_type,
                                                      crm_entity_id,
-                                                     entity,
-                                                     entity_deal,
-                                                     call_info,
+                                                     crm_context,
                                                      domain)
 
     # Анализ аудиозаписи и выгрузка отчета.
@@ -602,10 +696,12 @@ def process_bx_webhook_v2(request_body: bytes, request_log_id: Optional[int] = N
     return None
 
 
-def report_bypass_filters(report: Report, bx_wh_data: BxWhData, domain, body_str, webhook_url,
-                          request_log_id: Optional[None] = None) -> bool:
+def report_bypass_webhook_filters(report: Report, bx_wh_data: BxWhData, domain,
+                                  request_log_id: Optional[None] = None) -> bool:
+    """
+    Фильтры отчета по данным вебхука (без запросов к CRM): длительность, ответственный, тип звонка, телефон.
+    """
     filters = report.get_report_filters()
-    crm_data = report.get_report_crm_data()
 
     # Первичная проверка длительности звонка
     min_call_duration = filters.get("min_duration")
@@ -635,27 +731,31 @@ def report_bypass_filters(report: Report, bx_wh_data: BxWhData, domain, body_str
                     request_log_id=request_log_id)
         return False
 
-    if crm_data:
-        get_deal_timeout = crm_data.get('get_deal_timeout')
-        if get_deal_timeout:
-            time.sleep(get_deal_timeout)
+    return True
+
+
+def report_bypass_filters(report: Report, bx_wh_data: BxWhData, domain, body_str, webhook_url,
+                          request_log_id: Optional[None] = None) -> bool:
+    """
+    Фильтры отчета, требующие запросов к CRM. Фильтры по данным вебхука (report_bypass_webhook_filters)
+    уже пройдены.
+    """
+    filters = report.get_report_filters()
+    min_call_duration = filters.get("min_duration")
 
     bx24 = Bitrix24(webhook_url)
 
     try:
-        call_info = get_bitrix_call_info(bx24, bx_wh_data.CALL_ID, webhook_url, body_str, api_router='/bitrix_webhook/v2')
+        call_info, call_url, bindings = get_call_context(bx24, bx_wh_data, webhook_url, body_str,
+                                                         api_router='/bitrix_webhook/v2')
     except BadWebhookError:
         return False
 
-    call_url = bx24.get_call_url(call_info['RECORD_FILE_ID'])
     if Task.select().where(Task.file_url == call_url).exists():
         logger.info(f"[-] Bitrix24 {bx_wh_data.PORTAL_USER_ID}: Уже обрабатывали данный файл: {call_url}", request_log_id=request_log_id)
         return False
 
-    if bx_wh_data.CRM_ACTIVITY_ID != 0:
-        crm_entity_type, crm_entity_id = get_webhook_entity_and_type(bx24, bx_wh_data.CRM_ACTIVITY_ID)
-    else:
-        crm_entity_type, crm_entity_id = None, None
+    crm_entity_type, crm_entity_id = get_bindings_entity(bindings)
 
     # Если задан фильтр по сущности (CONTACT, LEAD, DEAL, COMPANY):
     # 1. Если звонок не связан ни с одной сущностью, то фильтр не пройден.
@@ -667,15 +767,20 @@ def report_bypass_filters(report: Report, bx_wh_data: BxWhData, domain, body_str
         return False
 
     if crm_entity_type is not None:
+        # Сущность, сделка и (для фильтра по первому звонку) звонки сущности – одним запросом.
+        crm_context = get_crm_context(bx24, crm_entity_type, crm_entity_id, bindings, call_info,
+                                      with_entity_calls=bool(filters.get("only_first_call")),
+                                      min_call_duration=min_call_duration)
+        entity, entity_deal = crm_context['entity'], crm_context['entity_deal']
+
         # Фильтр по первому звонку
         if filters.get("only_first_call"):
             if crm_entity_type is None:
                 logger.info(f"[-] Bitrix24: {domain}. Фильтр невозможен для сущности {crm_entity_type}.", request_log_id=request_log_id)
                 return False
             else:
-                # Получаем список звонков сущности
-                entity_calls = bx24.get_entity_calls(crm_entity_type, crm_entity_id, call_info,
-                                                     min_call_duration=min_call_duration)
+                # Список звонков сущности
+                entity_calls = crm_context['entity_calls']
                 # Проверка наличия первого звонка
                 if len(entity_calls) == 0:
                     logger.info(f"[-] Bitrix24: {domain}. У {crm_entity_type} {crm_entity_id} не найдено ни одного звонка", request_log_id=request_log_id)
@@ -686,8 +791,6 @@ def report_bypass_filters(report: Report, bx_wh_data: BxWhData, domain, body_str
                     logger.info(f"[-] Bitrix24: {domain}. Не первый звонок у сущности {crm_entity_type}.", request_log_id=request_log_id)
                     return False
 
-        entity, entity_deal = get_entity_and_entity_deal(bx24, crm_entity_type, crm_entity_id, bx_wh_data.CRM_ACTIVITY_ID)
-
         passed_pipelines_and_statuses_filters = check_pipelines_and_statuses(domain,
                                                                              filters,
                                                                              crm_entity_type,
@@ -704,7 +807,7 @@ def report_bypass_filters(report: Report, bx_wh_data: BxWhData, domain, body_str
     if crm_entity_type and custom_fields:
         # Сущность, в карточке которой ищем соответствующие поля.
         if entity_deal:
-            entity_with_custom_fields = bx24.get_deal(entity_deal['ID'])
+            entity_with_custom_fields = entity_deal
         elif crm_entity_type == CRMEntityType.DEAL or crm_entity_type == CRMEntityType.LEAD:
             entity_with_custom_fields = entity
         else:
@@ -737,3 +840,11 @@ def report_bypass_filters(report: Report, bx_wh_data: BxWhData, domain, body_str
                 logger.info(f'[+] Bitrix24: {domain}. Кастомное поле: {field_name}, со значением: "{value}"')
 
     return True
+
+
+@deferred_handler('bitrix24_webhook')
+def process_bx_webhook_deferred(body_str: str, request_log_id: Optional[int] = None):
+    """
+    Обработка вебхука Bitrix24 после задержки get_deal_timeout.
+    """
+    process_bx_webhook_v2(body_str.encode('utf-8'), request_log_id=request_log_id, deferred=True)
@@ -0,0 +1,154 @@
+"""
+Квоты Google Sheets API и повтор запросов при их превышении.
+
+Google ограничивает количество запросов в минуту на пользователя (сервисный аккаунт) и на проект,
+поэтому перед каждым запросом берется токен из двух корзин (token bucket): сервисного аккаунта
+и таблицы. Корзина таблицы не дает одной большой выгрузке израсходовать всю квоту аккаунта.
+
+На ответ 429 запрос повторяется с экспоненциальной задержкой, но не раньше Retry-After.
+Ответы 5xx и ошибки соединения повторяются только для идемпотентных запросов: запрос мог быть выполнен,
+и повтор, например, вставки строк (insertDimension, append) вставил бы их дважды.
+После 429 корзина аккаунта приостанавливается на время задержки, чтобы остальные потоки тоже подождали.
+"""
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Optional, TypeVar
+
+import requests
+from gspread.exceptions import APIError
+from loguru import logger
+
+from config import config as cfg
+from helpers.token_bucket import TokenBucket
+
+
+T = TypeVar('T')
+
+
+def get_response(ex: Exception) -> Optional[requests.Response]:
+    if isinstance(ex, (APIError, requests.HTTPError)):
+        return ex.response
+    return None
+
+
+def is_retryable(ex: Exception, idempotent: bool = True) -> bool:
+    # Соединение не установлено – запрос не отправлен, его можно повторить.
+    if isinstance(ex, requests.ConnectTimeout):
+        return True
+    if isinstance(ex, (requests.ConnectionError, requests.Timeout)):
+        return idempotent
+    response = get_response(ex)
+    if response is None:
+        return False
+    return response.status_code == 429 or (response.status_code >= 500 and idempotent)
+
+
+def get_retry_after(ex: Exception) -> Optional[float]:
+    response = get_response(ex)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+class SheetsQuota:
+    """
+    Корзины сервисных аккаунтов и таблиц и повтор запросов с экспоненциальной задержкой.
+    """
+    def __init__(
+            self,
+            account_rate: Optional[float] = None,
+            spreadsheet_rate: Optional[float] = None,
+            max_attempts: Optional[int] = None,
+            base_delay: float = 1.0,
+            max_delay: Optional[float] = None,
+            sleep: Callable[[float], None] = time.sleep,
+            clock: Callable[[], float] = time.monotonic,
+    ):
+        self.account_rate = account_rate or cfg.GOOGLE_SHEETS_ACCOUNT_REQUESTS_PER_MINUTE
+        self.spreadsheet_rate = spreadsheet_rate or cfg.GOOGLE_SHEETS_SPREADSHEET_REQUESTS_PER_MINUTE
+        self.max_attempts = max_attempts or cfg.GOOGLE_SHEETS_MAX_ATTEMPTS
+        self.base_delay = base_delay
+        self.max_delay = max_delay or cfg.GOOGLE_SHEETS_MAX_BACKOFF
+        self.sleep = sleep
+        self.clock = clock
+
+        self._accounts: Dict[str, TokenBucket] = {}
+        self._spreadsheets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        # Ответы с ошибками по кодам и количество повторов.
+        self.errors = defaultdict(int)
+        self.retries = 0
+
+    def _get_bucket(self, buckets: Dict[str, TokenBucket], key: str, rate: float) -> TokenBucket:
+        with self._lock:
+            if key not in buckets:
+                buckets[key] = TokenBucket(rate, clock=self.clock)
+            return buckets[key]
+
+    def get_account_bucket(self, account: str = cfg.GOOGLE_PATH) -> TokenBucket:
+        return self._get_bucket(self._accounts, account, self.account_rate)
+
+    def get_spreadsheet_bucket(self, sheet_id: str) -> TokenBucket:
+        return self._get_bucket(self._spreadsheets, sheet_id, self.spreadsheet_rate)
+
+    def get_wait(self, sheet_id: str, account: str = cfg.GOOGLE_PATH) -> float:
+        """
+        Сколько секунд ждать ближайшего запроса к таблице.
+        """
+        return max(self.get_account_bucket(account).get_wait(), self.get_spreadsheet_bucket(sheet_id).get_wait())
+
+    def call(self, sheet_id: str, func: Callable[[], T], account: str = cfg.GOOGLE_PATH, idempotent: bool = True) -> T:
+        """
+        Выполняет запрос к таблице sheet_id в пределах квот.
+        idempotent=False – запрос нельзя повторять после 5xx и ошибок соединения (только после 429).
+        """
+        account_bucket = self.get_account_bucket(account)
+        spreadsheet_bucket = self.get_spreadsheet_bucket(sheet_id)
+
+        for attempt in range(1, self.max_attempts + 1):
+            spreadsheet_bucket.acquire(self.sleep)
+            account_bucket.acquire(self.sleep)
+            try:
+                return func()
+            except Exception as ex:
+                response = get_response(ex)
+                status_code = response.status_code if response is not None else type(ex).__name__
+                with self._lock:
+                    self.errors[str(status_code)] += 1
+
+                if attempt == self.max_attempts or not is_retryable(ex, idempotent):
+                    raise
+
+                # Экспоненциальная задержка со случайной составляющей, но не меньше Retry-After.
+                delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+                delay = random.uniform(delay / 2, delay)
+                delay = max(delay, get_retry_after(ex) or 0)
+                if status_code == 429:
+                    account_bucket.pause(delay)
+
+                with self._lock:
+                    self.retries += 1
+                logger.warning(f'Google Sheets ({sheet_id}): ответ {status_code}, '
+                               f'повтор {attempt}/{self.max_attempts - 1} через {delay:.1f} сек.')
+                self.sleep(delay)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            accounts = dict(self._accounts)
+            spreadsheets = dict(self._spreadsheets)
+            errors = dict(self.errors)
+            retries = self.retries
+        return {
+            'accounts': {key: x.get_stats() for key, x in accounts.items()},
+            'spreadsheets': {key: x.get_stats() for key, x in spreadsheets.items()},
+            'errors': errors,
+            'retries': retries,
+        }
+
+
+sheets_quota = SheetsQuota()
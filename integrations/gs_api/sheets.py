@@ -1,25 +1,24 @@
 from typing import List
 
-import gspread
 from gspread import Spreadsheet
 from gspread.utils import ValueInputOption
 from loguru import logger
 from retry import retry
 
 from config import config
-from config.config import GOOGLE_PATH
 from data.models import User, Mode
+from integrations.gs_api.sheets_client import sheets_pool
 from integrations.gs_api.sheets_helpers import get_short_name_list
 from misc.time import get_refresh_time
 
 
 class SheetsApi:
 
-    @retry(tries=4, delay=1, backoff=4)
     def __init__(self, sheet_id):
-        self.gc = gspread.service_account(filename=GOOGLE_PATH)
-        self.file = self.gc.open_by_key(sheet_id)
-        self.analytics_sheet = self.file.sheet1
+        # Клиент и открытая таблица берутся из общего кэша процесса.
+        self.gc = sheets_pool.get_client()
+        self.file = sheets_pool.open(sheet_id)
+        self.analytics_sheet = sheets_pool.get_first_worksheet(sheet_id)
         self.row_number = 3
 
     @retry(tries=4, delay=1, backoff=4)
@@ -101,9 +100,7 @@ def clone_template(template_id=config.CLIENT_TEMPLATE_ID) -> Spreadsheet:
     """
     Функция клонирования Гугл отчета
     """
-    logger.info("Подключаюсь к Google аккаунту")
-    gc = gspread.service_account(filename=GOOGLE_PATH)
-    # gc.login()
+    gc = sheets_pool.get_client()
 
     logger.info("Клонирую шаблон клиентского отчета")
     sheet: Spreadsheet = gc.copy(template_id)
@@ -119,18 +116,14 @@ def update_first_row(sheet, first_row):
     """
     Обновляет первую строку значениями списка first_row
     """
-    cell_list = sheet.sheet1.range(2, 1, 2, len(first_row))
-    for i, cell in enumerate(cell_list):
-        cell.value = first_row[i]
-    sheet.sheet1.update_cells(cell_list)
+    # Одним запросом значений вместо чтения диапазона и записи ячеек.
+    sheet.values_update('A2', params={'valueInputOption': ValueInputOption.raw}, body={'values': [first_row]})
 
 
 @retry(tries=3, delay=1)
 def silent_create_default_spreadsheet(db_user: User) -> Spreadsheet:
     logger.info(f"Создаю Google таблицу для пользователя tg_id: {db_user.tg_id}")
-    logger.info("Подключаюсь к Google аккаунту")
-    gc = gspread.service_account(filename=GOOGLE_PATH)
-    # gc.login()
+    gc = sheets_pool.get_client()
 
     logger.info("Клонирую шаблон отчета")
     sheet: Spreadsheet = gc.copy(config.SHEETS_TEMPLATE_FILE_ID)
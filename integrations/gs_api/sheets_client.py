@@ -0,0 +1,182 @@
+"""
+Долгоживущий клиент Google Sheets и пакетная запись в таблицы.
+
+- SheetsClientPool – один авторизованный клиент gspread на процесс и кэш открытых таблиц
+  (open_by_key и sheet1 – это отдельные запросы метаданных таблицы).
+  Токен сервисного аккаунта обновляет AuthorizedSession клиента, когда срок его действия истекает.
+- SpreadsheetBatch – накапливает вставку строк, обновление значений (заголовки) и форматирование
+  одной таблицы и отправляет их двумя запросами: spreadsheets.batchUpdate и values.batchUpdate.
+
+Все запросы выполняются в пределах квот Google (см. integrations/gs_api/quota.py).
+"""
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import gspread
+from gspread import Spreadsheet, Worksheet
+from gspread.utils import ValueInputOption, a1_range_to_grid_range
+from loguru import logger
+from requests.adapters import HTTPAdapter
+
+from config import config as cfg
+from integrations.gs_api.quota import SheetsQuota, sheets_quota
+
+
+def create_service_account_client() -> gspread.Client:
+    client = gspread.service_account(filename=cfg.GOOGLE_PATH)
+    # Таблицы выгружаются в нескольких потоках через одну сессию.
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=int(cfg.UPLOAD_GOOGLE_MAX_WORKERS))
+    client.http_client.session.mount('https://', adapter)
+    return client
+
+
+class SheetsClientPool:
+    """
+    Авторизованный клиент и открытые таблицы (с первым листом), общие для всех потоков процесса.
+    """
+    def __init__(
+            self,
+            client_factory: Callable[[], gspread.Client] = create_service_account_client,
+            ttl: Optional[int] = None,
+            quota: Optional[SheetsQuota] = None,
+    ):
+        self.client_factory = client_factory
+        self.quota = quota or sheets_quota
+        self.ttl = cfg.GOOGLE_SPREADSHEET_CACHE_TTL if ttl is None else ttl
+        self._client: Optional[gspread.Client] = None
+        # ID таблицы -> (таблица, первый лист, время открытия).
+        self._spreadsheets: Dict[str, Tuple[Spreadsheet, Worksheet, float]] = {}
+        self._lock = threading.Lock()
+
+    def get_client(self) -> gspread.Client:
+        with self._lock:
+            if self._client is None:
+                self._client = self.client_factory()
+            return self._client
+
+    def _open(self, sheet_id: str) -> Tuple[Spreadsheet, Worksheet]:
+        spreadsheet = self.quota.call(sheet_id, lambda: self.get_client().open_by_key(sheet_id))
+        return spreadsheet, self.quota.call(sheet_id, lambda: spreadsheet.sheet1)
+
+    def _get(self, sheet_id: str) -> Tuple[Spreadsheet, Worksheet]:
+        with self._lock:
+            cached = self._spreadsheets.get(sheet_id)
+        if cached is not None and time.monotonic() - cached[2] < self.ttl:
+            return cached[0], cached[1]
+
+        spreadsheet, worksheet = self._open(sheet_id)
+        with self._lock:
+            self._spreadsheets[sheet_id] = (spreadsheet, worksheet, time.monotonic())
+        return spreadsheet, worksheet
+
+    def open(self, sheet_id: str) -> Spreadsheet:
+        return self._get(sheet_id)[0]
+
+    def get_first_worksheet(self, sheet_id: str) -> Worksheet:
+        return self._get(sheet_id)[1]
+
+    def invalidate(self, sheet_id: str) -> None:
+        """
+        Убирает таблицу из кэша (например, после ошибки: лист могли удалить или переименовать).
+        """
+        with self._lock:
+            self._spreadsheets.pop(sheet_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._client = None
+            self._spreadsheets.clear()
+
+
+class SpreadsheetBatch:
+    """
+    Изменения одной таблицы, отправляемые одним execute().
+    """
+    def __init__(self, spreadsheet: Spreadsheet, quota: Optional[SheetsQuota] = None):
+        self.spreadsheet = spreadsheet
+        self.quota = quota or sheets_quota
+        # (ID листа, номер строки) -> (лист, строки). Строки, вставленные позже, оказываются выше.
+        self._inserts: Dict[Tuple[int, int], Tuple[Worksheet, List[list]]] = {}
+        self._values: List[dict] = []
+        # Прочие запросы batchUpdate в порядке добавления (применяются после вставки строк).
+        self._requests: List[dict] = []
+
+    def insert_rows(self, worksheet: Worksheet, rows: List[list], row_number: int) -> None:
+        key = (worksheet.id, row_number)
+        if key in self._inserts:
+            rows = rows + self._inserts[key][1]
+        self._inserts[key] = (worksheet, rows)
+
+    def update_values(self, worksheet: Worksheet, range_name: str, values: List[list]) -> None:
+        """
+        Обновление значений диапазона (например, строки заголовков). Применяется после вставки строк.
+        """
+        self._values.append({'range': f"'{worksheet.title}'!{range_name}", 'values': values})
+
+    def add_request(self, request: dict) -> None:
+        self._requests.append(request)
+
+    def format(self, worksheet: Worksheet, range_name: str, cell_format: dict) -> None:
+        self.add_request({
+            'repeatCell': {
+                'range': a1_range_to_grid_range(range_name, worksheet.id),
+                'cell': {'userEnteredFormat': cell_format},
+                'fields': 'userEnteredFormat(' + ','.join(cell_format) + ')',
+            },
+        })
+
+    def _batch_update(self, requests: List[dict]) -> None:
+        # Повторная вставка строк после 5xx или таймаута могла бы вставить их дважды.
+        idempotent = not any('insertDimension' in x for x in requests)
+        self.quota.call(self.spreadsheet.id, lambda: self.spreadsheet.batch_update({'requests': requests}),
+                        idempotent=idempotent)
+
+    def _values_batch_update(self, data: List[dict]) -> None:
+        self.quota.call(self.spreadsheet.id, lambda: self.spreadsheet.values_batch_update({
+            'valueInputOption': ValueInputOption.user_entered,
+            'data': data,
+        }))
+
+    def execute(self) -> None:
+        """
+        Вставляет пустые строки и применяет форматирование (batchUpdate),
+        затем записывает значения вставленных строк и диапазонов (values.batchUpdate).
+        """
+        structure_requests = []
+        values = []
+        # Вставки ниже по листу выполняются первыми, чтобы не сдвигать строки вставок выше.
+        for (sheet_id, row_number), (worksheet, rows) in sorted(self._inserts.items(), key=lambda x: -x[0][1]):
+            structure_requests.append({
+                'insertDimension': {
+                    'range': {
+                        'sheetId': sheet_id,
+                        'dimension': 'ROWS',
+                        'startIndex': row_number - 1,
+                        'endIndex': row_number - 1 + len(rows),
+                    },
+                    'inheritFromBefore': False,
+                },
+            })
+        # Блок строк сдвигается вниз на строки, вставленные выше него на том же листе.
+        shifts = defaultdict(int)
+        for (sheet_id, row_number), (worksheet, rows) in sorted(self._inserts.items(), key=lambda x: x[0][1]):
+            values.append({'range': f"'{worksheet.title}'!A{row_number + shifts[sheet_id]}", 'values': rows})
+            shifts[sheet_id] += len(rows)
+        structure_requests += self._requests
+        values += self._values
+
+        if structure_requests:
+            self._batch_update(structure_requests)
+        if values:
+            self._values_batch_update(values)
+
+        logger.debug(f'Таблица {self.spreadsheet.id}: применено {len(structure_requests)} изменений структуры '
+                     f'и {len(values)} диапазонов значений.')
+        self._inserts.clear()
+        self._values.clear()
+        self._requests.clear()
+
+
+sheets_pool = SheetsClientPool()
@@ -1,61 +1,90 @@
-import gspread
-from gspread import Cell
+"""
+Выгрузка лидов (пользователей бота) в Гугл Таблицу LEAD_SHEET_ID.
+
+Выгрузка инкрементальная: в LeadSyncState хранится ID последнего выгруженного пользователя,
+и в таблицу дописываются только строки пользователей, созданных после него.
+При первой выгрузке в таблицу (состояния еще нет) пропускаются пользователи,
+tg_id которых уже есть в колонке tg_id таблицы.
+
+Модуль не обращается к Google при импорте: таблица открывается при первой выгрузке (см. sheets_pool).
+"""
+from datetime import datetime
+from typing import List, Optional, Set, Tuple
+
 from gspread.utils import ValueInputOption
 from loguru import logger
 
-from config.config import LEAD_SHEET_ID, GOOGLE_PATH
+from config import config as cfg
+from data.models import User, LeadSyncState
+from helpers.tg_helpers import get_user_info
+from integrations.gs_api.sheets_client import sheets_pool
+
+
+# Колонки таблицы лидов: дата, tg_id, имя, (пусто), ссылка на Telegram.
+TG_ID_COLUMN = 2
+
 
-gc = gspread.service_account(filename=GOOGLE_PATH)
-file = gc.open_by_key(LEAD_SHEET_ID)
-worksheet = file.sheet1
+def make_lead_row(user: User, user_info: dict) -> list:
+    username = user_info['username']
+    tg_link = f"https://t.me/{username}" if username else ""
+    return [user.created.strftime("%d.%m.%Y"),
+            str(user.tg_id),
+            user_info['full_name'],
+            '',
+            tg_link]
 
 
-# Функция для обновления таблицы
-def sync_leads_to_sheet(users, users_info):
-    # Получаем все записи из Google Таблицы
-    records = worksheet.get_all_records()
+def get_sheet_tg_ids(sheet_id: str) -> Set[str]:
+    """
+    tg_id пользователей, уже выгруженных в таблицу (без строки заголовков).
+    """
+    worksheet = sheets_pool.get_first_worksheet(sheet_id)
+    column = sheets_pool.quota.call(sheet_id, lambda: worksheet.col_values(TG_ID_COLUMN))
+    return set(column[1:])
 
-    # Маппинг tg_id к индексу строки в Google Таблице
-    record_mapping = {record['tg_id']: i + 2 for i, record in enumerate(records)}
 
-    # Ячейки для обновления
-    cells_to_update = []
+def get_new_users(last_user_id: int) -> List[User]:
+    return list(
+        User
+        .select(User.id, User.created, User.tg_id)
+        .where(User.id > last_user_id, User.tg_id.is_null(False))
+        .order_by(User.id)
+    )
 
-    # Данные для новых строк
-    new_rows = []
 
-    for user in users:
-        username = users_info[user.tg_id]['username']
-        tg_link = f"https://t.me/{username}" if username else ""
-        user_data = [user.created.strftime("%d.%m.%Y"),
-                     str(user.tg_id),
-                     users_info[user.tg_id]['full_name'],
-                     '',
-                     tg_link]
+def sync_leads_to_sheet(cli, sheet_id: Optional[str] = None) -> Tuple[int, int]:
+    """
+    Дописывает в таблицу лидов строки новых пользователей.
+    Возвращает количество новых пользователей и количество добавленных строк.
+    """
+    sheet_id = sheet_id or cfg.LEAD_SHEET_ID
+    state = LeadSyncState.get_or_none(LeadSyncState.sheet_id == sheet_id)
 
-        if user.tg_id in record_mapping:
-            # Рассчитываем индекс строки и добавляем данные для обновления
-            row_index = record_mapping[user.tg_id]
-            for col_index, value in enumerate(user_data, start=1):
-                cells_to_update.append(Cell(row=row_index, col=col_index, value=value))
-        else:
-            # Добавляем данные для новой строки
-            new_rows.append(user_data)
+    users = get_new_users(state.last_user_id if state is not None else 0)
+    if not users:
+        return 0, 0
 
-    updated = 0
-    added = 0
+    if state is None:
+        sheet_tg_ids = get_sheet_tg_ids(sheet_id)
+        users_to_add = [x for x in users if str(x.tg_id) not in sheet_tg_ids]
+    else:
+        users_to_add = users
 
-    # Обновляем существующие ячейки
-    if cells_to_update:
-        worksheet.update_cells(cells_to_update, value_input_option=ValueInputOption.user_entered)
-        updated += len(set(cell.row for cell in cells_to_update))
-        logger.info(f"Обновлено строк: {updated}")
+    users_info = get_user_info(cli, [x.tg_id for x in users_to_add])
+    rows = [make_lead_row(x, users_info[x.tg_id]) for x in users_to_add]
 
-    # Добавляем новые строки
-    if new_rows:
-        worksheet.append_rows(new_rows, value_input_option=ValueInputOption.user_entered)
-        added += len(new_rows)
-        logger.info(f"Добавлено новых строк: {added}")
+    if rows:
+        worksheet = sheets_pool.get_first_worksheet(sheet_id)
+        sheets_pool.quota.call(
+            sheet_id, lambda: worksheet.append_rows(rows, value_input_option=ValueInputOption.user_entered),
+            idempotent=False)
+        logger.info(f"Добавлено новых строк: {len(rows)}")
 
-    return updated, added
+    # Отметку сдвигаем только после успешной записи: при ошибке строки выгрузятся в следующий раз.
+    (LeadSyncState
+     .insert(sheet_id=sheet_id, last_user_id=users[-1].id, synced=datetime.now())
+     .on_conflict(conflict_target=[LeadSyncState.sheet_id],
+                  preserve=[LeadSyncState.last_user_id, LeadSyncState.synced])
+     .execute())
 
+    return len(users), len(rows)
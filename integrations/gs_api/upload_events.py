@@ -0,0 +1,81 @@
+"""
+События о новых строках для выгрузки в Гугл Таблицы (PostgreSQL LISTEN/NOTIFY).
+
+После создания GSpreadTask обработчик звонка вызывает notify_upload(report_id), а сервис upload_google
+ждет уведомлений через UploadListener и выгружает строки отчета, не дожидаясь периодической проверки.
+NOTIFY внутри транзакции доставляется только после ее фиксации, поэтому строки к этому моменту уже видны.
+Потерянные уведомления (например, пока сервис перезапускался) подбирает периодическая полная проверка.
+"""
+import select
+import time
+from typing import Set
+
+import psycopg2
+import psycopg2.extensions
+from loguru import logger
+
+from config import config as cfg
+from data.models import main_db
+
+
+def notify_upload(report_id: int) -> None:
+    """
+    Сообщает сервису выгрузки, что у отчета появились новые строки.
+    """
+    try:
+        main_db.execute_sql('SELECT pg_notify(%s, %s)', (cfg.UPLOAD_GOOGLE_CHANNEL, str(report_id)))
+    except Exception as ex:
+        # Строки выгрузит периодическая проверка.
+        logger.warning(f'Не удалось отправить уведомление о выгрузке отчета {report_id}: {ex}')
+
+
+class UploadListener:
+    """
+    Отдельное соединение в режиме autocommit, подписанное на канал cfg.UPLOAD_GOOGLE_CHANNEL.
+    """
+    def __init__(self, channel: str = cfg.UPLOAD_GOOGLE_CHANNEL):
+        self.channel = channel
+        self.connection = None
+
+    def connect(self) -> None:
+        self.close()
+        self.connection = psycopg2.connect(dbname=main_db.database, **main_db.connect_params)
+        self.connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+        logger.info(f'Подписка на уведомления о выгрузке в Гугл Таблицы (канал {self.channel}).')
+
+    def close(self) -> None:
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+
+    def wait(self, timeout: float) -> Set[int]:
+        """
+        Ждет уведомлений не дольше timeout секунд. Возвращает ID отчетов из полученных уведомлений.
+        При обрыве соединения переподключается при следующем вызове.
+        """
+        try:
+            if self.connection is None:
+                self.connect()
+            if not self.connection.notifies:
+                select.select([self.connection], [], [], timeout)
+            self.connection.poll()
+        except Exception as ex:
+            logger.error(f'Ошибка соединения для уведомлений о выгрузке: {ex}')
+            self.close()
+            # Не переподключаемся чаще, чем раз в timeout секунд.
+            time.sleep(timeout)
+            return set()
+
+        report_ids = set()
+        while self.connection.notifies:
+            notify = self.connection.notifies.pop(0)
+            try:
+                report_ids.add(int(notify.payload))
+            except ValueError:
+                logger.warning(f'Некорректное уведомление о выгрузке: {notify.payload!r}')
+        return report_ids
@@ -1,9 +1,12 @@
+from datetime import timedelta
+
 import pytz
 from apscheduler.schedulers.blocking import BlockingScheduler
 from loguru import logger
 
 from config import config
-from data.models import main_db
+from data.models import main_db, BalanceEntry, BalanceHold
+from data.partitions import ensure_partitions, archive_old_partitions
 from integrations.amo_crm.keys_refresher import refresh_amocrm_keys
 
 
@@ -21,6 +24,18 @@ def job_refresh_amocrm_keys():
     return refresh_amocrm_keys()
 
 
+@job_wrapper
+def job_maintain_partitions():
+    ensure_partitions()
+    return archive_old_partitions()
+
+
+@job_wrapper
+def job_compact_balance():
+    BalanceHold.release_expired(timedelta(hours=config.BALANCE_HOLD_TTL_HOURS))
+    return BalanceEntry.compact()
+
+
 # Примеры job-ов
 # scheduler.add_job(run_lesson_parser, "interval", seconds=lesson_parser_interval, next_run_time=datetime.now())
 # scheduler.add_job(sync_students, "interval", seconds=60)
@@ -28,6 +43,8 @@ def job_refresh_amocrm_keys():
 
 scheduler = BlockingScheduler(timezone=pytz.timezone(config.TIME_ZONE))
 scheduler.add_job(job_refresh_amocrm_keys, "cron", hour=6, minute=0)
+scheduler.add_job(job_maintain_partitions, "cron", hour=3, minute=0)
+scheduler.add_job(job_compact_balance, "interval", seconds=config.BALANCE_COMPACT_INTERVAL)
 
 
 def main():
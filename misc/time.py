@@ -1,4 +1,5 @@
-from datetime import datetime
+from datetime import date, datetime, time, timedelta
+from typing import Tuple
 
 import pytz
 
@@ -16,3 +17,16 @@ def get_refresh_time(
     """
     tz = pytz.timezone(tz_name)
     return datetime.now(tz).strftime(date_fmt)
+
+
+def get_datetime_range(from_date: date, to_date: date) -> Tuple[datetime, datetime]:
+    """
+    Возвращает полуинтервал [from_date 00:00; to_date + 1 день 00:00)
+    для фильтрации DateTimeField по диапазону дат включительно.
+
+    В отличие от сравнения fn.DATE(field) позволяет использовать индекс по полю
+    и отсекать лишние партиции (см. data/partitions.py).
+    """
+    start = datetime.combine(from_date, time.min)
+    end = datetime.combine(to_date + timedelta(days=1), time.min)
+    return start, end
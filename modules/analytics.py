@@ -0,0 +1,397 @@
+"""
+Колоночная аналитика по ответам отчета в памяти процесса.
+
+Для отчета строится снимок (ReportSnapshot): массивы NumPy, выровненные по завершенным задачам.
+Числовые вопросы хранятся как float64 (NaN – нет ответа или ответ нечисловой), остальные вопросы
+(в том числе колонки CRM, например responsible_user_name) – как коды категорий int32 (-1 – нет ответа).
+Группировки и агрегаты вычисляются векторно по этим массивам.
+
+Снимок обновляется инкрементально: при изменении версии отчета (ReportVersion) загружаются только
+новые завершенные задачи. При изменении вопросов отчета и раз в ANALYTICS_SNAPSHOT_MAX_AGE секунд
+снимок строится заново (так учитываются изменения ответов уже загруженных задач).
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from loguru import logger
+
+from config import config as cfg
+from data.models import Task, ModeAnswer, ModeQuestion, ModeQuestionType, ReportVersion
+from misc.time import get_datetime_range
+
+
+NUMERIC_TYPES = {ModeQuestionType.INTEGER, ModeQuestionType.PERCENT}
+NUMBER_RE = re.compile(r'^[+-]?[0-9]{1,18}$')
+
+# Измерение даты -> единица datetime64.
+DATE_DIMENSIONS = {'hour': 'h', 'day': 'D', 'week': 'D', 'month': 'M'}
+
+
+def parse_number(answer_text: Optional[str]) -> float:
+    """
+    Числовое значение ответа ("85%" -> 85.0) по тем же правилам, что ModeAnswer.get_integer_value_expression.
+    Для нечисловых ответов возвращает NaN.
+    """
+    if answer_text is None:
+        return np.nan
+    answer_number = answer_text.replace('%', '').strip()
+    if NUMBER_RE.match(answer_number):
+        return float(answer_number)
+    return np.nan
+
+
+class ReportSnapshot:
+    """
+    Колоночный снимок завершенных задач отчета.
+    """
+
+    def __init__(self, report_id: int):
+        self.report_id = report_id
+        self.lock = threading.Lock()
+        self._reset({})
+
+    def _reset(self, questions: Dict[int, dict]) -> None:
+        self.questions = questions
+        self.version: Optional[int] = None
+        self.built_at = time.monotonic()
+
+        self.task_ids = np.empty(0, dtype=np.int64)
+        self.created = np.empty(0, dtype='datetime64[s]')
+        self.numeric: Dict[int, np.ndarray] = {}
+        self.codes: Dict[int, np.ndarray] = {}
+        self.categories: Dict[int, List[str]] = {}
+        self._category_index: Dict[int, Dict[str, int]] = {}
+        for question_id, question in questions.items():
+            if question['answer_type'] in NUMERIC_TYPES:
+                self.numeric[question_id] = np.empty(0, dtype=np.float64)
+            else:
+                self.codes[question_id] = np.empty(0, dtype=np.int32)
+                self.categories[question_id] = []
+                self._category_index[question_id] = {}
+
+        # Задачи с ID не больше max_seen_task_id уже загружены, кроме незавершенных (pending_task_ids).
+        self.max_seen_task_id = 0
+        self.pending_task_ids: Set[int] = set()
+
+    @property
+    def tasks_count(self) -> int:
+        return len(self.task_ids)
+
+    def _load_questions(self) -> Dict[int, dict]:
+        questions = (
+            ModeQuestion
+            .select(ModeQuestion.id, ModeQuestion.answer_type, ModeQuestion.short_name, ModeQuestion.crm_id)
+            .where(ModeQuestion.report == self.report_id, ModeQuestion.is_active == True)
+        )
+        return {
+            x.id: {'answer_type': x.answer_type, 'short_name': x.short_name, 'crm_id': x.crm_id}
+            for x in questions
+        }
+
+    def ensure_fresh(self) -> None:
+        """
+        Обновляет снимок, если данные отчета изменились. Вызывается под self.lock.
+        """
+        version = ReportVersion.get_version(self.report_id)
+        expired = time.monotonic() - self.built_at > cfg.ANALYTICS_SNAPSHOT_MAX_AGE
+        if version == self.version and not expired:
+            return
+
+        questions = self._load_questions()
+        signature = {k: v['answer_type'] for k, v in questions.items()}
+        if expired or signature != {k: v['answer_type'] for k, v in self.questions.items()}:
+            self._reset(questions)
+        else:
+            self.questions = questions
+
+        started = time.monotonic()
+        loaded_count = self._load_new_tasks()
+        self.version = version
+        logger.debug(f'Аналитика отчета {self.report_id}: загружено задач: {loaded_count}, '
+                     f'всего: {self.tasks_count}, {(time.monotonic() - started) * 1000:.0f} мс.')
+
+    def _load_new_tasks(self) -> int:
+        condition = Task.id > self.max_seen_task_id
+        if self.pending_task_ids:
+            condition = condition | Task.id.in_(list(self.pending_task_ids))
+        tasks = (
+            Task
+            .select(Task.id, Task.created, Task.status)
+            .where(Task.report == self.report_id, condition)
+            .order_by(Task.id)
+            .tuples()
+        )
+
+        done_tasks = []
+        for task_id, created, status in tasks:
+            self.max_seen_task_id = max(self.max_seen_task_id, task_id)
+            if status == Task.StatusChoices.DONE:
+                self.pending_task_ids.discard(task_id)
+                done_tasks.append((task_id, created))
+            elif status == Task.StatusChoices.IN_PROGRESS:
+                self.pending_task_ids.add(task_id)
+            else:
+                self.pending_task_ids.discard(task_id)
+
+        # Загружаем частями, чтобы не строить запросы с огромным списком ID.
+        for start in range(0, len(done_tasks), cfg.ANALYTICS_LOAD_BATCH_SIZE):
+            self._append(done_tasks[start:start + cfg.ANALYTICS_LOAD_BATCH_SIZE])
+        return len(done_tasks)
+
+    def _append(self, done_tasks: List[Tuple[int, datetime]]) -> None:
+        new_ids = np.array([x[0] for x in done_tasks], dtype=np.int64)
+        new_created = np.array([x[1] for x in done_tasks], dtype='datetime64[s]')
+        positions = {task_id: i for i, task_id in enumerate(new_ids.tolist())}
+
+        new_numeric = {k: np.full(len(new_ids), np.nan) for k in self.numeric}
+        new_codes = {k: np.full(len(new_ids), -1, dtype=np.int32) for k in self.codes}
+
+        # Ответ не может быть создан раньше задачи: отсекаем старые партиции.
+        answers = (
+            ModeAnswer
+            .select(ModeAnswer.task, ModeAnswer.question, ModeAnswer.answer_text)
+            .where(
+                ModeAnswer.task.in_(new_ids.tolist()),
+                ModeAnswer.question.in_(list(self.questions)),
+                ModeAnswer.created >= min(x[1] for x in done_tasks),
+            )
+            .tuples()
+        )
+        for task_id, question_id, answer_text in answers:
+            position = positions[task_id]
+            if question_id in new_numeric:
+                new_numeric[question_id][position] = parse_number(answer_text)
+            elif answer_text is not None:
+                index = self._category_index[question_id]
+                code = index.get(answer_text)
+                if code is None:
+                    code = index[answer_text] = len(self.categories[question_id])
+                    self.categories[question_id].append(answer_text)
+                new_codes[question_id][position] = code
+
+        self.task_ids = np.concatenate([self.task_ids, new_ids])
+        self.created = np.concatenate([self.created, new_created])
+        for question_id, values in new_numeric.items():
+            self.numeric[question_id] = np.concatenate([self.numeric[question_id], values])
+        for question_id, codes in new_codes.items():
+            self.codes[question_id] = np.concatenate([self.codes[question_id], codes])
+
+    def resolve_question(self, dimension: str) -> int:
+        """
+        question:<ID> или crm:<crm_id> -> ID вопроса отчета.
+        """
+        kind, _, value = dimension.partition(':')
+        if kind == 'question' and value.isdigit() and int(value) in self.questions:
+            return int(value)
+        if kind == 'crm':
+            for question_id, question in self.questions.items():
+                if question['crm_id'] == value:
+                    return question_id
+        raise ValueError(f'Неизвестное измерение: {dimension}')
+
+    def query(
+            self,
+            from_date: date,
+            to_date: date,
+            group_by: List[str],
+            metrics: List[dict],
+            with_deltas: bool = False,
+    ) -> dict:
+        """
+        Группирует задачи за период по измерениям group_by и вычисляет метрики для каждой группы.
+        Вызывается под self.lock.
+        """
+        from_datetime, to_datetime = get_datetime_range(from_date, to_date)
+        mask = (self.created >= np.datetime64(from_datetime, 's')) & (self.created < np.datetime64(to_datetime, 's'))
+        rows = np.flatnonzero(mask)
+
+        # Значения измерений выбранных задач (int64) и функции их отображения.
+        dimension_values = []
+        labels = []
+        for dimension in group_by:
+            if dimension in DATE_DIMENSIONS:
+                values, label = self._get_date_dimension(dimension, rows)
+            else:
+                question_id = self.resolve_question(dimension)
+                if question_id in self.numeric:
+                    raise ValueError(f'Группировка по числовому вопросу не поддерживается: {dimension}')
+                values = self.codes[question_id][rows].astype(np.int64)
+                categories = self.categories[question_id]
+                label = lambda x, categories=categories: categories[x] if x >= 0 else None
+            dimension_values.append(values)
+            labels.append(label)
+
+        if dimension_values:
+            group_keys, inverse = np.unique(np.stack(dimension_values, axis=1), axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+        else:
+            group_keys = np.empty((1 if len(rows) else 0, 0), dtype=np.int64)
+            inverse = np.zeros(len(rows), dtype=np.int64)
+        groups_count = len(group_keys)
+        if groups_count > cfg.ANALYTICS_MAX_GROUPS:
+            raise ValueError(f'Слишком много групп: {groups_count}. Уменьшите период или число измерений.')
+
+        tasks_counts = np.bincount(inverse, minlength=groups_count)
+        metric_values = [self._compute_metric(metric, rows, inverse, groups_count) for metric in metrics]
+
+        groups = []
+        for i, key in enumerate(group_keys):
+            groups.append({
+                'key': {dimension: label(value) for dimension, label, value in zip(group_by, labels, key.tolist())},
+                'tasks_count': int(tasks_counts[i]),
+                'values': [values[i] for values in metric_values],
+            })
+
+        if with_deltas:
+            self._add_deltas(groups, group_keys, group_by)
+
+        return {
+            'report_id': self.report_id,
+            'from_date': from_date,
+            'to_date': to_date,
+            'group_by': group_by,
+            'tasks_count': int(len(rows)),
+            'groups': groups,
+        }
+
+    def _get_date_dimension(self, dimension: str, rows: np.ndarray):
+        unit = DATE_DIMENSIONS[dimension]
+        values = self.created[rows].astype(f'datetime64[{unit}]').astype(np.int64)
+        if dimension == 'week':
+            # 1970-01-01 – четверг: приводим день к понедельнику его недели.
+            values = values - (values + 3) % 7
+
+        if dimension == 'hour':
+            label = lambda x: np.datetime64(x, 'h').astype(datetime)
+        else:
+            label = lambda x, unit=unit: np.datetime64(x, unit).astype('datetime64[D]').astype(date)
+        return values, label
+
+    def _compute_metric(self, metric: dict, rows: np.ndarray, inverse: np.ndarray, groups_count: int) -> list:
+        operation = metric['operation']
+        question_id = metric.get('question_id')
+
+        if question_id is None:
+            if operation != 'count':
+                raise ValueError(f'Для операции {operation} нужно указать вопрос.')
+            return np.bincount(inverse, minlength=groups_count).tolist()
+
+        if question_id in self.codes:
+            codes = self.codes[question_id][rows]
+            valid = codes >= 0
+            if operation == 'count':
+                return np.bincount(inverse[valid], minlength=groups_count).tolist()
+            if operation == 'distribution':
+                categories = self.categories[question_id]
+                counts = np.bincount(inverse[valid] * len(categories) + codes[valid],
+                                     minlength=groups_count * len(categories)).reshape(groups_count, len(categories))
+                return [{categories[j]: int(x) for j, x in enumerate(row) if x} for row in counts]
+            raise ValueError(f'Операция {operation} недоступна для нечислового вопроса.')
+
+        if question_id not in self.numeric:
+            raise ValueError(f'Вопрос {question_id} не найден в отчете.')
+
+        values = self.numeric[question_id][rows]
+        valid = ~np.isnan(values)
+        group_index, values = inverse[valid], values[valid]
+        counts = np.bincount(group_index, minlength=groups_count)
+
+        if operation == 'count':
+            return counts.tolist()
+        elif operation == 'sum':
+            result = np.bincount(group_index, weights=values, minlength=groups_count)
+        elif operation == 'avg':
+            sums = np.bincount(group_index, weights=values, minlength=groups_count)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result = np.round(sums / counts, 2)
+        elif operation in {'min', 'max'}:
+            result = np.full(groups_count, np.nan)
+            (np.fmin if operation == 'min' else np.fmax).at(result, group_index, values)
+        elif operation in {'median', 'percentile'}:
+            percentile = 50 if operation == 'median' else metric.get('percentile')
+            if percentile is None:
+                raise ValueError('Для операции percentile нужно указать percentile.')
+            # Сортируем значения по группе, затем по значению: значения группы идут подряд.
+            order = np.lexsort((values, group_index))
+            sorted_values = values[order]
+            bounds = np.concatenate([[0], np.cumsum(counts)])
+            result = np.full(groups_count, np.nan)
+            for i in np.flatnonzero(counts):
+                result[i] = np.percentile(sorted_values[bounds[i]:bounds[i + 1]], percentile)
+            result = np.round(result, 2)
+        elif operation == 'histogram':
+            bins = metric.get('bins') or 10
+            if not len(values):
+                return [None] * groups_count
+            edges = np.histogram_bin_edges(values, bins=bins)
+            bin_index = np.clip(np.searchsorted(edges, values, side='right') - 1, 0, bins - 1)
+            histograms = np.bincount(group_index * bins + bin_index,
+                                     minlength=groups_count * bins).reshape(groups_count, bins)
+            edges_list = np.round(edges, 2).tolist()
+            return [{'edges': edges_list, 'counts': row.tolist()} for row in histograms]
+        else:
+            raise ValueError(f'Неизвестная операция: {operation}')
+
+        return [None if np.isnan(x) else float(x) for x in result]
+
+    @staticmethod
+    def _add_deltas(groups: List[dict], group_keys: np.ndarray, group_by: List[str]) -> None:
+        """
+        Добавляет к группам разницу значений с той же группой предыдущего периода
+        (по первому измерению даты).
+        """
+        date_positions = [i for i, x in enumerate(group_by) if x in DATE_DIMENSIONS]
+        if not date_positions:
+            raise ValueError('Для расчета разницы с предыдущим периодом нужно измерение hour/day/week/month.')
+        position = date_positions[0]
+        step = 7 if group_by[position] == 'week' else 1
+
+        index = {tuple(key): i for i, key in enumerate(group_keys.tolist())}
+        for key, group in zip(group_keys.tolist(), groups):
+            previous_key = list(key)
+            previous_key[position] -= step
+            previous = index.get(tuple(previous_key))
+            group['deltas'] = [
+                (value - groups[previous]['values'][j]
+                 if previous is not None
+                 and isinstance(value, (int, float))
+                 and isinstance(groups[previous]['values'][j], (int, float))
+                 else None)
+                for j, value in enumerate(group['values'])
+            ]
+
+
+class AnalyticsEngine:
+    """
+    Снимки отчетов в памяти процесса. Хранится не больше max_reports последних использованных снимков.
+    """
+
+    def __init__(self, max_reports: int = cfg.ANALYTICS_MAX_REPORTS):
+        self.max_reports = max_reports
+        self._snapshots: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def query(self, report_id: int, **kwargs) -> dict:
+        with self._lock:
+            snapshot = self._snapshots.get(report_id)
+            if snapshot is None:
+                snapshot = self._snapshots[report_id] = ReportSnapshot(report_id)
+            self._snapshots.move_to_end(report_id)
+            while len(self._snapshots) > self.max_reports:
+                self._snapshots.popitem(last=False)
+
+        with snapshot.lock:
+            snapshot.ensure_fresh()
+            return snapshot.query(**kwargs)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._snapshots.clear()
+
+
+analytics_engine = AnalyticsEngine()
@@ -9,7 +9,8 @@ from pyrogram.types import Message
 from retry import retry_call
 from loguru import logger
 
-from data.models import User, Task, GSpreadTask, Report, ModeAnswer, ModeQuestion, ModeQuestionCalcType, Company
+from data.models import User, Task, GSpreadTask, Report, ModeAnswer, ModeQuestion, ModeQuestionCalcType, Company, \
+    BalanceHold, BalanceEntry
 from misc.time import get_refresh_time
 from modules.audiofile import Audiofile
 from helpers.db_helpers import not_enough_company_balance, update_task_after_analysis, update_task_with_error, \
@@ -17,6 +18,7 @@ from helpers.db_helpers import not_enough_company_balance, update_task_after_ana
 from helpers.tg_helpers import request_money, send_user_call_report, make_transcript_link
 from misc.files import delete_files
 from integrations.gs_api.sheets import GSLoader
+from integrations.gs_api.upload_events import notify_upload
 from modules.assembly import Assembly
 from modules.exceptions import LemurParseError
 from modules.report_generator import ReportGenerator
@@ -99,6 +101,13 @@ def build_telegram_error(ex: Exception) -> Optional[str]:
     return None
 
 
+def save_task_transcript(task: Task, transcript_text: str) -> None:
+    """
+    Сохраняет текст транскрипта в Task.data['transcript'] (по нему ищет полнотекстовый поиск, см. data/search.py).
+    """
+    task.save_data({'transcript': transcript_text}, update=True)
+
+
 def process_telegram_audio(
         audio: Audiofile,
         cli: Client,
@@ -111,19 +120,23 @@ def process_telegram_audio(
     Обработчик аудиозаписи Telegram-интеграции.
     """
 
+    # Резервирование баланса (проверка и резерв под блокировкой компании). Списывается после успешной обработки.
+    balance_hold = None
+    if not not_enough_company_balance(db_user.company, audio.duration_in_sec):
+        balance_hold = BalanceHold.place(db_user.company, audio.duration_in_sec)
+
     # Когда не хватает баланса
-    if not_enough_company_balance(db_user.company, audio.duration_in_sec):
+    if balance_hold is None:
         request_money(cli, db_user, audio.duration_in_sec)
         delete_files([audio.path])
         return
 
-    # Списание баланса
-    db_user.company.add_balance(-audio.duration_in_sec)
-
     task = create_task(audio.duration_in_sec,
                        audio.url,
                        report)
     logger.info(f"Создал новый TG Task {task.id}")
+    balance_hold.task_id = task.id
+    balance_hold.save(only=['task_id'])
 
     try:
         # Прогнозируем время на анализ
@@ -142,16 +155,19 @@ def process_telegram_audio(
         # Генерация отчета
         report_generator = ReportGenerator(transcript=assembly.transcript)
         txt_file_path: str = report_generator.generate_txt_report(sorted_analyze_data)
+        transcript_text = report_generator.generate_transcript()
+        save_task_transcript(task, transcript_text)
 
         # Подготовка данных для записи в таблицу.
         if cfg.SAVE_TRANSCRIPT_AS_TEXT:
-            transcript_cell = report_generator.generate_transcript()
+            transcript_cell = transcript_text
         else:
             transcript_cell = make_transcript_link(assembly.transcript.id)
         values_to_upload = GSLoader.get_call_default_upload_values(answers_texts, audio) + [transcript_cell]
 
         # Выгрузка в Гугл таблицу
         GSpreadTask.create(values_to_upload=json.dumps(values_to_upload), task=task)
+        notify_upload(task.report_id)
 
         # Отправляем отчет пользователю
         info_message.delete()
@@ -159,7 +175,7 @@ def process_telegram_audio(
                               caption='Анализ отобразится в таблице в течение 1 минуты.')
 
     except Exception as exc:
-        db_user.company.add_balance(audio.duration_in_sec)
+        balance_hold.release()
         delete_files([audio.path])
         update_task_with_error(task)
         logger.error(f"Ошибка при обработке аудио Task TG {task.id}: {exc}")
@@ -170,6 +186,7 @@ def process_telegram_audio(
             raise
 
     else:
+        balance_hold.capture()
         # Завершение Task
         finish_task(task)
         # Удаление исходных файлов
@@ -250,8 +267,15 @@ def process_custom_webhook_audio(
 
     task_data = db_task.get_data()
 
-    # Проверка баланса.
-    if not_enough_company_balance(company, audio.duration_in_sec):
+    prompt_extra = get_task_extra_prompt(db_task)
+    seconds_cost = get_process_task_cost(audio, prompt_extra)
+
+    # Проверка баланса и резервирование (под блокировкой компании). Резерв списывается после успешной обработки.
+    balance_hold = None
+    if not not_enough_company_balance(company, audio.duration_in_sec):
+        balance_hold = BalanceHold.place(company, seconds_cost, task=db_task)
+
+    if balance_hold is None:
         task_data.update(**{"status": "cancelled",
                             "message": "Недостаточно средств",
                             "status_message": "Недостаточно средств"})
@@ -261,11 +285,6 @@ def process_custom_webhook_audio(
         delete_files([audio.path])
         return
 
-    prompt_extra = get_task_extra_prompt(db_task)
-    seconds_cost = get_process_task_cost(audio, prompt_extra)
-
-    # Списание баланса
-    company.add_balance(-seconds_cost)
     error_message = None
 
     try:
@@ -323,11 +342,12 @@ def process_custom_webhook_audio(
 
         # Выгрузка в Гугл таблицу
         GSpreadTask.create(values_to_upload=json.dumps(values_to_upload), task=db_task)
+        notify_upload(db_task.report_id)
 
     except Exception as ex:
 
-        # Возвращаем пользователю потраченные секунды баланса.
-        company.add_balance(seconds_cost)
+        # Снимаем резерв: пользователь не платит за необработанный звонок.
+        balance_hold.release()
 
         # Сохраняем текст ошибки в базу данных и в лог.
         if error_message is None:
@@ -340,12 +360,12 @@ def process_custom_webhook_audio(
         raise
 
     else:
+        balance_hold.capture()
         # Обновление Таска в БД
         db_task.transcript_id = assembly.transcript.id
         db_task.analyze_id = assembly.lemur_response.request_id
         db_task.assembly_duration = assembly.transcript.audio_duration
-        db_task.status = Task.StatusChoices.DONE
-        db_task.save()
+        finish_task(db_task)
 
     finally:
         # Удаление исходных файлов
@@ -440,16 +460,19 @@ def process_crm_call(
         answers_texts = [answer_text for _, answer_text in sorted_analyze_data]
 
         report_generator = ReportGenerator(transcript=assembly.transcript)
+        transcript_text = report_generator.generate_transcript()
+        save_task_transcript(task, transcript_text)
 
         # Подготовка данных для записи в таблицу.
         if cfg.SAVE_TRANSCRIPT_AS_TEXT:
-            transcript_cell = report_generator.generate_transcript()
+            transcript_cell = transcript_text
         else:
             transcript_cell = make_transcript_link(assembly.transcript.id)
         values_to_upload = basic_data + answers_texts + [transcript_cell]
 
         # Выгрузка в Гугл таблицу
         GSpreadTask.create(values_to_upload=json.dumps(values_to_upload), task=task)
+        notify_upload(task.report_id)
 
         populate_crm_columns(task, crm_values_to_upload)
 
@@ -460,7 +483,7 @@ def process_crm_call(
 
     else:
         # Снимаем с баланса продолжительность, обработанную нейронной сетью.
-        company.add_balance(-assembly.transcript.audio_duration)
+        BalanceEntry.charge(company.id, assembly.transcript.audio_duration, task_id=task.id)
         finish_task(task)
         string_report = report_generator.generate_string_report(sorted_analyze_data)
 
@@ -9,6 +9,7 @@ from pyrogram.types import Message
 
 from config.config import FERNET_KEY
 from data.models import Integration, User, IntegrationServiceName, Company
+from integrations.amo_crm import metadata as amo_metadata
 from integrations.amo_crm.amo_api_core import AmoApiAuth
 from integrations.bitrix.bitrix_api import Bitrix24
 from integrations.mango.process import MangoClient
@@ -75,6 +76,15 @@ def create_or_update_amocrm_integration(message: Message, full_json: dict):
     return integration
 
 
+def encrypt_bitrix_access(access: dict) -> None:
+    """
+    Шифрует webhook_url и, если задан, application_token исходящего вебхука событий портала.
+    """
+    access['webhook_url'] = encrypt(access['webhook_url'], FERNET_KEY)
+    if access.get('application_token'):
+        access['application_token'] = encrypt(access['application_token'], FERNET_KEY)
+
+
 def create_or_update_bitrix24_integration(message: Message, full_json: dict):
     """
     Создание интеграции с Bitrix24
@@ -98,7 +108,7 @@ def create_or_update_bitrix24_integration(message: Message, full_json: dict):
         # Обновление фильтров
         if json_data.get("access"):
             i_data["access"] = json_data["access"]
-            i_data['access']['webhook_url'] = encrypt(i_data['access']['webhook_url'], FERNET_KEY)
+            encrypt_bitrix_access(i_data['access'])
         if json_data.get("filters"):
             i_data["filters"] = json_data["filters"]
         if json_data.get('crm_data'):
@@ -115,7 +125,7 @@ def create_or_update_bitrix24_integration(message: Message, full_json: dict):
 
     else:
         i_data = full_json['data']
-        i_data['access']['webhook_url'] = encrypt(i_data['access']['webhook_url'], FERNET_KEY)
+        encrypt_bitrix_access(i_data['access'])
         integration: Integration = Integration.create(
             user=db_user,
             service_name=IntegrationServiceName.BITRIX24,
@@ -324,6 +334,11 @@ class IntegrationConstructor:
         IntegrationServiceName.BEELINE: ['token'],
         IntegrationServiceName.SIPUNI: ['application_token'],
     }
+    # Необязательные чувствительные поля: шифруются, если заданы.
+    optional_sensitive_fields = {
+        # Токен исходящего вебхука событий портала (routers/bitrix.py).
+        IntegrationServiceName.BITRIX24: ['application_token'],
+    }
 
     def __init__(
             self,
@@ -365,6 +380,9 @@ class IntegrationConstructor:
 
         for field_name in self.sensitive_fields.get(integration.service_name, []):
             self.new_data['access'][field_name] = encrypt(self.new_data['access'][field_name], FERNET_KEY)
+        for field_name in self.optional_sensitive_fields.get(integration.service_name, []):
+            if self.new_data['access'].get(field_name):
+                self.new_data['access'][field_name] = encrypt(self.new_data['access'][field_name], FERNET_KEY)
 
     def _check_connection(
             self,
@@ -476,4 +494,7 @@ class IntegrationConstructor:
 
         integration.save()
 
+        if integration.service_name == IntegrationServiceName.AMOCRM:
+            amo_metadata.warm_up(integration)
+
         return integration
@@ -0,0 +1,232 @@
+"""
+Выгрузка звонков отчета (строк таблицы звонков, см. data/call_tables.py) в CSV и Parquet.
+
+Строки читаются серверным курсором PostgreSQL пачками по EXPORT_BATCH_SIZE и сразу превращаются
+в байты файла, поэтому память не зависит от количества строк:
+- generate_export() – генератор частей файла для StreamingResponse;
+- run_report_export() – фоновая выгрузка в файл в S3 (EXPORTS_S3_BUCKET) для очень больших отчетов.
+
+Серверный курсор открывается на отдельном соединении: StreamingResponse читает генератор
+из разных потоков пула, а соединения main_db привязаны к потоку.
+"""
+import csv
+import io
+import os
+import tempfile
+import uuid
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+import boto3
+import peewee
+import psycopg2
+import pyarrow as pa
+import pyarrow.parquet as pq
+from loguru import logger
+
+from config import config as cfg
+from data.call_tables import TASK_COLUMNS, NUMERIC_TYPES, format_answer_value
+from data.models import main_db, ReportExport
+
+
+# Формат: (MIME-тип, расширение файла).
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+TASK_COLUMN_TITLES = {
+    'task_id': 'ID задачи',
+    'created': 'Дата',
+    'is_archived': 'В архиве',
+    'source': 'Источник',
+    'duration_sec': 'Длительность, сек.',
+}
+
+TASK_COLUMN_TYPES = {
+    'task_id': pa.int64(),
+    'created': pa.timestamp('us'),
+    'is_archived': pa.bool_(),
+    'source': pa.string(),
+    'duration_sec': pa.int64(),
+}
+
+
+def get_export_header(columns: List[dict]) -> List[str]:
+    """
+    Заголовки колонок файла. Одинаковые названия вопросов дополняются ID вопроса.
+    """
+    header = [TASK_COLUMN_TITLES[x] for x in TASK_COLUMNS]
+    for column in columns:
+        title = column['short_name']
+        if title in header:
+            title = f'{title} ({column["id"]})'
+        header.append(title)
+    return header
+
+
+def iter_query_rows(query: peewee.Select, batch_size: Optional[int] = None) -> Iterator[List[tuple]]:
+    """
+    Строки запроса пачками через серверный (именованный) курсор.
+    """
+    batch_size = batch_size or cfg.EXPORT_BATCH_SIZE
+    sql, params = query.sql()
+
+    connection = psycopg2.connect(dbname=main_db.database, **main_db.connect_params)
+    try:
+        # Именованный курсор существует только внутри транзакции.
+        with connection:
+            with connection.cursor(name=f'export_{uuid.uuid4().hex}') as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(sql, params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+    finally:
+        connection.close()
+
+
+def format_row(row: tuple, columns: List[dict]) -> list:
+    task_values = list(row[:len(TASK_COLUMNS)])
+    answers = [format_answer_value(column, value) for column, value in zip(columns, row[len(TASK_COLUMNS):])]
+    return task_values + answers
+
+
+def iter_csv(batches: Iterator[List[tuple]], columns: List[dict]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    # BOM – чтобы Excel открыл файл в UTF-8.
+    buffer.write('\ufeff')
+    writer.writerow(get_export_header(columns))
+
+    for rows in batches:
+        for row in rows:
+            writer.writerow(format_row(row, columns))
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Файл, накапливающий записанные байты до вызова drain().
+    Позиция считается от начала файла: по ней ParquetWriter вычисляет смещения групп строк.
+    """
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_parquet(batches: Iterator[List[tuple]], columns: List[dict]) -> Iterator[bytes]:
+    types = [TASK_COLUMN_TYPES[x] for x in TASK_COLUMNS]
+    types += [pa.int64() if x['answer_type'] in NUMERIC_TYPES else pa.string() for x in columns]
+    schema = pa.schema(list(zip(get_export_header(columns), types)))
+
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        for rows in batches:
+            values = list(zip(*[format_row(row, columns) for row in rows]))
+            arrays = [pa.array(column_values, type=column_type) for column_values, column_type in zip(values, types)]
+            # Каждая пачка – отдельная группа строк.
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def generate_export(query: peewee.Select, columns: List[dict], export_format: str) -> Iterator[bytes]:
+    """
+    Части файла выгрузки. Колонки query: TASK_COLUMNS и колонки вопросов в порядке columns.
+    """
+    batches = iter_query_rows(query)
+    if export_format == 'parquet':
+        return iter_parquet(batches, columns)
+    return iter_csv(batches, columns)
+
+
+def get_export_file_name(report_id: int, export_format: str) -> str:
+    return f'report_{report_id}_{datetime.now():%Y-%m-%d_%H-%M}.{EXPORT_FORMATS[export_format][1]}'
+
+
+def run_report_export(export_id: int, query: peewee.Select, columns: List[dict]) -> None:
+    """
+    Выгружает звонки отчета во временный файл и загружает его в S3.
+    """
+    export = ReportExport.get_by_id(export_id)
+    rows_count = 0
+
+    def count_rows(batches: Iterator[List[tuple]]) -> Iterator[List[tuple]]:
+        nonlocal rows_count
+        for rows in batches:
+            rows_count += len(rows)
+            yield rows
+
+    batches = count_rows(iter_query_rows(query))
+    if export.file_format == 'parquet':
+        chunks = iter_parquet(batches, columns)
+    else:
+        chunks = iter_csv(batches, columns)
+
+    file_key = f'exports/{export.report_id}/{export.id}/{get_export_file_name(export.report_id, export.file_format)}'
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'export')
+            with open(path, 'wb') as file:
+                for chunk in chunks:
+                    file.write(chunk)
+
+            s3 = boto3.client('s3', endpoint_url=cfg.EXPORTS_S3_ENDPOINT)
+            s3.upload_file(path, cfg.EXPORTS_S3_BUCKET, file_key)
+    except Exception as ex:
+        logger.error(f'Не удалось выгрузить звонки отчета {export.report_id} (ReportExport.id={export.id}): '
+                     f'{type(ex)} {ex}')
+        export.status = ReportExport.StatusChoices.ERROR
+        export.error_details = str(ex)
+    else:
+        logger.info(f'Звонки отчета {export.report_id} выгружены в S3: {file_key} ({rows_count} строк).')
+        export.status = ReportExport.StatusChoices.DONE
+        export.file_key = file_key
+        export.rows_count = rows_count
+
+    export.finished = datetime.now()
+    export.save()
+
+
+def get_export_url(export: ReportExport) -> Optional[str]:
+    """
+    Временная ссылка на скачивание файла завершенной выгрузки.
+    """
+    if export.status != ReportExport.StatusChoices.DONE or not export.file_key:
+        return None
+    s3 = boto3.client('s3', endpoint_url=cfg.EXPORTS_S3_ENDPOINT)
+    return s3.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': cfg.EXPORTS_S3_BUCKET, 'Key': export.file_key},
+        ExpiresIn=cfg.EXPORT_URL_TTL,
+    )
@@ -15,9 +15,9 @@ from starlette import status
 from config import config as cfg
 from config.config import ACCESS_TOKEN_EXPIRE_MINUTES
 from data.models import User, Company
+from helpers.auth_cache import get_auth_context
 from modules.exceptions import TelegramDataIsOutdated, TelegramBadHashError
-from routers.helpers import check_user_role
-from schemas.user import UserInDB, TokenData, UserModel, Token, TelegramAuthSchema
+from schemas.user import UserInDB, TokenData, UserModel, Token, TelegramAuthSchema, AuthContext
 from telegram_bot.handlers.on_cmd import get_or_register_telegram_user
 
 
@@ -78,7 +78,11 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> UserInDB:
+def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> AuthContext:
+    """
+    Пользователь из токена вместе с его правами доступа.
+    Пользователь и права берутся из кэша (helpers/auth_cache.py), поэтому большинство запросов не обращается к БД.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail='Could not validate credentials',
@@ -92,22 +96,20 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> Use
         token_data = TokenData(user_id=int(user_id))
     except InvalidTokenError:
         raise credentials_exception
-    user = get_user(token_data.user_id)
+    user = get_auth_context(token_data.user_id)
     if user is None:
         raise credentials_exception
     return user
 
 
-async def get_current_active_user(
-        current_user: Annotated[UserModel, Depends(get_current_user)],
-) -> UserModel:
-    # После проверки авторизации пароль не нужен.
-    del current_user.hashed_password
+def get_current_active_user(
+        current_user: Annotated[AuthContext, Depends(get_current_user)],
+) -> AuthContext:
     return current_user
 
 
 @router.post('/token')
-async def login_for_access_token(
+def login_for_access_token(
         form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
 ) -> Token:
     user_id = int(form_data.username)
@@ -132,48 +134,47 @@ def check_current_user_role(
     Возвращает функцию,
         которую можно использовать как зависимость для проверки прав доступа пользователя по его роли.
     Такая функция:
-        - возвращает успешно авторизовавшегося пользователя (объект User), если доступ разрешен;
+        - возвращает успешно авторизовавшегося пользователя (AuthContext), если доступ разрешен;
         – вызывает исключение со статусом 403, если в доступе отказано.
     """
     if isinstance(roles, str):
         roles = [roles]
 
     def _check_current_user(
-            current_user: Annotated[UserModel, Depends(get_current_active_user)],
-    ) -> User:
-        user = check_user_role(current_user.id, roles)
-        if user is None:
+            current_user: Annotated[AuthContext, Depends(get_current_active_user)],
+    ) -> AuthContext:
+        if not current_user.has_any_role(roles):
             logger.warning(f'Пользователь ID={current_user.id} запросил доступ {roles=} и потерпел неудачу.')
             raise HTTPException(status.HTTP_403_FORBIDDEN, detail='В доступе отказано.')
-        return user
+        return current_user
 
     return _check_current_user
 
 
 @router.get('/check/sys_admin', response_model=UserModel)
 def check_sys_admin(
-        current_user: Annotated[User, Depends(check_current_user_role([]))],
+        current_user: Annotated[AuthContext, Depends(check_current_user_role([]))],
 ):
     return current_user
 
 
 @router.get('/check/admin', response_model=UserModel)
 def check_admin(
-        current_user: Annotated[User, Depends(check_current_user_role(Company.Roles.ADMIN))],
+        current_user: Annotated[AuthContext, Depends(check_current_user_role(Company.Roles.ADMIN))],
 ):
     return current_user
 
 
 @router.get('/check/user', response_model=UserModel)
 def check_user(
-        current_user: Annotated[User, Depends(check_current_user_role(Company.Roles.USER))],
+        current_user: Annotated[AuthContext, Depends(check_current_user_role(Company.Roles.USER))],
 ):
     return current_user
 
 
 @router.get('/check/user_or_admin', response_model=UserModel)
 def check_user_or_admin(
-        current_user: Annotated[User, Depends(check_current_user_role([Company.Roles.USER, Company.Roles.ADMIN]))],
+        current_user: Annotated[AuthContext, Depends(check_current_user_role([Company.Roles.USER, Company.Roles.ADMIN]))],
 ):
     return current_user
 
@@ -204,7 +205,7 @@ def authenticate_telegram_user(
 
 
 @router.post('/tg_token')
-async def telegram_login_for_access_token(
+def telegram_login_for_access_token(
         form_data: TelegramAuthSchema = Depends(TelegramAuthSchema),
 ) -> Token:
     """
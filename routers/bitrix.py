@@ -1,9 +1,14 @@
+import asyncio
+import hmac
 from pprint import pprint
+from urllib.parse import parse_qs
 
-from fastapi import APIRouter, Request, BackgroundTasks
+from fastapi import APIRouter, Request, BackgroundTasks, HTTPException, status
 from loguru import logger
 
+from data.models import Integration, IntegrationServiceName
 from helpers.logging_utils import log_with_context
+from integrations.bitrix.metadata import bitrix_metadata_cache, get_event_kinds
 from integrations.bitrix.process_bitrix_webhook import process_bx_webhook_v2, parse_body_str
 
 
@@ -27,7 +32,55 @@ async def bitrix_webhook_v2(request: Request, background_tasks: BackgroundTasks)
     body = await request.body()
     context_id = getattr(request.state, 'context_id', None)
     request_log_id = getattr(request.state, 'request_log_id', None)
-    background_tasks.add_task(log_with_context(process_bx_webhook_v2, context_id=context_id), body, request_log_id=request_log_id)
+    background_tasks.add_task(log_with_context(process_bx_webhook_v2, context_id=context_id), body,
+                              request_log_id=request_log_id, context_id=context_id)
+
+    return {"status": 200}
+
+
+def check_application_token(domain: str, application_token: str) -> bool:
+    """
+    Проверяет токен исходящего вебхука портала (auth[application_token])
+    по токену, сохраненному в интеграции (data['access']['application_token']).
+    """
+    integration = Integration.get_or_none(
+        (Integration.account_id == domain)
+        & (Integration.service_name == IntegrationServiceName.BITRIX24)
+    )
+    if integration is None:
+        return False
+    expected_token = integration.get_decrypted_access_field('application_token', allow_empty=True)
+    if not expected_token:
+        logger.warning(f'Bitrix24: у интеграции портала {domain} не задан application_token исходящего вебхука, '
+                       f'события не принимаются.')
+        return False
+    return hmac.compare_digest(expected_token, application_token)
+
+
+@router.post("/bitrix_webhook/events")
+async def bitrix_events(request: Request):
+    """
+    Обработчик исходящих событий портала Битрикс24 (воронки, этапы, пользователи, поля).
+    Сбрасывает устаревшие метаданные портала в кэшах всех процессов сервера.
+    """
+    body = await request.body()
+    # Данные событий вложенные (data[FIELDS][ID]), нужны только event и auth.
+    parsed_body = parse_qs(body.decode('utf-8'))
+    event = (parsed_body.get('event') or [''])[0]
+    domain = (parsed_body.get('auth[domain]') or [''])[0]
+    application_token = (parsed_body.get('auth[application_token]') or [''])[0]
+    if not event or not domain:
+        logger.warning(f'Bitrix24: событие без event или домена: {event!r}, {domain!r}')
+        return {"status": 400}
+
+    if not application_token or not await asyncio.to_thread(check_application_token, domain, application_token):
+        logger.warning(f'Bitrix24: событие {event} портала {domain} с неверным application_token.')
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Неверный application_token.')
+
+    kinds = get_event_kinds(event)
+    logger.info(f'Bitrix24: событие {event} портала {domain}.')
+    if kinds is None or kinds:
+        await asyncio.to_thread(bitrix_metadata_cache.invalidate_everywhere, domain, kinds)
 
     return {"status": 200}
 
@@ -11,9 +11,9 @@ router = APIRouter()
 
 
 @router.post("/custom_webhook")
-async def custom_webhook(call_request: CustomCallRequest,
-                         request: Request,
-                         background_tasks: BackgroundTasks):
+def custom_webhook(call_request: CustomCallRequest,
+                   request: Request,
+                   background_tasks: BackgroundTasks):
     """
     Обработчик кастомного вебхука
     """
@@ -35,8 +35,8 @@ async def custom_webhook(call_request: CustomCallRequest,
 
 
 @router.post("/custom_task")
-async def custom_task(task_request: CustomTaskRequest,
-                      request: Request):
+def custom_task(task_request: CustomTaskRequest,
+                request: Request):
     """
     Получение информации о задаче обработки вебхука
     """
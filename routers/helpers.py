@@ -1,12 +1,15 @@
-from typing import Union, List, Optional
+from typing import Union, List, Optional, Type
 
 import peewee
-from fastapi import Request
+from fastapi import Request, HTTPException
 from loguru import logger
 from pydantic import BaseModel
+from starlette.status import HTTP_400_BAD_REQUEST
 
-from data.models import User
+from data.filters import parse_integer_filter_value
+from data.models import Company, ModeQuestion, ModeQuestionType, ModeAnswer, ColumnFilter
 from data.server_models import CustomCallRequest, CustomTaskRequest, AuthRequest
+from schemas.user import AuthContext
 
 
 def log_access_denied(
@@ -53,47 +56,62 @@ def update_endpoint_object(
     return obj
 
 
-def check_user_role(
-        user_id: int,
-        roles: List[str],
-) -> Optional[User]:
+def check_filter_value(mode_question: ModeQuestion, operation: str, value: str) -> None:
     """
-    Проверяет у пользователя с id=user_id наличие хотя бы одной из ролей, перечисленных в roles.
-
-    Доступ разрешен:
-        1. Системный администратор (user.is_admin is True):
-           - Имеет доступ всегда и ко всему.
-        2. Пользователь, у которого значение company_role содержится в roles.
-
-    В доступе отказано:
-        1. Пользователь с user_id не найден в БД.
-        2. Передан пустой список ролей (roles).
-        3. У пользователя в БД нет установленного значения роли (.company_role).
-        4. Пользователь не имеет хотя бы одну из ролей, перечисленных в roles.
-
-    Результат:
-        - объект пользователя (User), если доступ разрешен.
-        - None, если в доступе отказано.
+    Проверяет фильтр вида таблицы или графика: у числовых и процентных вопросов значение – число,
+    операция поддерживается для типа вопроса, даты в формате DD.MM.YYYY.
     """
-    user = User.get_or_none(User.id == user_id)
+    if (mode_question.answer_type in {ModeQuestionType.INTEGER, ModeQuestionType.PERCENT}
+            and parse_integer_filter_value(value) is None):
+        raise HTTPException(HTTP_400_BAD_REQUEST, detail=f'Значение фильтра должно быть числом: {value}.')
+    try:
+        ColumnFilter.build(ModeAnswer.answer_text, mode_question.answer_type, operation, value)
+    except ValueError:
+        raise HTTPException(HTTP_400_BAD_REQUEST, detail=f'Некорректная операция или значение фильтра: '
+                                                         f'{operation} {value}.')
+
+
+def get_projection_fields(
+        model: Type[peewee.Model],
+        schema: Type[BaseModel],
+        fields: Optional[str] = None,
+) -> List[peewee.Node]:
+    """
+    Колонки модели для выборки только запрошенных полей.
 
-    # Пользователь в БД не найден.
-    if user is None:
-        return None
+    fields: имена полей схемы через запятую (например, "id,created,status"). Если не указаны – все поля схемы.
+    Поля схемы должны совпадать с именами колонок таблицы (user_id, report_id и т.д.). Поле id выбирается всегда.
+    """
+    if fields:
+        names = list(dict.fromkeys(x.strip() for x in fields.split(',') if x.strip()))
+    else:
+        names = list(schema.model_fields)
 
-    # Администратор системы имеет полный доступ.
-    if user.is_admin:
-        return user
+    unknown_names = [x for x in names if x not in schema.model_fields or x not in model._meta.columns]
+    if unknown_names:
+        raise HTTPException(HTTP_400_BAD_REQUEST, detail=f'Неизвестные поля: {", ".join(unknown_names)}.')
 
-    # Пустой список ролей – в доступе отказано.
-    if not roles:
-        return None
+    if 'id' not in names:
+        names.insert(0, 'id')
+    return [model._meta.columns[x].alias(x) for x in names]
 
-    # У пользователя нет роли в компании - в доступе отказано.
-    if not user.company_role:
-        return None
 
-    if user.company_role in roles:
-        return user
+def get_accessible_companies(
+        current_user: AuthContext,
+        company_id: Optional[int] = None,
+        allow_company_user: bool = False,
+) -> peewee.ModelSelect:
+    """
+    Компании, к которым пользователь имеет доступ (правила – как в User.get_accessible_companies).
+    Права берутся из контекста авторизации, дополнительных запросов к БД не делается.
+    """
+    companies = Company.select()
 
-    return None
+    if company_id is not None:
+        companies = companies.where(Company.id == company_id)
+
+    company_ids = current_user.get_company_ids(allow_company_user)
+    if company_ids is not None:
+        companies = companies.where(Company.id.in_(company_ids))
+
+    return companies
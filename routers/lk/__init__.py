@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 
 from routers.auth import get_password_hash
+from routers.lk.analytics import router as analytics_router
 from routers.lk.call_analyze import router as call_analyze_router
 from routers.lk.chart import router as chart_router
 from routers.lk.chart_filter import router as chart_filter_router
@@ -13,6 +14,8 @@ from routers.lk.mode_answer import router as mode_answer_router
 from routers.lk.mode_question import router as mode_question_router
 from routers.lk.mode_template import router as mode_template_router
 from routers.lk.report import router as report_router
+from routers.lk.report_export import router as report_export_router
+from routers.lk.search import router as search_router
 from routers.lk.static import router as static_router
 from routers.lk.table_active_filter import router as table_active_filter_router
 from routers.lk.table_view_settings import router as table_view_settings_router
@@ -27,6 +30,7 @@ main_router.include_router(user_router, tags=['users'])
 
 main_router.include_router(report_router, tags=['report'])
 main_router.include_router(integration_router, tags=['report'])
+main_router.include_router(report_export_router, tags=['report'])
 
 main_router.include_router(mode_router, tags=['mode'])
 main_router.include_router(mode_answer_router, tags=['mode'])
@@ -35,10 +39,12 @@ main_router.include_router(mode_question_router, tags=['mode'])
 
 main_router.include_router(task_router, tags=['task'])
 main_router.include_router(call_analyze_router, tags=['task'])
+main_router.include_router(search_router, tags=['task'])
 
 main_router.include_router(chart_router, tags=['chart'])
 main_router.include_router(chart_filter_router, tags=['chart'])
 main_router.include_router(chart_parameter_router, tags=['chart'])
+main_router.include_router(analytics_router, tags=['chart'])
 
 main_router.include_router(static_router)
 main_router.include_router(table_active_filter_router)
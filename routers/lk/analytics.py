@@ -0,0 +1,47 @@
+from typing import Annotated, Dict
+
+from fastapi import APIRouter, Depends, HTTPException
+from starlette.status import HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND
+
+from data.models import Report
+from modules.analytics import analytics_engine
+from routers.auth import get_current_active_user
+from schemas.analytics import AnalyticsQuerySchema
+from schemas.user import AuthContext
+
+
+router = APIRouter()
+
+
+@router.post('/reports/{report_id}/analytics', response_model=Dict)
+def get_report_analytics(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
+        report_id: int,
+        data: AnalyticsQuerySchema,
+):
+    """
+    Группирует завершенные задачи отчета по измерениям и вычисляет метрики по ответам
+    (процентили, гистограммы, распределения вариантов, разница с предыдущим периодом).
+    """
+    report = Report.get_or_none(Report.id == report_id)
+
+    # Проверка доступа.
+    if report is None or (
+            not current_user.is_admin
+            and
+            not (current_user.company_id == report.integration.company.id)
+    ):
+        raise HTTPException(HTTP_404_NOT_FOUND, detail='Отчет не найден.')
+
+    try:
+        response = analytics_engine.query(
+            report.id,
+            from_date=data.from_date,
+            to_date=data.to_date,
+            group_by=data.group_by,
+            metrics=[x.model_dump() for x in data.metrics],
+            with_deltas=data.with_deltas,
+        )
+    except ValueError as ex:
+        raise HTTPException(HTTP_400_BAD_REQUEST, detail=str(ex))
+    return response
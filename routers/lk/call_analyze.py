@@ -17,7 +17,7 @@ router = APIRouter()
 
 
 @router.post('/call_analyzes')
-async def create_call_analyze(
+def create_call_analyze(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         request: Request,
         background_tasks: BackgroundTasks,
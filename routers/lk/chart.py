@@ -1,30 +1,37 @@
 import json
 from collections import defaultdict
-from datetime import date, timedelta
+from datetime import date, datetime
+from decimal import Decimal
 from functools import reduce
 from typing import Annotated, Dict, Optional, List
 
 import peewee
 from fastapi import APIRouter, Depends, HTTPException, Query
-from peewee import fn
+from fastapi.encoders import jsonable_encoder
+from peewee import fn, JOIN
 from starlette.status import HTTP_404_NOT_FOUND
 
+from config import config as cfg
 from data.models import Chart, Report, Integration, MetricsOptions, Task, ModeAnswer, ChartMetricType, ChartParameter, \
-    ModeQuestion, ChartFilter, ColumnFilter
+    ModeQuestion, ChartFilter, main_db, ChartRollup, ChartRollupChoice, ModeQuestionType, ReportVersion, \
+    ColumnFilter
+from data.filters import compile_task_filters, get_filters_key
+from helpers.chart_cache import chart_cache
+from misc.time import get_datetime_range
 from routers.auth import get_current_active_user
 from routers.helpers import update_endpoint_object
 from routers.lk.integration import get_accessible_integration
 from schemas.chart import ChartPublicSchema, ChartCreateSchema, ChartPartialUpdateSchema
 from schemas.chart_parameter import ChartParameterDataPublicSchema
-from schemas.user import UserModel
+from schemas.user import AuthContext
 
 
 router = APIRouter()
 
 
 @router.get('/charts/{obj_id}', response_model=ChartPublicSchema)
-async def get_chart(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def get_chart(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         obj_id: int,
 ):
     chart = Chart.get_or_none(Chart.id == obj_id)
@@ -41,8 +48,8 @@ async def get_chart(
 
 
 @router.get('/charts', response_model=Dict)
-async def get_charts_list(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def get_charts_list(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         report_ids: Optional[str] = None,
         company_id: Optional[int] = None,
         limit: int = Query(10, ge=1, le=100),
@@ -51,7 +58,7 @@ async def get_charts_list(
     db_query = Chart.select()
 
     # Интеграции, доступные пользователю для чтения.
-    allowed_integrations = get_accessible_integration(current_user.id, allow_company_user=True)
+    allowed_integrations = get_accessible_integration(current_user, allow_company_user=True)
 
     # Фильтр по компании.
     if company_id is not None:
@@ -84,8 +91,8 @@ async def get_charts_list(
 
 
 @router.post('/charts', response_model=ChartPublicSchema)
-async def create_chart(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def create_chart(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         data: ChartCreateSchema,
 ):
     report = Report.get_or_none(Report.id == data.report_id)
@@ -101,12 +108,13 @@ async def create_chart(
     chart = Chart.create(report=report,
                          name=data.name,
                          order=data.order)
+    ReportVersion.bump(report.id)
     return chart
 
 
 @router.patch('/charts/{obj_id}', response_model=ChartPublicSchema)
-async def partial_update_chart(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def partial_update_chart(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         obj_id: int,
         data: ChartPartialUpdateSchema,
 ):
@@ -121,12 +129,13 @@ async def partial_update_chart(
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Отчет не найден.')
 
     chart = update_endpoint_object(chart, data, False)
+    ReportVersion.bump(chart.report_id)
     return chart
 
 
 @router.delete('/charts/{obj_id}', response_model=Dict)
-async def delete_chart(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def delete_chart(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         obj_id: int,
 ):
     chart = Chart.get_or_none(Chart.id == obj_id)
@@ -140,13 +149,14 @@ async def delete_chart(
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Отчет не найден.')
 
     chart.delete_instance()
+    ReportVersion.bump(chart.report_id)
     response = {'chart': 1}
     return response
 
 
 @router.get('/charts_options', response_model=Dict)
-async def get_possible_metrics_options(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def get_possible_metrics_options(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
 ):
     response = {
         'result': {
@@ -156,208 +166,322 @@ async def get_possible_metrics_options(
     return response
 
 
-
-def get_percent_answer_value(answer_text: str) -> int:
-    try:
-        return int(answer_text.replace('%', '').strip())
-    except ValueError:
-        return 0
-
-
-def calculate_parameter_value(
+def get_parameter_value_expression(
         parameter: ChartParameter,
-        answer_texts: List[str],
-):
+        question_condition: Optional[peewee.Expression] = None,
+) -> peewee.Node:
     """
-    Вычисляет значение параметра на графике.
+    Агрегатное SQL-выражение, вычисляющее значение параметра графика по ответам одного шага.
+    Если передано question_condition, то агрегируются только ответы, удовлетворяющие условию
+    (так значения нескольких параметров вычисляются одним запросом).
     """
 
+    def aggregate(expression, condition=None):
+        conditions = [x for x in (question_condition, condition) if x is not None]
+        if not conditions:
+            return expression
+        return expression.filter(reduce(lambda acc, x: acc & x, conditions))
+
+    # Шаги без ответов на вопрос должны получать None, а не 0.
+    answers_count = aggregate(fn.COUNT(ModeAnswer.id))
+    if question_condition is not None:
+        answers_count = fn.NULLIF(answers_count, 0)
+
     # Операция одинаковая для всех типов параметров.
     if parameter.metric_operation == 'count':
-        value = len(answer_texts)
+        return answers_count
 
-    else:
-        if parameter.data_type in {ChartMetricType.INTEGER, ChartMetricType.PERCENT}:
-            values_list = [get_percent_answer_value(x) for x in answer_texts]
-
-            if parameter.metric_operation == 'max':
-                value = max(values_list)
-            elif parameter.metric_operation == 'min':
-                value = min(values_list)
-            elif parameter.metric_operation == 'average':
-                value = round(1.0 * sum(values_list) / len(values_list), 2)
-            else:
-                if parameter.data_type == ChartMetricType.INTEGER and parameter.metric_operation == 'sum':
-                    value = sum(values_list)
-                else:
-                    raise HTTPException(HTTP_404_NOT_FOUND, detail='Неизвестная операция над параметром графика.')
-
-        elif parameter.data_type == ChartMetricType.MULTIPLE_CHOICE:
-            if parameter.metric_operation == 'percentage_of_total':
-                # Варианты ответов, по которым нужно фильтровать.
-                condition_values = [x.lower() for x in json.loads(parameter.metric_condition)]
-                filtered_values = [x for x in answer_texts if x.lower() in condition_values]
-                # Общее число записей / Число записей, прошедших фильтр.
-                value = round(1.0 * len(filtered_values) / len(answer_texts), 2)
-            else:
-                raise HTTPException(HTTP_404_NOT_FOUND, detail='Неизвестная операция над параметром графика.')
+    if parameter.data_type in {ChartMetricType.INTEGER, ChartMetricType.PERCENT}:
+        answer_value = ModeAnswer.get_integer_value_expression()
 
-        else:
-            raise HTTPException(HTTP_404_NOT_FOUND, detail='Неизвестная операция над параметром графика.')
+        if parameter.metric_operation == 'max':
+            return aggregate(fn.MAX(answer_value))
+        elif parameter.metric_operation == 'min':
+            return aggregate(fn.MIN(answer_value))
+        elif parameter.metric_operation == 'average':
+            return fn.ROUND(aggregate(fn.AVG(answer_value)), 2)
+        elif parameter.data_type == ChartMetricType.INTEGER and parameter.metric_operation == 'sum':
+            return aggregate(fn.SUM(answer_value))
 
-    return value
+    elif parameter.data_type == ChartMetricType.MULTIPLE_CHOICE:
+        if parameter.metric_operation == 'percentage_of_total':
+            # Варианты ответов, по которым нужно фильтровать.
+            condition_values = [x.lower() for x in json.loads(parameter.metric_condition)]
+            filtered_count = aggregate(fn.COUNT(ModeAnswer.id),
+                                       fn.LOWER(ModeAnswer.answer_text).in_(condition_values))
+            # Число записей, прошедших фильтр / Общее число записей.
+            return fn.ROUND(filtered_count.cast('numeric') / answers_count, 2)
 
+    raise HTTPException(HTTP_404_NOT_FOUND, detail='Неизвестная операция над параметром графика.')
 
-def filter_chart_tasks(
-        chart: Chart,
-        task_ids,
-) -> Optional[peewee.ModelSelect]:
+
+def get_parameter_key(parameter: ChartParameter) -> tuple:
     """
-    Фильтрует задачи по фильтрам графика.
+    Параметры с одинаковым ключом имеют одинаковые значения на одном наборе задач.
     """
+    return (
+        parameter.mode_question_id,
+        parameter.data_type,
+        parameter.metric_operation,
+        parameter.metric_condition,
+    )
 
-    # Активные вопросы отчета графика.
-    mode_questions = ModeQuestion.select().where(ModeQuestion.report == chart.report,
-                                                 ModeQuestion.is_active == True)
-    # Активные фильтры указанного вида для указанного отчета.
-    chart_filters = ChartFilter.select().where(ChartFilter.chart == chart,
-                                               ChartFilter.mode_question.in_(mode_questions))
-
-    # Если ни одного фильтра не указано, то возвращаем исходный список задач.
-    if not chart_filters.exists():
-        return None
 
-    # Предварительная обработка фильтров
-    filter_conditions = []
-    for chart_filter in chart_filters:
-        expr = ColumnFilter.build(
-            ModeAnswer.answer_text,
-            chart_filter.mode_question.answer_type,
-            chart_filter.operation,
-            chart_filter.value
+def get_active_chart_filters(chart_ids: List[int]) -> Dict[int, List[ChartFilter]]:
+    """
+    Фильтры графиков по активным вопросам их отчетов: chart_id -> список фильтров.
+    """
+    chart_filters = (
+        ChartFilter
+        .select(ChartFilter, ModeQuestion)
+        .join(ModeQuestion)
+        .switch(ChartFilter)
+        .join(Chart)
+        .where(
+            ChartFilter.chart.in_(chart_ids),
+            ModeQuestion.report == Chart.report,
+            ModeQuestion.is_active == True,
         )
-        filter_conditions.append({'question': chart_filter.mode_question, 'expr': expr})
-
-    total_expr = reduce(lambda acc, cond: acc | ((ModeAnswer.question == cond['question']) & cond['expr']),
-                        filter_conditions,
-                        False)
-
-    filtered_task_ids = (
-        Task
-        .select(Task.id)
-        .where(Task.id.in_(task_ids))
-        .join(ModeAnswer)
-        .where(total_expr)
-        .group_by(Task.id)
-        .having(fn.COUNT(Task.id) == len(filter_conditions))
     )
-    return filtered_task_ids
+    filters_by_chart = defaultdict(list)
+    for chart_filter in chart_filters:
+        filters_by_chart[chart_filter.chart_id].append(chart_filter)
+    return filters_by_chart
 
 
-def make_parameter_data(
-        parameter: ChartParameter,
+def get_chart_step(from_date: date, to_date: date) -> str:
+    """
+    Шаг графика определяется диапазоном дат, для которого нужно получить данные.
+    Если этот диапазон равен одному дню, то шагом является час, а иначе – день.
+    """
+    return 'hour' if from_date == to_date else 'day'
+
+
+def fill_chart_steps(
+        values_query: peewee.SelectQuery,
+        step: str,
+        from_datetime: datetime,
+        to_datetime: datetime,
+        columns: List[str],
+) -> Dict[str, List[dict]]:
+    """
+    Дополняет значения параметров (запрос со столбцом step и столбцами columns) всеми шагами диапазона.
+    Шаги, для которых не было задач, получают значение None.
+    Возвращает данные графика для каждого столбца.
+    """
+    values_sql, values_params = values_query.sql()
+    values_columns = ''.join(f', v.{column}' for column in columns)
+    cursor = main_db.execute_sql(
+        f'SELECT steps.step{values_columns} '
+        f"FROM generate_series(%s::timestamp, %s::timestamp - interval '1 {step}', interval '1 {step}') "
+        f'AS steps(step) '
+        f'LEFT JOIN ({values_sql}) AS v ON v.step = steps.step '
+        f'ORDER BY steps.step',
+        [from_datetime, to_datetime] + values_params,
+    )
+
+    data = {column: [] for column in columns}
+    for step_start, *values in cursor.fetchall():
+        step_value = step_start.hour if step == 'hour' else step_start.date()
+        for column, value in zip(columns, values):
+            if isinstance(value, Decimal):
+                value = float(value)
+            data[column].append({'date': step_value, 'value': value})
+    return data
+
+
+def make_parameters_data(
+        parameters: List[ChartParameter],
         task_ids: peewee.ModelSelect,
         from_date: date,
         to_date: date,
-) -> List[dict]:
+) -> Dict[tuple, List[dict]]:
     """
-    Формирует данные для параметра графика с разбивкой по шагам.
+    Формирует данные для параметров графиков с разбивкой по шагам по исходным ответам.
+    Значения всех параметров, группировка и заполнение пустых шагов вычисляются одним SQL-запросом.
+    Возвращает данные для каждого ключа параметра (get_parameter_key).
     """
-    # Шаг графика определяется диапазоном дат, для которого нужно получить данные.
-    # Если этот диапазон равен одному дню, то шагом является час, а иначе – день.
-    group_by_hour = from_date == to_date
-
-    # Ответы, связанные с данным параметром и нужными задачами.
-    mode_answers = (
+    unique_parameters = {get_parameter_key(x): x for x in parameters}
+    if not unique_parameters:
+        return {}
+
+    step = get_chart_step(from_date, to_date)
+    from_datetime, to_datetime = get_datetime_range(from_date, to_date)
+    step_expression = fn.DATE_TRUNC(step, Task.created)
+
+    columns = {}
+    value_expressions = []
+    for i, (key, parameter) in enumerate(unique_parameters.items()):
+        column = f'value_{i}'
+        columns[column] = key
+        question_condition = ModeAnswer.question == parameter.mode_question_id
+        value_expressions.append(get_parameter_value_expression(parameter, question_condition).alias(column))
+
+    # Значения параметров по шагам. Ответ не может быть создан раньше своей задачи,
+    # поэтому нижняя граница по ModeAnswer.created отсекает партиции с более ранними ответами.
+    values_query = (
         ModeAnswer
-        .select(
-            ModeAnswer.answer_text,
-            ModeAnswer.task,
+        .select(step_expression.alias('step'), *value_expressions)
+        .join(Task, on=(ModeAnswer.task == Task.id))
+        .where(
+            ModeAnswer.question.in_({x.mode_question_id for x in unique_parameters.values()}),
+            ModeAnswer.task.in_(task_ids),
+            ModeAnswer.created >= from_datetime,
         )
+        .group_by(step_expression)
+    )
+    data = fill_chart_steps(values_query, step, from_datetime, to_datetime, list(columns))
+    return {key: data[column] for column, key in columns.items()}
+
+
+def can_use_rollups(parameter: ChartParameter) -> bool:
+    """
+    Можно ли построить параметр по почасовым агрегатам (ChartRollup).
+    Варианты ответов агрегируются только для вопросов с выбором из вариантов.
+    """
+    if not cfg.CHART_ROLLUPS_ENABLED:
+        return False
+    if parameter.metric_operation == 'percentage_of_total':
+        return parameter.mode_question.answer_type == ModeQuestionType.MULTIPLE_CHOICE
+    return True
+
+
+def make_rollup_parameter_data(
+        parameter: ChartParameter,
+        report_id: int,
+        from_date: date,
+        to_date: date,
+) -> List[dict]:
+    """
+    Формирует данные для параметра графика по почасовым агрегатам.
+    Результат совпадает с make_parameters_data для графика без фильтров.
+    """
+    step = get_chart_step(from_date, to_date)
+    from_datetime, to_datetime = get_datetime_range(from_date, to_date)
+    step_expression = fn.DATE_TRUNC(step, ChartRollup.hour)
+    answers_count = fn.SUM(ChartRollup.answers_count)
+
+    values_query = (
+        ChartRollup
+        .select(step_expression.alias('step'))
         .where(
-            ModeAnswer.question == parameter.mode_question,
-            ModeAnswer.task.in_(task_ids)
+            ChartRollup.report == report_id,
+            ChartRollup.question == parameter.mode_question,
+            ChartRollup.hour >= from_datetime,
+            ChartRollup.hour < to_datetime,
         )
-        .order_by(ModeAnswer.id)
+        .group_by(step_expression)
     )
 
-    # Группируем данные по дням/часам.
-    grouped_by_step = defaultdict(list)
-    for ma in mode_answers:
-        if group_by_hour:
-            step_name = ma.task.created.time().hour
-        else:
-            step_name = ma.task.created.date()
-        grouped_by_step[step_name].append(ma.answer_text)
-
-    # Вычисляем координаты параметра для всех шагов.
-    coordinates = {}
-    for step_name, answer_texts in grouped_by_step.items():
-        coordinates[step_name] = calculate_parameter_value(parameter, answer_texts)
-
-    # Заполняем шаги, для которых не было задач.
-    if group_by_hour:
-        for hour in range(1, 25):
-            if hour not in coordinates:
-                coordinates[hour] = None
+    operation = parameter.metric_operation
+    if operation == 'count':
+        value_expression = answers_count
+    elif parameter.data_type in {ChartMetricType.INTEGER, ChartMetricType.PERCENT} and operation == 'max':
+        value_expression = fn.MAX(ChartRollup.value_max)
+    elif parameter.data_type in {ChartMetricType.INTEGER, ChartMetricType.PERCENT} and operation == 'min':
+        value_expression = fn.MIN(ChartRollup.value_min)
+    elif parameter.data_type in {ChartMetricType.INTEGER, ChartMetricType.PERCENT} and operation == 'average':
+        value_expression = fn.ROUND(fn.SUM(ChartRollup.value_sum).cast('numeric') / answers_count, 2)
+    elif parameter.data_type == ChartMetricType.INTEGER and operation == 'sum':
+        value_expression = fn.SUM(ChartRollup.value_sum)
+    elif parameter.data_type == ChartMetricType.MULTIPLE_CHOICE and operation == 'percentage_of_total':
+        # Количество ответов с нужными вариантами по часам.
+        condition_values = [x.lower() for x in json.loads(parameter.metric_condition)]
+        choices = (
+            ChartRollupChoice
+            .select(ChartRollupChoice.hour, fn.SUM(ChartRollupChoice.answers_count).alias('answers_count'))
+            .where(
+                ChartRollupChoice.report == report_id,
+                ChartRollupChoice.question == parameter.mode_question,
+                ChartRollupChoice.hour >= from_datetime,
+                ChartRollupChoice.hour < to_datetime,
+                ChartRollupChoice.choice.in_(condition_values),
+            )
+            .group_by(ChartRollupChoice.hour)
+            .alias('choices')
+        )
+        values_query = values_query.join(choices, JOIN.LEFT_OUTER, on=(choices.c.hour == ChartRollup.hour))
+        filtered_count = fn.COALESCE(fn.SUM(choices.c.answers_count), 0)
+        value_expression = fn.ROUND(filtered_count.cast('numeric') / answers_count, 2)
     else:
-        temp_date = from_date
-        while temp_date <= to_date:
-            if temp_date not in coordinates:
-                coordinates[temp_date] = None
-            temp_date += timedelta(days=1)
+        raise HTTPException(HTTP_404_NOT_FOUND, detail='Неизвестная операция над параметром графика.')
 
-    data = [{'date': k, 'value': v} for k, v in sorted(coordinates.items(), key=lambda x: x[0])]
-    return data
+    values_query = values_query.select_extend(value_expression.alias('value'))
+    return fill_chart_steps(values_query, step, from_datetime, to_datetime, ['value'])['value']
 
 
-@router.get('/charts/{chart_id}/data', response_model=Dict)
-async def get_chart_data(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
-        chart_id: int,
+def make_charts_data(
+        charts: List[Chart],
+        report_id: int,
         from_date: date,
         to_date: date,
-):
+) -> Dict[int, List[ChartParameterDataPublicSchema]]:
     """
-    Возвращает данные о графике для отрисовки:
-    - параметры графика;
-    - параметры выборки;
-    - данные графика (координаты).
-    """
-    chart = Chart.get_or_none(Chart.id == chart_id)
+    Формирует данные параметров для графиков одного отчета: chart_id -> список параметров.
 
-    # Проверка доступа.
-    if chart is None or (
-            not current_user.is_admin
-            and
-            not (current_user.company_id == chart.report.integration.company.id)
-    ):
-        raise HTTPException(HTTP_404_NOT_FOUND, detail='График не найден.')
+    Графики с одинаковыми фильтрами используют общий набор задач, а значения
+    одинаковых параметров в рамках набора задач вычисляются один раз.
+    """
+    chart_ids = [x.id for x in charts]
 
     # Задачи за нужный период.
+    from_datetime, to_datetime = get_datetime_range(from_date, to_date)
     task_ids = Task.select(Task.id).where(
-        fn.DATE(Task.created) >= fn.DATE(from_date),
-        fn.DATE(Task.created) <= fn.DATE(to_date),
-        Task.report == chart.report,
+        Task.created >= from_datetime,
+        Task.created < to_datetime,
+        Task.report == report_id,
+        Task.status == Task.StatusChoices.DONE,
     )
-    # Фильтруем задачи.
-    filtered_task_ids = filter_chart_tasks(chart, task_ids)
-    if filtered_task_ids is not None:
-        task_ids = filtered_task_ids
 
-    parameters = ChartParameter.select().where(ChartParameter.chart == chart)
+    filters_by_chart = get_active_chart_filters(chart_ids)
+    parameters = list(
+        ChartParameter
+        .select(ChartParameter, ModeQuestion)
+        .join(ModeQuestion)
+        .where(ChartParameter.chart.in_(chart_ids))
+        .order_by(ChartParameter.id)
+    )
 
-    parameters_validated = []
+    # Видимые параметры, сгруппированные по наборам задач.
+    parameters_by_filters = defaultdict(list)
+    for parameter in parameters:
+        if not parameter.is_hidden:
+            filters_key = get_filters_key(filters_by_chart[parameter.chart_id])
+            parameters_by_filters[filters_key].append(parameter)
+
+    # (ключ фильтров, ключ параметра) -> данные.
+    values = {}
+    for filters_key, filter_parameters in parameters_by_filters.items():
+        filters_expression = compile_task_filters(filters_by_chart[filter_parameters[0].chart_id])
+        filtered_task_ids = task_ids if filters_expression is None else task_ids.where(filters_expression)
+
+        raw_parameters = filter_parameters
+        if filters_expression is None:
+            # Без фильтров графики строятся по почасовым агрегатам.
+            raw_parameters = []
+            for parameter in filter_parameters:
+                key = get_parameter_key(parameter)
+                if not can_use_rollups(parameter):
+                    raw_parameters.append(parameter)
+                elif (filters_key, key) not in values:
+                    values[(filters_key, key)] = make_rollup_parameter_data(parameter, report_id, from_date, to_date)
+
+        parameters_data = make_parameters_data(raw_parameters, filtered_task_ids, from_date, to_date)
+        for key, data in parameters_data.items():
+            values[(filters_key, key)] = data
+
+    charts_data = {chart_id: [] for chart_id in chart_ids}
     for parameter in parameters:
         if parameter.is_hidden:
             data = None
         else:
-            data = make_parameter_data(parameter, task_ids, from_date, to_date)
-        parameters_validated.append(
+            filters_key = get_filters_key(filters_by_chart[parameter.chart_id])
+            data = values[(filters_key, get_parameter_key(parameter))]
+        charts_data[parameter.chart_id].append(
             ChartParameterDataPublicSchema(
                 id=parameter.id,
-                chart_id=parameter.chart.id,
-                mode_question_id=parameter.mode_question.id,
+                chart_id=parameter.chart_id,
+                mode_question_id=parameter.mode_question_id,
                 color=parameter.color,
                 data_type=parameter.data_type,
                 metric_operation=parameter.metric_operation,
@@ -366,10 +490,127 @@ async def get_chart_data(
                 data=data,
             )
         )
+    return charts_data
+
+
+def get_cached_charts_data(
+        charts: List[Chart],
+        report_id: int,
+        from_date: date,
+        to_date: date,
+) -> Dict[int, List[dict]]:
+    """
+    То же, что make_charts_data, но с кэшированием данных каждого графика.
+    Вычисляются только графики, которых нет в кэше для текущей версии отчета.
+    """
+    version = ReportVersion.get_version(report_id)
+
+    # Прошедший диапазон кэшируется по версиям его дней. Графики с относительными фильтрами
+    # («Последние X дней») зависят от текущей даты, поэтому кэшируются как текущий диапазон.
+    past_chart_ids = set()
+    range_version = None
+    if chart_cache.is_past_range(to_date):
+        range_version = ReportVersion.get_range_version(report_id, from_date, to_date)
+        filters_by_chart = get_active_chart_filters([x.id for x in charts])
+        past_chart_ids = {
+            x.id for x in charts
+            if not any(f.operation.lower() in ColumnFilter.RELATIVE_OPERATIONS for f in filters_by_chart[x.id])
+        }
+
+    # chart_id -> (ключ кэша, TTL).
+    keys = {}
+    for chart in charts:
+        if chart.id in past_chart_ids:
+            keys[chart.id] = (chart_cache.make_past_key(report_id, range_version, chart.id, from_date, to_date),
+                              cfg.CHART_CACHE_PAST_TTL)
+        else:
+            keys[chart.id] = (chart_cache.make_key(report_id, version, chart.id, from_date, to_date),
+                              cfg.CHART_CACHE_TTL)
+
+    charts_data = {}
+    missing_charts = []
+    for chart in charts:
+        cached = chart_cache.get(keys[chart.id][0])
+        if cached is None:
+            missing_charts.append(chart)
+        else:
+            charts_data[chart.id] = cached
+
+    if missing_charts:
+        for chart_id, parameters in make_charts_data(missing_charts, report_id, from_date, to_date).items():
+            charts_data[chart_id] = jsonable_encoder(parameters)
+            key, ttl = keys[chart_id]
+            chart_cache.set(key, charts_data[chart_id], ttl)
+    return charts_data
+
+
+@router.get('/charts/{chart_id}/data', response_model=Dict)
+def get_chart_data(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
+        chart_id: int,
+        from_date: date,
+        to_date: date,
+):
+    """
+    Возвращает данные о графике для отрисовки:
+    - параметры графика;
+    - параметры выборки;
+    - данные графика (координаты).
+    """
+    chart = Chart.get_or_none(Chart.id == chart_id)
+
+    # Проверка доступа.
+    if chart is None or (
+            not current_user.is_admin
+            and
+            not (current_user.company_id == chart.report.integration.company.id)
+    ):
+        raise HTTPException(HTTP_404_NOT_FOUND, detail='График не найден.')
+
+    charts_data = get_cached_charts_data([chart], chart.report_id, from_date, to_date)
 
     response = {
         'chart': ChartPublicSchema.model_validate(chart),
-        'parameters': parameters_validated,
+        'parameters': charts_data[chart.id],
+        'from_date': from_date,
+        'to_date': to_date,
+    }
+    return response
+
+
+@router.get('/reports/{report_id}/dashboard', response_model=Dict)
+def get_report_dashboard(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
+        report_id: int,
+        from_date: date,
+        to_date: date,
+):
+    """
+    Возвращает данные всех графиков отчета для отрисовки за один запрос
+    (аналогично /charts/{chart_id}/data для каждого графика).
+    """
+    report = Report.get_or_none(Report.id == report_id)
+
+    # Проверка доступа.
+    if report is None or (
+            not current_user.is_admin
+            and
+            not (current_user.company_id == report.integration.company.id)
+    ):
+        raise HTTPException(HTTP_404_NOT_FOUND, detail='Отчет не найден.')
+
+    charts = list(Chart.select().where(Chart.report == report).order_by(Chart.order, Chart.id))
+    charts_data = get_cached_charts_data(charts, report.id, from_date, to_date)
+
+    response = {
+        'report_id': report.id,
+        'charts': [
+            {
+                'chart': ChartPublicSchema.model_validate(chart),
+                'parameters': charts_data[chart.id],
+            }
+            for chart in charts
+        ],
         'from_date': from_date,
         'to_date': to_date,
     }
@@ -4,9 +4,9 @@ from typing import Dict
 from fastapi import APIRouter, Depends, HTTPException
 from starlette.status import HTTP_404_NOT_FOUND
 
-from data.models import Chart, ChartFilter, ModeQuestion
+from data.models import Chart, ChartFilter, ModeQuestion, ReportVersion
 from routers.auth import get_current_active_user
-from routers.helpers import update_endpoint_object
+from routers.helpers import update_endpoint_object, check_filter_value
 from schemas.chart_filter import ChartFilterPublicSchema, ChartFilterCreateSchema, \
     ChartFilterUpdateSchema
 from schemas.user import UserModel
@@ -16,7 +16,7 @@ router = APIRouter()
 
 
 @router.get('/charts/{obj_id}/filters', response_model=List[ChartFilterPublicSchema])
-async def get_chart_filters_list(
+def get_chart_filters_list(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         obj_id: int,
 ):
@@ -35,7 +35,7 @@ async def get_chart_filters_list(
 
 
 @router.post('/charts/{obj_id}/filters', response_model=ChartFilterPublicSchema)
-async def create_chart_filter(
+def create_chart_filter(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         obj_id: int,
         data: ChartFilterCreateSchema,
@@ -54,6 +54,7 @@ async def create_chart_filter(
                                              ModeQuestion.report == chart.report)
     if mode_question is None:
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Вопрос не найден.')
+    check_filter_value(mode_question, data.operation, data.value)
 
     chart_filter = ChartFilter.create(
         chart=chart,
@@ -61,11 +62,12 @@ async def create_chart_filter(
         operation=data.operation,
         value=data.value,
     )
+    ReportVersion.bump(chart.report_id)
     return chart_filter
 
 
 @router.put('/charts/{chart_id}/filters/{filter_id}', response_model=ChartFilterPublicSchema)
-async def update_chart_filter(
+def update_chart_filter(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         chart_id: int,
         filter_id: int,
@@ -87,12 +89,14 @@ async def update_chart_filter(
     if chart_filter is None:
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Фильтр не найден.')
 
+    check_filter_value(chart_filter.mode_question, data.operation, data.value)
     chart_filter = update_endpoint_object(chart_filter, data, True)
+    ReportVersion.bump(chart.report_id)
     return chart_filter
 
 
 @router.delete('/charts/{chart_id}/filters/{filter_id}', response_model=Dict)
-async def delete_chart_filter(
+def delete_chart_filter(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         chart_id: int,
         filter_id: int,
@@ -114,5 +118,6 @@ async def delete_chart_filter(
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Фильтр не найден.')
 
     chart_filter.delete_instance()
+    ReportVersion.bump(chart.report_id)
     response = {'chart_filter': 1}
     return response
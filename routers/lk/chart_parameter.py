@@ -4,7 +4,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from starlette.status import HTTP_404_NOT_FOUND, HTTP_400_BAD_REQUEST
 
 from data.models import Chart
-from data.models import ChartParameter, ModeQuestion
+from data.models import ChartParameter, ModeQuestion, ReportVersion
 from routers.auth import get_current_active_user
 from schemas.chart_parameter import ChartParameterPublicSchema, \
     ChartParameterCreateSchema, ChartParameterPartialUpdateSchema
@@ -15,7 +15,7 @@ router = APIRouter()
 
 
 @router.get('/charts/{chart_id}/parameters/{parameter_id}', response_model=ChartParameterPublicSchema)
-async def get_chart_parameter(
+def get_chart_parameter(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         chart_id: int,
         parameter_id: int,
@@ -39,7 +39,7 @@ async def get_chart_parameter(
 
 
 @router.get('/charts/{chart_id}/parameters', response_model=Dict)
-async def get_chart_parameters_list(
+def get_chart_parameters_list(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         chart_id: int,
         limit: int = Query(10, ge=1, le=100),
@@ -71,7 +71,7 @@ async def get_chart_parameters_list(
 
 
 @router.post('/charts/{chart_id}/parameters', response_model=ChartParameterPublicSchema)
-async def create_chart_parameter(
+def create_chart_parameter(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         chart_id: int,
         data: ChartParameterCreateSchema,
@@ -104,11 +104,12 @@ async def create_chart_parameter(
         metric_condition=data.metric_condition,
         is_hidden=data.is_hidden,
     )
+    ReportVersion.bump(chart.report_id)
     return parameter
 
 
 @router.patch('/charts/{chart_id}/parameters/{parameter_id}', response_model=ChartParameterPublicSchema)
-async def partial_update_chart_parameter(
+def partial_update_chart_parameter(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         chart_id: int,
         parameter_id: int,
@@ -147,12 +148,13 @@ async def partial_update_chart_parameter(
 
     if parameter.is_dirty():
         parameter.save()
+        ReportVersion.bump(chart.report_id)
 
     return parameter
 
 
 @router.delete('/charts/{chart_id}/parameters/{parameter_id}', response_model=Dict)
-async def delete_chart_parameter(
+def delete_chart_parameter(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         chart_id: int,
         parameter_id: int,
@@ -172,5 +174,6 @@ async def delete_chart_parameter(
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Параметр графика не найден.')
 
     parameter.delete_instance()
+    ReportVersion.bump(chart.report_id)
     response = {'chart_parameter': 1}
     return response
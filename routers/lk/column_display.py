@@ -13,7 +13,7 @@ router = APIRouter()
 
 
 @router.get('/column_displays/{obj_id}', response_model=ColumnDisplayPublicSchema)
-async def get_column_display(
+def get_column_display(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         obj_id: int,
 ):
@@ -33,7 +33,7 @@ async def get_column_display(
 
 
 @router.get('/column_displays', response_model=Dict)
-async def get_column_displays_list(
+def get_column_displays_list(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         table_settings_id: Optional[int] = None,
         limit: int = Query(10, ge=1, le=100),
@@ -72,7 +72,7 @@ async def get_column_displays_list(
 
 
 @router.post('/column_displays', response_model=ColumnDisplayPublicSchema)
-async def create_column_display(
+def create_column_display(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         data: ColumnDisplayCreateSchema,
 ):
@@ -104,7 +104,7 @@ async def create_column_display(
 
 
 @router.put('/column_displays/{obj_id}', response_model=ColumnDisplayPublicSchema)
-async def update_column_display(
+def update_column_display(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         obj_id: int,
         data: ColumnDisplayUpdateSchema,
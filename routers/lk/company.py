@@ -7,29 +7,40 @@ from starlette.status import HTTP_404_NOT_FOUND
 from data.models import Transaction
 from data.models import User, Company
 from routers.auth import get_current_active_user
-from routers.helpers import update_endpoint_object
+from routers.helpers import update_endpoint_object, get_accessible_companies
 from schemas.company import CompanyPublicSchema, CompanyPartialUpdateSchema, CompanyExtendedPublicSchema
-from schemas.user import UserModel
+from schemas.user import AuthContext
 
 
 router = APIRouter()
 
 
 @router.get('/companies/{company_id}', response_model=CompanyPublicSchema)
-async def get_company(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def get_company(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         company_id: int,
 ):
     company = Company.get_or_none(id=company_id)
     if company is None:
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Компания не найдена.')
-    return company
+    return get_company_schema(company, company.get_balance())
 
 
+def get_company_schema(company: Company, seconds_balance: int) -> CompanyPublicSchema:
+    """
+    seconds_balance – баланс с учетом записей журнала, еще не перенесенных в Company.seconds_balance.
+    """
+    return CompanyPublicSchema(
+        id=company.id,
+        name=company.name,
+        firm_name=company.firm_name,
+        seconds_balance=seconds_balance,
+    )
+
 
 @router.get('/companies', response_model=Dict)
-async def get_companies(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def get_companies(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         company_name: Optional[str] = None,
         search_query: Optional[str] = None,
         has_payments: Optional[bool] = None,
@@ -43,10 +54,8 @@ async def get_companies(
     company_name и search_query являются взаимоисключающими аргументами.
     """
 
-    user = User.get(id=current_user.id)
-
     # Компании, к которым разрешен доступ пользователю.
-    db_query = user.get_accessible_companies(allow_company_user=True)
+    db_query = get_accessible_companies(current_user, allow_company_user=True)
 
     if company_name:
         db_query = db_query.where(
@@ -95,13 +104,16 @@ async def get_companies(
     else:
         user_counts_dict = {}
 
+    # Балансы с учетом записей журнала, еще не перенесенных в Company.seconds_balance.
+    balances = Company.get_balances(companies)
+
     companies_validated = []
     for company in companies:
         company_kwargs = dict(
             id=company.id,
             name=company.name,
             firm_name=company.firm_name,
-            seconds_balance=company.seconds_balance,
+            seconds_balance=balances[company.id],
         )
         if current_user.is_admin:
             company_kwargs.update({
@@ -122,8 +134,8 @@ async def get_companies(
 
 
 @router.patch('/companies/{company_id}', response_model=CompanyPublicSchema)
-async def partial_update_company(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def partial_update_company(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         company_id: int,
         data: CompanyPartialUpdateSchema,
 ):
@@ -135,4 +147,4 @@ async def partial_update_company(
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Компания не найдена.')
 
     company = update_endpoint_object(company, data, False)
-    return company
+    return get_company_schema(company, company.get_balance())
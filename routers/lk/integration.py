@@ -1,4 +1,3 @@
-import asyncio
 import json
 from typing import Optional, Annotated, List, Dict
 
@@ -8,9 +7,11 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from starlette.status import HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND, HTTP_503_SERVICE_UNAVAILABLE, HTTP_403_FORBIDDEN
 
 from config import config as cfg
-from data.models import User, Integration, IntegrationServiceName, Company
+from data.models import Integration, IntegrationServiceName, Company
+from integrations.amo_crm import metadata as amo_metadata
 from integrations.amo_crm.amo_api_core import AmoApi
 from integrations.beeline.process import BeelineProcessor
+from integrations.bitrix import metadata as bitrix_metadata
 from integrations.bitrix.bitrix_api import Bitrix24
 from integrations.mango.process import MangoProcessor
 from integrations.sipuni.api import SipuniClient
@@ -20,13 +21,13 @@ from modules.json_processor.integration import IntegrationConstructor
 from routers.auth import get_current_active_user
 from schemas.integration import IntegrationPublicSchema, IntegrationCreateSchema, IntegrationUpdateSchema, \
     CRMUserPublicSchema, CRMFieldPublicSchema, PipelinePublicSchema
-from schemas.user import UserModel
+from schemas.user import AuthContext
 
 router = APIRouter()
 
 
 def get_accessible_integration(
-        current_user_id: int,
+        current_user: AuthContext,
         integration_id: Optional[int] = None,
         allow_company_user: bool = True,
 ) -> peewee.ModelSelect:
@@ -39,10 +40,9 @@ def get_accessible_integration(
         db_query = db_query.where(Integration.id == integration_id)
 
     # Оставляем только интеграции тех компаний, которые доступны пользователю.
-    if db_query.exists():
-        user = User.get(id=current_user_id)
-        companies = user.get_accessible_companies(allow_company_user=allow_company_user)
-        db_query = db_query.where(Integration.company.in_(companies))
+    company_ids = current_user.get_company_ids(allow_company_user)
+    if company_ids is not None:
+        db_query = db_query.where(Integration.company.in_(company_ids))
 
     return db_query
 
@@ -73,14 +73,14 @@ def get_public_integration(
 
 
 @router.get('/integrations/{integration_id}', response_model=IntegrationPublicSchema)
-async def get_integration(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def get_integration(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         integration_id: int,
 ):
     """
     Получить интеграцию по переданному ID.
     """
-    integration = get_accessible_integration(current_user.id, integration_id=integration_id).first()
+    integration = get_accessible_integration(current_user, integration_id=integration_id).first()
     if integration is None:
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Интеграция не найдена.')
 
@@ -89,14 +89,14 @@ async def get_integration(
 
 
 @router.get('/integrations', response_model=Dict)
-async def get_integrations_list(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def get_integrations_list(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         service_name: Optional[IntegrationServiceName] = None,
         company_id: Optional[int] = Query(None),
         limit: int = Query(10, ge=1, le=100),
         offset: int = Query(0, ge=0),
 ):
-    db_query = get_accessible_integration(current_user.id)
+    db_query = get_accessible_integration(current_user)
 
     # Фильтр по типу интеграции.
     if service_name:
@@ -125,8 +125,8 @@ async def get_integrations_list(
 
 
 @router.post('/integrations', response_model=IntegrationPublicSchema)
-async def create_integration(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def create_integration(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         integration_data: IntegrationCreateSchema,
 ):
     """
@@ -135,9 +135,7 @@ async def create_integration(
     - Администратору компании для своей компании или для компаний, где он интегратор.
     - Пользователю компании в компаниях, где он интегратор.
     """
-    user = User.get(id=current_user.id)
-    accessible_companies = user.get_accessible_companies(company_id=integration_data.company_id)
-    if not accessible_companies.exists():
+    if not current_user.can_access_company(integration_data.company_id):
         raise HTTPException(HTTP_403_FORBIDDEN, detail='В доступе отказано.')
 
     constructor = IntegrationConstructor(integration_data.telegram_id,
@@ -157,8 +155,8 @@ async def create_integration(
 
 
 @router.put('/integrations/{integration_id}', response_model=IntegrationPublicSchema)
-async def update_integration(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def update_integration(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         integration_id: int,
         integration_data: IntegrationUpdateSchema,
 ):
@@ -168,12 +166,10 @@ async def update_integration(
     - Администратору компании для своей компании или для компаний, где он интегратор.
     - Пользователю компании в компаниях, где он интегратор.
     """
-    user = User.get(id=current_user.id)
-    accessible_companies = user.get_accessible_companies(company_id=integration_data.company_id)
-    if not accessible_companies.exists():
+    if not current_user.can_access_company(integration_data.company_id):
         raise HTTPException(HTTP_403_FORBIDDEN, detail='В доступе отказано.')
 
-    integration = get_accessible_integration(current_user.id, integration_id=integration_id).first()
+    integration = get_accessible_integration(current_user, integration_id=integration_id).first()
     if integration is None:
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Интеграция с таким ID не найдена.')
 
@@ -194,11 +190,11 @@ async def update_integration(
 
 
 @router.get('/integrations/{integration_id}/users', response_model=List[CRMUserPublicSchema])
-async def get_users(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def get_users(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         integration_id: int,
 ):
-    integration = get_accessible_integration(current_user.id, integration_id=integration_id).first()
+    integration = get_accessible_integration(current_user, integration_id=integration_id).first()
     if integration is None:
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Интеграция с таким ID не найдена.')
 
@@ -216,7 +212,7 @@ async def get_users(
         webhook_url = integration.get_decrypted_access_field('webhook_url')
         bx24 = Bitrix24(webhook_url)
 
-        users = await asyncio.to_thread(bx24.get_users)
+        users = bx24.get_users()
         response = []
         for user in users:
             # Имя + Отчество + Фамилия. Пустые компоненты пропускаем.
@@ -290,15 +286,15 @@ async def get_users(
 
 
 @router.get('/integrations/{integration_id}/fields/{entity_type}', response_model=List[CRMFieldPublicSchema])
-async def get_integration_fields(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def get_integration_fields(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         integration_id: int,
         entity_type: str,
 ):
     """
     Возвращает все поля CRM/телефонии для указанного типа сущности.
     """
-    integration = get_accessible_integration(current_user.id, integration_id=integration_id).first()
+    integration = get_accessible_integration(current_user, integration_id=integration_id).first()
     if integration is None:
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Интеграция с таким ID не найдена.')
 
@@ -308,7 +304,7 @@ async def get_integration_fields(
         except KeyError:
             raise HTTPException(HTTP_400_BAD_REQUEST, detail='Не удалось подключиться к CRM. Проверьте интеграцию.')
         try:
-            fields = amo_api.get_custom_fields(entity_type)
+            fields = amo_metadata.get_custom_fields(amo_api, entity_type)
         except TypeError:
             raise HTTPException(HTTP_400_BAD_REQUEST, detail='Не удалось получить список полей. Проверьте интеграцию.')
         response = [
@@ -323,16 +319,9 @@ async def get_integration_fields(
         webhook_url = integration.get_decrypted_access_field('webhook_url')
         bx24 = Bitrix24(webhook_url)
 
-        if entity_type == 'deal':
-            fields = await asyncio.to_thread(bx24.get_deal_fields)
-        elif entity_type == 'lead':
-            fields = await asyncio.to_thread(bx24.get_lead_fields)
-        elif entity_type == 'contact':
-            fields = await asyncio.to_thread(bx24.get_contact_fields)
-        elif entity_type == 'company':
-            fields = await asyncio.to_thread(bx24.get_company_fields)
-        else:
+        if entity_type not in bitrix_metadata.ENTITY_FIELDS_METHODS:
             raise HTTPException(HTTP_400_BAD_REQUEST, detail=f'Неизвестный тип сущности: {entity_type}.')
+        fields = bitrix_metadata.get_entity_fields(bx24, entity_type)
 
         response = []
         for field_id, field_data in fields.items():
@@ -351,11 +340,11 @@ async def get_integration_fields(
 
 
 @router.get('/integrations/{integration_id}/pipelines_and_statuses', response_model=List[PipelinePublicSchema])
-async def get_integration_pipelines(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def get_integration_pipelines(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         integration_id: int,
 ):
-    integration = get_accessible_integration(current_user.id, integration_id=integration_id).first()
+    integration = get_accessible_integration(current_user, integration_id=integration_id).first()
     if integration is None:
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Интеграция не найдена.')
 
@@ -364,7 +353,7 @@ async def get_integration_pipelines(
             amo_api = AmoApi(integration)
         except KeyError:
             raise HTTPException(HTTP_400_BAD_REQUEST, detail='Не удалось подключиться к CRM. Проверьте интеграцию.')
-        pipelines = amo_api.get_pipelines()
+        pipelines = amo_metadata.get_pipelines(amo_api)
         response = [
             PipelinePublicSchema(
                 id=x['id'],
@@ -376,7 +365,7 @@ async def get_integration_pipelines(
     elif integration.service_name == IntegrationServiceName.BITRIX24:
         webhook_url = integration.get_decrypted_access_field('webhook_url')
         bx24 = Bitrix24(webhook_url)
-        pipelines = await asyncio.to_thread(bx24.get_funnels_with_stages)
+        pipelines = bitrix_metadata.get_funnels_with_stages(bx24)
         response = [
             PipelinePublicSchema(
                 id=x['id'],
@@ -386,7 +375,7 @@ async def get_integration_pipelines(
         ]
 
         # Этапы лидов.
-        lead_stages = await asyncio.to_thread(bx24.get_status_list, 'STATUS')
+        lead_stages = bitrix_metadata.get_lead_stages(bx24)
         response.append(
             PipelinePublicSchema(
                 id=int(cfg.BITRIX24_LEAD_PIPELINE_ID),
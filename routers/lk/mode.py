@@ -14,7 +14,7 @@ router = APIRouter()
 
 
 @router.get('/modes/{mode_id}', response_model=ModePublicSchema)
-async def get_mode(
+def get_mode(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         mode_id: int,
 ):
@@ -25,7 +25,7 @@ async def get_mode(
 
 
 @router.get('/modes', response_model=List[ModePublicSchema])
-async def get_modes_list(
+def get_modes_list(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         name: Optional[str] = None,
         limit: int = Query(10, ge=1, le=100),
@@ -40,7 +40,7 @@ async def get_modes_list(
 
 
 @router.post('/modes', response_model=ModePublicSchema)
-async def create_mode(
+def create_mode(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         mode_data: ModeCreateSchema,
 ):
@@ -49,7 +49,7 @@ async def create_mode(
 
 
 @router.put('/modes/{mode_id}', response_model=ModePublicSchema)
-async def update_mode(
+def update_mode(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         mode_id: int,
         mode_data: ModeUpdateSchema,
@@ -66,7 +66,7 @@ async def update_mode(
 
 
 @router.patch('/modes/{mode_id}', response_model=ModePublicSchema)
-async def partial_update_mode(
+def partial_update_mode(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         mode_id: int,
         mode_update: ModePartialUpdateSchema,
@@ -3,7 +3,10 @@ from typing import Annotated, Dict
 from fastapi import APIRouter, Depends, HTTPException, Query
 from starlette.status import HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND
 
-from data.models import ModeAnswer, Task, ModeQuestion
+from data.models import ModeAnswer, Task, ModeQuestion, ReportVersion
+from data.call_tables import refresh_task_call_row
+from data.rollups import refresh_task_rollups
+from data.search import index_task
 from routers.auth import get_current_active_user
 from schemas.mode_answer import ModeAnswerPublicSchema, ModeAnswerCreateSchema
 from schemas.user import UserModel
@@ -12,7 +15,7 @@ router = APIRouter()
 
 
 @router.get('/mode_answers/{mode_answer_id}', response_model=ModeAnswerPublicSchema)
-async def get_mode_answer(
+def get_mode_answer(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         obj_id: int,
 ):
@@ -23,7 +26,7 @@ async def get_mode_answer(
 
 
 @router.get('/mode_answers', response_model=Dict)
-async def get_mode_answers_list(
+def get_mode_answers_list(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         task_ids: str = None,
         limit: int = Query(10, ge=1, le=500),
@@ -55,7 +58,7 @@ async def get_mode_answers_list(
 
 
 @router.post('/mode_answers', response_model=ModeAnswerPublicSchema)
-async def create_mode_answer(
+def create_mode_answer(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         data: ModeAnswerCreateSchema,
 ):
@@ -73,4 +76,10 @@ async def create_mode_answer(
         question=mode_question,
         answer_text=data.answer_text,
     )
+    # Ответы незавершенных задач попадут в агрегаты графиков при завершении задачи.
+    if task.status == Task.StatusChoices.DONE:
+        refresh_task_rollups(task)
+        refresh_task_call_row(task)
+        index_task(task)
+        ReportVersion.bump_data(task.report_id, task.created.date())
     return mode_answer
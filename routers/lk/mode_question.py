@@ -1,9 +1,11 @@
 from typing import Annotated, Optional, Dict
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
 from starlette.status import HTTP_404_NOT_FOUND
 
-from data.models import ModeQuestion, ModeQuestionCalcType, Report
+from data.call_tables import rebuild_call_table
+from data.models import ModeQuestion, ModeQuestionCalcType, Report, ReportVersion
+from data.rollups import rebuild_rollups
 from routers.auth import get_current_active_user
 from routers.helpers import update_endpoint_object
 from schemas.mode_question import ModeQuestionPublicSchema, ModeQuestionCreateSchema, ModeQuestionUpdateSchema, \
@@ -15,7 +17,7 @@ router = APIRouter()
 
 
 @router.get('/mode_questions/{mode_question_id}', response_model=ModeQuestionPublicSchema)
-async def get_mode_question(
+def get_mode_question(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         obj_id: int,
 ):
@@ -26,7 +28,7 @@ async def get_mode_question(
 
 
 @router.get('/mode_questions', response_model=Dict)
-async def get_mode_questions_list(
+def get_mode_questions_list(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         report_ids: Optional[str] = None,
         is_active: Optional[bool] = True,
@@ -72,9 +74,10 @@ async def get_mode_questions_list(
 
 
 @router.post('/mode_questions', response_model=ModeQuestionPublicSchema)
-async def create_mode_question(
+def create_mode_question(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         data: ModeQuestionCreateSchema,
+        background_tasks: BackgroundTasks,
 ):
     report = Report.get_or_none(Report.id == data.report_id)
     if report is None:
@@ -94,30 +97,37 @@ async def create_mode_question(
         answer_options=data.answer_options,
         variant_colors=data.variant_colors,
     )
+    background_tasks.add_task(rebuild_call_table, report.id, only_if_stale=True)
     return mode_question
 
 
 @router.put('/mode_questions/{mode_question_id}', response_model=ModeQuestionPublicSchema)
-async def update_mode_question(
+def update_mode_question(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         mode_question_id: int,
         data: ModeQuestionUpdateSchema,
+        background_tasks: BackgroundTasks,
 ):
     mode_question = ModeQuestion.get_or_none(ModeQuestion.id == mode_question_id)
     if mode_question is None:
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Вопрос не найден.')
 
     if mode_question.calc_type == ModeQuestionCalcType.AI:
+        old_answer_type = mode_question.answer_type
         mode_question = update_endpoint_object(mode_question, data, True)
+        ReportVersion.bump(mode_question.report_id)
+        rebuild_rollups_if_needed(mode_question, old_answer_type, background_tasks)
+        background_tasks.add_task(rebuild_call_table, mode_question.report_id, only_if_stale=True)
 
     return mode_question
 
 
 @router.patch('/mode_questions/{mode_question_id}', response_model=ModeQuestionPublicSchema)
-async def partial_update_mode_question(
+def partial_update_mode_question(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         mode_question_id: int,
         data: ModeQuestionPartialUpdateSchema,
+        background_tasks: BackgroundTasks,
 ):
     mode_question = ModeQuestion.get_or_none(ModeQuestion.id == mode_question_id)
     if mode_question is None:
@@ -145,5 +155,22 @@ async def partial_update_mode_question(
     else:
         ignore_fields = []
 
+    old_answer_type = mode_question.answer_type
     mode_question = update_endpoint_object(mode_question, data, False, ignore_fields=ignore_fields)
+    ReportVersion.bump(mode_question.report_id)
+    rebuild_rollups_if_needed(mode_question, old_answer_type, background_tasks)
+    background_tasks.add_task(rebuild_call_table, mode_question.report_id, only_if_stale=True)
     return mode_question
+
+
+def rebuild_rollups_if_needed(
+        mode_question: ModeQuestion,
+        old_answer_type: str,
+        background_tasks: BackgroundTasks,
+) -> None:
+    """
+    Агрегаты вариантов ответа хранятся только для вопросов с выбором из вариантов,
+    поэтому при смене типа ответа агрегаты вопроса пересчитываются в фоне.
+    """
+    if mode_question.answer_type != old_answer_type:
+        background_tasks.add_task(rebuild_rollups, mode_question.report_id, question_ids=[mode_question.id])
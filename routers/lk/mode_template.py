@@ -14,7 +14,7 @@ router = APIRouter()
 
 
 @router.get('/mode_templates/{mode_template_id}', response_model=ModeTemplatePublicSchema)
-async def get_mode_template(
+def get_mode_template(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         mode_template_id: int,
 ):
@@ -25,7 +25,7 @@ async def get_mode_template(
 
 
 @router.get('/mode_templates', response_model=Dict)
-async def get_mode_template_list(
+def get_mode_template_list(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         limit: int = Query(10, ge=1, le=100),
         offset: int = Query(0, ge=0),
@@ -45,7 +45,7 @@ async def get_mode_template_list(
 
 
 @router.post('/mode_templates', response_model=ModeTemplatePublicSchema)
-async def create_mode_template(
+def create_mode_template(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         data: ModeTemplateCreateSchema,
 ):
@@ -80,7 +80,7 @@ async def create_mode_template(
 
 
 @router.put('/mode_templates/{mode_template_id}', response_model=ModeTemplatePublicSchema)
-async def update_mode_template(
+def update_mode_template(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         mode_template_id: int,
         data: ModeTemplateUpdateSchema,
@@ -1,27 +1,28 @@
 import json
 from typing import Optional, Annotated, Dict
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
 from peewee import fn
 from starlette.status import HTTP_404_NOT_FOUND
 
 from config import config as cfg
+from data.call_tables import rebuild_call_table
 from data.models import Integration, Report, ModeTemplate, main_db, ModeQuestion, DefaultQuestions, \
-    ModeQuestionCalcType, ModeQuestionType, Company, ModeTemplateQuestion
+    ModeQuestionCalcType, ModeQuestionType, Company, ModeTemplateQuestion, ReportVersion
 from routers.auth import get_current_active_user
 from routers.helpers import update_endpoint_object
 from routers.lk.integration import get_accessible_integration
 from schemas.report import ReportPublicSchema, ReportCreateSchema, ReportUpdateSchema, ReportListItemPublicSchema, \
     ReportPartialUpdateSchema, ReportCRMQuestionsUpdateSchema
-from schemas.user import UserModel
+from schemas.user import AuthContext
 
 
 router = APIRouter()
 
 
 @router.get('/reports/{report_id}', response_model=ReportPublicSchema)
-async def get_report(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def get_report(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         report_id: int,
 ):
     report = Report.get_or_none(Report.id == report_id)
@@ -29,7 +30,7 @@ async def get_report(
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Отчет не найден.')
 
     # Проверка доступа через интеграцию.
-    integration = get_accessible_integration(current_user.id, integration_id=report.integration.id).first()
+    integration = get_accessible_integration(current_user, integration_id=report.integration.id).first()
     if integration is None:
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Отчет не найден.')
 
@@ -37,8 +38,8 @@ async def get_report(
 
 
 @router.get('/reports', response_model=Dict)
-async def get_reports_list(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def get_reports_list(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         company_id: Optional[int] = Query(None),
         limit: int = Query(10, ge=1, le=100),
         offset: int = Query(0, ge=0),
@@ -49,7 +50,7 @@ async def get_reports_list(
     db_query = Report.select().where(Report.is_archived == False)
 
     # Интеграции, доступные пользователю.
-    integrations = get_accessible_integration(current_user.id)
+    integrations = get_accessible_integration(current_user)
 
     # Фильтр по компании.
     if company_id is not None:
@@ -78,12 +79,12 @@ async def get_reports_list(
 
 
 @router.post('/reports', response_model=ReportPublicSchema)
-async def create_report(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def create_report(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         data: ReportCreateSchema,
 ):
     # Проверка доступа через интеграцию.
-    integrations = get_accessible_integration(current_user.id, integration_id=data.integration_id)
+    integrations = get_accessible_integration(current_user, integration_id=data.integration_id)
     integration = integrations.where(Integration.id == data.integration_id).first()
     if integration is None:
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Интеграция не найдена.')
@@ -158,8 +159,8 @@ async def create_report(
 
 
 @router.put('/reports/{report_id}', response_model=ReportPublicSchema)
-async def update_report(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def update_report(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         report_id: int,
         data: ReportUpdateSchema,
 ):
@@ -168,7 +169,7 @@ async def update_report(
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Отчет не найден.')
 
     # Проверяем, разрешен ли пользователю доступ к редактированию текущей интеграции отчета.
-    current_integration = get_accessible_integration(current_user.id, integration_id=report.integration.id, allow_company_user=False).first()
+    current_integration = get_accessible_integration(current_user, integration_id=report.integration.id, allow_company_user=False).first()
     if current_integration is None:
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Отчет не найден.')
 
@@ -178,7 +179,7 @@ async def update_report(
             raise HTTPException(HTTP_404_NOT_FOUND, detail='Интеграция не найдена.')
 
         # Проверяем, разрешен ли пользователю доступ к редактированию интеграции, с которой хотим связать отчет.
-        new_integration = get_accessible_integration(current_user.id, integration_id=data.integration_id, allow_company_user=False).first()
+        new_integration = get_accessible_integration(current_user, integration_id=data.integration_id, allow_company_user=False).first()
         if new_integration is None:
             raise HTTPException(HTTP_404_NOT_FOUND, detail='Интеграция не найдена.')
     else:
@@ -201,8 +202,8 @@ async def update_report(
 
 
 @router.patch('/reports/{report_id}', response_model=ReportPublicSchema)
-async def partial_update_report(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def partial_update_report(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         report_id: int,
         data: ReportPartialUpdateSchema,
 ):
@@ -211,7 +212,7 @@ async def partial_update_report(
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Отчет не найден.')
 
     # Проверяем, разрешен ли пользователю доступ к редактированию текущей интеграции отчета.
-    current_integration = get_accessible_integration(current_user.id, integration_id=report.integration.id, allow_company_user=False).first()
+    current_integration = get_accessible_integration(current_user, integration_id=report.integration.id, allow_company_user=False).first()
     if current_integration is None:
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Отчет не найден.')
 
@@ -221,17 +222,18 @@ async def partial_update_report(
 
 
 @router.put('/reports/{report_id}/crm_questions', response_model=Dict)
-async def update_report_crm_questions(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def update_report_crm_questions(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         report_id: int,
         data: ReportCRMQuestionsUpdateSchema,
+        background_tasks: BackgroundTasks,
 ):
     report = Report.get_or_none(Report.id == report_id)
     if report is None:
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Отчет не найден.')
 
     # Проверяем, разрешен ли пользователю доступ к редактированию текущей интеграции отчета.
-    integration = get_accessible_integration(current_user.id, integration_id=report.integration.id, allow_company_user=False).first()
+    integration = get_accessible_integration(current_user, integration_id=report.integration.id, allow_company_user=False).first()
     if integration is None:
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Отчет не найден.')
 
@@ -300,6 +302,10 @@ async def update_report_crm_questions(
                                                    ModeQuestion.calc_type == ModeQuestionCalcType.CRM,
                                                    ModeQuestion.id.not_in(active_question_ids),
                                                    ).execute()
+        ReportVersion.bump(report.id)
+
+    # Набор колонок изменился: таблица звонков перестраивается в фоне.
+    background_tasks.add_task(rebuild_call_table, report.id, only_if_stale=True)
 
     response = {
         'active_crm_questions': list(active_question_ids),
@@ -343,8 +349,8 @@ def clone_report(
 
 
 @router.post('/reports/{report_id}/duplicate', response_model=ReportPublicSchema)
-async def duplicate_report(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def duplicate_report(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         report_id: int,
 ):
     report = Report.get_or_none(Report.id == report_id)
@@ -352,7 +358,7 @@ async def duplicate_report(
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Отчет не найден.')
 
     # Проверяем, разрешен ли пользователю доступ к редактированию текущей интеграции отчета.
-    report_integration = get_accessible_integration(current_user.id, integration_id=report.integration.id,
+    report_integration = get_accessible_integration(current_user, integration_id=report.integration.id,
                                                     allow_company_user=False).first()
     if report_integration is None:
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Отчет не найден.')
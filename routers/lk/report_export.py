@@ -0,0 +1,97 @@
+from typing import Annotated, Optional, Literal
+
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi.responses import StreamingResponse
+from starlette.status import HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND
+
+from config import config as cfg
+from data.models import Report, ReportExport
+from modules.report_export import generate_export, get_export_file_name, run_report_export, get_export_url, \
+    EXPORT_FORMATS
+from routers.auth import get_current_active_user
+from routers.lk.task import get_report_calls_query
+from schemas.report_export import ReportExportCreateSchema, ReportExportPublicSchema
+from schemas.user import UserModel
+
+
+router = APIRouter()
+
+
+def get_export_report(current_user: UserModel, report_id: int) -> Report:
+    report = Report.get_or_none(Report.id == report_id)
+
+    # Проверка доступа.
+    if report is None or (
+            not current_user.is_admin
+            and
+            not (current_user.company_id == report.integration.company.id)
+    ):
+        raise HTTPException(HTTP_404_NOT_FOUND, detail='Отчет не найден.')
+    return report
+
+
+def get_public_export(export: ReportExport) -> ReportExportPublicSchema:
+    response = ReportExportPublicSchema.model_validate(export)
+    response.url = get_export_url(export)
+    return response
+
+
+@router.get('/reports/{report_id}/export')
+def export_report_calls(
+        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+        report_id: int,
+        background_tasks: BackgroundTasks,
+        file_format: Literal['csv', 'parquet'] = 'csv',
+        table_settings_id: Optional[int] = None,
+        is_archived: Optional[bool] = None,
+        source: Optional[str] = None,
+):
+    """
+    Потоковая выгрузка звонков отчета (задачи с ответами и CRM-колонками) с фильтрами «Вида».
+    """
+    report = get_export_report(current_user, report_id)
+    db_query, calls, columns = get_report_calls_query(report, background_tasks, table_settings_id, is_archived, source)
+    db_query = db_query.order_by(calls.c.task_id)
+
+    file_name = get_export_file_name(report.id, file_format)
+    return StreamingResponse(
+        generate_export(db_query, columns, file_format),
+        media_type=EXPORT_FORMATS[file_format][0],
+        headers={'Content-Disposition': f'attachment; filename="{file_name}"'},
+    )
+
+
+@router.post('/reports/{report_id}/export', response_model=ReportExportPublicSchema)
+def create_report_export(
+        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+        report_id: int,
+        data: ReportExportCreateSchema,
+        background_tasks: BackgroundTasks,
+):
+    """
+    Фоновая выгрузка звонков отчета в файл для очень больших отчетов.
+    Статус и ссылка на файл – GET /exports/{export_id}.
+    """
+    if not cfg.EXPORTS_S3_BUCKET:
+        raise HTTPException(HTTP_400_BAD_REQUEST, detail='Хранилище выгрузок не настроено.')
+
+    report = get_export_report(current_user, report_id)
+    db_query, calls, columns = get_report_calls_query(report, background_tasks, data.table_settings_id,
+                                                      data.is_archived, data.source)
+    db_query = db_query.order_by(calls.c.task_id)
+
+    export = ReportExport.create(report=report, user=current_user.id, file_format=data.file_format)
+    background_tasks.add_task(run_report_export, export.id, db_query, columns)
+    return get_public_export(export)
+
+
+@router.get('/exports/{export_id}', response_model=ReportExportPublicSchema)
+def get_report_export(
+        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+        export_id: int,
+):
+    export = ReportExport.get_or_none(ReportExport.id == export_id)
+    if export is None:
+        raise HTTPException(HTTP_404_NOT_FOUND, detail='Выгрузка не найдена.')
+    get_export_report(current_user, export.report_id)
+    return get_public_export(export)
@@ -0,0 +1,55 @@
+from datetime import date, datetime, time, timedelta
+from typing import Annotated, Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from starlette.status import HTTP_404_NOT_FOUND
+
+from data.models import Report
+from data.search import search_tasks
+from routers.auth import get_current_active_user
+from routers.lk.integration import get_accessible_integration
+from schemas.user import AuthContext
+
+
+router = APIRouter()
+
+
+@router.get('/search', response_model=Dict)
+def search(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
+        q: Annotated[str, Query(min_length=2, max_length=200)],
+        report_id: Optional[int] = None,
+        from_date: Optional[date] = None,
+        to_date: Optional[date] = None,
+        limit: int = Query(20, ge=1, le=100),
+        offset: int = Query(0, ge=0),
+):
+    """
+    Поиск звонков по транскриптам и ответам нейронной сети в доступных пользователю отчетах.
+
+    Запрос в синтаксисе веб-поиска: слова, "точная фраза", -исключение, OR.
+    Совпадения во фрагментах текста отмечены тегом <mark>, остальной текст экранирован.
+    """
+    # Отчеты интеграций, доступных пользователю.
+    report_ids = Report.select(Report.id).where(Report.integration.in_(get_accessible_integration(current_user)))
+
+    if report_id is not None:
+        report_ids = report_ids.where(Report.id == report_id)
+        if not report_ids.exists():
+            raise HTTPException(HTTP_404_NOT_FOUND, detail='Отчет не найден.')
+
+    total_count, items = search_tasks(
+        q,
+        report_ids,
+        from_date=datetime.combine(from_date, time.min) if from_date else None,
+        to_date=datetime.combine(to_date + timedelta(days=1), time.min) if to_date else None,
+        limit=limit,
+        offset=offset,
+    )
+
+    response = {
+        'total_count': total_count,
+        'count': len(items),
+        'items': items,
+    }
+    return response
@@ -7,7 +7,7 @@ from starlette.status import HTTP_404_NOT_FOUND
 from data.models import ColumnFilter, Company
 from data.models import TableViewSettings, ModeQuestion, TableActiveFilter
 from routers.auth import get_current_active_user
-from routers.helpers import update_endpoint_object
+from routers.helpers import update_endpoint_object, check_filter_value
 from schemas.table_active_filter import TableActiveFilterPublicSchema, TableActiveFilterCreateSchema, \
     TableActiveFilterUpdateSchema
 from schemas.user import UserModel
@@ -17,7 +17,7 @@ router = APIRouter()
 
 
 @router.get('/filter_operations', response_model=Dict)
-async def get_possible_filter_operations(
+def get_possible_filter_operations(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
 ):
     response = {
@@ -27,7 +27,7 @@ async def get_possible_filter_operations(
 
 
 @router.get('/table_settings/{obj_id}/filters', response_model=List[TableActiveFilterPublicSchema])
-async def get_table_filters_list(
+def get_table_filters_list(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         obj_id: int,
 ):
@@ -46,7 +46,7 @@ async def get_table_filters_list(
 
 
 @router.post('/table_settings/{obj_id}/filters', response_model=TableActiveFilterPublicSchema)
-async def create_table_filter(
+def create_table_filter(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         obj_id: int,
         data: TableActiveFilterCreateSchema,
@@ -67,6 +67,7 @@ async def create_table_filter(
                                              ModeQuestion.report == table_settings.report)
     if mode_question is None:
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Вопрос не найден.')
+    check_filter_value(mode_question, data.operation, data.value)
 
     table_filter = TableActiveFilter.create(
         table_settings=table_settings,
@@ -78,7 +79,7 @@ async def create_table_filter(
 
 
 @router.put('/filters/{obj_id}', response_model=TableActiveFilterPublicSchema)
-async def update_table_filter(
+def update_table_filter(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         obj_id: int,
         data: TableActiveFilterUpdateSchema,
@@ -95,12 +96,13 @@ async def update_table_filter(
     ):
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Фильтр не найден.')
 
+    check_filter_value(table_filter.mode_question, data.operation, data.value)
     table_filter = update_endpoint_object(table_filter, data, True)
     return table_filter
 
 
 @router.delete('/filters/{obj_id}', response_model=Dict)
-async def delete_table_filter(
+def delete_table_filter(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         obj_id: int,
 ):
@@ -3,21 +3,21 @@ from typing import Annotated, Optional, Dict
 from fastapi import APIRouter, Depends, HTTPException, Query
 from starlette.status import HTTP_404_NOT_FOUND
 
-from data.models import main_db, TableViewSettings, User, Report, Company, ColumnDisplay, TableActiveFilter
+from data.models import main_db, TableViewSettings, Report, Company, ColumnDisplay, TableActiveFilter
 from routers.auth import get_current_active_user
 from routers.helpers import update_endpoint_object
 from routers.lk.integration import get_accessible_integration
 from schemas.table_view_settings import TableViewSettingsPublicSchema, TableViewSettingsCreateSchema, \
     TableViewSettingsUpdateSchema
-from schemas.user import UserModel
+from schemas.user import AuthContext
 
 
 router = APIRouter()
 
 
 @router.get('/table_settings/{obj_id}', response_model=TableViewSettingsPublicSchema)
-async def get_table_view_settings(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def get_table_view_settings(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         obj_id: int,
 ):
     obj = TableViewSettings.get_or_none(TableViewSettings.id == obj_id)
@@ -36,8 +36,8 @@ async def get_table_view_settings(
 
 
 @router.get('/table_settings', response_model=Dict)
-async def get_table_view_settings_list(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def get_table_view_settings_list(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         report_id: Optional[int] = None,
         limit: int = Query(10, ge=1, le=100),
         offset: int = Query(0, ge=0),
@@ -45,7 +45,7 @@ async def get_table_view_settings_list(
     db_query = TableViewSettings.select()
 
     # Интеграции, доступные пользователю для чтения.
-    allowed_integrations = get_accessible_integration(current_user.id, allow_company_user=True)
+    allowed_integrations = get_accessible_integration(current_user, allow_company_user=True)
     # Отчеты, доступные пользователю для чтения.
     allowed_reports = Report.select().where(Report.integration.in_(allowed_integrations))
 
@@ -70,21 +70,19 @@ async def get_table_view_settings_list(
 
 
 @router.post('/table_settings', response_model=TableViewSettingsPublicSchema)
-async def create_table_view_settings(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def create_table_view_settings(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         data: TableViewSettingsCreateSchema,
 ):
-    user = User.get(User.id == current_user.id)
-
     # Интеграции, доступные пользователю для чтения.
-    allowed_integrations = get_accessible_integration(current_user.id, allow_company_user=True)
+    allowed_integrations = get_accessible_integration(current_user, allow_company_user=True)
     # Отчеты, доступные пользователю для чтения.
     allowed_reports = Report.select().where(Report.integration.in_(allowed_integrations))
     report = allowed_reports.where(Report.id == data.report_id).first()
     if report is None:
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Отчет не найден.')
 
-    table_settings = TableViewSettings.create(user=user,
+    table_settings = TableViewSettings.create(user=current_user.id,
                                               report=report,
                                               name=data.name)
 
@@ -92,8 +90,8 @@ async def create_table_view_settings(
 
 
 @router.put('/table_settings/{obj_id}', response_model=TableViewSettingsPublicSchema)
-async def update_table_view_settings(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def update_table_view_settings(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         obj_id: int,
         data: TableViewSettingsUpdateSchema,
 ):
@@ -117,8 +115,8 @@ async def update_table_view_settings(
 
 
 @router.delete('/table_settings/{obj_id}', response_model=Dict)
-async def delete_table_view_settings(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def delete_table_view_settings(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         obj_id: int,
 ):
     table_settings = TableViewSettings.get_or_none(TableViewSettings.id == obj_id)
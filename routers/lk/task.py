@@ -1,18 +1,20 @@
-from functools import reduce
 from operator import or_
-from typing import Optional, Annotated, Dict
+from typing import Optional, Annotated, Dict, List, Tuple
 
 import peewee
-from fastapi import APIRouter, Depends, HTTPException, Query
-from peewee import fn
-from starlette.status import HTTP_404_NOT_FOUND
+from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
+from fastapi.responses import ORJSONResponse
+from starlette.status import HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND
 
-from data.models import Report, Task, TableViewSettings, TableActiveFilter, ModeAnswer, ModeQuestion, ColumnFilter
+from data.call_tables import get_call_source, rebuild_call_table, refresh_task_call_row, format_answer_value, \
+    TASK_COLUMNS, get_column_name
+from data.filters import compile_task_filters, compile_call_table_filters
+from data.models import main_db, Report, Task, TableViewSettings, TableActiveFilter, ModeQuestion
 from modules.assembly import Assembly
 from modules.report_generator import ReportGenerator
 from routers.auth import get_current_active_user
 from schemas.task import TaskPublicSchema, TaskUpdateSchema, TranscriptPublicSchema
-from routers.helpers import update_endpoint_object
+from routers.helpers import update_endpoint_object, get_projection_fields
 from schemas.user import UserModel
 
 
@@ -20,7 +22,7 @@ router = APIRouter()
 
 
 @router.get('/tasks/{task_id}', response_model=TaskPublicSchema)
-async def get_task(
+def get_task(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         task_id: int,
 ):
@@ -31,7 +33,7 @@ async def get_task(
 
 
 @router.get('/tasks/{task_id}/transcript', response_model=TranscriptPublicSchema)
-async def get_task_transcript(
+def get_task_transcript(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         task_id: int,
 ):
@@ -55,67 +57,39 @@ async def get_task_transcript(
     )
 
 
-def filter_tasks(
-        table_settings: TableViewSettings,
-        task_ids: peewee.ModelSelect,
-) -> Optional[peewee.ModelSelect]:
+def get_active_table_filters(table_settings: TableViewSettings) -> List[TableActiveFilter]:
     """
-    Фильтрует задачи по фильтрам вида просмотра.
+    Фильтры вида просмотра по активным вопросам отчета.
     """
-    # Активные вопросы отчета.
-    mode_questions = ModeQuestion.select().where(ModeQuestion.report == table_settings.report,
-                                                 ModeQuestion.is_active == True)
-
-    # Активные фильтры указанного вида для указанного отчета.
-    table_filters = TableActiveFilter.select().where(TableActiveFilter.table_settings == table_settings,
-                                                     TableActiveFilter.mode_question.in_(mode_questions))
-
-    # Если ни одного фильтра не указано, то возвращаем исходный список задач.
-    if not table_filters.exists():
-        return None
-
-    # Предварительная обработка фильтров
-    filter_conditions = []
-    for table_filter in table_filters:
-        expr = ColumnFilter.build(
-            ModeAnswer.answer_text,
-            table_filter.mode_question.answer_type,
-            table_filter.operation,
-            table_filter.value
+    return list(
+        TableActiveFilter
+        .select(TableActiveFilter, ModeQuestion)
+        .join(ModeQuestion)
+        .where(
+            TableActiveFilter.table_settings == table_settings,
+            ModeQuestion.report == table_settings.report,
+            ModeQuestion.is_active == True,
         )
-        filter_conditions.append({'question': table_filter.mode_question, 'expr': expr})
-
-    total_expr = reduce(lambda acc, cond: acc | ((ModeAnswer.question == cond['question']) & cond['expr']),
-                        filter_conditions,
-                        False)
-
-    filtered_task_ids = (
-        Task
-        .select(Task.id)
-        .where(Task.id.in_(task_ids))
-        .join(ModeAnswer)
-        .where(total_expr)
-        .group_by(Task.id)
-        .having(fn.COUNT(Task.id) == len(filter_conditions))
     )
-    return filtered_task_ids
 
 
 @router.get('/tasks', response_model=Dict)
-async def get_tasks_list(
+def get_tasks_list(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         status: Optional[str] = Task.StatusChoices.DONE,
         is_archived: Optional[bool] = None,
         source: Optional[str] = None,
         report_id: Optional[int] = Query(None),
         table_settings_id: Optional[int] = None,
+        fields: Optional[str] = Query(None, examples=['id,created,status,duration_sec']),
         limit: int = Query(10, ge=1, le=500),
         offset: int = Query(0, ge=0),
 ):
     """
     table_settings_id можно передать только вместе с report_id.
+    fields – поля задачи через запятую (см. TaskPublicSchema), которые нужно вернуть. По умолчанию – все.
     """
-    db_query = Task.select()
+    db_query = Task.select(*get_projection_fields(Task, TaskPublicSchema, fields))
 
     if status is not None:
         db_query = db_query.where(Task.status == status)
@@ -142,24 +116,25 @@ async def get_tasks_list(
             if table_settings is None:
                 raise HTTPException(HTTP_404_NOT_FOUND, detail='Вид просмотра таблицы не найден.')
 
-            filtered_task_ids = filter_tasks(table_settings, db_query.select(Task.id))
-            if filtered_task_ids is not None:
-                db_query = db_query.where(Task.id.in_(filtered_task_ids))
+            filters_expression = compile_task_filters(get_active_table_filters(table_settings))
+            if filters_expression is not None:
+                db_query = db_query.where(filters_expression)
 
     total_count = db_query.count()
-    tasks = db_query.limit(limit).offset(offset).order_by(Task.id.desc())
-    page_count = tasks.count()
+    # Строки выбираются сразу словарями только с нужными колонками
+    # и сериализуются orjson, минуя валидацию TaskPublicSchema.
+    items = list(db_query.limit(limit).offset(offset).order_by(Task.id.desc()).dicts())
 
     response = {
         'total_count': total_count,
-        'count': page_count,
-        'items': [TaskPublicSchema.model_validate(x) for x in tasks],
+        'count': len(items),
+        'items': items,
     }
-    return response
+    return ORJSONResponse(response)
 
 
 @router.patch('/tasks/{task_id}', response_model=TaskPublicSchema)
-async def partial_update_task(
+def partial_update_task(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         task_id: int,
         task_update: TaskUpdateSchema,
@@ -169,4 +144,115 @@ async def partial_update_task(
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Задача не найдена.')
 
     task = update_endpoint_object(task, task_update, False)
+    if task.status == Task.StatusChoices.DONE:
+        refresh_task_call_row(task)
     return task
+
+
+def get_report_calls_query(
+        report: Report,
+        background_tasks: BackgroundTasks,
+        table_settings_id: Optional[int] = None,
+        is_archived: Optional[bool] = None,
+        source: Optional[str] = None,
+) -> Tuple[peewee.Select, peewee.Source, List[dict]]:
+    """
+    Запрос строк таблицы звонков отчета с фильтрами, источник строк и колонки вопросов.
+    Колонки запроса: TASK_COLUMNS и колонки вопросов в порядке columns.
+    """
+    calls, columns, is_materialized = get_call_source(report.id)
+    if not is_materialized:
+        # Пока таблица строится, строки собираются из ответов на лету.
+        background_tasks.add_task(rebuild_call_table, report.id, only_if_stale=True)
+
+    column_names = TASK_COLUMNS + [x['name'] for x in columns]
+    db_query = peewee.Select(from_list=[calls], columns=[getattr(calls.c, x) for x in column_names]).bind(main_db)
+
+    if is_archived is not None:
+        db_query = db_query.where(calls.c.is_archived == is_archived)
+    if source is not None:
+        if source == 'main':
+            db_query = db_query.where(or_(calls.c.source == source, calls.c.source.is_null(True)))
+        else:
+            db_query = db_query.where(calls.c.source == source)
+
+    # Фильтры «Вида».
+    if table_settings_id is not None:
+        table_settings = TableViewSettings.get_or_none(TableViewSettings.id == table_settings_id,
+                                                       TableViewSettings.report == report)
+        if table_settings is None:
+            raise HTTPException(HTTP_404_NOT_FOUND, detail='Вид просмотра таблицы не найден.')
+        filters_expression = compile_call_table_filters(calls, get_active_table_filters(table_settings))
+        if filters_expression is not None:
+            db_query = db_query.where(filters_expression)
+
+    return db_query, calls, columns
+
+
+@router.get('/reports/{report_id}/calls', response_model=Dict)
+def get_report_calls(
+        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+        report_id: int,
+        background_tasks: BackgroundTasks,
+        table_settings_id: Optional[int] = None,
+        is_archived: Optional[bool] = None,
+        source: Optional[str] = None,
+        order_by: str = '-created',
+        limit: int = Query(10, ge=1, le=500),
+        offset: int = Query(0, ge=0),
+):
+    """
+    Таблица звонков отчета: завершенные задачи с ответами на активные вопросы.
+
+    order_by: created, task_id или question:<ID вопроса>; «-» в начале – сортировка по убыванию.
+    """
+    report = Report.get_or_none(Report.id == report_id)
+
+    # Проверка доступа.
+    if report is None or (
+            not current_user.is_admin
+            and
+            not (current_user.company_id == report.integration.company.id)
+    ):
+        raise HTTPException(HTTP_404_NOT_FOUND, detail='Отчет не найден.')
+
+    db_query, calls, columns = get_report_calls_query(report, background_tasks, table_settings_id, is_archived, source)
+    column_names = TASK_COLUMNS + [x['name'] for x in columns]
+
+    # Сортировка.
+    descending = order_by.startswith('-')
+    order_field = order_by.lstrip('-')
+    if order_field in {'created', 'task_id'}:
+        order_column = getattr(calls.c, order_field)
+    elif order_field.startswith('question:') and order_field[len('question:'):].isdigit():
+        column_name = get_column_name(int(order_field[len('question:'):]))
+        if column_name not in column_names:
+            raise HTTPException(HTTP_400_BAD_REQUEST, detail='Колонка для сортировки не найдена.')
+        order_column = getattr(calls.c, column_name)
+    else:
+        raise HTTPException(HTTP_400_BAD_REQUEST, detail='Некорректная сортировка.')
+
+    if descending:
+        ordering = [order_column.desc(nulls='LAST'), calls.c.task_id.desc()]
+    else:
+        ordering = [order_column.asc(nulls='LAST'), calls.c.task_id.asc()]
+
+    total_count = db_query.count()
+    rows = list(db_query.order_by(*ordering).limit(limit).offset(offset).dicts())
+
+    response = {
+        'total_count': total_count,
+        'count': len(rows),
+        'columns': [
+            {'mode_question_id': x['id'], 'short_name': x['short_name'], 'answer_type': x['answer_type']}
+            for x in columns
+        ],
+        'items': [
+            {
+                **{x: row[x] for x in TASK_COLUMNS},
+                'answers': {x['id']: format_answer_value(x, row[x['name']]) for x in columns},
+            }
+            for row in rows
+        ],
+    }
+    return response
@@ -13,7 +13,7 @@ router = APIRouter()
 
 
 @router.get('/transactions/{transaction_id}', response_model=TransactionPublicSchema)
-async def get_transaction(
+def get_transaction(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         transaction_id: int,
 ):
@@ -37,7 +37,7 @@ async def get_transaction(
 
 
 @router.get('/transactions', response_model=Dict)
-async def get_transactions_list(
+def get_transactions_list(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         company_id: Optional[int] = None,
         limit: int = Query(10, ge=1, le=100),
@@ -76,7 +76,7 @@ async def get_transactions_list(
 
 
 @router.post('/transactions', response_model=TransactionPublicSchema)
-async def create_transaction(
+def create_transaction(
         current_user: Annotated[UserModel, Depends(get_current_active_user)],
         data: TransactionCreateSchema,
 ):
@@ -6,27 +6,29 @@ from starlette.status import HTTP_404_NOT_FOUND, HTTP_400_BAD_REQUEST
 
 from data.models import User, Company
 from routers.auth import get_current_active_user, authenticate_user, get_password_hash
-from routers.helpers import update_endpoint_object
-from schemas.user import UserModel, UserMeUpdateSchema, PasswordUpdateSchema, UserCreateSchema, UserPartialUpdateSchema, \
-    UserCompanyUpdateSchema, SysAdminPasswordUpdateSchema
+from helpers.auth_cache import invalidate_auth_context_everywhere
+from routers.helpers import update_endpoint_object, get_accessible_companies
+from schemas.user import AuthContext, UserModel, UserMeUpdateSchema, PasswordUpdateSchema, UserCreateSchema, \
+    UserPartialUpdateSchema, UserCompanyUpdateSchema, SysAdminPasswordUpdateSchema
 
 router = APIRouter()
 
 
 @router.get('/users/me/', response_model=UserModel)
-async def read_users_me(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def read_users_me(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
 ):
     return current_user
 
 
 @router.put('/users/me/', response_model=UserModel)
-async def update_users_me(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def update_users_me(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         data: UserMeUpdateSchema,
 ):
     user = User.get(id=current_user.id)
     user = update_endpoint_object(user, data, True)
+    invalidate_auth_context_everywhere(user.id)
     return user
 
 
@@ -59,8 +61,8 @@ def check_and_update_user_password(
 
 
 @router.put('/users/me/password', response_model=UserModel)
-async def update_my_password(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def update_my_password(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         data: PasswordUpdateSchema,
 ):
     """
@@ -72,8 +74,8 @@ async def update_my_password(
 
 
 @router.get('/users/', response_model=List[UserModel])
-async def get_users_list(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def get_users_list(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         company_id: Optional[int] = Query(None),
         user_or_tg_id: Optional[int] = None,
         limit: int = Query(10, ge=1, le=100),
@@ -88,11 +90,10 @@ async def get_users_list(
     Если company_id передан, доступ проверяется только к этой компании.
     Если передан user_or_tg_id, то происходит поиск по полям пользователя: User.id, User.tg_id.
     """
-    db_user = User.get(id=current_user.id)
     db_query = User.select()
 
     # Получаем компании, к которым пользователь имеет доступ.
-    companies = db_user.get_accessible_companies(company_id=company_id)
+    companies = get_accessible_companies(current_user, company_id=company_id)
     if company_id is not None:
         if not companies.exists():
             raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail='Компания не найдена.')
@@ -106,8 +107,8 @@ async def get_users_list(
 
 
 @router.post('/users', response_model=UserModel)
-async def create_user(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def create_user(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         data: UserCreateSchema,
 ):
     """
@@ -117,7 +118,7 @@ async def create_user(
     if (
             not current_user.is_admin
             and
-            not (current_user.company.id == data.company_id and current_user.company_role == Company.Roles.ADMIN)
+            not (current_user.company_id == data.company_id and current_user.company_role == Company.Roles.ADMIN)
     ):
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Компания не найдена.')
 
@@ -137,8 +138,8 @@ async def create_user(
 
 
 @router.patch('/users/{user_id}', response_model=UserModel)
-async def partial_update_user(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def partial_update_user(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         user_id: int,
         data: UserPartialUpdateSchema,
 ):
@@ -151,17 +152,19 @@ async def partial_update_user(
     if user_to_update is None or (
             not current_user.is_admin
             and
-            not (user_to_update.company.id == current_user.company.id and current_user.company_role == Company.Roles.ADMIN)
+            not (user_to_update.company_id == current_user.company_id and current_user.company_role == Company.Roles.ADMIN)
     ):
         raise HTTPException(HTTP_404_NOT_FOUND, detail='Пользователь не найден.')
 
     user = update_endpoint_object(user_to_update, data, False)
+    # Могла измениться роль пользователя.
+    invalidate_auth_context_everywhere(user.id)
     return user
 
 
 @router.patch('/users/{user_id}/company', response_model=UserModel)
-async def update_user_company(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def update_user_company(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         user_id: int,
         data: UserCompanyUpdateSchema,
 ):
@@ -179,13 +182,14 @@ async def update_user_company(
 
     user.company = new_company
     user.save(only=['company'])
+    invalidate_auth_context_everywhere(user.id)
 
     return user
 
 
 @router.put('/users/{user_id}/password', response_model=UserModel)
-async def update_user_password(
-        current_user: Annotated[UserModel, Depends(get_current_active_user)],
+def update_user_password(
+        current_user: Annotated[AuthContext, Depends(get_current_active_user)],
         user_id: int,
         data: SysAdminPasswordUpdateSchema,
 ):
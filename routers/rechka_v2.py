@@ -11,9 +11,9 @@ router = APIRouter()
 
 
 @router.post("/create_task")
-async def create_task_webhook(call_request: CustomCallRequest,
-                              request: Request,
-                              background_tasks: BackgroundTasks):
+def create_task_webhook(call_request: CustomCallRequest,
+                        request: Request,
+                        background_tasks: BackgroundTasks):
     """
     Отправка звонка на анализ
     """
@@ -35,8 +35,8 @@ async def create_task_webhook(call_request: CustomCallRequest,
 
 
 @router.post("/check_task")
-async def check_task_webhook(task_request: CustomTaskRequest,
-                             request: Request):
+def check_task_webhook(task_request: CustomTaskRequest,
+                       request: Request):
     """
     Получение результатов анализа
     """
@@ -62,8 +62,8 @@ async def check_task_webhook(task_request: CustomTaskRequest,
 
 
 @router.post('/user_balance')
-async def user_balance(user_request: AuthRequest,
-                       request: Request):
+def user_balance(user_request: AuthRequest,
+                 request: Request):
 
     if not has_access(user_request):
         log_access_denied(user_request, request)
@@ -0,0 +1,24 @@
+from datetime import date
+from typing import Annotated, Optional, List, Literal
+
+from pydantic import BaseModel, Field
+
+
+class AnalyticsMetricSchema(BaseModel):
+    # Без вопроса доступна только операция count (количество задач).
+    question_id: Optional[int] = None
+    operation: Literal['count', 'sum', 'avg', 'min', 'max', 'median', 'percentile', 'histogram', 'distribution']
+    # Для операции percentile.
+    percentile: Optional[Annotated[float, Field(ge=0, le=100)]] = None
+    # Для операции histogram.
+    bins: Annotated[int, Field(ge=1, le=100)] = 10
+
+
+class AnalyticsQuerySchema(BaseModel):
+    from_date: date
+    to_date: date
+    # Измерения: hour, day, week, month, question:<ID вопроса>, crm:<crm_id колонки CRM>.
+    group_by: Annotated[List[str], Field(max_length=3, examples=[['week', 'crm:responsible_user_name']])] = []
+    metrics: Annotated[List[AnalyticsMetricSchema], Field(min_length=1, max_length=20)]
+    # Добавить разницу с предыдущим периодом (нужно измерение hour/day/week/month).
+    with_deltas: bool = False
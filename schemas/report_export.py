@@ -0,0 +1,26 @@
+from datetime import datetime
+from typing import Optional, Literal
+
+from pydantic import BaseModel, ConfigDict
+
+
+class ReportExportCreateSchema(BaseModel):
+    file_format: Literal['csv', 'parquet'] = 'csv'
+    table_settings_id: Optional[int] = None
+    is_archived: Optional[bool] = None
+    source: Optional[str] = None
+
+
+class ReportExportPublicSchema(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    report_id: int
+    created: datetime
+    finished: Optional[datetime] = None
+    file_format: str
+    status: str
+    rows_count: Optional[int] = None
+    error_details: Optional[str] = None
+    # Временная ссылка на файл (для завершенной выгрузки).
+    url: Optional[str] = None
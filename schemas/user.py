@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional, Annotated
+from typing import Optional, Annotated, Set, List, Union
 
 from pydantic import BaseModel, Field
 
@@ -31,6 +31,36 @@ class UserInDB(UserModel):
     hashed_password: Optional[str] = None
 
 
+class AuthContext(UserModel):
+    """
+    Авторизованный пользователь ЛК и его права доступа (см. helpers/auth_cache.py).
+    """
+    # Компании, где пользователь – администратор или интегратор. None – все компании (системный администратор).
+    admin_company_ids: Optional[Set[int]] = None
+    # admin_company_ids + компания, в которой пользователь состоит.
+    member_company_ids: Optional[Set[int]] = None
+
+    def get_company_ids(self, allow_company_user: bool = False) -> Optional[Set[int]]:
+        """
+        ID доступных компаний. None – доступ ко всем компаниям.
+        """
+        if self.is_admin:
+            return None
+        return self.member_company_ids if allow_company_user else self.admin_company_ids
+
+    def can_access_company(self, company_id: int, allow_company_user: bool = False) -> bool:
+        company_ids = self.get_company_ids(allow_company_user)
+        return company_ids is None or company_id in company_ids
+
+    def has_any_role(self, roles: List[Union[str, Company.Roles]]) -> bool:
+        """
+        Системный администратор имеет доступ всегда. Остальные – если их роль в компании есть в roles.
+        """
+        if self.is_admin:
+            return True
+        return bool(roles) and self.company_role is not None and self.company_role in roles
+
+
 class UserCreateSchema(BaseModel):
     password: str
     company_id: int
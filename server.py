@@ -1,27 +1,41 @@
+import asyncio
 import json
 import os
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import Annotated
 
+import anyio.to_thread
 import uvicorn
-from fastapi import FastAPI, Request, BackgroundTasks
+from fastapi import FastAPI, Request, BackgroundTasks, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
 from loguru import logger
 from starlette.responses import JSONResponse
 
 from config import config
-from data.models import main_db, RequestLog
+from data.models import main_db, RequestLog, IntegrationServiceName
+from helpers.auth_cache import auth_invalidation_listener
+from helpers.chart_cache import chart_cache
 from helpers.db_helpers import select_db_1, DBLogHandler
+from helpers.deferred_jobs import deferred_scheduler
+from helpers.loop_monitor import loop_monitor
+from helpers.metadata_cache import metadata_invalidation_listener
+from integrations.amo_crm.http_client import get_amo_http_stats
+from integrations.amo_crm.metadata import amo_metadata_cache
 from integrations.bitrix.exceptions import BadWebhookError as BitrixBadWebhookError
+from integrations.bitrix.metadata import bitrix_metadata_cache
 from integrations.robokassa.proc_result_url import process_result_url
 from routers.amocrm import router as amocrm_router
-from routers.auth import router as auth_router, route_prefix as auth_route_prefix
+from routers.auth import router as auth_router, route_prefix as auth_route_prefix, check_current_user_role
 from routers.bitrix import router as bitrix_router
 from routers.custom import router as custom_router
 from routers.lk import main_router as lk_router
 from routers.rechka_v2 import router as rechka_v2_router
+from schemas.user import AuthContext
 
 
 
@@ -49,9 +63,24 @@ async def lifespan(app: FastAPI):
     logger.info('Подключаемся к БД.')
     main_db.connect()
 
+    # Синхронные обработчики и зависимости FastAPI выполняются в пуле потоков anyio,
+    # а asyncio.to_thread – в пуле event loop по умолчанию. Ограничиваем оба пула.
+    anyio.to_thread.current_default_thread_limiter().total_tokens = config.FASTAPI_THREADPOOL_SIZE
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=config.FASTAPI_THREADPOOL_SIZE)
+    )
+    loop_monitor.start()
+    deferred_scheduler.start()
+    metadata_invalidation_listener.start()
+    auth_invalidation_listener.start()
+
     logger.info('Запускаем FastApi.')
     yield
 
+    auth_invalidation_listener.stop()
+    metadata_invalidation_listener.stop()
+    deferred_scheduler.stop()
+    loop_monitor.stop()
     logger.info('Закрываем соединение с БД.')
     main_db.close()
 
@@ -64,6 +93,8 @@ server.add_middleware(
     allow_methods=['*'],
     allow_headers=['*'],
 )
+# Сжатие ответов (списки задач, данные графиков) для клиентов с Accept-Encoding: gzip.
+server.add_middleware(GZipMiddleware, minimum_size=config.FASTAPI_GZIP_MIN_SIZE)
 server.include_router(amocrm_router, tags=['crm'])
 server.include_router(bitrix_router, tags=['crm'])
 server.include_router(custom_router, tags=['crm'])
@@ -121,7 +152,8 @@ async def log_request(request: Request, call_next):
             logger.warning(f'Получен запрос с бинарным содержимым. context_id: "{context_id}".')
             body_str = None
 
-        request_log = RequestLog.create(
+        request_log = await asyncio.to_thread(
+            RequestLog.create,
             context_id=context_id,
             method=request.method,
             path=path,
@@ -161,6 +193,99 @@ def status_response():
     return {"status": 200 if status else 500}
 
 
+@server.get("/status/event_loop")
+def event_loop_status(
+        current_user: Annotated[AuthContext, Depends(check_current_user_role([]))],
+        limit: int = 20,
+):
+    """
+    Места в коде, сильнее всего блокировавшие event loop. Только для системных администраторов.
+    """
+    return {"max_lag_ms": round(loop_monitor.max_lag_ms, 1),
+            "threshold_ms": loop_monitor.threshold_ms,
+            "callsites": loop_monitor.get_stats(limit)}
+
+
+@server.get("/status/chart_cache")
+def chart_cache_status(
+        current_user: Annotated[AuthContext, Depends(check_current_user_role([]))],
+):
+    """
+    Статистика попаданий в кэш данных графиков ЛК (по текущему процессу). Только для системных администраторов.
+    """
+    return chart_cache.get_stats()
+
+
+# Кэши метаданных CRM по типам интеграций.
+CRM_METADATA_CACHES = {
+    IntegrationServiceName.AMOCRM: amo_metadata_cache,
+    IntegrationServiceName.BITRIX24: bitrix_metadata_cache,
+}
+
+
+@server.get("/status/crm_metadata_cache")
+def crm_metadata_cache_status(
+        current_user: Annotated[AuthContext, Depends(check_current_user_role([]))],
+):
+    """
+    Статистика попаданий в кэши метаданных CRM по типам данных (по текущему процессу).
+    Только для системных администраторов.
+    """
+    return {service_name.value: cache.get_stats() for service_name, cache in CRM_METADATA_CACHES.items()}
+
+
+@server.delete("/status/crm_metadata_cache/{service_name}/{account}")
+def crm_metadata_cache_invalidate(
+        current_user: Annotated[AuthContext, Depends(check_current_user_role([]))],
+        service_name: IntegrationServiceName,
+        account: str,
+):
+    """
+    Сбрасывает метаданные аккаунта CRM (ID аккаунта amoCRM, домен портала Битрикс24) в кэшах всех процессов сервера.
+    Только для системных администраторов.
+    """
+    if service_name not in CRM_METADATA_CACHES:
+        raise HTTPException(status_code=404, detail=f'Нет кэша метаданных для {service_name.value}.')
+    return {"invalidated": CRM_METADATA_CACHES[service_name].invalidate_everywhere(account)}
+
+
+@server.get("/status/amocrm_http")
+def amocrm_http_status(
+        current_user: Annotated[AuthContext, Depends(check_current_user_role([]))],
+):
+    """
+    Запросы к API amoCRM по поддоменам: повторы, обновления токенов, ожидание лимита (по текущему процессу).
+    Только для системных администраторов.
+    """
+    return get_amo_http_stats()
+
+
+@server.get("/status/deferred_jobs")
+def deferred_jobs_status(
+        current_user: Annotated[AuthContext, Depends(check_current_user_role([]))],
+):
+    """
+    Отложенные задачи (обработка вебхуков CRM после задержки) в планировщике текущего процесса.
+    Только для системных администраторов.
+    """
+    return deferred_scheduler.get_stats()
+
+
+@server.get("/status/sheets_upload")
+def sheets_upload_status(
+        current_user: Annotated[AuthContext, Depends(check_current_user_role([]))],
+):
+    """
+    Очередь выгрузки в Гугл Таблицы и расход квот Google Sheets API (по последнему циклу upload_google).
+    Только для системных администраторов.
+    """
+    try:
+        with open(config.UPLOAD_GOOGLE_STATUS_PATH) as file:
+            return json.load(file)
+    except (OSError, json.JSONDecodeError):
+        raise HTTPException(status_code=404, detail='Выгрузка в Гугл Таблицы еще не запускалась.')
+
+
 @server.post("/json_test")
 async def json_echo(request: Request):
     """
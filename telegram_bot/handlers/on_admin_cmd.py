@@ -8,7 +8,6 @@ from pyrogram import Client, filters
 from pyrogram.types import Message
 
 from data.models import User, Integration, IntegrationServiceName, Transaction, Company
-from helpers.tg_helpers import get_user_info
 from integrations.amo_crm.amo_api_core import AmoApi
 from integrations.bitrix.bitrix_api import Bitrix24
 from integrations.gs_api.syncer import sync_leads_to_sheet
@@ -106,13 +105,9 @@ def sync_cmd(cli: Client, message: Message):
     """
     m: Message = cli.send_message(message.chat.id, "⏳")
 
-    users = User.select()
-    tg_ids = [user.tg_id for user in users]
+    new_users, added = sync_leads_to_sheet(cli)
 
-    users_info = get_user_info(cli, tg_ids)
-    updated, added = sync_leads_to_sheet(users, users_info)
-
-    text = f"Обновлено строк: {updated}\nДобавлено новых строк: {added}"
+    text = f"Новых пользователей: {new_users}\nДобавлено новых строк: {added}"
     m.edit_text(text, reply_markup=markup.with_close_btn())
 
     raise pyrogram.StopPropagation
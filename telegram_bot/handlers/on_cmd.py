@@ -9,6 +9,7 @@ from pyrogram.types import Message
 
 from config import config as cfg
 from data.models import User, UserMode, Mode, Transaction, Company
+from helpers.auth_cache import invalidate_auth_context_everywhere
 from helpers.db_helpers import create_default_telegram_report
 from integrations.gs_api import sheets
 from misc.files import delete_file
@@ -56,6 +57,8 @@ def get_or_register_telegram_user(
     logger.info(f'Связали пользователя с его компанией, company ID: {company.id}')
 
     db_user.save()
+    # Компания и роль пользователя изменились: сбрасываем кэш прав доступа ЛК.
+    invalidate_auth_context_everywhere(db_user.id)
 
     create_default_telegram_report(db_user, sheet.id)
 
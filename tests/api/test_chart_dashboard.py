@@ -0,0 +1,167 @@
+from datetime import date
+
+import pytest
+from fastapi.testclient import TestClient
+
+from config import config as cfg
+from data.models import ReconnectPostgresqlDatabase, User, Company, Integration, Mode, Report, Deal, RequestLog, \
+    Task, ModeQuestion, ModeQuestionType, ModeAnswer, Chart, ChartParameter, ChartFilter, ChartMetricType, \
+    ReportVersion, ReportDayVersion
+from helpers.auth_cache import invalidate_auth_context
+from helpers.chart_cache import ChartDataCache
+from routers.auth import get_password_hash
+from routers.lk import chart as chart_router
+from server import server
+
+
+# Тестовая временная база данных.
+test_db = ReconnectPostgresqlDatabase(
+    cfg.PYTEST_TEMP_POSTGRES_DB,
+    host=cfg.PYTEST_TEMP_POSTGRES_HOST,
+    port=cfg.PYTEST_TEMP_POSTGRES_PORT,
+    sslmode=cfg.PYTEST_TEMP_POSTGRES_SSL_MODE,
+    user=cfg.PYTEST_TEMP_POSTGRES_USER,
+    password=cfg.PYTEST_TEMP_POSTGRES_PASSWORD,
+    target_session_attrs='read-write',
+)
+
+
+@pytest.fixture(scope='function')
+def setup_db(monkeypatch):
+
+    # Привязываем модели к тестовой базе данных.
+    models = [
+        User,
+        Company,
+        Integration,
+        Mode,
+        Report,
+        Deal,
+        RequestLog,
+        Task,
+        ModeQuestion,
+        ModeAnswer,
+        Chart,
+        ChartParameter,
+        ChartFilter,
+        ReportVersion,
+        ReportDayVersion,
+    ]
+    for model in models:
+        model._meta.database = test_db
+
+    test_db.bind(models, bind_refs=True, bind_backrefs=True)
+    test_db.connect()
+    test_db.create_tables(models)
+    invalidate_auth_context()
+    # Данные графиков не должны попадать в кэш других тестов.
+    monkeypatch.setattr(chart_router, 'chart_cache', ChartDataCache(redis_url=None))
+
+    user_password = 'password'
+    hashed_password = get_password_hash(user_password)
+    company = Company.create(name='company')
+    other_company = Company.create(name='other company')
+    company_admin = User.create(
+        hashed_password=hashed_password,
+        is_admin=False,
+        company=company,
+        company_role=Company.Roles.ADMIN,
+    )
+    other_user = User.create(
+        hashed_password=hashed_password,
+        is_admin=False,
+        company=other_company,
+        company_role=Company.Roles.ADMIN,
+    )
+    integration = Integration.create(company=company, service_name='custom', account_id='1')
+    report = Report.create(name='report', integration=integration)
+    question = ModeQuestion.create(report=report, is_active=True, short_name='Оценка', column_index=1,
+                                   question_text='Оценка', answer_type=ModeQuestionType.INTEGER)
+    for answer_text in ['3', '5', '7']:
+        task = Task.create(report=report, status=Task.StatusChoices.DONE)
+        ModeAnswer.create(task=task, question=question, answer_text=answer_text)
+
+    # Два графика с одинаковыми фильтрами и параметрами.
+    charts = []
+    for i in range(2):
+        chart = Chart.create(report=report, name=f'chart {i}', order=i)
+        ChartParameter.create(chart=chart, mode_question=question, color='#000000',
+                              data_type=ChartMetricType.INTEGER, metric_operation='sum', is_hidden=False)
+        ChartFilter.create(chart=chart, mode_question=question, operation='greater_or_equal', value='4')
+        charts.append(chart)
+
+    yield {
+        'user_password': user_password,
+        'company_admin': company_admin,
+        'other_user': other_user,
+        'report': report,
+        'charts': charts,
+    }
+
+    test_db.drop_tables(models)
+    test_db.close()
+
+
+def get_access_headers(
+        client: TestClient,
+        user_id: int,
+        password: str,
+) -> dict:
+    """
+    Возвращает заголовки запроса авторизованного пользователя.
+    """
+    response = client.post('/v2/lk/token/', data={'username': user_id, 'password': password})
+    token = response.json()['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+    return headers
+
+
+def get_dashboard(client: TestClient, headers: dict, report_id: int):
+    today = date.today().isoformat()
+    return client.get(f'/v2/lk/reports/{report_id}/dashboard', headers=headers,
+                      params={'from_date': today, 'to_date': today})
+
+
+def test_dashboard_dedupes_identical_filters_and_parameters(setup_db, monkeypatch):
+    client = TestClient(server)
+    headers = get_access_headers(client, setup_db['company_admin'].id, setup_db['user_password'])
+
+    calls = []
+    get_parameter_value_expression = chart_router.get_parameter_value_expression
+
+    def counting_get_parameter_value_expression(parameter, *args, **kwargs):
+        calls.append(parameter.chart_id)
+        return get_parameter_value_expression(parameter, *args, **kwargs)
+    monkeypatch.setattr(chart_router, 'get_parameter_value_expression', counting_get_parameter_value_expression)
+
+    response = get_dashboard(client, headers, setup_db['report'].id)
+    assert response.status_code == 200
+    dashboard = response.json()
+
+    # Одинаковые фильтры – один набор задач, одинаковые параметры вычисляются один раз.
+    assert len(calls) == 1
+    assert [x['chart']['id'] for x in dashboard['charts']] == [x.id for x in setup_db['charts']]
+    values = [sum(step['value'] or 0 for step in x['parameters'][0]['data']) for x in dashboard['charts']]
+    assert values == [12, 12]
+
+    # Повторный запрос берется из кэша.
+    assert get_dashboard(client, headers, setup_db['report'].id).json() == dashboard
+    assert len(calls) == 1
+
+
+def test_dashboard_access(setup_db):
+    client = TestClient(server)
+
+    # Отчет другой компании.
+    headers = get_access_headers(client, setup_db['other_user'].id, setup_db['user_password'])
+    response = get_dashboard(client, headers, setup_db['report'].id)
+    assert response.status_code == 404
+
+    # Несуществующий отчет.
+    headers = get_access_headers(client, setup_db['company_admin'].id, setup_db['user_password'])
+    response = get_dashboard(client, headers, setup_db['report'].id + 1)
+    assert response.status_code == 404
+
+    # Без авторизации.
+    response = get_dashboard(client, {}, setup_db['report'].id)
+    assert response.status_code == 401
@@ -0,0 +1,131 @@
+import asyncio
+import inspect
+
+import httpx
+import pytest
+from fastapi.routing import APIRoute
+
+from config import config as cfg
+from data.models import IntegratorCompany
+from data.models import ReconnectPostgresqlDatabase, User, Company
+from helpers.loop_monitor import EventLoopMonitor
+from helpers.auth_cache import invalidate_auth_context
+from routers.auth import get_password_hash
+from server import server
+
+
+# Максимально допустимая блокировка event loop одним обработчиком (мс).
+MAX_LOOP_BLOCK_MS = 50
+
+# async-обработчики, которые ожидают только неблокирующий ввод-вывод (тело запроса, загрузка файла).
+ASYNC_ENDPOINTS_ALLOWED = {
+    'amo_webhook_test',
+    'amo_webhook',
+    'amo_webhook_v2',
+    'amo_webhook_v2_report',
+    'bitrix_webhook',
+    'bitrix_webhook_v2',
+    'bitrix_webhook_test',
+    'bitrix_events',
+    'upload_user_file',
+    'root',
+    'json_echo',
+}
+
+
+# Тестовая временная база данных.
+test_db = ReconnectPostgresqlDatabase(
+    cfg.PYTEST_TEMP_POSTGRES_DB,
+    host=cfg.PYTEST_TEMP_POSTGRES_HOST,
+    port=cfg.PYTEST_TEMP_POSTGRES_PORT,
+    sslmode=cfg.PYTEST_TEMP_POSTGRES_SSL_MODE,
+    user=cfg.PYTEST_TEMP_POSTGRES_USER,
+    password=cfg.PYTEST_TEMP_POSTGRES_PASSWORD,
+    target_session_attrs='read-write',
+)
+
+
+@pytest.fixture(scope='function')
+def setup_db():
+
+    # Привязываем модели к тестовой базе данных.
+    models = [
+        User,
+        Company,
+        IntegratorCompany,
+    ]
+    for model in models:
+        model._meta.database = test_db
+
+    test_db.bind(models, bind_refs=True, bind_backrefs=True)
+    test_db.connect()
+    test_db.create_tables(models)
+
+    # ID пользователей повторяются между тестами: сбрасываем кэш прав доступа.
+    invalidate_auth_context()
+
+    user_password = 'password'
+    company = Company.create(name='company')
+    sys_admin = User.create(
+        hashed_password=get_password_hash(user_password),
+        is_admin=True,
+        company=company,
+        company_role=Company.Roles.ADMIN,
+    )
+
+    yield {
+        'user_password': user_password,
+        'sys_admin': sys_admin,
+    }
+
+    test_db.drop_tables(models)
+    test_db.close()
+
+
+def test_no_new_async_endpoints():
+    """
+    Синхронный код (peewee, bcrypt, requests) в async-обработчике блокирует event loop.
+    Такие обработчики объявляются через def: FastAPI выполняет их в пуле потоков.
+    """
+    async_endpoints = {
+        route.endpoint.__name__
+        for route in server.routes
+        if isinstance(route, APIRoute) and inspect.iscoroutinefunction(route.endpoint)
+    }
+    assert async_endpoints <= ASYNC_ENDPOINTS_ALLOWED
+
+
+def test_handlers_do_not_block_event_loop(setup_db):
+    """
+    Параллельные запросы к обработчикам не блокируют event loop дольше MAX_LOOP_BLOCK_MS.
+    """
+    user_password = setup_db['user_password']
+    sys_admin = setup_db['sys_admin']
+
+    async def run_requests() -> EventLoopMonitor:
+        monitor = EventLoopMonitor(threshold_ms=MAX_LOOP_BLOCK_MS, interval=0.01)
+        monitor.start()
+
+        transport = httpx.ASGITransport(app=server)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test',
+                                     follow_redirects=True) as client:
+            # Проверка пароля (bcrypt) – самая тяжелая операция авторизации.
+            responses = await asyncio.gather(*[
+                client.post('/v2/lk/token/', data={'username': sys_admin.id, 'password': user_password})
+                for _ in range(5)
+            ])
+            token = responses[0].json()['access_token']
+            headers = {'Authorization': f'Bearer {token}'}
+
+            responses += await asyncio.gather(*[
+                client.get(path, headers=headers)
+                for path in ['/v2/lk/users/', '/v2/lk/users/me/', '/v2/lk/check/sys_admin'] * 5
+            ])
+
+        monitor.stop()
+        assert all(r.status_code == 200 for r in responses)
+        return monitor
+
+    monitor = asyncio.run(run_requests())
+
+    assert monitor.max_lag_ms < MAX_LOOP_BLOCK_MS, monitor.get_stats()
@@ -4,6 +4,7 @@ from fastapi.testclient import TestClient
 from config import config as cfg
 from data.models import IntegratorCompany
 from data.models import ReconnectPostgresqlDatabase, User, Company
+from helpers.auth_cache import invalidate_auth_context
 from routers.auth import get_password_hash
 from server import server
 
@@ -36,6 +37,9 @@ def setup_db():
     test_db.connect()
     test_db.create_tables(models)
 
+    # ID пользователей повторяются между тестами: сбрасываем кэш прав доступа.
+    invalidate_auth_context()
+
     # Создаем тестовые сущности.
     user_password = 'password'
     hashed_password = get_password_hash(user_password)
@@ -170,3 +174,26 @@ def test_user(setup_db):
     for url in urls_403:
         response = client.get(url, headers=headers)
         assert response.status_code == 403
+
+
+def test_role_change_invalidates_cache(setup_db):
+    """
+    Права пользователя кэшируются, но смена роли применяется сразу.
+    """
+    client = TestClient(server)
+
+    sys_admin = setup_db['sys_admin']
+    user = setup_db['user']
+    user_password = setup_db['user_password']
+
+    user_headers = get_access_headers(client, user.id, user_password)
+    response = client.get('/v2/lk/check/admin/', headers=user_headers)
+    assert response.status_code == 403
+
+    sys_admin_headers = get_access_headers(client, sys_admin.id, user_password)
+    response = client.patch(f'/v2/lk/users/{user.id}', headers=sys_admin_headers,
+                            json={'company_role': Company.Roles.ADMIN.value})
+    assert response.status_code == 200
+
+    response = client.get('/v2/lk/check/admin/', headers=user_headers)
+    assert response.json()['id'] == user.id
@@ -0,0 +1,161 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from config import config as cfg
+from data.models import ReconnectPostgresqlDatabase, User, Company, Integration, Mode, Report, Deal, RequestLog, \
+    Task, ModeQuestion, ModeQuestionType, ModeAnswer, TableViewSettings, TableActiveFilter
+from helpers.auth_cache import invalidate_auth_context
+from routers.auth import get_password_hash
+from server import server
+
+
+# Тестовая временная база данных.
+test_db = ReconnectPostgresqlDatabase(
+    cfg.PYTEST_TEMP_POSTGRES_DB,
+    host=cfg.PYTEST_TEMP_POSTGRES_HOST,
+    port=cfg.PYTEST_TEMP_POSTGRES_PORT,
+    sslmode=cfg.PYTEST_TEMP_POSTGRES_SSL_MODE,
+    user=cfg.PYTEST_TEMP_POSTGRES_USER,
+    password=cfg.PYTEST_TEMP_POSTGRES_PASSWORD,
+    target_session_attrs='read-write',
+)
+
+
+@pytest.fixture(scope='function')
+def setup_db():
+
+    # Привязываем модели к тестовой базе данных.
+    models = [
+        User,
+        Company,
+        Integration,
+        Mode,
+        Report,
+        Deal,
+        RequestLog,
+        Task,
+        ModeQuestion,
+        ModeAnswer,
+        TableViewSettings,
+        TableActiveFilter,
+    ]
+    for model in models:
+        model._meta.database = test_db
+
+    test_db.bind(models, bind_refs=True, bind_backrefs=True)
+    test_db.connect()
+    test_db.create_tables(models)
+    invalidate_auth_context()
+
+    user_password = 'password'
+    company = Company.create(name='company')
+    sys_admin = User.create(
+        hashed_password=get_password_hash(user_password),
+        is_admin=True,
+        company=company,
+        company_role=Company.Roles.ADMIN,
+    )
+    integration = Integration.create(company=company, service_name='custom', account_id='1')
+    report = Report.create(name='report', integration=integration)
+    question = ModeQuestion.create(report=report, is_active=True, short_name='Оценка', column_index=1,
+                                   question_text='Оценка', answer_type=ModeQuestionType.PERCENT)
+    task = Task.create(report=report, status=Task.StatusChoices.DONE)
+    ModeAnswer.create(task=task, question=question, answer_text='60%')
+    table_settings = TableViewSettings.create(report=report, user=sys_admin, name='view')
+
+    yield {
+        'user_password': user_password,
+        'sys_admin': sys_admin,
+        'report': report,
+        'question': question,
+        'table_settings': table_settings,
+    }
+
+    test_db.drop_tables(models)
+    test_db.close()
+
+
+def get_access_headers(
+        client: TestClient,
+        user_id: int,
+        password: str,
+) -> dict:
+    """
+    Возвращает заголовки запроса авторизованного пользователя.
+    """
+    response = client.post('/v2/lk/token/', data={'username': user_id, 'password': password})
+    token = response.json()['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+    return headers
+
+
+def get_tasks_count(client: TestClient, headers: dict, setup_db: dict) -> int:
+    response = client.get('/v2/lk/tasks', headers=headers, params={
+        'report_id': setup_db['report'].id,
+        'table_settings_id': setup_db['table_settings'].id,
+    })
+    assert response.status_code == 200
+    return response.json()['total_count']
+
+
+def test_malformed_numeric_filter(setup_db):
+    client = TestClient(server)
+    headers = get_access_headers(client, setup_db['sys_admin'].id, setup_db['user_password'])
+
+    # Значение со знаком процента сравнивается как число.
+    table_filter = TableActiveFilter.create(table_settings=setup_db['table_settings'],
+                                            mode_question=setup_db['question'],
+                                            operation='greater_or_equal', value='50%')
+    assert get_tasks_count(client, headers, setup_db) == 1
+
+    # Некорректное значение, уже сохраненное в БД: фильтр не проходит ни одна задача, а не ошибка 500.
+    table_filter.value = 'abc'
+    table_filter.save()
+    assert get_tasks_count(client, headers, setup_db) == 0
+
+    # Новые некорректные значения не сохраняются.
+    response = client.post(f'/v2/lk/table_settings/{setup_db["table_settings"].id}/filters', headers=headers, json={
+        'mode_question_id': setup_db['question'].id,
+        'operation': 'greater_or_equal',
+        'value': 'abc',
+    })
+    assert response.status_code == 400
+    response = client.put(f'/v2/lk/filters/{table_filter.id}', headers=headers, json={
+        'operation': 'equal',
+        'value': '50 %',
+    })
+    assert response.status_code == 200
+
+
+def test_malformed_date_filter_and_unsupported_operation(setup_db):
+    client = TestClient(server)
+    headers = get_access_headers(client, setup_db['sys_admin'].id, setup_db['user_password'])
+    question = ModeQuestion.create(report=setup_db['report'], is_active=True, short_name='Дата', column_index=2,
+                                   question_text='Дата', answer_type=ModeQuestionType.DATE)
+
+    # Фильтры, уже сохраненные в БД, не проходит ни одна задача, а не ошибка 500.
+    table_filter = TableActiveFilter.create(table_settings=setup_db['table_settings'], mode_question=question,
+                                            operation='greater_than', value='2024-01-01')
+    assert get_tasks_count(client, headers, setup_db) == 0
+    table_filter.operation = 'contains'
+    table_filter.value = '01.01.2024'
+    table_filter.save()
+    assert get_tasks_count(client, headers, setup_db) == 0
+
+    # Новые некорректные фильтры не сохраняются.
+    response = client.post(f'/v2/lk/table_settings/{setup_db["table_settings"].id}/filters', headers=headers, json={
+        'mode_question_id': question.id,
+        'operation': 'range',
+        'value': '01.01.2024',
+    })
+    assert response.status_code == 400
+    response = client.put(f'/v2/lk/filters/{table_filter.id}', headers=headers, json={
+        'operation': 'contains',
+        'value': '01.01.2024',
+    })
+    assert response.status_code == 400
+    response = client.put(f'/v2/lk/filters/{table_filter.id}', headers=headers, json={
+        'operation': 'greater_than',
+        'value': '01.01.2024',
+    })
+    assert response.status_code == 200
@@ -4,6 +4,7 @@ from fastapi.testclient import TestClient
 from config import config as cfg
 from data.models import IntegratorCompany
 from data.models import ReconnectPostgresqlDatabase, User, Company
+from helpers.auth_cache import invalidate_auth_context
 from routers.auth import get_password_hash
 from server import server
 
@@ -36,6 +37,9 @@ def setup_db():
     test_db.connect()
     test_db.create_tables(models)
 
+    # ID пользователей повторяются между тестами: сбрасываем кэш прав доступа.
+    invalidate_auth_context()
+
     # Создаем тестовые сущности.
     user_password = 'password'
     hashed_password = get_password_hash(user_password)
@@ -0,0 +1,95 @@
+"""
+Общие фикстуры тестов: локальный сервер Google Sheets API и пул клиентов, подключенный к нему.
+"""
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import gspread
+import pytest
+import requests
+from google.auth.credentials import AnonymousCredentials
+
+from integrations.gs_api import sheets_client
+from integrations.gs_api.quota import SheetsQuota
+from integrations.gs_api.sheets_client import SheetsClientPool
+
+
+class FakeSheetsHandler(BaseHTTPRequestHandler):
+    """
+    Минимальный Sheets API v4: метаданные таблицы, значения колонки A, batchUpdate и values.batchUpdate.
+    """
+    def _reply(self, data: dict):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.requests.append(('GET', self.path.split('?')[0], None))
+        if '/values/' in self.path:
+            self._reply({'majorDimension': 'COLUMNS', 'values': [self.server.first_column]})
+            return
+        spreadsheet_id = re.match(r'/v4/spreadsheets/([^/?]+)', self.path).group(1)
+        self._reply({
+            'spreadsheetId': spreadsheet_id,
+            'properties': {'title': spreadsheet_id},
+            'sheets': [{'properties': {'sheetId': 0, 'title': 'Лист1', 'index': 0,
+                                       'gridProperties': {'rowCount': 1000, 'columnCount': 26}}}],
+        })
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests.append(('POST', self.path.split('?')[0], body))
+        if self.server.errors:
+            # Ответ с ошибкой: (код, Retry-After).
+            status_code, retry_after = self.server.errors.pop(0)
+            error = json.dumps({'error': {'code': status_code, 'message': 'Quota exceeded'}}).encode()
+            self.send_response(status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(error)))
+            if retry_after is not None:
+                self.send_header('Retry-After', str(retry_after))
+            self.end_headers()
+            self.wfile.write(error)
+            return
+        self._reply({'replies': []})
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalSession(requests.Session):
+    """
+    Сессия, отправляющая запросы к Sheets API на локальный сервер.
+    """
+    def __init__(self, base_url: str):
+        super().__init__()
+        self.base_url = base_url
+
+    def request(self, method, url, *args, **kwargs):
+        url = url.replace('https://sheets.googleapis.com', self.base_url)
+        return super().request(method, url, *args, **kwargs)
+
+
+@pytest.fixture
+def fake_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeSheetsHandler)
+    server.requests = []
+    server.first_column = []
+    server.errors = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def pool(fake_server, monkeypatch):
+    # Квоты Google к локальному серверу не применяем.
+    monkeypatch.setattr(sheets_client, 'sheets_quota', SheetsQuota(account_rate=10 ** 6, spreadsheet_rate=10 ** 6))
+    session = LocalSession(f'http://127.0.0.1:{fake_server.server_address[1]}')
+    return SheetsClientPool(client_factory=lambda: gspread.Client(AnonymousCredentials(), session=session))
@@ -0,0 +1,163 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import jwt
+import pytest
+from cryptography.fernet import Fernet
+
+from config import config as cfg
+from data.models import Integration, IntegrationServiceName
+from integrations.amo_crm import http_client
+from integrations.amo_crm.amo_api_core import AmoApi
+from integrations.amo_crm.http_client import AmoHttpClient
+from modules.crypter import encrypt
+
+
+def make_token(number: int, ttl: int = 3600) -> str:
+    return jwt.encode({'exp': int(time.time()) + ttl, 'n': number}, 'fake-amocrm-secret-key-for-tests-only', algorithm='HS256')
+
+
+class FakeAmoHandler(BaseHTTPRequestHandler):
+    """
+    API аккаунта amoCRM: сделки, примечания и выдача токенов. Refresh token одноразовый.
+    """
+    def _send(self, status: int, data=None, headers=None):
+        body = json.dumps(data).encode() if data is not None else b''
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        with server.lock:
+            server.requests.append((self.command, self.path, time.monotonic()))
+
+            if self.path == '/oauth2/access_token':
+                if body['refresh_token'] != server.refresh_token:
+                    return self._send(400, {'title': 'Bad Request', 'detail': 'Refresh token has been revoked'})
+                server.refreshes += 1
+                server.access_token = make_token(server.refreshes)
+                server.refresh_token = f'refresh-{server.refreshes}'
+                return self._send(200, {'access_token': server.access_token, 'refresh_token': server.refresh_token})
+
+            if self.headers['Authorization'] != f'Bearer {server.access_token}':
+                return self._send(401, {'title': 'Unauthorized'})
+            if server.failures:
+                status, retry_after = server.failures.pop(0)
+                return self._send(status, {}, {'Retry-After': retry_after} if retry_after else None)
+
+        if self.path.startswith('/api/v4/leads/'):
+            return self._send(200, {'id': int(self.path.split('/')[-1].split('?')[0]), 'pipeline_id': 1})
+        return self._send(200, {'ok': True})
+
+    do_GET = do_POST = do_PATCH = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_amo(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeAmoHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.failures = []
+    server.refreshes = 0
+    # Токен, сохраненный в БД, уже отозван сервером: первый запрос получит 401.
+    server.access_token = make_token(-1)
+    server.refresh_token = 'refresh-0'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    server.sleeps = []
+    client = AmoHttpClient(f'http://127.0.0.1:{server.server_address[1]}', rate_per_second=1000,
+                           sleep=server.sleeps.append)
+    monkeypatch.setattr(http_client, '_clients', {'fake': client})
+    monkeypatch.setattr(cfg, 'FERNET_KEY', Fernet.generate_key().decode())
+    server.client = client
+    yield server
+    server.shutdown()
+
+
+def make_amo() -> AmoApi:
+    integration = Integration(service_name=IntegrationServiceName.AMOCRM, account_id='1', data=json.dumps({
+        'access': {
+            'subdomain': 'fake',
+            'client_id': 'client',
+            'client_secret': 'secret',
+            'redirect_uri': 'https://example.com',
+            'code': None,
+            # Токен из БД выдан раньше токенов, полученных клиентом при обновлении.
+            'access_token': encrypt(make_token(0, ttl=1800), cfg.FERNET_KEY),
+            'refresh_token': encrypt('refresh-0', cfg.FERNET_KEY),
+        },
+    }))
+    return AmoApi(integration, commit_on_update=False)
+
+
+def test_refresh_once_for_burst(fake_amo):
+    results = []
+    # Каждый вебхук создает свой AmoApi с токеном из БД.
+    amos = [make_amo() for _ in range(10)]
+    threads = [threading.Thread(target=lambda amo=amo: results.append(amo.get_lead_by_id(5))) for amo in amos]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [{'id': 5, 'pipeline_id': 1}] * 10
+    assert fake_amo.refreshes == 1
+    # Новый AmoApi со старым токеном из БД берет токен клиента без обновления.
+    assert make_amo().get_lead_by_id(6)['id'] == 6
+    assert fake_amo.refreshes == 1
+
+
+def test_retry_429_and_5xx(fake_amo):
+    amo = make_amo()
+    amo.get_lead_by_id(1)
+    fake_amo.failures = [(429, '2'), (503, None)]
+
+    assert amo.get_lead_by_id(2) == {'id': 2, 'pipeline_id': 1}
+    assert fake_amo.sleeps[0] >= 2
+    assert fake_amo.client.get_stats()['errors'] == {'401': 1, '429': 1, '503': 1}
+
+
+def test_post_is_not_retried_on_5xx(fake_amo):
+    amo = make_amo()
+    amo.get_lead_by_id(1)
+    fake_amo.failures = [(502, None)]
+
+    assert amo.add_note(1, 'Комментарий', 'leads') is None
+    assert [x[0] for x in fake_amo.requests].count('POST') == 2  # токен и примечание
+
+
+def test_rate_limit(fake_amo):
+    client = AmoHttpClient(fake_amo.client.base_url, rate_per_second=20)
+    http_client._clients['fake'] = client
+    amo = make_amo()
+    amo.get_lead_by_id(1)
+
+    start = time.monotonic()
+    for i in range(5):
+        amo.get_lead_by_id(i)
+    assert time.monotonic() - start >= 5 / 20 * 0.9
+
+
+def test_async_request(fake_amo):
+    amo = make_amo()
+
+    async def load():
+        return await asyncio.gather(*[amo.base_request_async(endpoint=f'/api/v4/leads/{i}', type='get')
+                                      for i in range(3)])
+
+    assert [x['id'] for x in asyncio.run(load())] == [0, 1, 2]
+    assert fake_amo.refreshes == 1
@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+import pytest
+
+from integrations.amo_crm import metadata as amo_metadata
+from integrations.amo_crm.metadata import amo_metadata_cache
+
+
+class FakeAmo:
+    def __init__(self):
+        self.integration = SimpleNamespace(account_id='31000001')
+        self.subdomain = 'example'
+        self.calls = []
+        self.pipelines = [
+            {'id': 1, 'name': 'Продажи', 'statuses': [{'id': 11, 'name': 'Новая'}, {'id': 142, 'name': 'Успешно'}]},
+            {'id': 2, 'name': 'Сервис', 'statuses': [{'id': 21, 'name': 'Заявка'}, {'id': 142, 'name': 'Закрыто'}]},
+        ]
+        self.leads = {100: {'pipeline_id': 2, 'status_id': 142}}
+
+    def get_pipelines(self):
+        self.calls.append('pipelines')
+        return self.pipelines
+
+    def get_lead_by_id(self, lead_id):
+        self.calls.append('lead')
+        return self.leads[lead_id]
+
+    def get_user(self, user_id):
+        self.calls.append('user')
+        return {'id': user_id, 'name': 'Анна'} if user_id == 5 else None
+
+    def get_users(self):
+        return [{'id': 5, 'name': 'Анна'}, {'id': 6, 'name': 'Олег'}]
+
+    def get_custom_fields(self, entity_type):
+        self.calls.append(f'custom_fields_{entity_type}')
+        return [{'id': 1, 'name': 'Источник', 'enums': None}]
+
+
+@pytest.fixture
+def amo():
+    amo_metadata_cache.clear()
+    yield FakeAmo()
+    amo_metadata_cache.clear()
+
+
+def test_pipeline_and_status_names_resolve_locally(amo):
+    for _ in range(3):
+        assert amo_metadata.get_pipeline_and_status_names(amo, 100) == ('Сервис', 'Закрыто')
+    assert amo.calls == ['lead', 'pipelines', 'lead', 'lead']
+
+
+def test_new_status_reloads_pipelines(amo, monkeypatch):
+    monkeypatch.setattr(amo_metadata_cache, 'min_refresh_interval', 0)
+    amo_metadata.get_pipeline_and_status_names(amo, 100)
+
+    amo.pipelines = amo.pipelines + [{'id': 3, 'name': 'Партнеры', 'statuses': [{'id': 31, 'name': 'Первичный'}]}]
+    amo.leads[101] = {'pipeline_id': 3, 'status_id': 31}
+    assert amo_metadata.get_pipeline_and_status_names(amo, 101) == ('Партнеры', 'Первичный')
+    assert amo.calls.count('pipelines') == 2
+
+
+def test_user_names(amo):
+    assert amo_metadata.get_user_name(amo, 5) == 'Анна'
+    assert amo_metadata.get_user_name(amo, 5) == 'Анна'
+    assert amo_metadata.get_user_name(amo, 7) == 'Пользователь удален из AmoCRM'
+    assert amo.calls == ['user', 'user']
+
+
+def test_warm_up(amo, monkeypatch):
+    monkeypatch.setattr(amo_metadata, 'AmoApi', lambda integration: amo)
+    amo_metadata.load_account_metadata(amo.integration)
+
+    assert amo_metadata.get_user_name(amo, 6) == 'Олег'
+    assert amo_metadata.get_custom_fields(amo, 'contacts')[0]['name'] == 'Источник'
+    amo_metadata.get_pipelines(amo)
+    assert amo.calls == ['pipelines', 'custom_fields_leads', 'custom_fields_contacts', 'custom_fields_companies']
+    assert amo_metadata_cache.get_stats()['kinds']['users']['hit_rate'] == 1
@@ -0,0 +1,95 @@
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+
+from data.models import ModeQuestionType
+from modules.analytics import ReportSnapshot, parse_number
+
+
+SCORE_ID = 1
+MANAGER_ID = 2
+
+
+@pytest.fixture
+def snapshot():
+    """
+    Снимок отчета без БД: 6 задач за две недели, оценка звонка и менеджер.
+    """
+    snapshot = ReportSnapshot(report_id=1)
+    snapshot._reset({
+        SCORE_ID: {'answer_type': ModeQuestionType.INTEGER, 'short_name': 'Оценка', 'crm_id': None},
+        MANAGER_ID: {'answer_type': ModeQuestionType.STRING, 'short_name': 'Менеджер',
+                     'crm_id': 'responsible_user_name'},
+    })
+    snapshot.task_ids = np.arange(1, 7, dtype=np.int64)
+    snapshot.created = np.array([
+        datetime(2024, 1, 1, 10), datetime(2024, 1, 2, 11), datetime(2024, 1, 3, 12),
+        datetime(2024, 1, 8, 10), datetime(2024, 1, 9, 11), datetime(2024, 1, 10, 12),
+    ], dtype='datetime64[s]')
+    snapshot.numeric[SCORE_ID] = np.array([10, 20, np.nan, 40, 50, 60], dtype=np.float64)
+    snapshot.categories[MANAGER_ID] = ['Анна', 'Иван']
+    snapshot.codes[MANAGER_ID] = np.array([0, 1, 0, 0, 1, -1], dtype=np.int32)
+    return snapshot
+
+
+def test_parse_number():
+    assert parse_number(' 85% ') == 85
+    assert np.isnan(parse_number('нет'))
+    assert np.isnan(parse_number(None))
+
+
+def test_aggregate_without_groups(snapshot):
+    result = snapshot.query(
+        from_date=date(2024, 1, 1),
+        to_date=date(2024, 1, 31),
+        group_by=[],
+        metrics=[
+            {'operation': 'count'},
+            {'question_id': SCORE_ID, 'operation': 'avg'},
+            {'question_id': SCORE_ID, 'operation': 'median'},
+            {'question_id': SCORE_ID, 'operation': 'max'},
+        ],
+    )
+    assert result['tasks_count'] == 6
+    assert result['groups'][0]['values'] == [6, 36.0, 40.0, 60.0]
+
+
+def test_crosstab_by_week_and_manager(snapshot):
+    result = snapshot.query(
+        from_date=date(2024, 1, 1),
+        to_date=date(2024, 1, 31),
+        group_by=['week', 'crm:responsible_user_name'],
+        metrics=[{'question_id': SCORE_ID, 'operation': 'sum'}],
+        with_deltas=True,
+    )
+    groups = {(x['key']['week'], x['key']['crm:responsible_user_name']): x for x in result['groups']}
+
+    assert groups[(date(2024, 1, 1), 'Анна')]['values'] == [10.0]
+    assert groups[(date(2024, 1, 1), 'Иван')]['values'] == [20.0]
+    assert groups[(date(2024, 1, 8), 'Анна')]['values'] == [40.0]
+    assert groups[(date(2024, 1, 8), None)]['values'] == [60.0]
+
+    # Разница с той же группой предыдущей недели.
+    assert groups[(date(2024, 1, 8), 'Иван')]['deltas'] == [30.0]
+    assert groups[(date(2024, 1, 1), 'Иван')]['deltas'] == [None]
+
+
+def test_distribution_and_histogram(snapshot):
+    result = snapshot.query(
+        from_date=date(2024, 1, 1),
+        to_date=date(2024, 1, 7),
+        group_by=['day'],
+        metrics=[
+            {'question_id': MANAGER_ID, 'operation': 'distribution'},
+            {'question_id': SCORE_ID, 'operation': 'histogram', 'bins': 2},
+        ],
+    )
+    assert [x['key']['day'] for x in result['groups']] == [date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 3)]
+    assert [x['values'][0] for x in result['groups']] == [{'Анна': 1}, {'Иван': 1}, {'Анна': 1}]
+    assert result['groups'][0]['values'][1] == {'edges': [10.0, 15.0, 20.0], 'counts': [1, 0]}
+
+
+def test_unknown_dimension(snapshot):
+    with pytest.raises(ValueError):
+        snapshot.query(date(2024, 1, 1), date(2024, 1, 31), ['crm:unknown'], [{'operation': 'count'}])
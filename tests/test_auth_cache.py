@@ -0,0 +1,32 @@
+import json
+from datetime import datetime
+
+from config import config as cfg
+from helpers import auth_cache
+from schemas.user import AuthContext
+
+
+def make_context(user_id: int) -> AuthContext:
+    return AuthContext(id=user_id, created=datetime.now(), tg_id=None, full_name=None, email=None,
+                       company_id=1, company_role='admin', is_admin=False)
+
+
+def test_invalidation_is_sent_to_other_processes(monkeypatch):
+    auth_cache.invalidate_auth_context()
+    notifications = []
+    monkeypatch.setattr(auth_cache.main_db, 'execute_sql', lambda sql, params: notifications.append(params))
+    auth_cache._cache[1] = (float('inf'), make_context(1))
+
+    auth_cache.invalidate_auth_context_everywhere(1)
+    assert 1 not in auth_cache._cache
+    assert notifications == [(cfg.AUTH_CACHE_CHANNEL, json.dumps({'user_id': 1}))]
+
+    # Процесс сервера сбрасывает контекст по уведомлению.
+    auth_cache._cache[1] = (float('inf'), make_context(1))
+    auth_cache._cache[2] = (float('inf'), make_context(2))
+    auth_cache.apply_auth_invalidation(notifications[0][1])
+    assert list(auth_cache._cache) == [2]
+
+    auth_cache.apply_auth_invalidation('not json')
+    auth_cache.apply_auth_invalidation(json.dumps({'user_id': None}))
+    assert auth_cache._cache == {}
@@ -0,0 +1,139 @@
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+import pytest
+
+from integrations.bitrix.bitrix_api import Bitrix24, encode_command
+from integrations.bitrix.metadata import bitrix_metadata_cache
+from integrations.bitrix.process_bitrix_webhook import get_crm_context
+
+
+def fake_method(method: str, params: dict):
+    if method == 'user.get':
+        return [{'ID': params['id'], 'NAME': 'Иван', 'LAST_NAME': 'Петров', 'UF_DEPARTMENT': [7]}]
+    if method == 'department.get':
+        return [{'ID': params['ID'], 'NAME': f'Отдел {params["ID"]}'}]
+    if method == 'crm.contact.get':
+        return {'ID': params['id']}
+    if method == 'crm.deal.get':
+        return {'ID': params['id'], 'CATEGORY_ID': '3', 'STAGE_ID': 'C3:NEW'}
+    if method == 'crm.dealcategory.stage.list':
+        return [{'STATUS_ID': f'C{params["id"]}:NEW', 'NAME': 'Новая'}]
+    if method == 'crm.status.list':
+        return [{'STATUS_ID': 'NEW', 'NAME': 'Новая (основная воронка)'}]
+    if method == 'crm.category.list':
+        return {'categories': [{'id': 3, 'name': 'Продажи'}]}
+    if method == 'echo':
+        return params
+    raise KeyError(method)
+
+
+class FakeBitrixHandler(BaseHTTPRequestHandler):
+    """
+    Метод batch REST API Битрикс24 с подстановкой ссылок $result[...] внутри запроса.
+    """
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests.append((self.path, body))
+
+        results, errors = {}, {}
+        for key, command in body['cmd'].items():
+            method, _, query = command.partition('?')
+            params = {}
+            for name, value in parse_qsl(query):
+                ref = re.match(r'^\$result\[([^\]]+)\](.*)$', value)
+                if ref:
+                    value = results.get(ref.group(1))
+                    for part in re.findall(r'\[([^\]]*)\]', ref.group(2)):
+                        value = value[int(part) if isinstance(value, list) else part]
+                params[name] = value
+            try:
+                results[key] = fake_method(method, params)
+            except (KeyError, TypeError):
+                errors[key] = {'error': 'ERROR_METHOD_NOT_FOUND', 'error_description': method}
+
+        data = json.dumps({'result': {'result': results, 'result_error': errors or [], 'result_next': []}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def bx24():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeBitrixHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    bitrix = Bitrix24(f'http://127.0.0.1:{server.server_address[1]}/rest/1/secret/')
+    bitrix.fake_server = server
+
+    # Отдельные запросы (метаданные портала) выполняются через библиотеку bitrix24.
+    bitrix.method_calls = []
+
+    def call_method(method, params=None, **kwargs):
+        bitrix.method_calls.append(method)
+        return fake_method(method, params or kwargs)
+
+    bitrix.bx24.callMethod = call_method
+    bitrix_metadata_cache.clear()
+    yield bitrix
+    bitrix_metadata_cache.clear()
+    server.shutdown()
+
+
+def test_encode_command():
+    command = encode_command('crm.deal.list', {'filter': {'>ID': 5, 'TITLE': 'a&b c'}, 'select': ['ID', 'TITLE']})
+    assert command == 'crm.deal.list?filter[%3EID]=5&filter[TITLE]=a%26b%20c&select[0]=ID&select[1]=TITLE'
+    assert encode_command('department.get', {'ID': '$result[user][0][UF_DEPARTMENT][0]'}) == \
+        'department.get?ID=$result[user][0][UF_DEPARTMENT][0]'
+
+
+def test_batch_split_and_references(bx24):
+    batch = bx24.new_batch()
+    batch.add('user', 'user.get', {'id': 1})
+    batch.add('department', 'department.get', {'ID': batch.ref('user', 0, 'UF_DEPARTMENT', 0)})
+    for i in range(100):
+        batch.add(f'echo_{i}', 'echo', {'value': i})
+    # Команда из третьего запроса ссылается на результат первого.
+    batch.add('late_department', 'department.get', {'ID': batch.ref('user', 0, 'UF_DEPARTMENT', 0)})
+    batch.add('unknown', 'unknown.method')
+    results = batch.execute()
+
+    assert [path for path, _ in bx24.fake_server.requests] == ['/rest/1/secret/batch.json'] * 3
+    assert [len(body['cmd']) for _, body in bx24.fake_server.requests] == [50, 50, 4]
+    assert results['department'][0]['NAME'] == 'Отдел 7'
+    assert results['late_department'][0]['NAME'] == 'Отдел 7'
+    assert bx24.fake_server.requests[2][1]['cmd']['late_department'] == 'department.get?ID=7'
+    assert results['echo_99'] == {'value': '99'}
+    assert 'unknown' not in results and 'unknown' in batch.errors
+
+
+def test_crm_context_with_metadata_cache(bx24):
+    bindings = [{'entityTypeId': 3, 'entityId': 10}, {'entityTypeId': 2, 'entityId': 20}]
+    for _ in range(3):
+        context = get_crm_context(bx24, 'CONTACT', 10, bindings, call_info={}, portal_user_id=1,
+                                  system_fields=['department', 'pipeline', 'stage'])
+
+        assert context['entity'] == {'ID': '10'}
+        assert context['entity_deal']['ID'] == '20'
+        assert context['department_name'] == 'Отдел 7'
+        assert context['user']['LAST_NAME'] == 'Петров'
+        assert context['funnels'] == [{'ID': '3', 'NAME': 'Продажи'}]
+        # Этапы воронки 3 сделки контакта.
+        assert context['stages'] == [{'STATUS_ID': 'C3:NEW', 'NAME': 'Новая'}]
+
+    # Сущности – одним batch на вебхук, метаданные портала – один раз.
+    assert len(bx24.fake_server.requests) == 3
+    assert sorted(bx24.method_calls) == ['crm.category.list', 'crm.dealcategory.stage.list',
+                                         'department.get', 'user.get']
+    stats = bitrix_metadata_cache.get_stats()['kinds']
+    assert stats['stages'] == {'hits': 2, 'stale_hits': 0, 'misses': 1, 'coalesced': 0,
+                               'refreshes': 0, 'errors': 0, 'hit_rate': 0.667}
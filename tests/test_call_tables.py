@@ -0,0 +1,57 @@
+import peewee
+
+from data.call_tables import format_answer_value, get_call_table, get_indexed_columns
+from data.filters import compile_call_table_filters, compile_task_filters
+from data.models import ModeQuestion, ModeQuestionType, TableActiveFilter, Task
+
+
+def test_format_answer_value():
+    date_column = {'id': 1, 'name': 'q_1', 'answer_type': ModeQuestionType.DATE}
+    assert format_answer_value(date_column, '2024-03-15') == '15.03.2024'
+    assert format_answer_value(date_column, 'не указана') == 'не указана'
+    assert format_answer_value({'id': 2, 'name': 'q_2', 'answer_type': ModeQuestionType.INTEGER}, 42) == 42
+
+
+def test_call_table_filters():
+    calls = get_call_table(1)
+    score = ModeQuestion(id=5, answer_type=ModeQuestionType.INTEGER)
+    manager = ModeQuestion(id=6, answer_type=ModeQuestionType.STRING)
+    filters = [
+        TableActiveFilter(mode_question=score, operation='greater_or_equal', value='20'),
+        TableActiveFilter(mode_question=manager, operation='contains', value='Анна'),
+    ]
+
+    sql, params = peewee.Select([calls], [calls.c.task_id]).where(compile_call_table_filters(calls, filters)).sql()
+    # Числа сравниваются как числа по типизированной колонке, без подзапросов к ModeAnswer.
+    assert '"q_5" >= ' in sql
+    assert 20 in params
+    assert 'modeanswer' not in sql
+
+    assert compile_call_table_filters(calls, []) is None
+
+
+def test_malformed_numeric_filter_matches_nothing():
+    calls = get_call_table(1)
+    score = ModeQuestion(id=5, answer_type=ModeQuestionType.PERCENT)
+    filters = [TableActiveFilter(mode_question=score, operation='greater_or_equal', value='abc')]
+    sql, params = peewee.Select([calls], [calls.c.task_id]).where(compile_call_table_filters(calls, filters)).sql()
+    assert 'FALSE' in sql
+
+    filters = [TableActiveFilter(mode_question=score, operation='greater_or_equal', value='50%')]
+    sql, params = peewee.Select([calls], [calls.c.task_id]).where(compile_call_table_filters(calls, filters)).sql()
+    assert 50 in params
+
+    sql, params = Task.select(Task.id).where(compile_task_filters(filters)).sql()
+    assert 50 in params
+
+
+def test_only_numeric_and_date_columns_are_indexed():
+    columns = [
+        {'id': 1, 'name': 'q_1', 'answer_type': ModeQuestionType.INTEGER},
+        {'id': 2, 'name': 'q_2', 'answer_type': ModeQuestionType.PERCENT},
+        {'id': 3, 'name': 'q_3', 'answer_type': ModeQuestionType.DATE},
+        {'id': 4, 'name': 'q_4', 'answer_type': ModeQuestionType.STRING},
+        {'id': 5, 'name': 'q_5', 'answer_type': ModeQuestionType.MULTIPLE_CHOICE},
+    ]
+    # Длинные текстовые ответы не помещаются в строку btree-индекса.
+    assert [x['name'] for x in get_indexed_columns(columns)] == ['q_1', 'q_2', 'q_3']
@@ -0,0 +1,76 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+from config import config as cfg
+from helpers.chart_cache import ChartDataCache
+
+
+def test_lru_eviction_and_stats():
+    cache = ChartDataCache(max_size=2, redis_url=None)
+    keys = [cache.make_key(1, 1, chart_id, date(2024, 1, 1), date(2024, 1, 31)) for chart_id in range(3)]
+
+    for i, key in enumerate(keys):
+        cache.set(key, [{'value': i}], ttl=60)
+
+    # Самая старая запись вытеснена.
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) == [{'value': 2}]
+
+    stats = cache.get_stats()
+    assert stats['local_hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['local_size'] == 2
+
+
+def test_expired_entry_is_miss():
+    cache = ChartDataCache(max_size=10, redis_url=None)
+    key = cache.make_key(1, 1, 1, date(2024, 1, 1), date(2024, 1, 1))
+    cache.set(key, [], ttl=0)
+    assert cache.get(key) is None
+
+
+def test_version_changes_key():
+    from_date = to_date = date(2024, 1, 1)
+    assert ChartDataCache.make_key(1, 1, 1, from_date, to_date) != ChartDataCache.make_key(1, 2, 1, from_date, to_date)
+
+
+def test_past_range_has_long_ttl():
+    today = date.today()
+    assert ChartDataCache.get_ttl(today - timedelta(days=1)) == cfg.CHART_CACHE_PAST_TTL
+    assert ChartDataCache.get_ttl(today) == cfg.CHART_CACHE_TTL
+
+
+def test_past_range_key_ignores_report_version(monkeypatch):
+    from routers.lk import chart as chart_router
+
+    versions = {'version': 1, 'range_version': '1.0'}
+    computed = []
+    monkeypatch.setattr(chart_router, 'chart_cache', ChartDataCache(max_size=10, redis_url=None))
+    monkeypatch.setattr(chart_router.ReportVersion, 'get_version', lambda report_id: versions['version'])
+    monkeypatch.setattr(chart_router.ReportVersion, 'get_range_version',
+                        lambda report_id, from_date, to_date: versions['range_version'])
+    relative_filter = SimpleNamespace(operation='last_x_days')
+    monkeypatch.setattr(chart_router, 'get_active_chart_filters',
+                        lambda chart_ids: defaultdict(list, {2: [relative_filter]}))
+
+    def make_charts_data(charts, report_id, from_date, to_date):
+        computed.extend(x.id for x in charts)
+        return {x.id: [] for x in charts}
+    monkeypatch.setattr(chart_router, 'make_charts_data', make_charts_data)
+
+    charts = [SimpleNamespace(id=1), SimpleNamespace(id=2)]
+    yesterday = date.today() - timedelta(days=1)
+    chart_router.get_cached_charts_data(charts, 1, yesterday - timedelta(days=6), yesterday)
+    assert computed == [1, 2]
+
+    # Завершение сегодняшней задачи не сбрасывает прошедший диапазон.
+    # График с фильтром «Последние X дней» зависит от текущей даты и кэшируется по версии отчета.
+    versions['version'] = 2
+    chart_router.get_cached_charts_data(charts, 1, yesterday - timedelta(days=6), yesterday)
+    assert computed == [1, 2, 2]
+
+    # Изменение ответов задач диапазона сбрасывает его.
+    versions['range_version'] = '1.1'
+    chart_router.get_cached_charts_data(charts, 1, yesterday - timedelta(days=6), yesterday)
+    assert computed == [1, 2, 2, 1]
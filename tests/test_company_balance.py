@@ -1,7 +1,9 @@
+from datetime import timedelta
+
 import pytest
 
 from config import config as cfg
-from data.models import ReconnectPostgresqlDatabase, User, Company, Transaction
+from data.models import ReconnectPostgresqlDatabase, User, Company, Transaction, BalanceEntry, BalanceHold
 from helpers.db_helpers import not_enough_company_balance
 
 
@@ -25,6 +27,8 @@ def setup_db():
         User,
         Company,
         Transaction,
+        BalanceHold,
+        BalanceEntry,
     ]
     for model in models:
         model._meta.database = test_db
@@ -247,3 +251,54 @@ def test_balance_sufficient(setup_db):
     result = not_enough_company_balance(company1, 12)
     assert result is True
 
+
+
+def test_hold_capture_and_release(setup_db):
+    """
+    Резерв уменьшает доступный баланс, списание попадает в seconds_balance после компакции.
+    """
+    company1 = setup_db['company1']
+    company1.seconds_balance = 600
+    company1.save(only=['seconds_balance'])
+
+    hold = BalanceHold.place(company1, 300)
+    assert company1.get_available_balance() == 300
+    assert company1.get_balance() == 600
+    assert not_enough_company_balance(company1, 301) is True
+
+    # Повторное закрытие резерва ничего не меняет.
+    assert hold.capture() is not None
+    assert hold.capture() is None
+    assert hold.release() is False
+    assert company1.get_balance() == 300
+    assert company1.get_available_balance() == 300
+    assert Company.get(id=company1.id).seconds_balance == 600
+
+    BalanceEntry.compact()
+    assert Company.get(id=company1.id).seconds_balance == 300
+    assert company1.get_balance() == 300
+
+    hold = BalanceHold.place(company1, 120)
+    assert company1.get_available_balance() == 180
+    assert hold.release() is True
+    assert company1.get_available_balance() == 300
+
+    # Резерв больше доступного баланса не создается.
+    assert BalanceHold.place(company1, 301) is None
+
+
+def test_expired_hold_is_captured(setup_db):
+    """
+    Зависший резерв не уменьшает доступный баланс, но списывается, если обработка звонка завершилась.
+    """
+    company1 = setup_db['company1']
+    company1.seconds_balance = 600
+    company1.save(only=['seconds_balance'])
+
+    hold = BalanceHold.place(company1, 300)
+    assert BalanceHold.release_expired(timedelta(0)) == 1
+    assert company1.get_available_balance() == 600
+
+    assert hold.capture() is not None
+    assert hold.capture() is None
+    assert company1.get_balance() == 300
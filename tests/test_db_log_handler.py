@@ -0,0 +1,96 @@
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from helpers import db_helpers
+from helpers.db_helpers import DBLogHandler
+
+
+def make_message(text: str, request_log_id=1):
+    extra = {'request_log_id': request_log_id} if request_log_id else {}
+    return SimpleNamespace(record={
+        'time': datetime.now(),
+        'level': SimpleNamespace(name='INFO'),
+        'message': text,
+        'extra': extra,
+    })
+
+
+class FakeDB:
+    """
+    Запоминает пачки строк вместо записи в RequestLogLine. Запись можно задержать (release).
+    """
+    def __init__(self):
+        self.batches = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def insert_many(self, rows):
+        def execute():
+            self.entered.set()
+            self.release.wait(5)
+            self.batches.append(list(rows))
+        return SimpleNamespace(execute=execute)
+
+    def messages(self) -> list:
+        return [row['message'] for batch in self.batches for row in batch]
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    fake_db = FakeDB()
+    monkeypatch.setattr(db_helpers.main_db, 'connect', lambda reuse_if_open=False: None)
+    monkeypatch.setattr(db_helpers.RequestLogLine, 'insert_many', fake_db.insert_many)
+    return fake_db
+
+
+def wait_for(condition, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_rows_are_written_in_batches(fake_db):
+    handler = DBLogHandler(max_queue_size=100, batch_size=3, flush_interval=1)
+    for i in range(7):
+        handler.write(make_message(str(i)))
+    # Строки без RequestLog не пишутся в БД.
+    handler.write(make_message('no request', request_log_id=None))
+
+    assert wait_for(lambda: len(fake_db.batches) == 2)
+
+    # Неполная пачка дописывается через flush_interval или при остановке.
+    handler.stop()
+    assert [len(x) for x in fake_db.batches] == [3, 3, 1]
+    assert fake_db.messages() == [str(x) for x in range(7)]
+
+
+def test_incomplete_batch_is_flushed_on_interval(fake_db):
+    handler = DBLogHandler(max_queue_size=100, batch_size=100, flush_interval=0.1)
+    handler.write(make_message('first'))
+    handler.write(make_message('second'))
+
+    assert wait_for(lambda: len(fake_db.batches) == 1, timeout=2)
+    assert fake_db.messages() == ['first', 'second']
+    handler.stop()
+
+
+def test_rows_are_dropped_on_overflow(fake_db):
+    fake_db.release.clear()
+    handler = DBLogHandler(max_queue_size=2, batch_size=1, flush_interval=1)
+
+    # Первую строку забрал поток, ее запись в БД ждет. Очередь вмещает еще две строки.
+    handler.write(make_message('0'))
+    assert fake_db.entered.wait(5)
+    for i in range(1, 5):
+        handler.write(make_message(str(i)))
+    assert handler.dropped_count == 2
+
+    fake_db.release.set()
+    handler.stop()
+    assert fake_db.messages() == ['0', '1', '2']
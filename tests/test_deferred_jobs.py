@@ -0,0 +1,131 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from config import config as cfg
+from data.models import ReconnectPostgresqlDatabase, DeferredJob
+from helpers import deferred_jobs
+from helpers.deferred_jobs import DeferredScheduler, defer, deferred_handler
+
+
+# Тестовая временная база данных.
+test_db = ReconnectPostgresqlDatabase(
+    cfg.PYTEST_TEMP_POSTGRES_DB,
+    host=cfg.PYTEST_TEMP_POSTGRES_HOST,
+    port=cfg.PYTEST_TEMP_POSTGRES_PORT,
+    sslmode=cfg.PYTEST_TEMP_POSTGRES_SSL_MODE,
+    user=cfg.PYTEST_TEMP_POSTGRES_USER,
+    password=cfg.PYTEST_TEMP_POSTGRES_PASSWORD,
+    target_session_attrs='read-write',
+)
+
+calls = []
+
+
+@deferred_handler('test_job')
+def run_test_job(value, fail=False):
+    if fail:
+        raise ValueError('Ошибка обработки')
+    calls.append(value)
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    scheduler = DeferredScheduler(workers=2, sweep_interval=3600)
+    monkeypatch.setattr(deferred_jobs, 'deferred_scheduler', scheduler)
+    calls.clear()
+    yield scheduler
+    scheduler.stop()
+
+
+@pytest.fixture
+def setup_db():
+    DeferredJob._meta.database = test_db
+    test_db.bind([DeferredJob])
+    test_db.connect()
+    test_db.create_tables([DeferredJob])
+    yield
+    test_db.drop_tables([DeferredJob])
+    test_db.close()
+
+
+def test_pending_jobs_use_no_threads(scheduler, monkeypatch):
+    ran = []
+    monkeypatch.setattr(scheduler, 'sweep', lambda include_future=False: 0)
+    monkeypatch.setattr(scheduler, 'run_job', ran.append)
+    scheduler.start()
+    threads_before = threading.active_count()
+
+    now = datetime.now()
+    for job_id in range(1000):
+        scheduler.schedule(job_id, now + timedelta(seconds=600))
+    scheduler.schedule(1000, now + timedelta(seconds=0.2))
+
+    assert threading.active_count() == threads_before
+    assert scheduler.get_stats()['pending'] == 1001
+
+    deadline = time.monotonic() + 5
+    while not ran and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert ran == [1000]
+    assert scheduler.get_stats()['pending'] == 1000
+
+
+def test_defer_and_run(setup_db, scheduler):
+    job = defer('test_job', 60, value=1)
+    defer('test_job', 0, value=2)
+
+    due = scheduler.pop_due()
+    assert job.id not in due
+    assert [scheduler.run_job(x) for x in due] == [True]
+    assert calls == [2]
+    # Выполненная задача удаляется и не запускается повторно.
+    assert not scheduler.run_job(due[0])
+    assert DeferredJob.select().count() == 1
+
+    # Задачу другого процесса подбирает проверка БД, когда ее время наступит.
+    DeferredJob.update(run_after=datetime.now()).where(DeferredJob.id == job.id).execute()
+    scheduler._heap.clear()
+    scheduler._scheduled.clear()
+    assert scheduler.sweep() == 1
+    assert scheduler.run_job(scheduler.pop_due()[0])
+    assert calls == [2, 1]
+
+
+def test_failed_job_is_not_repeated(setup_db, scheduler):
+    job = defer('test_job', 0, value=1, fail=True)
+
+    assert scheduler.run_job(job.id)
+    job = DeferredJob.get_by_id(job.id)
+    assert job.finished is not None
+    assert job.last_error == 'ValueError: Ошибка обработки'
+    assert not scheduler.run_job(job.id)
+    assert scheduler.get_stats()['failed'] == 1
+
+
+def test_interrupted_job_is_not_restarted(setup_db, scheduler):
+    job = defer('test_job', 0, value=1)
+    stale = datetime.now() - timedelta(seconds=cfg.DEFERRED_JOB_STALE_SEC + 1)
+    DeferredJob.update(started=stale, heartbeat=stale).where(DeferredJob.id == job.id).execute()
+
+    # Начатая задача не запускается повторно, а прерванная завершается с ошибкой.
+    assert not scheduler.run_job(job.id)
+    assert scheduler.fail_interrupted() == 1
+    job = DeferredJob.get_by_id(job.id)
+    assert job.finished is not None
+    assert job.last_error
+    assert calls == []
+
+
+def test_running_job_sends_heartbeat(setup_db, scheduler):
+    job = defer('test_job', 0, value=1)
+    stale = datetime.now() - timedelta(seconds=cfg.DEFERRED_JOB_STALE_SEC + 1)
+    DeferredJob.update(started=stale, heartbeat=stale).where(DeferredJob.id == job.id).execute()
+
+    # Задача еще выполняется процессом: отметка обновлена, задача не считается прерванной.
+    scheduler._running_ids.add(job.id)
+    scheduler.send_heartbeat()
+    assert scheduler.fail_interrupted() == 0
+    assert DeferredJob.get_by_id(job.id).finished is None
@@ -0,0 +1,179 @@
+import threading
+import time
+
+import pytest
+
+from fastapi.testclient import TestClient
+
+from helpers import metadata_cache
+from helpers.metadata_cache import MetadataCache, apply_invalidation
+from integrations.bitrix.metadata import bitrix_metadata_cache, get_event_kinds
+from routers import bitrix
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Loader:
+    def __init__(self, delay: float = 0):
+        self.calls = 0
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            self.calls += 1
+            calls = self.calls
+        time.sleep(self.delay)
+        return [{'ID': str(x)} for x in range(calls)]
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def cache(clock):
+    return MetadataCache('test', ttl=60, stale_ttl=600, max_size=3, min_refresh_interval=10, clock=clock)
+
+
+def test_single_flight(cache):
+    loader = Loader(delay=0.2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('portal', 'funnels', loader)))
+               for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loader.calls == 1
+    assert results == [[{'ID': '0'}]] * 10
+    stats = cache.get_stats()['kinds']['funnels']
+    assert stats['misses'] == 1 and stats['coalesced'] == 9
+
+
+def test_loader_error_is_not_cached(cache):
+    def fail():
+        raise RuntimeError('portal is down')
+
+    with pytest.raises(RuntimeError):
+        cache.get('portal', 'users', fail, subkey='1')
+    assert cache.get('portal', 'users', lambda: {'ID': '1'}, subkey='1') == {'ID': '1'}
+    assert cache.get_stats()['kinds']['users']['errors'] == 1
+
+
+def test_stale_while_revalidate(cache, clock):
+    loader = Loader(delay=0.1)
+    assert cache.get('portal', 'funnels', loader) == [{'ID': '0'}]
+
+    # Устаревшая запись отдается сразу, обновление идет в фоне.
+    clock.now = 100
+    assert cache.get('portal', 'funnels', loader) == [{'ID': '0'}]
+    assert cache.get('portal', 'funnels', loader) == [{'ID': '0'}]
+    cache._executor.shutdown(wait=True)
+    assert loader.calls == 2
+    assert cache.get('portal', 'funnels', loader) == [{'ID': '0'}, {'ID': '1'}]
+
+    # После stale_ttl запись загружается синхронно.
+    clock.now = 1000
+    assert len(cache.get('portal', 'funnels', loader)) == 3
+    stats = cache.get_stats()['kinds']['funnels']
+    assert stats['stale_hits'] == 2 and stats['refreshes'] == 1 and stats['misses'] == 2
+
+
+def test_is_valid_refreshes_unknown_id(cache, clock):
+    loader = Loader()
+    cache.get('portal', 'funnels', loader)
+
+    def has_funnel(funnels):
+        return any(x['ID'] == '1' for x in funnels)
+
+    # Сразу после загрузки запись не перезагружается, даже если ID в ней нет.
+    assert cache.get('portal', 'funnels', loader, is_valid=has_funnel) == [{'ID': '0'}]
+    clock.now = 20
+    assert has_funnel(cache.get('portal', 'funnels', loader, is_valid=has_funnel))
+    assert loader.calls == 2
+
+
+def test_invalidate_and_max_size(cache):
+    for i in range(3):
+        cache.get('portal', 'users', lambda: i, subkey=i)
+    cache.get('other', 'funnels', lambda: [])
+    assert cache.get_stats()['size'] == 3
+
+    assert cache.invalidate('portal', ['funnels']) == 0
+    assert cache.invalidate('portal', ['users']) == 2
+    assert cache.get('portal', 'users', lambda: 'new', subkey=1) == 'new'
+
+    cache.invalidate('other')
+    assert cache.get('other', 'funnels', lambda: ['new']) == ['new']
+
+
+def test_invalidate_during_load(cache):
+    """
+    Результат загрузки, начатой до сброса, не сохраняется.
+    """
+    def load():
+        cache.invalidate('portal')
+        return 'old'
+
+    assert cache.get('portal', 'stages', load) == 'old'
+    assert cache.get('portal', 'stages', lambda: 'new') == 'new'
+
+
+def test_hit_rate(cache):
+    for _ in range(4):
+        cache.get('portal', 'stages', lambda: [], subkey='0')
+    assert cache.get_stats()['kinds']['stages']['hit_rate'] == 0.75
+
+
+def test_bitrix_event_kinds():
+    assert get_event_kinds('ONCRMDEALUSERFIELDUPDATE') == ['fields']
+    assert get_event_kinds('ONUSERADD') == ['users', 'departments']
+    assert get_event_kinds('ONCRMDEALUPDATE') == []
+    assert get_event_kinds('onCrmDealCategoryAdd') == ['funnels', 'stages']
+    assert get_event_kinds('ONAPPUNINSTALL') is None
+
+
+def test_invalidation_notification(cache, monkeypatch):
+    notifications = []
+    monkeypatch.setattr(metadata_cache.main_db, 'execute_sql', lambda sql, params: notifications.append(params[1]))
+    cache.put('portal', 'stages', 'old')
+    cache.put('portal', 'users', 'old')
+
+    # Сброс в одном процессе рассылается остальным, они сбрасывают те же записи.
+    assert cache.invalidate_everywhere('portal', ['stages']) == 1
+    cache.put('portal', 'stages', 'old')
+    apply_invalidation(notifications[0])
+    assert cache.get('portal', 'stages', lambda: 'new') == 'new'
+    assert cache.get('portal', 'users', lambda: 'new') == 'old'
+
+    # Некорректное уведомление не ломает поток подписки.
+    apply_invalidation('{"cache": "unknown"}')
+
+
+def test_bitrix_event_requires_application_token(monkeypatch):
+    from server import server
+
+    invalidated = []
+    monkeypatch.setattr(bitrix, 'check_application_token', lambda domain, token: token == 'secret')
+    monkeypatch.setattr(bitrix_metadata_cache, 'invalidate_everywhere',
+                        lambda domain, kinds: invalidated.append((domain, kinds)))
+    client = TestClient(server)
+    body = {'event': 'ONCRMDEALUSERFIELDUPDATE', 'auth[domain]': 'portal.bitrix24.ru'}
+
+    for token in ('', 'wrong'):
+        response = client.post('/bitrix_webhook/events', data={**body, 'auth[application_token]': token})
+        assert response.status_code == 403
+    assert invalidated == []
+
+    response = client.post('/bitrix_webhook/events', data={**body, 'auth[application_token]': 'secret'})
+    assert response.status_code == 200
+    assert invalidated == [('portal.bitrix24.ru', ['fields'])]
@@ -0,0 +1,20 @@
+from data.models import Task, ModeAnswer, GSpreadTask
+from data.partitions import get_partition_indexes
+
+
+def test_partition_indexes_include_composite_indexes():
+    task_indexes = {name: (columns, unique) for name, columns, unique in get_partition_indexes(Task)}
+    assert task_indexes['task_report_id_created_part'] == (['report_id', 'created'], False)
+    assert task_indexes['task_request_log_id_part'] == (['request_log_id'], False)
+
+    answer_indexes = {name: columns for name, columns, _ in get_partition_indexes(ModeAnswer)}
+    assert answer_indexes['modeanswer_question_id_task_id_part'] == ['question_id', 'task_id']
+    assert answer_indexes['modeanswer_created_part'] == ['created']
+
+
+def test_no_foreign_keys_to_partitioned_tables():
+    # Ссылки на партиционированные таблицы не создают ограничений FOREIGN KEY.
+    for model in (Task, ModeAnswer, GSpreadTask):
+        sql, _ = model._schema._create_table().query()
+        assert 'REFERENCES "task"' not in sql
+        assert 'REFERENCES "requestlog"' not in sql
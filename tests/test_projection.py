@@ -0,0 +1,21 @@
+import pytest
+from fastapi import HTTPException
+
+from data.models import Task
+from routers.helpers import get_projection_fields
+from schemas.task import TaskPublicSchema
+
+
+def test_projection_fields():
+    sql, _ = Task.select(*get_projection_fields(Task, TaskPublicSchema, 'status, report_id,status')).sql()
+    # id выбирается всегда, внешние ключи возвращаются под именем колонки.
+    assert sql.startswith('SELECT "t1"."id" AS "id", "t1"."status" AS "status", "t1"."report_id" AS "report_id" FROM')
+
+    all_fields = get_projection_fields(Task, TaskPublicSchema)
+    assert len(all_fields) == len(TaskPublicSchema.model_fields)
+
+
+def test_projection_unknown_field():
+    with pytest.raises(HTTPException) as ex:
+        get_projection_fields(Task, TaskPublicSchema, 'id,hashed_password')
+    assert ex.value.status_code == 400
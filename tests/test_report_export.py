@@ -0,0 +1,46 @@
+import csv
+import io
+from datetime import datetime
+
+import pyarrow.parquet as pq
+
+from data.models import ModeQuestionType
+from modules.report_export import iter_csv, iter_parquet
+
+
+COLUMNS = [
+    {'id': 5, 'name': 'q_5', 'answer_type': ModeQuestionType.INTEGER, 'short_name': 'Оценка'},
+    {'id': 6, 'name': 'q_6', 'answer_type': ModeQuestionType.DATE, 'short_name': 'Оценка'},
+]
+
+
+def make_batches():
+    """
+    Две пачки строк в порядке колонок запроса таблицы звонков.
+    """
+    return iter([
+        [(1, datetime(2024, 1, 1, 10), False, None, 120, 85, '2024-03-15')],
+        [(2, datetime(2024, 1, 2), True, 'main', None, None, None)],
+    ])
+
+
+def test_csv_export():
+    chunks = list(iter_csv(make_batches(), COLUMNS))
+    # Заголовок и по одной части на пачку.
+    assert len(chunks) == 2
+
+    rows = list(csv.reader(io.StringIO(b''.join(chunks).decode('utf-8-sig'))))
+    assert rows[0][-2:] == ['Оценка', 'Оценка (6)']
+    assert rows[1][-2:] == ['85', '15.03.2024']
+    assert len(rows) == 3
+
+
+def test_parquet_export():
+    chunks = list(iter_parquet(make_batches(), COLUMNS))
+    parquet_file = pq.ParquetFile(io.BytesIO(b''.join(chunks)))
+
+    assert parquet_file.num_row_groups == 2
+    rows = parquet_file.read().to_pylist()
+    assert rows[0]['Оценка'] == 85
+    assert rows[0]['Оценка (6)'] == '15.03.2024'
+    assert rows[1]['Длительность, сек.'] is None
@@ -0,0 +1,42 @@
+import json
+from datetime import datetime
+
+import peewee
+
+from data.search import format_headline, get_document_expression, get_task_transcript, HEADLINE_START, HEADLINE_STOP
+from data.models import Task, TaskSearchDocument
+
+
+def test_format_headline():
+    headline = f'звонок <script> про {HEADLINE_START}конкурента{HEADLINE_STOP}'
+    assert format_headline(headline) == 'звонок &lt;script&gt; про <mark>конкурента</mark>'
+    # Фрагмент без совпадений не показывается.
+    assert format_headline('начало транскрипта') is None
+    assert format_headline(None) is None
+
+
+def test_document_weights():
+    sql, params = TaskSearchDocument.select(get_document_expression('транскрипт', None)).sql()
+    assert sql.count('setweight(to_tsvector(') == 2
+    assert params == ['russian', '', 'A', 'russian', 'транскрипт', 'B']
+
+
+def test_task_transcript_backfill(monkeypatch):
+    updates = []
+    monkeypatch.setattr(peewee.ModelUpdate, 'execute', lambda self, database=None: updates.append(self) or 1)
+    loaded = []
+
+    def load_transcript(task):
+        loaded.append(task.id)
+        return 'Менеджер: Здравствуйте'
+
+    task = Task(id=1, created=datetime(2024, 1, 1), data=json.dumps({'transcript': 'Клиент: Добрый день'}),
+                transcript_id='t1')
+    assert get_task_transcript(task, load_transcript) == 'Клиент: Добрый день'
+
+    # Задача, обработанная до сохранения транскрипта в Task.data.
+    task = Task(id=2, created=datetime(2024, 1, 1), data='{}', transcript_id='t2')
+    assert get_task_transcript(task) is None
+    assert get_task_transcript(task, load_transcript) == 'Менеджер: Здравствуйте'
+    assert loaded == [2]
+    assert len(updates) == 1
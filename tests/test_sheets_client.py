@@ -0,0 +1,45 @@
+from integrations.gs_api.sheets_client import SheetsClientPool, SpreadsheetBatch
+
+
+def run_cycle(pool: SheetsClientPool, sheet_ids: list, tasks_per_sheet: int):
+    """
+    Цикл выгрузки: по одной вставке строки на задачу, один пакет на таблицу.
+    """
+    for sheet_id in sheet_ids:
+        batch = SpreadsheetBatch(pool.open(sheet_id))
+        worksheet = pool.get_first_worksheet(sheet_id)
+        for task_number in range(tasks_per_sheet):
+            batch.insert_rows(worksheet, [[f'задача {task_number}']], 3)
+        batch.update_values(worksheet, 'A2', [['Дата', 'Ответ']])
+        batch.format(worksheet, 'A2:B2', {'textFormat': {'bold': True}})
+        batch.execute()
+
+
+def test_requests_per_spreadsheet(pool, fake_server):
+    sheet_ids = ['sheet-a', 'sheet-b', 'sheet-c']
+
+    run_cycle(pool, sheet_ids, tasks_per_sheet=50)
+    # Открытие таблицы и первого листа, затем batchUpdate и values.batchUpdate.
+    assert len(fake_server.requests) == 4 * len(sheet_ids)
+
+    fake_server.requests.clear()
+    run_cycle(pool, sheet_ids, tasks_per_sheet=200)
+    # Таблицы уже открыты: количество запросов не зависит от количества задач.
+    assert len(fake_server.requests) == 2 * len(sheet_ids)
+
+
+def test_batch_payload(pool, fake_server):
+    run_cycle(pool, ['sheet-a'], tasks_per_sheet=3)
+    batch_update, values_update = [x for x in fake_server.requests if x[0] == 'POST']
+
+    assert batch_update[1] == '/v4/spreadsheets/sheet-a:batchUpdate'
+    insert = batch_update[2]['requests'][0]['insertDimension']['range']
+    assert (insert['startIndex'], insert['endIndex']) == (2, 5)
+    assert 'repeatCell' in batch_update[2]['requests'][1]
+
+    assert values_update[1] == '/v4/spreadsheets/sheet-a/values:batchUpdate'
+    rows_range, header_range = values_update[2]['data']
+    assert rows_range['range'] == "'Лист1'!A3"
+    # Строки, добавленные позже, оказываются выше – как при вставке по одной.
+    assert rows_range['values'] == [['задача 2'], ['задача 1'], ['задача 0']]
+    assert header_range['values'] == [['Дата', 'Ответ']]
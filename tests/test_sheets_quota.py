@@ -0,0 +1,113 @@
+import pytest
+from gspread.exceptions import APIError
+
+from integrations.gs_api.quota import SheetsQuota, TokenBucket
+from integrations.gs_api.sheets_client import SpreadsheetBatch
+from upload_google import UploadScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(60, capacity=2, clock=clock)
+
+    assert bucket.acquire(clock.sleep) == 0
+    assert bucket.acquire(clock.sleep) == 0
+    # Корзина пуста: следующий токен – через секунду.
+    assert bucket.get_wait() == pytest.approx(1)
+    assert bucket.acquire(clock.sleep) == pytest.approx(1)
+
+    bucket.pause(30)
+    assert bucket.get_wait() == pytest.approx(30)
+
+
+def test_retry_after(pool, fake_server):
+    clock = FakeClock()
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock.sleep(seconds)
+
+    quota = SheetsQuota(account_rate=10 ** 6, spreadsheet_rate=10 ** 6, max_attempts=3, sleep=sleep, clock=clock)
+    fake_server.errors = [(429, 7), (503, None)]
+
+    batch = SpreadsheetBatch(pool.open('sheet-a'), quota=quota)
+    batch.update_values(pool.get_first_worksheet('sheet-a'), 'A2', [['Дата']])
+    batch.execute()
+
+    assert len([x for x in fake_server.requests if x[0] == 'POST']) == 3
+    # После 429 ждем не меньше Retry-After (корзина аккаунта приостановлена для всех таблиц),
+    # после 5xx – экспоненциальная задержка.
+    assert sleeps[0] >= 7
+    assert 0.5 <= sleeps[-1] <= 2
+    assert clock.now >= 7
+    assert quota.get_stats()['errors'] == {'429': 1, '503': 1}
+
+
+def test_retry_limit(pool, fake_server):
+    quota = SheetsQuota(account_rate=10 ** 6, spreadsheet_rate=10 ** 6, max_attempts=2, sleep=lambda x: None)
+    fake_server.errors = [(500, None), (500, None), (500, None)]
+
+    batch = SpreadsheetBatch(pool.open('sheet-a'), quota=quota)
+    batch.update_values(pool.get_first_worksheet('sheet-a'), 'A2', [['Дата']])
+    with pytest.raises(APIError):
+        batch.execute()
+    assert quota.retries == 1
+
+
+def test_insert_is_retried_only_on_429(pool, fake_server):
+    quota = SheetsQuota(account_rate=10 ** 6, spreadsheet_rate=10 ** 6, max_attempts=3, sleep=lambda x: None)
+    worksheet = pool.get_first_worksheet('sheet-a')
+
+    # Вставка строк могла выполниться до ответа 5xx: повтор вставил бы строки дважды.
+    fake_server.errors = [(503, None)]
+    batch = SpreadsheetBatch(pool.open('sheet-a'), quota=quota)
+    batch.insert_rows(worksheet, [['задача 1']], 3)
+    with pytest.raises(APIError):
+        batch.execute()
+    assert len([x for x in fake_server.requests if x[0] == 'POST']) == 1
+
+    # Ответ 429 означает, что запрос не выполнен.
+    fake_server.errors = [(429, None)]
+    batch = SpreadsheetBatch(pool.open('sheet-a'), quota=quota)
+    batch.insert_rows(worksheet, [['задача 1']], 3)
+    batch.execute()
+    assert quota.retries == 1
+
+
+class FakeReport:
+    def __init__(self, report_id: int):
+        self.id = report_id
+        self.sheet_id = f'sheet-{report_id}'
+
+
+def test_round_robin(tmp_path, monkeypatch):
+    monkeypatch.setattr('config.config.UPLOAD_GOOGLE_STATUS_PATH', str(tmp_path / 'status.json'))
+    reports = [FakeReport(1), FakeReport(2), FakeReport(3)]
+    rows = {1: list(range(5)), 2: [0], 3: list(range(2))}
+    uploads = []
+
+    def upload(report, chunk):
+        uploads.append(report.id)
+        return True
+
+    scheduler = UploadScheduler(reports, chunk_size=1, upload=upload, load_tasks=lambda x: rows[x.id],
+                                quota=SheetsQuota(account_rate=10 ** 6, spreadsheet_rate=10 ** 6))
+    scheduler.run(max_workers=1)
+
+    # Большой отчет 1 не задерживает отчеты 2 и 3.
+    assert uploads == [1, 2, 3, 1, 3, 1, 1, 1]
+    stats = scheduler.get_stats()
+    assert (stats['queue_depth'], stats['uploaded_rows']) == (0, 8)
+    assert (tmp_path / 'status.json').exists()
@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import pytest
+
+from helpers import tg_helpers
+from helpers.tg_helpers import get_user_info
+
+
+class FakeClient:
+    """
+    Клиент Pyrogram: get_users по списку ID или по одному ID. Неизвестный ID в пачке – ошибка всей пачки.
+    """
+    def __init__(self, known_ids):
+        self.known_ids = set(known_ids)
+        self.calls = []
+
+    def get_users(self, user_ids):
+        self.calls.append(user_ids)
+        ids = user_ids if isinstance(user_ids, list) else [user_ids]
+        if not set(ids) <= self.known_ids:
+            raise ValueError('Peer id invalid')
+        users = [SimpleNamespace(id=x, first_name=f'Имя {x}', last_name=None, username=f'user{x}') for x in ids]
+        return users if isinstance(user_ids, list) else users[0]
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    tg_helpers._user_info_cache.clear()
+    yield
+    tg_helpers._user_info_cache.clear()
+
+
+def test_batches_and_cache(monkeypatch):
+    monkeypatch.setattr(tg_helpers, 'GET_USERS_BATCH_SIZE', 2)
+    cli = FakeClient(known_ids=[1, 2, 3])
+
+    info = get_user_info(cli, [1, 2, 3])
+    assert cli.calls == [[1, 2], [3]]
+    assert info[3] == {'tg_id': 3, 'full_name': 'Имя 3', 'username': 'user3'}
+
+    cli.calls.clear()
+    assert get_user_info(cli, [1, 3]) == {1: info[1], 3: info[3]}
+    assert cli.calls == []
+
+
+def test_unknown_user_fallback():
+    cli = FakeClient(known_ids=[1])
+
+    info = get_user_info(cli, [1, 5])
+    # Пачка не получена – пользователи запрашиваются по одному.
+    assert cli.calls == [[1, 5], 1, 5]
+    assert info[5] == {'tg_id': 5, 'full_name': '', 'username': ''}
+
+    # Неполученный профиль не кэшируется.
+    cli.calls.clear()
+    get_user_info(cli, [1, 5])
+    assert cli.calls == [[5], 5]
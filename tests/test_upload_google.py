@@ -0,0 +1,82 @@
+from upload_google import write_keyed_rows, KEY_COLUMN_HEADER, UploadService
+
+
+def get_batches(fake_server):
+    return [x[2] for x in fake_server.requests if x[1].endswith(':batchUpdate')]
+
+
+def test_upsert_by_key(pool, fake_server):
+    # Строка 3 – задача 7, строка 4 – задача 5.
+    fake_server.first_column = ['', KEY_COLUMN_HEADER, '7', '5']
+
+    write_keyed_rows(pool.open('sheet-a'), pool.get_first_worksheet('sheet-a'), {'5': ['обновлено'], '9': ['новая']})
+    structure, values = get_batches(fake_server)
+
+    insert, keys = structure['requests']
+    assert (insert['insertDimension']['range']['startIndex'], insert['insertDimension']['range']['endIndex']) == (2, 3)
+    # Ключ новой строки пишется вместе со вставкой.
+    assert keys['updateCells']['rows'] == [{'values': [{'userEnteredValue': {'stringValue': '9'}}]}]
+
+    # Новая строка – на месте вставки, строка задачи 5 сдвинулась с 4 на 5.
+    assert values['data'] == [
+        {'range': "'Лист1'!A3", 'values': [['9', 'новая']]},
+        {'range': "'Лист1'!A5", 'values': [['5', 'обновлено']]},
+    ]
+
+
+def test_adds_hidden_key_column(pool, fake_server):
+    fake_server.first_column = ['', 'Дата добавления звонка']
+
+    write_keyed_rows(pool.open('sheet-a'), pool.get_first_worksheet('sheet-a'), {'1': ['a'], '2': ['b']})
+    structure, values = get_batches(fake_server)
+
+    request_types = [list(x)[0] for x in structure['requests']]
+    assert request_types == ['insertDimension', 'insertDimension', 'updateDimensionProperties', 'updateCells']
+    assert structure['requests'][1]['insertDimension']['range']['dimension'] == 'COLUMNS'
+    # Последняя задача – сверху.
+    assert values['data'][0] == {'range': "'Лист1'!A3", 'values': [['2', 'b'], ['1', 'a']]}
+    assert values['data'][1] == {'range': "'Лист1'!A2", 'values': [[KEY_COLUMN_HEADER]]}
+
+
+class FakeListener:
+    """
+    Уведомления по шагам: каждый вызов wait() сдвигает время на timeout и возвращает очередную пачку.
+    """
+    def __init__(self, clock, batches):
+        self.clock = clock
+        self.batches = list(batches)
+
+    def wait(self, timeout):
+        self.clock.now += timeout
+        return self.batches.pop(0) if self.batches else set()
+
+    def close(self):
+        pass
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_service_debounce_and_sweep():
+    clock = FakeClock()
+    uploads = []
+    listener = FakeListener(clock, [set(), {1}, {1, 2}, set(), set(), set(), set(), {3}])
+    service = UploadService(listener=listener, debounce_sec=2, sweep_interval=100, clock=clock,
+                            upload=lambda report_ids=None, stop_event=None: uploads.append((clock.now, report_ids)))
+
+    for _ in range(10):
+        service.run_once()
+
+    # Полная проверка при запуске, затем каждый отчет – через 2 секунды после его первого уведомления
+    # (повторное уведомление об отчете 1 не откладывает выгрузку).
+    assert uploads == [(0, None), (3, [1]), (4, [2]), (9, [3])]
+
+    clock.now = 200
+    service.run_once()
+    assert uploads[-1] == (200, None)
+    assert service.due == {}
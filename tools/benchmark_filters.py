@@ -0,0 +1,168 @@
+"""
+Сравнение фильтрации задач через EXISTS (data/filters.py) с прежним способом
+(OR всех условий по ModeAnswer + HAVING COUNT = n) на синтетических данных.
+
+Данные создаются во временной тестовой базе (PYTEST_TEMP_POSTGRES_*) и удаляются после замера:
+    python -m tools.benchmark_filters --tasks 20000 --questions 12
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from functools import reduce
+from typing import List
+
+import peewee
+from loguru import logger
+
+from config import config as cfg
+from data.filters import compile_task_filters
+from data.models import ReconnectPostgresqlDatabase, ALL_MODELS, Integration, Report, ModeQuestion, ModeAnswer, \
+    ModeQuestionType, Task, ChartFilter, ColumnFilter
+
+
+test_db = ReconnectPostgresqlDatabase(
+    cfg.PYTEST_TEMP_POSTGRES_DB,
+    host=cfg.PYTEST_TEMP_POSTGRES_HOST,
+    port=cfg.PYTEST_TEMP_POSTGRES_PORT,
+    sslmode=cfg.PYTEST_TEMP_POSTGRES_SSL_MODE,
+    user=cfg.PYTEST_TEMP_POSTGRES_USER,
+    password=cfg.PYTEST_TEMP_POSTGRES_PASSWORD,
+    target_session_attrs='read-write',
+)
+
+QUESTION_TYPES = [ModeQuestionType.INTEGER, ModeQuestionType.STRING, ModeQuestionType.MULTIPLE_CHOICE]
+CHOICES = ['Да', 'Нет', 'Не знаю', 'Перезвонить']
+WORDS = ['доставка', 'оплата', 'возврат', 'скидка', 'качество', 'сроки', 'менеджер', 'цена']
+
+
+def legacy_filter_query(filters: List[ChartFilter], task_ids: peewee.ModelSelect) -> peewee.ModelSelect:
+    """
+    Прежняя реализация filter_tasks / filter_chart_tasks.
+    """
+    total_expr = reduce(
+        lambda acc, x: acc | ((ModeAnswer.question == x.mode_question)
+                              & ColumnFilter.build(ModeAnswer.answer_text, x.mode_question.answer_type,
+                                                   x.operation, x.value)),
+        filters,
+        False,
+    )
+    return (
+        Task
+        .select(Task.id)
+        .where(Task.id.in_(task_ids))
+        .join(ModeAnswer)
+        .where(total_expr)
+        .group_by(Task.id)
+        .having(peewee.fn.COUNT(Task.id) == len(filters))
+    )
+
+
+def create_synthetic_data(tasks_count: int, questions_count: int, batch_size: int = 1000) -> Report:
+    integration = Integration.create(service_name='custom', account_id=f'benchmark-{time.time()}')
+    report = Report.create(name='benchmark', integration=integration, final_model='benchmark')
+
+    questions = []
+    for i in range(questions_count):
+        answer_type = QUESTION_TYPES[i % len(QUESTION_TYPES)]
+        questions.append(ModeQuestion.create(
+            is_active=True,
+            report=report,
+            short_name=f'question {i}',
+            column_index=i + 1,
+            question_text=f'question {i}',
+            answer_type=answer_type,
+        ))
+
+    now = datetime.now()
+    for start in range(0, tasks_count, batch_size):
+        with test_db.atomic():
+            created = [now - timedelta(minutes=random.randint(0, 60 * 24 * 60))
+                       for _ in range(min(batch_size, tasks_count - start))]
+            task_ids = [
+                row[0] for row in
+                Task.insert_many([{'report': report, 'status': Task.StatusChoices.DONE, 'created': x} for x in created])
+                .returning(Task.id)
+                .tuples()
+                .execute()
+            ]
+
+            answers = []
+            for task_id, task_created in zip(task_ids, created):
+                for question in questions:
+                    if question.answer_type == ModeQuestionType.INTEGER:
+                        answer_text = str(random.randint(0, 100))
+                    elif question.answer_type == ModeQuestionType.MULTIPLE_CHOICE:
+                        answer_text = random.choice(CHOICES)
+                    else:
+                        answer_text = ' '.join(random.sample(WORDS, 3))
+                    answers.append({'task': task_id, 'question': question, 'answer_text': answer_text,
+                                    'created': task_created})
+            ModeAnswer.insert_many(answers).execute()
+
+    test_db.execute_sql('ANALYZE')
+    return report
+
+
+def make_filters(report: Report, filters_count: int) -> List[ChartFilter]:
+    """
+    Несохраненные фильтры по первым filters_count вопросам отчета.
+    """
+    filters = []
+    for question in ModeQuestion.select().where(ModeQuestion.report == report).order_by(ModeQuestion.column_index):
+        if len(filters) == filters_count:
+            break
+        if question.answer_type == ModeQuestionType.INTEGER:
+            filters.append(ChartFilter(mode_question=question, operation='greater_or_equal', value='20'))
+        elif question.answer_type == ModeQuestionType.MULTIPLE_CHOICE:
+            filters.append(ChartFilter(mode_question=question, operation='contains_one_of', value='["Да", "Нет"]'))
+        else:
+            filters.append(ChartFilter(mode_question=question, operation='contains', value='оплата'))
+    return filters
+
+
+def measure(query: peewee.SelectQuery, repeats: int) -> tuple:
+    timings = []
+    count = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        count = query.count()
+        timings.append((time.perf_counter() - started) * 1000)
+    return count, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tasks', type=int, default=20000)
+    parser.add_argument('--questions', type=int, default=12)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    for model in ALL_MODELS:
+        model._meta.database = test_db
+    test_db.bind(ALL_MODELS, bind_refs=True, bind_backrefs=True)
+    test_db.connect()
+    test_db.create_tables(ALL_MODELS)
+
+    try:
+        logger.info(f'Создаем {args.tasks} задач с {args.questions} ответами.')
+        report = create_synthetic_data(args.tasks, args.questions)
+        task_ids = Task.select(Task.id).where(Task.report == report,
+                                              Task.created >= datetime.now() - timedelta(days=30))
+
+        for filters_count in sorted({1, 3, args.questions // 2, args.questions}):
+            filters = make_filters(report, filters_count)
+            legacy_count, legacy_ms = measure(legacy_filter_query(filters, task_ids), args.repeats)
+            exists_count, exists_ms = measure(task_ids.where(compile_task_filters(filters)), args.repeats)
+            # Прежний способ сравнивает числа как строки, поэтому количество задач может отличаться.
+            logger.info(f'Фильтров: {filters_count:>3}. '
+                        f'OR + HAVING: {legacy_ms:8.1f} мс ({legacy_count} задач). '
+                        f'EXISTS: {exists_ms:8.1f} мс ({exists_count} задач).')
+    finally:
+        test_db.drop_tables(ALL_MODELS)
+        test_db.close()
+
+
+if __name__ == '__main__':
+    main()
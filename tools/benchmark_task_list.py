@@ -0,0 +1,119 @@
+"""
+Размер ответа и время формирования страницы списка задач (/v2/lk/tasks):
+прежний способ (TaskPublicSchema.model_validate + стандартный json) против выборки
+только нужных колонок (fields=) с сериализацией orjson, без сжатия и с gzip.
+
+Задачи с подробным транскриптом (advance_transcript) создаются во временной тестовой базе
+(PYTEST_TEMP_POSTGRES_*) и удаляются после замера:
+    python -m tools.benchmark_task_list --tasks 500 --words 3000
+"""
+import argparse
+import gzip
+import json
+import random
+import statistics
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from loguru import logger
+
+from data.models import ALL_MODELS, Integration, Report, Task
+from routers.lk.task import get_tasks_list
+from schemas.task import TaskPublicSchema
+from schemas.user import UserModel
+from tools.benchmark_filters import test_db
+
+
+WORDS = ['здравствуйте', 'доставка', 'оплата', 'заказ', 'менеджер', 'перезвоню', 'спасибо', 'скидка']
+FIELDS = 'id,created,status,is_archived,duration_sec,report_id'
+
+
+def make_task_data(words_count: int) -> str:
+    words = []
+    start = 0
+    for _ in range(words_count):
+        end = start + random.randint(100, 700)
+        words.append({'text': random.choice(WORDS), 'start': start, 'end': end,
+                      'confidence': round(random.random(), 4), 'speaker': random.choice('AB')})
+        start = end
+    transcript = ' '.join(x['text'] for x in words)
+    return json.dumps({
+        'transcript': transcript,
+        'settings': {'advance_transcript': True},
+        'result': {'advance_transcript_data': {'audio_duration': start // 1000, 'text': transcript, 'words': words}},
+    })
+
+
+def create_synthetic_data(tasks_count: int, words_count: int) -> Report:
+    integration = Integration.create(service_name='custom', account_id=f'benchmark-{time.time()}')
+    report = Report.create(name='benchmark', integration=integration, final_model='benchmark')
+    with test_db.atomic():
+        for _ in range(tasks_count):
+            Task.create(report=report, status=Task.StatusChoices.DONE, duration_sec=random.randint(10, 900),
+                        analyze_data=json.dumps({str(i): ' '.join(random.sample(WORDS, 5)) for i in range(20)}),
+                        data=make_task_data(words_count))
+    return report
+
+
+def legacy_tasks_list(report: Report, limit: int) -> bytes:
+    """
+    Прежняя реализация: все колонки, model_validate и JSONResponse.
+    """
+    tasks = Task.select().where(Task.report == report).limit(limit).order_by(Task.id.desc())
+    response = {
+        'total_count': Task.select().where(Task.report == report).count(),
+        'count': tasks.count(),
+        'items': [TaskPublicSchema.model_validate(x) for x in tasks],
+    }
+    # Так ответ сериализует FastAPI при response_model=Dict.
+    return JSONResponse(jsonable_encoder(response)).body
+
+
+def projected_tasks_list(report: Report, limit: int, fields: Optional[str]) -> bytes:
+    return get_tasks_list(UserModel(id=0, created=datetime.now(), is_admin=True), report_id=report.id, status=None, is_archived=None,
+                          source=None, table_settings_id=None, fields=fields, limit=limit, offset=0).body
+
+
+def measure(name: str, make_body: Callable[[], bytes], repeats: int) -> None:
+    timings = []
+    body = b''
+    for _ in range(repeats):
+        started = time.perf_counter()
+        body = make_body()
+        timings.append((time.perf_counter() - started) * 1000)
+    p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+    logger.info(f'{name:<32} {len(body) / 1024:10.1f} КБ (gzip {len(gzip.compress(body)) / 1024:8.1f} КБ), '
+                f'медиана {statistics.median(timings):8.1f} мс, p95 {p95:8.1f} мс')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tasks', type=int, default=500)
+    parser.add_argument('--words', type=int, default=3000)
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    for model in ALL_MODELS:
+        model._meta.database = test_db
+    test_db.bind(ALL_MODELS, bind_refs=True, bind_backrefs=True)
+    test_db.connect()
+    test_db.create_tables(ALL_MODELS)
+
+    try:
+        logger.info(f'Создаем {args.tasks} задач по {args.words} слов в транскрипте.')
+        report = create_synthetic_data(args.tasks, args.words)
+
+        measure('model_validate + json', lambda: legacy_tasks_list(report, args.tasks), args.repeats)
+        measure('все поля + orjson', lambda: projected_tasks_list(report, args.tasks, None), args.repeats)
+        measure(f'fields={FIELDS} + orjson', lambda: projected_tasks_list(report, args.tasks, FIELDS),
+                args.repeats)
+    finally:
+        test_db.drop_tables(ALL_MODELS)
+        test_db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,9 +2,18 @@ from typing import Optional, List
 
 from loguru import logger
 
-from data.models import main_db, Mode, Integration, IntegrationServiceName, User
+from data.call_tables import rebuild_call_table
+from data.models import main_db, Mode, Integration, IntegrationServiceName, User, Task, ModeAnswer, ChartRollup, \
+    ChartRollupChoice, CallTableState, Report, TaskSearchDocument, GSpreadTask, ReportVersion, ReportDayVersion, \
+    IntegratorCompany
+from data.partitions import convert_all_to_partitioned, ensure_partitions
+from data.rollups import rebuild_rollups
+from data.search import rebuild_search_index
+from helpers.auth_cache import invalidate_auth_context_everywhere
 from integrations.amo_crm.amo_api_core import AmoApi
 from integrations.bitrix.bitrix_api import Bitrix24
+from modules.assembly import Assembly
+from modules.report_generator import ReportGenerator
 from routers.lk import get_password_hash
 
 
@@ -143,6 +152,116 @@ def update_password(user_id: int, new_password: str):
         user.save()
 
 
+def add_integrator_company(user_id: int, company_id: int):
+    """
+    Делает пользователя интегратором компании.
+    """
+    with main_db:
+        IntegratorCompany.get_or_create(integrator=user_id, company=company_id)
+        invalidate_auth_context_everywhere(user_id)
+        logger.info(f'Пользователь {user_id} – интегратор компании {company_id}.')
+
+
+def remove_integrator_company(user_id: int, company_id: int):
+    """
+    Удаляет связь интегратора с компанией.
+    """
+    with main_db:
+        deleted = (IntegratorCompany
+                   .delete()
+                   .where(IntegratorCompany.integrator == user_id, IntegratorCompany.company == company_id)
+                   .execute())
+        invalidate_auth_context_everywhere(user_id)
+        logger.info(f'Удалено связей интегратора {user_id} с компанией {company_id}: {deleted}.')
+
+
+def partition_tables():
+    """
+    Разовая миграция: партиционирование таблиц Task, ModeAnswer, RequestLog и RequestLogLine по месяцам.
+    Уже партиционированные таблицы пропускаются, поэтому команду можно запускать повторно для новых таблиц.
+    """
+    logger.info('Партиционируем таблицы.')
+
+    with main_db:
+        convert_all_to_partitioned()
+        ensure_partitions()
+
+    logger.info('Партиционирование завершено.')
+
+
+def create_chart_indexes():
+    """
+    Разовая миграция: составные индексы Task и ModeAnswer для построения графиков.
+    """
+    with main_db:
+        for model in (Task, ModeAnswer):
+            model._schema.create_indexes(safe=True)
+            logger.info(f'Индексы таблицы {model._meta.table_name} созданы.')
+
+
+def rebuild_chart_rollups(report_id: Optional[int] = None):
+    """
+    Заполняет почасовые агрегаты графиков по всем отчетам (или по одному отчету).
+    """
+    with main_db:
+        ChartRollup.create_table(safe=True)
+        ChartRollupChoice.create_table(safe=True)
+        rebuild_rollups(report_id)
+
+
+def add_gspread_task_last_error_column():
+    """
+    Добавляет в таблицу GSpreadTask колонку last_error (текст ошибки последней попытки выгрузки).
+    """
+    with main_db:
+        main_db.execute_sql(f'ALTER TABLE "{GSpreadTask._meta.table_name}" ADD COLUMN IF NOT EXISTS last_error TEXT')
+        logger.info('Колонка GSpreadTask.last_error добавлена.')
+
+
+def add_report_day_versions():
+    """
+    Добавляет в таблицу ReportVersion колонку settings_version и создает таблицу ReportDayVersion
+    (версии данных прошедших диапазонов для кэша графиков).
+    """
+    with main_db:
+        main_db.execute_sql(f'ALTER TABLE "{ReportVersion._meta.table_name}" '
+                            f'ADD COLUMN IF NOT EXISTS settings_version BIGINT NOT NULL DEFAULT 1')
+        ReportDayVersion.create_table(safe=True)
+        logger.info('Колонка ReportVersion.settings_version и таблица ReportDayVersion добавлены.')
+
+
+def build_call_tables(report_id: Optional[int] = None):
+    """
+    Строит таблицы звонков по всем отчетам (или по одному отчету).
+    """
+    with main_db:
+        CallTableState.create_table(safe=True)
+        if report_id is None:
+            report_ids = [x.id for x in Report.select(Report.id).order_by(Report.id)]
+        else:
+            report_ids = [report_id]
+        for x in report_ids:
+            rebuild_call_table(x)
+
+
+def load_transcript_text(task: Task) -> Optional[str]:
+    """
+    Текст транскрипта задачи из AssemblyAI (для задач, обработанных до сохранения транскрипта в Task.data).
+    """
+    transcript = Assembly('').get_transcript_by_id(task.transcript_id)
+    return ReportGenerator(transcript=transcript).generate_transcript()
+
+
+def build_search_index(report_id: Optional[int] = None, load_missing_transcripts: bool = True):
+    """
+    Индексирует для полнотекстового поиска все завершенные задачи (или задачи одного отчета).
+    load_missing_transcripts – загрузить из AssemblyAI транскрипты задач, у которых их нет в Task.data.
+    """
+    with main_db:
+        TaskSearchDocument.create_table(safe=True)
+        rebuild_search_index(report_id, load_transcript=load_transcript_text if load_missing_transcripts else None)
+
+
 def main():
     pass
 
@@ -1,14 +1,28 @@
 import json
+import os
+import signal
+import threading
 import time
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
 
+from gspread import Spreadsheet, Worksheet
 from loguru import logger
 
 from config import config as cfg
-from data.models import GSpreadTask, Task, Report
-from integrations.gs_api.sheets import SheetsApi
+from data.models import main_db, GSpreadTask, Task, Report
+from integrations.gs_api.quota import SheetsQuota, sheets_quota
+from integrations.gs_api.sheets_client import sheets_pool, SpreadsheetBatch
+from integrations.gs_api.upload_events import UploadListener
+
+
+# Строка заголовков таблицы и строка, перед которой вставляются новые строки.
+HEADER_ROW = 2
+INSERT_ROW = 3
+# Заголовок скрытой колонки A с ключом строки (ID задачи).
+KEY_COLUMN_HEADER = 'task_id'
 
 
 def prepare_row(values_to_upload: str) -> List[str]:
@@ -30,20 +44,83 @@ def prepare_row(values_to_upload: str) -> List[str]:
     return row
 
 
-def update_google_report(
-        report: Report,
-        chunk_size: int = 2000,
-):
+def get_row_keys(worksheet: Worksheet, quota: SheetsQuota) -> Optional[Dict[str, int]]:
+    """
+    Номера строк таблицы по ключам (ID задачи) из скрытой колонки A.
+    None – в таблице еще нет колонки ключей.
+    """
+    column = quota.call(worksheet.spreadsheet_id, lambda: worksheet.col_values(1))
+    if len(column) < HEADER_ROW or column[HEADER_ROW - 1] != KEY_COLUMN_HEADER:
+        return None
+    return {value: index + 1 for index, value in enumerate(column) if index >= HEADER_ROW and value}
+
+
+def add_key_column(batch: SpreadsheetBatch, worksheet: Worksheet) -> None:
+    """
+    Добавляет в начало листа скрытую колонку с ключами строк. Остальные колонки сдвигаются вправо.
+    """
+    batch.add_request({
+        'insertDimension': {
+            'range': {'sheetId': worksheet.id, 'dimension': 'COLUMNS', 'startIndex': 0, 'endIndex': 1},
+            'inheritFromBefore': False,
+        },
+    })
+    batch.add_request({
+        'updateDimensionProperties': {
+            'range': {'sheetId': worksheet.id, 'dimension': 'COLUMNS', 'startIndex': 0, 'endIndex': 1},
+            'properties': {'hiddenByUser': True},
+            'fields': 'hiddenByUser',
+        },
+    })
+    batch.update_values(worksheet, f'A{HEADER_ROW}', [[KEY_COLUMN_HEADER]])
+
+
+def write_keyed_rows(spreadsheet: Spreadsheet, worksheet: Worksheet, rows: Dict[str, list]) -> None:
     """
-    Обновляет Гугл Таблицу для переданного Мода.
+    Записывает строки по ключам: существующие строки обновляются, новые вставляются в начало таблицы.
+    Ключи новых строк пишутся в том же batchUpdate, что и вставка, поэтому после сбоя при записи значений
+    следующая попытка найдет строки по ключам и обновит их, а не вставит повторно.
     """
-    insert_row = 3
+    batch = SpreadsheetBatch(spreadsheet)
+
+    row_keys = get_row_keys(worksheet, batch.quota)
+    if row_keys is None:
+        add_key_column(batch, worksheet)
+        row_keys = {}
+
+    # Новые строки – в порядке добавления задач, последняя задача – сверху.
+    new_keys = [key for key in rows if key not in row_keys][::-1]
+    if new_keys:
+        batch.insert_rows(worksheet, [[key] + rows[key] for key in new_keys], INSERT_ROW)
+        batch.add_request({
+            'updateCells': {
+                'range': {'sheetId': worksheet.id, 'startRowIndex': INSERT_ROW - 1,
+                          'endRowIndex': INSERT_ROW - 1 + len(new_keys), 'startColumnIndex': 0, 'endColumnIndex': 1},
+                'rows': [{'values': [{'userEnteredValue': {'stringValue': key}}]} for key in new_keys],
+                'fields': 'userEnteredValue',
+            },
+        })
 
-    task_ids_and_values = (
+    for key, row in rows.items():
+        if key in row_keys:
+            # Строки ниже места вставки сдвигаются на количество новых строк.
+            row_number = row_keys[key] + (len(new_keys) if row_keys[key] >= INSERT_ROW else 0)
+            batch.update_values(worksheet, f'A{row_number}', [[key] + row])
+
+    batch.execute()
+
+
+def get_pending_tasks(report: Report) -> List[GSpreadTask]:
+    """
+    Строки задач отчета, еще не выгруженные в Гугл Таблицу, в порядке добавления.
+    """
+    pending_tasks = (
         GSpreadTask
         .select(
             GSpreadTask.id,
+            GSpreadTask.task,
             GSpreadTask.values_to_upload,
+            GSpreadTask.retry_count,
         )
         .where(
             GSpreadTask.uploaded.is_null(),
@@ -55,51 +132,66 @@ def update_google_report(
         )
         .order_by(GSpreadTask.id.asc())
     )
+    return list(pending_tasks)
 
 
-    # Количество успешно загруженных строк.
-    uploaded_count = 0
+def upload_chunk(report: Report, tasks_chunk: List[GSpreadTask]) -> bool:
+    """
+    Выгружает часть строк отчета одним пакетом изменений таблицы.
 
-    for chunk_start in range(0, len(task_ids_and_values), chunk_size):
-        tasks_chunk = task_ids_and_values[chunk_start:chunk_start + chunk_size]
+    Строка задачи ищется по ключу (ID задачи) в скрытой колонке A: повторная выгрузка той же задачи
+    обновляет ее строку. Выгруженными отмечаются только задачи успешно записанной части,
+    для остальных в GSpreadTask сохраняются количество попыток и текст последней ошибки.
+    """
+    # Строки по ключам. Если задача выгружается несколько раз, остается последняя строка.
+    rows = {}
+    for chunk_item in tasks_chunk:
+        rows[str(chunk_item.task_id)] = prepare_row(chunk_item.values_to_upload)
 
-        # Набор строк со значениями ячеек.
-        rows = []
-        for chunk_item in tasks_chunk:
-            row = prepare_row(chunk_item.values_to_upload)
-            rows.append(row)
-        reversed_rows = list(reversed(rows))
+    attempt_time = datetime.now()
+    error = None
 
-        attempt_time = datetime.now()
-        uploaded_date = None
+    try:
+        write_keyed_rows(sheets_pool.open(report.sheet_id), sheets_pool.get_first_worksheet(report.sheet_id), rows)
+    except Exception as ex:
+        logger.error(f'Ошибка при выгрузке в Гугл Таблицу Отчет {report.id}: {ex}')
+        error = f'{type(ex).__name__}: {ex}'[:1000]
+        # Таблицу откроем заново: ее могли удалить, переименовать лист или закрыть доступ.
+        sheets_pool.invalidate(report.sheet_id)
 
-        try:
-            # Выгрузка строк в Гугл Таблицу.
-            api = SheetsApi(report.sheet_id)
-            # Выгрузка в новые строки.
-            api.insert_rows(reversed_rows, insert_row)
-        except Exception as ex:
-            logger.error(f'Ошибка при выгрузке в Гугл Таблицу Отчет {report.id}: {ex}')
-        else:
-            uploaded_date = attempt_time
-            uploaded_count += len(rows)
-
-        # Обновляем статусы задач.
-        task_ids = [x.id for x in task_ids_and_values]
-        chunk_tasks = GSpreadTask.select().where(GSpreadTask.id.in_(task_ids))
-        for t in chunk_tasks:
-            t.retry_count += 1
-            t.last_attempt = attempt_time
-            # Если задача успешно выполнена.
-            if uploaded_date is not None:
-                t.uploaded = uploaded_date
-
-        # Обновляем в БД только те поля, которые действительно изменили.
-        update_fields = [GSpreadTask.retry_count, GSpreadTask.last_attempt]
-        if uploaded_date is not None:
-            update_fields.append(GSpreadTask.uploaded)
-
-        GSpreadTask.bulk_update(chunk_tasks, fields=update_fields, batch_size=500)
+    # Обновляем статусы задач только этой части.
+    for t in tasks_chunk:
+        t.retry_count += 1
+        t.last_attempt = attempt_time
+        t.last_error = error
+        if error is None:
+            t.uploaded = attempt_time
+
+    # Обновляем в БД только те поля, которые действительно изменили.
+    update_fields = [GSpreadTask.retry_count, GSpreadTask.last_attempt, GSpreadTask.last_error]
+    if error is None:
+        update_fields.append(GSpreadTask.uploaded)
+
+    GSpreadTask.bulk_update(tasks_chunk, fields=update_fields, batch_size=500)
+    return error is None
+
+
+def update_google_report(
+        report: Report,
+        chunk_size: int = 2000,
+):
+    """
+    Выгружает в Гугл Таблицу отчета все строки задач, еще не отмеченные как выгруженные.
+    """
+    pending_tasks = get_pending_tasks(report)
+
+    # Количество успешно загруженных строк.
+    uploaded_count = 0
+
+    for chunk_start in range(0, len(pending_tasks), chunk_size):
+        tasks_chunk = pending_tasks[chunk_start:chunk_start + chunk_size]
+        if upload_chunk(report, tasks_chunk):
+            uploaded_count += len(tasks_chunk)
 
     if uploaded_count > 0:
         logger.info(f'[+] Успешно выгружено {uploaded_count} строк в Таблицу {report.sheet_id}.')
@@ -107,10 +199,128 @@ def update_google_report(
         logger.info(f'[-] Ничего не выгружено в Таблицу {report.sheet_id} (0 строк).')
 
 
-def upload_tasks_in_threads():
+class UploadScheduler:
+    """
+    Очередь отчетов с невыгруженными строками, общая для потоков выгрузки.
+
+    Поток берет отчет из начала очереди, выгружает одну часть его строк и возвращает отчет в конец
+    очереди, если строки еще остались: большой отчет не задерживает выгрузку остальных,
+    а части одного отчета никогда не выгружаются параллельно. Отчет, для таблицы которого квота
+    сейчас исчерпана, пропускается в пользу следующего.
+    """
+    def __init__(
+            self,
+            reports: List[Report],
+            chunk_size: int,
+            upload: Callable[[Report, List[GSpreadTask]], bool] = upload_chunk,
+            load_tasks: Callable[[Report], List[GSpreadTask]] = get_pending_tasks,
+            quota: Optional[SheetsQuota] = None,
+            stop_event: Optional[threading.Event] = None,
+    ):
+        self.chunk_size = chunk_size
+        # После остановки сервиса потоки дописывают текущие части и не берут новые.
+        self.stop_event = stop_event or threading.Event()
+        self.upload = upload
+        self.load_tasks = load_tasks
+        self.quota = quota or sheets_quota
+        # (отчет, невыгруженные строки). Строки загружаются, когда отчет впервые взят из очереди.
+        self._queue: Deque[Tuple[Report, Optional[List[GSpreadTask]]]] = deque((x, None) for x in reports)
+        self._lock = threading.Lock()
+        self.in_progress = 0
+        self.uploaded_rows = 0
+        self.failed_rows = 0
+        self.uploaded_chunks = 0
+        self.failed_chunks = 0
+
+    def _pop(self) -> Optional[Tuple[Report, Optional[List[GSpreadTask]]]]:
+        """
+        Первый отчет очереди, для таблицы которого не нужно ждать квоту
+        (если ждать нужно для всех – отчет с наименьшим ожиданием).
+        """
+        with self._lock:
+            if not self._queue or self.stop_event.is_set():
+                return None
+            waits = [self.quota.get_wait(report.sheet_id) for report, _ in self._queue]
+            index = next((i for i, wait in enumerate(waits) if wait <= 0), None)
+            if index is None:
+                index = waits.index(min(waits))
+            item = self._queue[index]
+            del self._queue[index]
+            self.in_progress += 1
+            return item
+
+    def _worker(self) -> None:
+        while True:
+            item = self._pop()
+            if item is None:
+                return
+            report, tasks = item
+            try:
+                if tasks is None:
+                    tasks = self.load_tasks(report)
+                chunk, tasks = tasks[:self.chunk_size], tasks[self.chunk_size:]
+                is_uploaded = self.upload(report, chunk) if chunk else True
+            except Exception as ex:
+                logger.exception(f'Выгрузка строк отчета {report.id} в Гугл Таблицу прервана: {ex}')
+                chunk, tasks, is_uploaded = [], [], False
+
+            with self._lock:
+                self.in_progress -= 1
+                if is_uploaded:
+                    self.uploaded_rows += len(chunk)
+                    self.uploaded_chunks += 1
+                else:
+                    self.failed_rows += len(chunk)
+                    self.failed_chunks += 1
+                if tasks:
+                    self._queue.append((report, tasks))
+            self.write_status()
+
+    def run(self, max_workers: int) -> None:
+        self.write_status()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self._worker) for _ in range(max_workers)]
+            for future in futures:
+                future.result()
+        self.write_status()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            queue = list(self._queue)
+            stats = {
+                'queue_depth': len(queue),
+                'in_progress': self.in_progress,
+                # Строки отчетов, которые еще не брались из очереди, не учитываются.
+                'queued_rows': sum(len(tasks) for _, tasks in queue if tasks is not None),
+                'uploaded_rows': self.uploaded_rows,
+                'failed_rows': self.failed_rows,
+                'uploaded_chunks': self.uploaded_chunks,
+                'failed_chunks': self.failed_chunks,
+            }
+        stats['quota'] = self.quota.get_stats()
+        return stats
+
+    def write_status(self) -> None:
+        """
+        Сохраняет состояние очереди и квот в файл для /status/sheets_upload.
+        """
+        status = {'updated': datetime.now().isoformat(), **self.get_stats()}
+        tmp_path = f'{cfg.UPLOAD_GOOGLE_STATUS_PATH}.{threading.get_ident()}'
+        try:
+            with open(tmp_path, 'w') as file:
+                json.dump(status, file, ensure_ascii=False)
+            os.replace(tmp_path, cfg.UPLOAD_GOOGLE_STATUS_PATH)
+        except OSError as ex:
+            logger.warning(f'Не удалось сохранить состояние выгрузки в Гугл Таблицы: {ex}')
+
+
+def upload_tasks_in_threads(
+        report_ids: Optional[Iterable[int]] = None,
+        stop_event: Optional[threading.Event] = None,
+):
     """
-    Запускает многопоточную выгрузку строк в Гугл Таблицы.
-    Каждый поток обрабатывает Гугл Таблицу одного отчета.
+    Запускает многопоточную выгрузку строк в Гугл Таблицы (всех отчетов или только report_ids).
+    Потоки по очереди выгружают по одной части строк каждого отчета (см. UploadScheduler).
     """
 
     # Отчеты, для которых нужно сделать выгрузку в Гугл Таблицу.
@@ -129,21 +339,83 @@ def upload_tasks_in_threads():
         )
         .group_by(Report.id)
     )
+    if report_ids is not None:
+        reports = reports.where(Report.id.in_(list(report_ids)))
+    reports = list(reports)
     logger.info(f'Начинаю выгружать звонки в Гугл Таблицы: всего отчетов {len(reports)}.')
 
-    with ThreadPoolExecutor(max_workers=cfg.UPLOAD_GOOGLE_MAX_WORKERS) as executor:
-        futures = []
-        for report in reports:
-            futures.append(executor.submit(update_google_report, report, chunk_size=cfg.UPLOAD_GOOGLE_CHUNK_SIZE))
-        for future in futures:
-            future.result()
+    scheduler = UploadScheduler(reports, chunk_size=int(cfg.UPLOAD_GOOGLE_CHUNK_SIZE), stop_event=stop_event)
+    scheduler.run(max_workers=int(cfg.UPLOAD_GOOGLE_MAX_WORKERS))
+    logger.info(f'Выгрузка в Гугл Таблицы завершена: {scheduler.get_stats()}')
+
+
+class UploadService:
+    """
+    Сервис выгрузки: ждет уведомлений о новых строках (LISTEN/NOTIFY) и выгружает строки отчета
+    через UPLOAD_GOOGLE_DEBOUNCE_SEC после первого уведомления – строки, появившиеся за это время,
+    уходят одним пакетом. Раз в UPLOAD_GOOGLE_SWEEP_INTERVAL секунд проверяются все отчеты.
+    """
+    def __init__(
+            self,
+            listener: Optional[UploadListener] = None,
+            upload: Callable[..., None] = upload_tasks_in_threads,
+            debounce_sec: Optional[float] = None,
+            sweep_interval: Optional[float] = None,
+            clock: Callable[[], float] = time.monotonic,
+    ):
+        self.listener = listener or UploadListener()
+        self.upload = upload
+        self.debounce_sec = cfg.UPLOAD_GOOGLE_DEBOUNCE_SEC if debounce_sec is None else debounce_sec
+        self.sweep_interval = cfg.UPLOAD_GOOGLE_SWEEP_INTERVAL if sweep_interval is None else sweep_interval
+        self.clock = clock
+        self.stop_event = threading.Event()
+        # ID отчета -> время, когда выгружать его строки.
+        self.due: Dict[int, float] = {}
+        # Первая полная проверка – сразу после запуска: подбираем строки, накопившиеся во время простоя.
+        self.next_sweep = clock()
+
+    def stop(self, signum=None, frame=None) -> None:
+        logger.info('Остановка выгрузки в Гугл Таблицы: дописываем текущие части строк.')
+        self.stop_event.set()
+
+    def run_once(self) -> None:
+        now = self.clock()
+        timeout = max(0.0, min([self.next_sweep] + list(self.due.values())) - now)
+        # Ожидание прерывается не реже раза в секунду, чтобы быстро реагировать на остановку.
+        for report_id in self.listener.wait(min(timeout, 1.0)):
+            self.due.setdefault(report_id, self.clock() + self.debounce_sec)
+
+        now = self.clock()
+        if now >= self.next_sweep:
+            self.due.clear()
+            self.next_sweep = now + self.sweep_interval
+            self.upload(stop_event=self.stop_event)
+            return
+
+        ready = [report_id for report_id, due in self.due.items() if due <= now]
+        if ready:
+            for report_id in ready:
+                del self.due[report_id]
+            self.upload(report_ids=ready, stop_event=self.stop_event)
+
+    def run(self) -> None:
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    self.run_once()
+                except Exception as ex:
+                    logger.exception(f'Ошибка выгрузки в Гугл Таблицы: {ex}')
+                    self.stop_event.wait(5)
+        finally:
+            self.listener.close()
+            main_db.close()
+            logger.info('Выгрузка в Гугл Таблицы остановлена.')
 
 
 def main():
-    while True:
-        upload_tasks_in_threads()
-        logger.info('Ожидание 1 мин перед следующей попыткой...')
-        time.sleep(60)
+    UploadService().run()
 
 
 if __name__ == "__main__":